@@ -1,7 +1,14 @@
 #!/usr/bin/env python
 import os
 
-from ._version import get_data as get_version_data
+from .startup_profile import start_from_environment
+from .tracing import start_from_environment as start_tracing_from_environment
+
+# before anything heavy is imported
+start_from_environment()
+start_tracing_from_environment()
+
+from ._version import get_data as get_version_data  # noqa: E402
 
 
 def get_version():
@@ -0,0 +1,299 @@
+"""
+Write-ahead checkpoint logs of the running experiments, one file per experiment.
+
+A log is an append-only file of records, one per line: the CRC32 of the JSON
+record in hex, a space and the record. The experiment appends a record when a
+cycle begins and when it completes, and around every operation on a reactor
+whose interruption matters (e.g. a dilution), so after a crash or a power cut
+the state of the experiment is the fold of its records:
+
+- ``created``: class, machine, args and kwargs to create the experiment again
+- ``started``: start time
+- ``cycle``: a cycle began, with the state of the experiment
+- ``cycle_complete``: the cycle completed
+- ``operation``: an operation began or ended, the end carries the state
+- ``finished``: the experiment ended, it is not restored
+- ``snapshot``: the fold of the records before it, written by the compaction
+
+Records are written to the OS at once, so a crash of the server loses nothing.
+The fsync a power cut needs is batched: the first record after a sync schedules
+the next one ``sync_interval`` later and the records written in between go to
+the disk together. When the log reaches ``compact_records`` records it is
+replaced by a single snapshot record. Reading stops at the first torn or
+corrupt line, which is all a crash while appending can leave behind.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass, field, fields
+from typing import Optional
+
+from biofactory.util import clock
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_SUFFIX = ".wal"
+
+CREATED = "created"
+STARTED = "started"
+CYCLE = "cycle"
+CYCLE_COMPLETE = "cycle_complete"
+OPERATION = "operation"
+FINISHED = "finished"
+SNAPSHOT = "snapshot"
+
+BEGIN = "begin"
+END = "end"
+
+
+@dataclass
+class CheckpointState:
+    """State of an experiment folded from its checkpoint records"""
+
+    experiment_id: str
+    experiment_class: Optional[str] = None
+    machine: Optional[str] = None
+    args: list = field(default_factory=list)
+    kwargs: dict = field(default_factory=dict)
+    start_time: Optional[str] = None
+    cycle: int = 0
+    cycle_time: Optional[float] = None
+    """Wall clock time the latest cycle began"""
+    cycle_complete: bool = False
+    state: dict = field(default_factory=dict)
+    """State of the experiment subclass, see ``Experiment.checkpoint_state``"""
+    operations: dict[str, dict] = field(default_factory=dict)
+    """Operations which began and did not end, by key"""
+    finished: Optional[str] = None
+
+    def apply(self, record: dict):
+        match record["type"]:
+            case "created":
+                self.experiment_class = record["class"]
+                self.machine = record["machine"]
+                self.args = record["args"]
+                self.kwargs = record["kwargs"]
+            case "started":
+                self.start_time = record["time"]
+            case "cycle":
+                self.cycle = record["cycle"]
+                self.cycle_time = record["time"]
+                self.cycle_complete = False
+            case "cycle_complete":
+                self.cycle_complete = True
+            case "operation":
+                if record["phase"] == BEGIN:
+                    self.operations[record["key"]] = {
+                        "name": record["name"],
+                        "data": record["data"],
+                    }
+                else:
+                    self.operations.pop(record["key"], None)
+            case "finished":
+                self.finished = record["status"]
+            case "snapshot":
+                for name in (f.name for f in fields(self)):
+                    setattr(self, name, record[name])
+        if "state" in record and record["type"] != SNAPSHOT:
+            self.state = record["state"]
+
+    def to_record(self) -> dict:
+        return {"type": SNAPSHOT, **asdict(self)}
+
+
+def _encode(record: dict) -> bytes:
+    payload = json.dumps(record, separators=(",", ":"), default=str).encode()
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def read_checkpoint(path: str) -> tuple[CheckpointState, int, int]:
+    """
+    Folds the valid records of the log, returns the state, the count of the
+    records and the size of the file they take
+    """
+    experiment_id = os.path.basename(path).removesuffix(CHECKPOINT_SUFFIX)
+    state = CheckpointState(experiment_id=experiment_id)
+    records = 0
+    size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n") or line[8:9] != b" ":
+                break
+            payload = line[9:-1]
+            try:
+                if int(line[:8], 16) != zlib.crc32(payload):
+                    break
+                record = json.loads(payload)
+            except ValueError:
+                break
+            state.apply(record)
+            records += 1
+            size += len(line)
+    return state, records, size
+
+
+class CheckpointLog:
+    """Checkpoint log of one experiment, use ``create`` or ``open``"""
+
+    def __init__(
+        self,
+        path: str,
+        state: CheckpointState,
+        records: int = 0,
+        sync_interval: float = 1.0,
+        compact_records: int = 1000,
+    ):
+        self._path = path
+        self._state = state
+        self._records = records
+        self._sync_interval = sync_interval
+        self._compact_records = compact_records
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        self._sync_timer: Optional[threading.Timer] = None
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        experiment_id: str,
+        experiment_class: type,
+        machine: Optional[str],
+        args=(),
+        kwargs=None,
+        **log_kwargs,
+    ) -> "CheckpointLog":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        checkpoint = cls(
+            path, CheckpointState(experiment_id=experiment_id), **log_kwargs
+        )
+        checkpoint.append(
+            {
+                "type": CREATED,
+                "class": f"{experiment_class.__module__}.{experiment_class.__name__}",
+                "machine": machine,
+                "args": list(args),
+                "kwargs": kwargs or {},
+            },
+            sync=True,
+        )
+        return checkpoint
+
+    @classmethod
+    def open(cls, path: str, **log_kwargs) -> "CheckpointLog":
+        """Opens an existing log for appending, drops a torn tail"""
+        state, records, size = read_checkpoint(path)
+        if os.path.getsize(path) != size:
+            log.warning(f"Truncating checkpoint log {path} to {records} records")
+            with open(path, "ab") as f:
+                f.truncate(size)
+        return cls(path, state, records, **log_kwargs)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def state(self) -> CheckpointState:
+        return self._state
+
+    def append(self, record: dict, sync: bool = False):
+        """Writes the record, ``sync`` waits until it is on the disk"""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._state.apply(record)
+            self._file.write(_encode(record))
+            self._file.flush()
+            self._records += 1
+            if self._records >= self._compact_records:
+                self._compact()
+            elif sync:
+                self._sync()
+            elif self._sync_timer is None:
+                self._sync_timer = threading.Timer(self._sync_interval, self.sync)
+                self._sync_timer.daemon = True
+                self._sync_timer.start()
+
+    def sync(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+
+    def _sync(self):
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        os.fsync(self._file.fileno())
+
+    def compact(self):
+        with self._lock:
+            if not self._file.closed:
+                self._compact()
+
+    def _compact(self):
+        """Replaces the log with the snapshot of its state"""
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_encode(self._state.to_record()))
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self._path)
+        _fsync_folder(self._path)
+        self._file = open(self._path, "ab")
+        self._records = 1
+        self._sync()
+
+    def finish(self, status: str):
+        """Records the end of the experiment and closes the compacted log"""
+        self.append({"type": FINISHED, "status": status, "time": clock.time()})
+        self.close(compact=True)
+
+    def close(self, compact: bool = False):
+        with self._lock:
+            if self._file.closed:
+                return
+            if compact:
+                self._compact()
+            else:
+                self._sync()
+            self._file.close()
+
+
+def _fsync_folder(path: str):
+    """Makes the rename of a file in the folder durable"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def load_checkpoints(folder: str) -> dict[str, CheckpointState]:
+    """States of the experiments of the folder which did not finish"""
+    if not os.path.isdir(folder):
+        return {}
+    started = time.perf_counter()
+    states = {}
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith(CHECKPOINT_SUFFIX):
+            continue
+        try:
+            state, _, _ = read_checkpoint(os.path.join(folder, name))
+        except OSError:
+            log.exception(f"Could not read checkpoint log {name}")
+            continue
+        if state.finished is None and state.experiment_class is not None:
+            states[state.experiment_id] = state
+    log.info(
+        f"Loaded {len(states)} unfinished experiments from {folder} "
+        f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+    )
+    return states
@@ -3,6 +3,7 @@ from typing import Optional
 from pydantic import BaseModel as PydanticBaseModel
 
 from biofactory.config.connection import ConnectionConfig
+from biofactory.config.od_calibration import OdCalibrationConfig
 from biofactory.config.temperature import TemperatureConfig
 
 from .folder import FolderConfig
@@ -15,6 +16,7 @@ class Config(PydanticBaseModel):
     folder: FolderConfig = FolderConfig()
     temperature: TemperatureConfig = TemperatureConfig()
     connection: ConnectionConfig = ConnectionConfig()
+    od_calibration: OdCalibrationConfig = OdCalibrationConfig()
 
     def save(self):
         if self._save_callback:
@@ -9,3 +9,6 @@ class FolderConfig(PydanticBaseModel):
 
     experiments: Optional[str] = None
     """Absolute path where to store experiments data. Defaults to the `experiments` folder in application base folder."""
+
+    data: Optional[str] = None
+    """Absolute path where to store measurements time series. Defaults to the `data` folder in application base folder."""
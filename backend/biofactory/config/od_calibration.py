@@ -0,0 +1,6 @@
+from pydantic import BaseModel as PydanticBaseModel
+
+
+class OdCalibrationConfig(PydanticBaseModel):
+    fits: dict[str, list[float]] = {}
+    """Fitted OD calibration coefficients (a, b, c, d, g) by hash of the calibration points"""
@@ -10,6 +10,9 @@ class DeviceCallback:
     def _on_device_state_change(self, state, device, *args, **kwargs):
         pass
 
+    def _on_device_measurement(self, device, values, *args, **kwargs):
+        pass
+
 
 DUMMY_DEVICE_CALBACK = DeviceCallback()
 
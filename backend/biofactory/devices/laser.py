@@ -1,9 +1,9 @@
-import time
 from enum import Enum
 from typing import Optional
 
 from biofactory.devices import Device, DeviceCallback
 from biofactory.drivers.pca9555 import IOPortDriver
+from biofactory.util import clock
 
 LASER_ON = 0
 LASER_OFF = 1
@@ -31,20 +31,22 @@ class Laser(Device):
     def read_state(self):
         self._set_state(self.States.STATE_OPERATIONAL)
 
+    def get_pin_value(self, on: bool) -> tuple[int, int]:
+        """
+        Returns the IO expander pin and the value which switches the laser
+        """
+        if self.io_driver.port.address == I2C_PORT_IO_REACTOR:
+            return REACTOR_LASER_EN_PIN, 1 if on else 0
+        return self.laser_cs, LASER_ON if on else LASER_OFF
+
     def switch_on(self):
         self._log.debug(f"{self.name} switch ON")
-        if self.io_driver.port.address == I2C_PORT_IO_REACTOR:
-            self.io_driver.write_pin(REACTOR_LASER_EN_PIN, 1)
-        else:
-            self.io_driver.write_pin(self.laser_cs, LASER_ON)
+        self.io_driver.write_pin(*self.get_pin_value(True))
         self._set_state(self.States.STATE_ON)
 
     def switch_off(self):
         self._log.debug(f"{self.name} switch OFF")
-        if self.io_driver.port.address == I2C_PORT_IO_REACTOR:
-            self.io_driver.write_pin(REACTOR_LASER_EN_PIN, 0)
-        else:
-            self.io_driver.write_pin(self.laser_cs, LASER_OFF)
+        self.io_driver.write_pin(*self.get_pin_value(False))
         self._set_state(self.States.STATE_OFF)
 
     def blink(self, times: int = 3, freq: float = 3):
@@ -52,7 +54,7 @@ class Laser(Device):
         delay = 1 / (freq * 2)
         for _ in range(times):
             self.switch_on()
-            time.sleep(delay)
+            clock.sleep(delay)
             self.switch_off()
 
     def __enter__(self):
@@ -64,3 +66,17 @@ class Laser(Device):
 
     def get_drivers(self):
         return [self.io_driver]
+
+
+def switch_lasers(lasers: list[Laser], on: bool):
+    """
+    Switches several lasers at once, with a single write per IO expander
+    """
+    pins_by_driver: dict[IOPortDriver, dict[int, int]] = {}
+    for laser in lasers:
+        pin, value = laser.get_pin_value(on)
+        pins_by_driver.setdefault(laser.io_driver, {})[pin] = value
+    for io_driver, pins in pins_by_driver.items():
+        io_driver.write_pins(pins)
+    for laser in lasers:
+        laser._set_state(laser.States.STATE_ON if on else laser.States.STATE_OFF)
@@ -0,0 +1,217 @@
+"""
+Motion completion watcher.
+
+A motor move takes a time which is known in advance from the move profile, so
+instead of polling the driver status every 100 ms the watcher sleeps until
+shortly before the expected end of the move and only then polls the busy state,
+doubling the interval between polls while the motor is still moving. Completion
+is published as a ``concurrent.futures.Future`` so callers can wait on several
+motors at once.
+"""
+
+import heapq
+import itertools
+import logging
+import math
+import threading
+from concurrent.futures import FIRST_EXCEPTION, Future
+from concurrent.futures import wait as wait_futures
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+
+from biofactory.util.clock import blocking, monotonic, wait_condition
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def motionWatcher():
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = MotionWatcher()
+    return _instance
+
+
+def estimate_move_duration(
+    steps: float,
+    max_speed: float,
+    acceleration: float,
+    deceleration: Optional[float] = None,
+) -> float:
+    """
+    Duration in seconds of a move with trapezoidal speed profile, speeds and
+    accelerations are in steps/s and steps/s^2
+    """
+    steps = abs(steps)
+    deceleration = deceleration or acceleration
+    if steps == 0 or max_speed <= 0:
+        return 0.0
+    if acceleration <= 0 or deceleration <= 0:
+        return steps / max_speed
+    ramps_steps = max_speed**2 / (2 * acceleration) + max_speed**2 / (2 * deceleration)
+    if ramps_steps >= steps:
+        # triangular profile, the max speed is never reached
+        peak_speed = math.sqrt(
+            2 * steps * acceleration * deceleration / (acceleration + deceleration)
+        )
+        return peak_speed / acceleration + peak_speed / deceleration
+    return (
+        max_speed / acceleration
+        + max_speed / deceleration
+        + (steps - ramps_steps) / max_speed
+    )
+
+
+def wait_for_motions(
+    futures: Iterable[Optional[Future]], timeout: Optional[float] = None
+) -> list:
+    """
+    Waits until all motions are completed, raises the first motion error or
+    TimeoutError
+    """
+    futures = [future for future in futures if future is not None]
+    with blocking():
+        done, not_done = wait_futures(
+            futures, timeout=timeout, return_when=FIRST_EXCEPTION
+        )
+    for future in done:
+        if future.exception() is not None:
+            raise future.exception()
+    if not_done:
+        raise TimeoutError(f"{len(not_done)} motions are not completed")
+    return [future.result() for future in futures]
+
+
+def completed_motion() -> Future:
+    future = Future()
+    future.set_result(0.0)
+    return future
+
+
+@dataclass(order=True)
+class _Watch:
+    next_check: float
+    seq: int
+    name: str = field(compare=False)
+    is_busy: Callable[[], bool] = field(compare=False)
+    future: Future = field(compare=False)
+    started: float = field(compare=False)
+    deadline: float = field(compare=False)
+    interval: float = field(compare=False)
+
+
+class MotionWatcher:
+    """
+    Completes motion futures from a single background thread.
+
+    ``lead_time`` is how long before the expected end of the move the polling
+    starts, the poll interval then grows from ``min_poll_interval`` to
+    ``max_poll_interval``. A motion which is still busy ``timeout_factor`` times
+    its expected duration plus ``timeout_margin`` seconds after the start fails
+    with TimeoutError.
+    """
+
+    def __init__(
+        self,
+        lead_time: float = 0.05,
+        min_poll_interval: float = 0.01,
+        max_poll_interval: float = 0.25,
+        timeout_factor: float = 2.0,
+        timeout_margin: float = 5.0,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self._log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._lead_time = lead_time
+        self._min_poll_interval = min_poll_interval
+        self._max_poll_interval = max_poll_interval
+        self._timeout_factor = timeout_factor
+        self._timeout_margin = timeout_margin
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._watches: list[_Watch] = []
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._polls = 0
+
+    @property
+    def polls(self):
+        """Count of busy state checks done since the watcher was created"""
+        return self._polls
+
+    def watch(
+        self,
+        name: str,
+        is_busy: Callable[[], bool],
+        expected_duration: float = 0.0,
+    ) -> Future:
+        """
+        Returns a future completed with the motion duration in seconds once
+        ``is_busy`` returns False
+        """
+        now = self._clock()
+        watch = _Watch(
+            next_check=now + max(expected_duration - self._lead_time, 0.0),
+            seq=next(self._seq),
+            name=name,
+            is_busy=is_busy,
+            future=Future(),
+            started=now,
+            deadline=now
+            + expected_duration * self._timeout_factor
+            + self._timeout_margin,
+            interval=self._min_poll_interval,
+        )
+        watch.future.set_running_or_notify_cancel()
+        with self._condition:
+            heapq.heappush(self._watches, watch)
+            self._ensure_thread()
+            self._condition.notify()
+        return watch.future
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="MotionWatcher", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._watches:
+                        wait_condition(self._condition)
+                        continue
+                    delay = self._watches[0].next_check - self._clock()
+                    if delay <= 0:
+                        break
+                    wait_condition(self._condition, delay)
+                watch = heapq.heappop(self._watches)
+            self._check(watch)
+
+    def _check(self, watch: _Watch):
+        if watch.future.done():
+            return
+        self._polls += 1
+        try:
+            busy = watch.is_busy()
+        except Exception as e:
+            self._log.exception(f"Failed to read {watch.name} motion state")
+            watch.future.set_exception(e)
+            return
+        now = self._clock()
+        if not busy:
+            watch.future.set_result(now - watch.started)
+        elif now >= watch.deadline:
+            watch.future.set_exception(
+                TimeoutError(
+                    f"{watch.name} is still moving after {now - watch.started:.1f} s"
+                )
+            )
+        else:
+            watch.next_check = now + watch.interval
+            watch.interval = min(watch.interval * 2, self._max_poll_interval)
+            with self._condition:
+                heapq.heappush(self._watches, watch)
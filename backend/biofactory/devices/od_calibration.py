@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+from array import array
+from collections.abc import MutableMapping
+from typing import Callable, Optional
+
+import numpy as np
+
+ADC_FULL_SCALE_MV = 2.048 * 1000 / 8
+"""MCP3421 full scale at gain 8 (the gain used by the OD sensors)"""
+ADC_CODES = 2**15
+"""Positive codes of 16 bit conversion"""
+
+PARAMETERS_INITIAL = (20, 5, 0.07, -0.2, 1)
+PARAMETERS_BOUNDS = ((3, 0, 0, -0.5, 0), (200, 10, 20, 0.1, 5))
+PARAMETERS_COUNT = len(PARAMETERS_INITIAL)
+
+
+def od_from_mv(x, a, b, c, d, g):
+    """4 parameter logistic function, signal mV to optical density"""
+    return d + (a - d) / ((1 + (x / c) ** b) ** g)
+
+
+def mv_from_od(y, a, b, c, d, g):
+    """Analytic inverse of the 4 parameter logistic function"""
+    return c * (((a - d) / (y - d)) ** (1 / g) - 1) ** (1 / b)
+
+
+def points_hash(points: dict[float, list[float]]) -> str:
+    """Hash of the calibration points, the key of the fitted coefficients cache"""
+    canonical = sorted(
+        (float(od), sorted(float(mv) for mv in mvs)) for od, mvs in points.items()
+    )
+    return hashlib.sha1(json.dumps(canonical).encode()).hexdigest()
+
+
+class OdLookupTable:
+    """
+    Precomputed optical density for every code of the ADC range, conversion is a
+    linear interpolation between the two nearest codes. Signals out of the range
+    are converted with the function directly.
+    """
+
+    def __init__(
+        self,
+        parameters: tuple[float, ...],
+        full_scale_mv: float = ADC_FULL_SCALE_MV,
+        size: int = ADC_CODES,
+    ):
+        self.parameters = tuple(parameters)
+        self._step = full_scale_mv / (size - 1)
+        self._size = size
+        with np.errstate(all="ignore"):
+            table = od_from_mv(np.arange(size) * self._step, *self.parameters)
+        # compact and, unlike a numpy array, fast to index with python scalars
+        self._table = array("d", table.tobytes())
+
+    def __call__(self, mv: float) -> float:
+        position = mv / self._step
+        index = int(position)
+        if index < 0 or index >= self._size - 1:
+            return float(od_from_mv(mv, *self.parameters))
+        low = self._table[index]
+        return low + (self._table[index + 1] - low) * (position - index)
+
+
+class OdCalibrationEngine:
+    """
+    Fits the calibration functions of several sensors in one least squares
+    problem and caches the coefficients by the hash of the calibration points.
+
+    cache - mapping of points hash to coefficients, e.g. a part of the settings
+    save - called after new coefficients were added to the cache
+    """
+
+    def __init__(
+        self,
+        cache: Optional[MutableMapping] = None,
+        save: Optional[Callable[[], None]] = None,
+    ):
+        self._log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._cache = cache if cache is not None else {}
+        self._save = save
+
+    @classmethod
+    def from_settings(cls) -> "OdCalibrationEngine":
+        """Engine persisting the coefficients in the settings, in memory if the
+        settings are not initialized"""
+        from biofactory.config import settings
+
+        try:
+            config = settings()
+        except ValueError:
+            return cls()
+        return cls(cache=config.od_calibration.fits, save=config.save)
+
+    def fit(self, points: dict[str, dict[float, list[float]]]) -> dict[str, tuple]:
+        """
+        Returns (a, b, c, d, g) coefficients for every sensor id, sensors with less
+        than two calibration points are skipped. Only the coefficients of a
+        converged fit are cached, a failed fit is tried again the next time.
+        """
+        result = {}
+        missing = {}
+        for sensor_id, sensor_points in points.items():
+            if len(sensor_points) < 2:
+                continue
+            key = points_hash(sensor_points)
+            if key in self._cache:
+                result[sensor_id] = tuple(self._cache[key])
+            else:
+                missing[sensor_id] = (key, sensor_points)
+        if missing:
+            fitted, success = self._fit_batch([p for _, p in missing.values()])
+            for (sensor_id, (key, _)), coefficients in zip(missing.items(), fitted):
+                if success:
+                    self._cache[key] = list(coefficients)
+                result[sensor_id] = coefficients
+            if success and self._save is not None:
+                self._save()
+        return result
+
+    def _fit_batch(self, sensors_points: list[dict[float, list[float]]]):
+        from scipy.optimize import least_squares
+
+        ods, mvs, sigmas, owners = [], [], [], []
+        for sensor_index, points in enumerate(sensors_points):
+            for od, values in points.items():
+                values = np.asarray(values, dtype=float)
+                ods.append(float(od))
+                mvs.append(values.mean())
+                # allows the fit with single measurements
+                sigmas.append(values.std() + 0.01)
+                owners.append(sensor_index)
+        ods, mvs, sigmas = np.array(ods), np.array(mvs), np.array(sigmas)
+        owners = np.array(owners)
+        sensors = len(sensors_points)
+
+        def residuals(flat):
+            parameters = flat.reshape(sensors, PARAMETERS_COUNT)[owners].T
+            with np.errstate(all="ignore"):
+                predicted = mv_from_od(ods, *parameters)
+            return np.nan_to_num(
+                (predicted - mvs) / sigmas, nan=1e6, posinf=1e6, neginf=-1e6
+            )
+
+        # one problem for all sensors, the dense jacobian is cheaper than separate
+        # fits (sparse lsmr solver converges much slower on these curves)
+        solution = least_squares(
+            residuals,
+            np.tile(PARAMETERS_INITIAL, sensors).astype(float),
+            bounds=(
+                np.tile(PARAMETERS_BOUNDS[0], sensors),
+                np.tile(PARAMETERS_BOUNDS[1], sensors),
+            ),
+            max_nfev=5000,
+        )
+        if not solution.success:
+            self._log.warning(f"OD calibration fit failed: {solution.message}")
+        fitted = [
+            tuple(float(value) for value in coefficients)
+            for coefficients in solution.x.reshape(sensors, PARAMETERS_COUNT)
+        ]
+        return fitted, solution.success
@@ -1,16 +1,21 @@
 import threading
-import time
 from dataclasses import dataclass
 from enum import Enum
 from typing import Optional
 
-import numpy as np
 from pyftdi.i2c import I2cNackError
-from scipy.optimize import curve_fit
 
 from biofactory.devices import Device, DeviceCallback
 from biofactory.devices.laser import Laser
+from biofactory.devices.od_calibration import (
+    OdCalibrationEngine,
+    OdLookupTable,
+    mv_from_od,
+    od_from_mv,
+)
 from biofactory.devices.photodiode import Photodiode
+from biofactory.metrics import I2C_NACKS
+from biofactory.util import clock
 
 global_lock = threading.RLock()
 
@@ -70,7 +75,8 @@ class OpticalDensitySensor(Device):
         self.laser = laser
         self.delay_before_measure = delay_before_measure
         self.lock = lock
-        self.curve_fitting_parameters = curve_fitting_parameters
+        self.calibration_od_to_mv: dict[float, list[float]] = {}
+        self.set_curve_fitting_parameters(curve_fitting_parameters)
         self._value = 0
         self._background = 0
         self._transmitted = 0
@@ -90,8 +96,7 @@ class OpticalDensitySensor(Device):
                 but, in practice, to zero.
         :return: y - optical density
         """
-        y = d + (a - d) / ((1 + (x / c) ** b) ** g)
-        return y
+        return od_from_mv(x, a, b, c, d, g)
 
     def od_calibration_function_inverse(self, y, a, b, c, d, g):
         """
@@ -109,50 +114,37 @@ class OpticalDensitySensor(Device):
                 but, in practice, to zero.
         :return: x - signal voltage in millivolts
         """
-        x = c * (((a - d) / (y - d)) ** (1 / g) - 1) ** (1 / b)
-        return x
+        return mv_from_od(y, a, b, c, d, g)
+
+    def set_curve_fitting_parameters(self, parameters: CurveFittingParameters):
+        self.curve_fitting_parameters = parameters
+        self._lookup_table = OdLookupTable(
+            (
+                parameters.infinity_x_asymptote,
+                parameters.hill,
+                parameters.inflection,
+                parameters.small_x_asymptote,
+                parameters.rate_of_change,
+            )
+        )
 
     def calibration_function(self, mv):
-        a = self.curve_fitting_parameters.infinity_x_asymptote
-        b = self.curve_fitting_parameters.hill
-        c = self.curve_fitting_parameters.inflection
-        d = self.curve_fitting_parameters.small_x_asymptote
-        g = self.curve_fitting_parameters.rate_of_change
-        return self.od_calibration_function(mv, a, b, c, d, g)
-
-    def fit_calibration_function(self):
-        # try:
-        calibration_od = np.array(list(self.calibration_od_to_mv.keys()))
-        calibration_mv = np.array(list(self.calibration_od_to_mv.values()))
-
-        max_len = len(max(calibration_mv, key=len))
-        calibration_mv_filled = np.array(
-            [list(i) + [np.nan] * (max_len - len(i)) for i in calibration_mv]
-        )
-        calibration_mv_err = np.nanstd(calibration_mv_filled, 1)
-        # calibration_mv = np.array(list(self.calibration_od_to_mv.values())).mean(1)
-        calibration_mv = np.nanmean(calibration_mv_filled, 1)
-
-        calibration_mv_err += 0.01  # allows curve fit with single measurements
-
-        coefs, _ = curve_fit(
-            self.od_calibration_function_inverse,
-            calibration_od,
-            calibration_mv,
-            maxfev=5000,
-            p0=(20, 5, 0.07, -0.2, 1),
-            bounds=[(3, 0, 0, -0.5, 0), (200, 10, 20, 0.1, 5)],
-            sigma=calibration_mv_err,
-        )
-        # a, b, c, d, g = coefs
+        """converts signal mV to optical density with the precomputed table"""
+        return self._lookup_table(mv)
+
+    def fit_calibration_function(self, engine: Optional[OdCalibrationEngine] = None):
+        """
+        Fits the calibration function to the calibration points, see
+        OpticalDensitySensorsGroup.fit_calibrations to fit all sensors at once
+        """
+        engine = engine or OdCalibrationEngine()
+        coefs = engine.fit({self.id: self.calibration_od_to_mv}).get(self.id)
+        if coefs is not None:
+            self.apply_calibration_coefficients(coefs)
+
+    def apply_calibration_coefficients(self, coefs: tuple[float, ...]):
         self.coefs = coefs
-        # except:
-        #     print("vial %d calibration function fit error" % self.vial_number)
-        # def f(mv):
-        #     """
-        #     converts mV to OD
-        #     """
-        #     return od_calibration_function(mv, a, b, c, d, g)
+        self.set_curve_fitting_parameters(CurveFittingParameters(*coefs))
 
     def add_calibration_point(self, mv, od):
         temp = self.calibration_od_to_mv
@@ -167,7 +159,7 @@ class OpticalDensitySensor(Device):
         :return:
         """
         with self.lock, self.laser:
-            time.sleep(self.delay_before_measure)
+            clock.sleep(self.delay_before_measure)
             mv, err = self.photodiode.measure(gain=8, bitrate=16)
             return mv, err
 
@@ -185,21 +177,29 @@ class OpticalDensitySensor(Device):
         transmitted, _ = self._measure_transmitted_intensity()
         # if self.device.directory is not None:
         #     self.log_mv(background=background, transmitted=transmitted)
+        return background, transmitted
+
+    def update_from_signal(self, background: float, transmitted: float):
+        """
+        converts measured background and transmitted intensities (mV) to optical density
+        :return: optical density
+        """
         signal = transmitted - background
         self._background = background
         self._transmitted = transmitted
-        return signal
-
-    def measure_od(self):
-        self._set_state(self.States.STATE_MEASURING)
-        signal = self._measure_signal()
-        if not callable(self.calibration_function):
-            self.fit_calibration_function()
         if signal < 0:
             od = signal
         else:
             od = self.calibration_function(signal)
         self._value = od
+        self._callback._on_device_measurement(
+            self, {"od": od, "background": background, "transmitted": transmitted}
+        )
+        return od
+
+    def measure_od(self):
+        self._set_state(self.States.STATE_MEASURING)
+        od = self.update_from_signal(*self._measure_signal())
         self._set_state(self.States.STATE_OPERATIONAL)
         return od
 
@@ -215,6 +215,7 @@ class OpticalDensitySensor(Device):
             self.measure_od()
         except I2cNackError as exc:
             self._log.warning("Not acknowledge (NACK)")
+            I2C_NACKS.labels(self.id).inc()
             self._error = str(exc)
             self._set_state(self.States.STATE_ERROR)
         else:
@@ -0,0 +1,128 @@
+from typing import Optional
+
+from biofactory.devices import Device, DeviceCallback, device_command
+from biofactory.devices.laser import switch_lasers
+from biofactory.devices.od_calibration import OdCalibrationEngine
+from biofactory.devices.optical_density_sensor import OpticalDensitySensor, global_lock
+from biofactory.drivers import Driver
+from biofactory.util import clock
+
+
+class OpticalDensitySensorsGroup(Device):
+    """
+    Measures optical density of several vials in one sweep.
+
+    Background intensities of all requested vials are read first with every laser
+    switched off, then lasers are switched on in groups of non adjacent vials
+    (every ``laser_group_stride``-th vial) with a single IO expander write, so the
+    ``delay_before_measure`` warm up is paid once per group instead of once per vial.
+    """
+
+    def __init__(
+        self,
+        sensors: list[OpticalDensitySensor],
+        laser_group_stride: int = 2,
+        background_max_age: float = 0.0,
+        lock=global_lock,
+        calibration_engine: Optional[OdCalibrationEngine] = None,
+        name: Optional[str] = None,
+        callback: Optional[DeviceCallback] = None,
+    ):
+        super().__init__(name or "Optical Density Sensors Group", callback)
+        if laser_group_stride < 1:
+            raise ValueError("Laser group stride should be at least 1")
+        self._sensors = sensors
+        self.laser_group_stride = laser_group_stride
+        self.background_max_age = background_max_age
+        self.lock = lock
+        self._background_time: dict[int, float] = {}
+        self.calibration_engine = calibration_engine or OdCalibrationEngine()
+        for sensor in sensors:
+            self._devices[sensor.name] = sensor
+
+    def read_state(self):
+        pass
+
+    def __getitem__(self, key) -> OpticalDensitySensor:
+        return self._sensors[key]
+
+    @device_command
+    def fit_calibrations(self) -> dict[str, tuple[float, ...]]:
+        """
+        Fits the calibration functions of all sensors with calibration points in one
+        batch, returns the coefficients by sensor id
+        """
+        sensors = {sensor.id: sensor for sensor in self._sensors}
+        fitted = self.calibration_engine.fit(
+            {
+                sensor_id: sensor.calibration_od_to_mv
+                for sensor_id, sensor in sensors.items()
+            }
+        )
+        for sensor_id, coefs in fitted.items():
+            sensors[sensor_id].apply_calibration_coefficients(coefs)
+        return fitted
+
+    def _measure_backgrounds(self, indexes: list[int]) -> dict[int, float]:
+        now = clock.monotonic()
+        backgrounds = {}
+        stale = []
+        for index in indexes:
+            sensor = self._sensors[index]
+            measured_at = self._background_time.get(index)
+            if measured_at is not None and now - measured_at <= self.background_max_age:
+                backgrounds[index] = sensor._background
+            else:
+                stale.append(index)
+        if stale:
+            switch_lasers([self._sensors[index].laser for index in stale], on=False)
+            for index in stale:
+                mv, _ = self._sensors[index].photodiode.measure(gain=8, bitrate=16)
+                backgrounds[index] = mv
+                self._background_time[index] = clock.monotonic()
+        return backgrounds
+
+    def _measure_transmitted(self, indexes: list[int]) -> dict[int, float]:
+        transmitted = {}
+        for offset in range(self.laser_group_stride):
+            group = [
+                index for index in indexes if index % self.laser_group_stride == offset
+            ]
+            if not group:
+                continue
+            lasers = [self._sensors[index].laser for index in group]
+            try:
+                switch_lasers(lasers, on=True)
+                clock.sleep(
+                    max(self._sensors[index].delay_before_measure for index in group)
+                )
+                for index in group:
+                    mv, _ = self._sensors[index].photodiode.measure(gain=8, bitrate=16)
+                    transmitted[index] = mv
+            finally:
+                switch_lasers(lasers, on=False)
+        return transmitted
+
+    def measure_od_all(self, indexes: Optional[list[int]] = None) -> list[float]:
+        """
+        Measures optical density of the sensors with the given indexes (all by default)
+        :return: optical densities in the order of the requested indexes
+        """
+        indexes = list(range(len(self._sensors))) if indexes is None else indexes
+        sensors = [self._sensors[index] for index in indexes]
+        for sensor in sensors:
+            sensor._set_state(sensor.States.STATE_MEASURING)
+        try:
+            with self.lock:
+                backgrounds = self._measure_backgrounds(indexes)
+                transmitted = self._measure_transmitted(indexes)
+            return [
+                sensor.update_from_signal(backgrounds[index], transmitted[index])
+                for index, sensor in zip(indexes, sensors)
+            ]
+        finally:
+            for sensor in sensors:
+                sensor._set_state(sensor.States.STATE_OPERATIONAL)
+
+    def get_drivers(self) -> list[Driver]:
+        return [driver for sensor in self._sensors for driver in sensor.get_drivers()]
@@ -1,6 +1,11 @@
-from typing import Optional
+from concurrent.futures import Future
+from typing import Optional, Union
+
+import numpy as np
 
 from biofactory.devices import Device, DeviceCallback, device_command
+from biofactory.devices.motion import completed_motion
+from biofactory.devices.pump_calibration import PumpCalibration
 from biofactory.devices.step_motor import Motor
 
 
@@ -23,7 +28,7 @@ class Pump(Device, DeviceCallback):
             10: 9.0,
             50: 8.5,
         }
-        self.points = sorted([(rot, coef) for rot, coef in self.coefficients.items()])
+        self.calibration = PumpCalibration.from_coefficients(self.coefficients)
 
     def reset(self):
         self.motor.reset()
@@ -35,16 +40,34 @@ class Pump(Device, DeviceCallback):
         return motor_state
 
     @device_command
-    def stop(self):
+    def stop(self) -> Future:
+        """Soft stops the motor, returns a future completed when it stops"""
         self._log.debug(f"Stoping {self.name}")
         self._set_state(self.States.STATE_FINISHING)
         self.motor.stop()
         # self._set_state(self.States.STATE_OPERATIONAL)
+        return self.motor.watch_motion(self.motor.get_stop_duration())
+
+    @device_command
+    def watch_motion(self) -> Future:
+        """Returns a future completed when the current motion ends"""
+        return self.motor.watch_motion()
 
     @device_command
     def set_profile(self, profile):
         self.motor.set_profile(profile)
 
+    @device_command
+    def set_calibration(self, calibration: Union[dict[float, float], PumpCalibration]):
+        """
+        Sets the calibration from volume per rotation coefficients by rotations or
+        a fitted calibration
+        """
+        if isinstance(calibration, dict):
+            self.coefficients = dict(calibration)
+            calibration = PumpCalibration.from_coefficients(self.coefficients)
+        self.calibration = calibration
+
     def _on_device_state_change(self, device, state):
         if state == self.States.STATE_ERROR:
             self._set_state(self.States.STATE_ERROR, force=True)
@@ -77,83 +100,37 @@ class Pump(Device, DeviceCallback):
         self.motor.run(forward, rot_per_sec or self.max_speed_rps)
 
     @device_command
-    def pump(self, volume: float, rot_per_sec: Optional[float] = None):
+    def pump(self, volume: float, rot_per_sec: Optional[float] = None) -> Future:
         """Pump certain amount of liquid
 
         Args:
             volume (float): amount that have to be pumped
             rot_per_sec (float, optional): Pumping speed in rotations per second. Defaults to None.
+
+        Returns:
+            Future: completed with the pumping duration when the motor stops
         """
         rotations = self.calculate_rotations(abs(volume))
         if volume < 0:
             rotations *= -1
-        if volume != 0:
-            if rot_per_sec is None:
-                rot_per_sec = self.max_speed_rps
-            self._set_state(self.States.STATE_WORKING)
-            self.motor.move(n_revolutions=rotations, revolution_per_second=rot_per_sec)
-
-    def calculate_rotations(self, volume):
-        # Get the coefficients for the given pumpId
-        # Convert the coefficients into a list of (rotations, coefficient) pairs and sort
-        points = self.points
-
-        # If volume is larger than the largest known, use the largest coefficient
-        if volume >= points[-1][0] * points[-1][1]:
-            return volume / points[-1][1]
-
-        # Find the two points surrounding the given volume
-        lower_point = points[0]
-        upper_point = points[-1]
-        for i in range(len(points) - 1):
-            if (
-                volume >= points[i][0] * points[i][1]
-                and volume <= points[i + 1][0] * points[i + 1][1]
-            ):
-                lower_point = points[i]
-                upper_point = points[i + 1]
-                break
-
-        # Calculate the interpolation factor
-        lower_volume = lower_point[0] * lower_point[1]
-        upper_volume = upper_point[0] * upper_point[1]
-        factor = (volume - lower_volume) / (upper_volume - lower_volume)
-
-        # Interpolate the coefficient
-        interpolated_coefficient = (
-            lower_point[1] + (upper_point[1] - lower_point[1]) * factor
+        if volume == 0:
+            return completed_motion()
+        if rot_per_sec is None:
+            rot_per_sec = self.max_speed_rps
+        self._set_state(self.States.STATE_WORKING)
+        self.motor.move(n_revolutions=rotations, revolution_per_second=rot_per_sec)
+        return self.motor.watch_motion(
+            self.motor.get_move_duration(rotations, rot_per_sec)
         )
 
-        # Calculate the rotations
-        rotations = volume / interpolated_coefficient
-
-        return rotations
+    def calculate_rotations(self, volume):
+        """Rotations required to pump the volume, accepts arrays"""
+        return self.calibration.rotations(volume)
 
     def calculate_volume(self, rotations):
-        coefficients = self.coefficients
-
-        if rotations <= min(coefficients.keys()):
-            correction_coefficient = coefficients[min(coefficients.keys())]
-        else:
-            for i in range(len(coefficients) - 1):
-                if (
-                    list(coefficients.keys())[i]
-                    <= rotations
-                    < list(coefficients.keys())[i + 1]
-                ):
-                    correction_coefficient = coefficients[
-                        list(coefficients.keys())[i]
-                    ] + (rotations - list(coefficients.keys())[i]) * (
-                        coefficients[list(coefficients.keys())[i + 1]]
-                        - coefficients[list(coefficients.keys())[i]]
-                    ) / (
-                        list(coefficients.keys())[i + 1] - list(coefficients.keys())[i]
-                    )
-                    break
-            else:
-                correction_coefficient = coefficients[max(coefficients.keys())]
-        volume = rotations * correction_coefficient
-        return round(volume, 2)
+        """Volume pumped by the rotations, accepts arrays"""
+        volume = self.calibration.volume(rotations)
+        return round(volume, 2) if isinstance(volume, float) else np.round(volume, 2)
 
     def test(self):
         return self.motor.test()
@@ -0,0 +1,138 @@
+from bisect import bisect_left
+from typing import Union
+
+import numpy as np
+
+ArrayLike = Union[float, np.ndarray, list[float]]
+
+
+class PumpCalibration:
+    """
+    Monotone mapping between pump motor rotations and pumped volume.
+
+    The calibration is kept as a table of strictly increasing (rotations, volume)
+    points starting at (0, 0), both directions are linear interpolations of the
+    table (O(log n), bisect for scalars and numpy for arrays) and beyond the last point the
+    volume per rotation of the last segment is used. Negative values (pumping
+    backwards) are mapped symmetrically. Scalars and arrays are accepted.
+    """
+
+    def __init__(self, rotations: ArrayLike, volumes: ArrayLike):
+        rotations = np.asarray(rotations, dtype=float)
+        volumes = np.asarray(volumes, dtype=float)
+        if rotations.shape != volumes.shape or rotations.ndim != 1:
+            raise ValueError("Rotations and volumes must be 1D arrays of equal size")
+        if len(rotations) == 0 or rotations[0] != 0.0:
+            rotations = np.concatenate(([0.0], rotations))
+            volumes = np.concatenate(([0.0], volumes))
+        if np.any(np.diff(rotations) <= 0) or np.any(np.diff(volumes) <= 0):
+            raise ValueError("Calibration must be strictly increasing")
+        self._rotations = rotations
+        self._volumes = volumes
+        self._slope = (volumes[-1] - volumes[-2]) / (rotations[-1] - rotations[-2])
+        # python lists are faster than numpy for scalar lookups
+        self._rotations_list = rotations.tolist()
+        self._volumes_list = volumes.tolist()
+
+    @property
+    def rotations_table(self) -> np.ndarray:
+        return self._rotations
+
+    @property
+    def volumes_table(self) -> np.ndarray:
+        return self._volumes
+
+    @classmethod
+    def from_coefficients(
+        cls, coefficients: dict[float, float], samples_per_segment: int = 32
+    ) -> "PumpCalibration":
+        """
+        Builds the table from volume per rotation coefficients measured at several
+        rotation counts, the coefficient is interpolated linearly between them and
+        constant outside of them
+        """
+        points = sorted(coefficients.items())
+        knots = np.array([rotations for rotations, _ in points], dtype=float)
+        values = np.array([coefficient for _, coefficient in points], dtype=float)
+        rotations = np.concatenate(
+            [
+                np.linspace(start, end, samples_per_segment, endpoint=False)
+                for start, end in zip(knots[:-1], knots[1:])
+            ]
+            # beyond the last knot the volume grows with the last coefficient
+            + [knots[-1:], 2 * knots[-1:]]
+        )
+        volumes = rotations * np.interp(rotations, knots, values)
+        return cls(rotations, volumes)
+
+    @classmethod
+    def fit(
+        cls, rotations: ArrayLike, volumes: ArrayLike, points: int = 64
+    ) -> "PumpCalibration":
+        """
+        Fits a monotone cubic spline (PCHIP) to measured (rotations, volume) pairs
+        and tabulates it, measurements at equal rotations are averaged and
+        measurements breaking the monotonicity are dropped
+        """
+        from scipy.interpolate import PchipInterpolator
+
+        rotations = np.asarray(rotations, dtype=float)
+        volumes = np.asarray(volumes, dtype=float)
+        keep = rotations > 0
+        rotations, inverse = np.unique(rotations[keep], return_inverse=True)
+        volumes = np.bincount(inverse, weights=volumes[keep]) / np.bincount(inverse)
+        rotations = np.concatenate(([0.0], rotations))
+        volumes = np.concatenate(([0.0], volumes))
+        increasing = np.concatenate(
+            ([True], volumes[1:] > np.maximum.accumulate(volumes)[:-1])
+        )
+        rotations, volumes = rotations[increasing], volumes[increasing]
+        if len(rotations) < 2:
+            raise ValueError("At least one increasing measurement is required")
+        grid = np.linspace(0.0, rotations[-1], max(points, len(rotations)))
+        return cls(grid, PchipInterpolator(rotations, volumes)(grid))
+
+    def volume(self, rotations: ArrayLike) -> ArrayLike:
+        """Volume pumped by the rotations"""
+        if isinstance(rotations, (int, float)):
+            return self._lookup_scalar(
+                rotations, self._rotations_list, self._volumes_list, self._slope
+            )
+        return self._lookup(rotations, self._rotations, self._volumes, self._slope)
+
+    def rotations(self, volume: ArrayLike) -> ArrayLike:
+        """Rotations required to pump the volume"""
+        if isinstance(volume, (int, float)):
+            return self._lookup_scalar(
+                volume, self._volumes_list, self._rotations_list, 1 / self._slope
+            )
+        return self._lookup(volume, self._volumes, self._rotations, 1 / self._slope)
+
+    @staticmethod
+    def _lookup_scalar(x: float, xp: list, fp: list, slope: float) -> float:
+        magnitude = abs(x)
+        if magnitude >= xp[-1]:
+            result = fp[-1] + (magnitude - xp[-1]) * slope
+        else:
+            i = max(bisect_left(xp, magnitude), 1)
+            result = fp[i - 1] + (magnitude - xp[i - 1]) * (fp[i] - fp[i - 1]) / (
+                xp[i] - xp[i - 1]
+            )
+        return -result if x < 0 else result
+
+    @staticmethod
+    def _lookup(x: ArrayLike, xp: np.ndarray, fp: np.ndarray, slope: float):
+        values = np.asarray(x, dtype=float)
+        magnitudes = np.abs(values)
+        result = np.interp(magnitudes, xp, fp)
+        beyond = magnitudes > xp[-1]
+        if np.any(beyond):
+            result = np.where(beyond, fp[-1] + (magnitudes - xp[-1]) * slope, result)
+        result = np.copysign(result, values)
+        return float(result) if result.ndim == 0 else result
+
+    def get_data(self):
+        return {
+            "rotations": self._rotations.tolist(),
+            "volumes": self._volumes.tolist(),
+        }
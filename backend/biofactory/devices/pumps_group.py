@@ -0,0 +1,100 @@
+from concurrent.futures import Future
+from typing import Iterable, Optional
+
+from biofactory.devices import Device, DeviceCallback, device_command
+from biofactory.devices.pump import Pump
+from biofactory.devices.valves_group import ValvesGroup
+from biofactory.drivers import HARDWARE_SESSION, Driver
+
+
+class PumpsInterlockError(Exception):
+    pass
+
+
+class PumpsGroup(Device):
+    """
+    Moves several pumps together. The moves are issued back to back to the
+    drivers and the returned motion futures are waited together.
+
+    simultaneous - sets of pump ids which are allowed to flow at the same time,
+    e.g. the inflow pumps of a reactor. If a valves group is given, simultaneous
+    flow also requires exactly one open valve, so the pumps can't be connected
+    to several reactors at once.
+    """
+
+    def __init__(
+        self,
+        pumps: list[Pump],
+        simultaneous: Iterable[Iterable[str]] = (),
+        valves_group: Optional[ValvesGroup] = None,
+        name: Optional[str] = None,
+        callback: Optional[DeviceCallback] = None,
+    ):
+        super().__init__(name or "Pumps Group", callback)
+        self.pumps = {pump.id: pump for pump in pumps}
+        self._simultaneous = [frozenset(group) for group in simultaneous]
+        self._valves_group = valves_group
+
+    def read_state(self):
+        for pump in self.pumps.values():
+            pump.read_state()
+
+    def __getitem__(self, key) -> Pump:
+        return self.pumps[key]
+
+    def check_interlocks(self, pump_ids: Iterable[str]):
+        """Raises PumpsInterlockError if the pumps must not flow together"""
+        pump_ids = set(pump_ids)
+        if len(pump_ids) < 2:
+            return
+        if not any(pump_ids <= group for group in self._simultaneous):
+            raise PumpsInterlockError(
+                f"Pumps {sorted(pump_ids)} are not allowed to run simultaneously"
+            )
+        if self._valves_group is not None:
+            open_valves = self._valves_group.get_fully_open_valves()
+            if len(open_valves) != 1:
+                raise PumpsInterlockError(
+                    f"Pumps {sorted(pump_ids)} can run simultaneously only with one"
+                    f" open valve, open valves: {[v.name for v in open_valves]}"
+                )
+
+    @device_command
+    def pump_volumes(
+        self, volumes: dict[str, float], rot_per_sec: Optional[float] = None
+    ) -> list[Future]:
+        """
+        Pumps the volumes by pump id simultaneously
+
+        Returns:
+            list[Future]: motion futures of the pumps
+        """
+        volumes = {
+            pump_id: volume for pump_id, volume in volumes.items() if volume != 0
+        }
+        self.check_interlocks(volumes)
+        started = {}
+        with HARDWARE_SESSION:
+            try:
+                for pump_id, volume in volumes.items():
+                    started[pump_id] = self.pumps[pump_id].pump(volume, rot_per_sec)
+            except Exception:
+                # the pumps already started must not flow alone
+                for pump_id in started:
+                    self._stop_pump(pump_id)
+                raise
+        return list(started.values())
+
+    def _stop_pump(self, pump_id: str):
+        try:
+            self.pumps[pump_id].stop()
+        except Exception as exc:
+            self._log.exception(f"Failed to stop {pump_id}: {exc}")
+
+    @device_command
+    def stop_all(self) -> list[Future]:
+        with HARDWARE_SESSION:
+            return [pump.stop() for pump in self.pumps.values()]
+
+    def get_drivers(self) -> list[Driver]:
+        return [driver for pump in self.pumps.values() for driver in pump.get_drivers()]
@@ -1,11 +1,14 @@
+from concurrent.futures import Future
 from dataclasses import dataclass
-from typing import Any, Optional
-
-import pandas as pd
+from typing import Any, Callable, Optional
 
 import biofactory.drivers.l6470h as l6470h
 from biofactory.devices import Device, DeviceCallback
+from biofactory.devices.motion import estimate_move_duration, motionWatcher
 from biofactory.util import BraceMessage as __
+from biofactory.util.module_loading import lazy_import
+
+pd = lazy_import("pandas")
 
 
 @dataclass
@@ -73,7 +76,12 @@ class Motor(Device):
         callback: Optional[DeviceCallback] = None,
         profile: Optional[MotorProfile] = None,
         name: str = "Motor",
+        busy_signal: Optional[Callable[[], bool]] = None,
     ):
+        """
+        busy_signal - optional cheap check of the driver BUSY pin (e.g. a FTDI GPIO),
+        the motion watcher uses it instead of reading the status over SPI
+        """
         profile = profile or MotorProfile()
         self.driver: l6470h.StepMotorDriver = driver
         super().__init__(name=name, callback=callback)
@@ -82,6 +90,7 @@ class Motor(Device):
             driver.max_steps_per_second / self.steps_per_revolution
         )
         self._profile = profile
+        self._busy_signal = busy_signal
 
     def is_moving(self):
         return self.driver.get_status().is_busy
@@ -220,6 +229,40 @@ class Motor(Device):
         self.driver.set_step_mode(suitable_step_mode)
         return self.driver.move(n_steps=n_microsteps, reverse=reversed)
 
+    def get_move_duration(
+        self, n_revolutions: float, revolution_per_second: Optional[float] = None
+    ) -> float:
+        """Expected duration in seconds of the move from the motor profile"""
+        return estimate_move_duration(
+            steps=n_revolutions * self.steps_per_revolution,
+            max_speed=(revolution_per_second or self._profile.max_speed_rps)
+            * self.steps_per_revolution,
+            acceleration=self._profile.acceleration,
+            deceleration=self._profile.deceleration,
+        )
+
+    def get_stop_duration(self) -> float:
+        """Expected duration in seconds of the soft stop from the max speed"""
+        if self._profile.deceleration <= 0:
+            return 0.0
+        return (
+            self._profile.max_speed_rps
+            * self.steps_per_revolution
+            / self._profile.deceleration
+        )
+
+    def watch_motion(self, expected_duration: float = 0.0) -> Future:
+        """Returns a future completed when the motor stops moving"""
+        return motionWatcher().watch(
+            self._name, self._is_motion_busy, expected_duration
+        )
+
+    def _is_motion_busy(self) -> bool:
+        if self._busy_signal is not None and self._busy_signal():
+            return True
+        # confirm over SPI, it also updates the motor state
+        return self.read_state() == self.States.STATE_WORKING
+
     def set_max_speed(self, revolutions_per_second: float):
         if revolutions_per_second > self.max_revolution_per_second:
             raise ValueError(
@@ -1,11 +1,11 @@
 import threading
-import time
 from enum import Enum
 from typing import Optional, Union
 
 import biofactory.drivers.pca9685 as pca9685
 from biofactory.devices import Device, DeviceCallback
 from biofactory.util import BraceMessage as __
+from biofactory.util import clock
 
 
 class Stirrer(Device):
@@ -65,14 +65,8 @@ class Stirrer(Device):
             return result
         raise ValueError("Speed should be in [0, 1, 2]")
 
-    def set_speed(self, speed: Union[float, int], accelerate=True):
-        self._log.debug(
-            __(
-                "enter set_speed(speed={speed}, accelerate={accelerate})",
-                speed=speed,
-                accelerate=accelerate,
-            )
-        )
+    def get_duty_cycle(self, speed: Union[float, int]) -> float:
+        """Converts speed (0, 1, 2 or a ratio) to a duty cycle in range [0.0, 1.0]"""
         if isinstance(speed, int):
             duty_cycle = self.speed_to_duty_cycle(speed)
         else:
@@ -87,14 +81,28 @@ class Stirrer(Device):
                 f"Duty cycle {duty_cycle} lower than range [0.0, 1.0]. Set to 0.0"
             )
             duty_cycle = 0.0
+        return duty_cycle
+
+    def needs_acceleration(self, duty_cycle: float) -> bool:
+        return 0 < duty_cycle < self.accelerate_threshold
+
+    def set_speed(self, speed: Union[float, int], accelerate=True):
+        self._log.debug(
+            __(
+                "enter set_speed(speed={speed}, accelerate={accelerate})",
+                speed=speed,
+                accelerate=accelerate,
+            )
+        )
+        duty_cycle = self.get_duty_cycle(speed)
         with self.lock:
-            if 0 < duty_cycle < self.accelerate_threshold and accelerate:
+            if self.needs_acceleration(duty_cycle) and accelerate:
                 self._log.debug(
                     f"Duty cycle {duty_cycle} lower than accelerate threshold {self.accelerate_threshold}. Accelerating."
                 )
                 self._set_speed(self.fast_speed)
                 self._log.debug(f"Wait {self.acceleration_delay} sec to accelerate")
-                time.sleep(self.acceleration_delay)
+                clock.sleep(self.acceleration_delay)
             self._set_speed(duty_cycle)
         self._log.debug("exit set_speed")
 
@@ -1,8 +1,9 @@
-import time
+from typing import Union
 
 from biofactory.devices import Device
 from biofactory.devices.stirrer import Stirrer
 from biofactory.drivers import Driver
+from biofactory.util import clock
 
 
 class StirrersGroup(Device):
@@ -20,17 +21,46 @@ class StirrersGroup(Device):
     #     self._stirrers[key].set_speed()
 
     def run_all(self, speed):
-        for stirrer in self._stirrers:
-            stirrer.set_speed(speed)
+        self.set_speeds({index: speed for index in range(len(self._stirrers))})
 
     def stop_all(self):
-        for stirrer in self._stirrers:
-            stirrer.set_speed(0.0)
+        self.set_speeds({index: 0.0 for index in range(len(self._stirrers))})
+
+    def set_speeds(self, speeds: dict[int, Union[float, int]], accelerate=True):
+        """
+        Sets speeds of several stirrers, the channels are written in one bus
+        transaction per PWM driver and accelerated together
+
+        Args:
+            speeds (dict[int, float | int]): stirrer index to speed
+        """
+        duty_cycles = {
+            self._stirrers[index]: self._stirrers[index].get_duty_cycle(speed)
+            for index, speed in speeds.items()
+        }
+        with Stirrer.lock:
+            accelerated = {
+                stirrer: stirrer.fast_speed
+                for stirrer, duty_cycle in duty_cycles.items()
+                if accelerate and stirrer.needs_acceleration(duty_cycle)
+            }
+            if accelerated:
+                self._write_duty_cycles(accelerated)
+                clock.sleep(max(s.acceleration_delay for s in accelerated))
+            self._write_duty_cycles(duty_cycles)
+
+    def _write_duty_cycles(self, duty_cycles: dict[Stirrer, float]):
+        drivers = {stirrer.driver for stirrer in duty_cycles}
+        for driver in drivers:
+            with driver.batch():
+                for stirrer, duty_cycle in duty_cycles.items():
+                    if stirrer.driver is driver:
+                        stirrer._set_speed(duty_cycle)
 
     def test(self):
         try:
             self.run_all(0.2)
-            time.sleep(2)
+            clock.sleep(2)
             self.stop_all()
             return True
         except Exception as e:
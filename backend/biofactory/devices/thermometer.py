@@ -4,6 +4,7 @@ from pyftdi.i2c import I2cNackError
 
 from biofactory.devices import Device, device_command
 from biofactory.drivers import Driver, ThermometerDriver
+from biofactory.metrics import I2C_NACKS
 
 
 class Thermometer(Device):
@@ -18,6 +19,7 @@ class Thermometer(Device):
         value = self.driver.read()
         self._last_value = value
         self._set_state(self.States.STATE_OPERATIONAL)
+        self._callback._on_device_measurement(self, {"temperature": value})
         return value
 
     def _test(self):
@@ -28,6 +30,7 @@ class Thermometer(Device):
             self.measure()
         except I2cNackError as exc:
             self._log.warning("Not acknowledge (NACK)")
+            I2C_NACKS.labels(self.id).inc()
             self._error = str(exc)
             self._set_state(self.States.STATE_ERROR)
         else:
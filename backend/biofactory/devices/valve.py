@@ -1,12 +1,12 @@
 import logging
 import math
-import time
 from enum import Enum
 from typing import Literal, Optional
 
 from biofactory.devices import Device, DeviceCallback
 from biofactory.drivers import Driver
 from biofactory.drivers.pca9685 import PWMDriver
+from biofactory.util import clock
 
 
 class Valve(Device):
@@ -64,7 +64,7 @@ class Valve(Device):
         self._set_state(self.States.STATE_OPENING)
         self._driver.set_duty_cycle(self._pwm_channel, self._open_duty_cycle)
         if wait:
-            time.sleep(self._change_state_delay)
+            clock.sleep(self._change_state_delay)
         self._is_open = True
         self._set_state(self.States.STATE_OPEN)
 
@@ -73,7 +73,7 @@ class Valve(Device):
         self._set_state(self.States.STATE_CLOSING)
         self._driver.set_duty_cycle(self._pwm_channel, self._closed_duty_cycle)
         if wait:
-            time.sleep(self._change_state_delay)
+            clock.sleep(self._change_state_delay)
         self._is_open = False
         self._set_state(self.States.STATE_CLOSE)
 
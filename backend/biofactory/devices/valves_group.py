@@ -2,6 +2,7 @@ from typing import Optional
 
 from biofactory.devices import Device, DeviceCallback
 from biofactory.devices.valve import Valve
+from biofactory.util import clock
 
 
 class ValvesGroup(Device):
@@ -27,13 +28,13 @@ class ValvesGroup(Device):
         self.valves[key].set_state(value)
 
     def get_fully_open_valves(self):
-        return [valve for valve in self.valves if valve.is_open]
+        return [valve for valve in self.valves if valve.is_open()]
 
     def get_fully_closed_valves(self):
-        return [valve for valve in self.valves if valve.is_close]
+        return [valve for valve in self.valves if valve.is_close()]
 
     def all_closed(self):
-        return all(valve.is_close for valve in self.valves)
+        return all(valve.is_close() for valve in self.valves)
 
     def not_all_closed(self):
         return not self.all_closed()
@@ -54,25 +55,37 @@ class ValvesGroup(Device):
     def set_state(self, index: int, value: bool):
         self.valves[index].set_state(value)
 
-    def open_all(self):
-        self._batch_open(self.valves)
+    def open_all(self, wait: bool = True):
+        self._batch_open(self.valves, wait)
 
-    def close_all(self):
-        self._batch_close(self.valves)
+    def close_all(self, wait: bool = True):
+        self._batch_close(self.valves, wait)
 
-    def close_all_except(self, excluded_index):
+    def close_all_except(self, excluded_index, wait: bool = True):
         filtered_valves = [
             valve for i, valve in enumerate(self.valves) if i != excluded_index
         ]
-        self._batch_close(filtered_valves)
+        self._batch_close(filtered_valves, wait)
 
-    def _batch_open(self, valves: list[Valve]):
-        for valve in valves:
-            valve.open()
+    def _batch_open(self, valves: list[Valve], wait: bool = True):
+        self._batch_change(valves, lambda valve: valve.open(wait=False), wait)
 
-    def _batch_close(self, valves: list[Valve]):
-        for valve in valves:
-            valve.close()
+    def _batch_close(self, valves: list[Valve], wait: bool = True):
+        self._batch_change(valves, lambda valve: valve.close(wait=False), wait)
+
+    def _batch_change(self, valves: list[Valve], change, wait: bool):
+        """
+        Moves the valves together: the channels are written in one bus transaction
+        per PWM driver and the valves are waited for once
+        """
+        drivers = {valve._driver for valve in valves}
+        for driver in drivers:
+            with driver.batch():
+                for valve in valves:
+                    if valve._driver is driver:
+                        change(valve)
+        if wait and valves:
+            clock.sleep(max(valve._change_state_delay for valve in valves))
 
     def get_drivers(self):
         return [valve._driver for valve in self.valves]
@@ -1,4 +1,6 @@
 import logging
+from collections.abc import Sized
+from contextlib import nullcontext
 from enum import Enum
 from threading import RLock
 from typing import Callable, Iterable, Optional, Union
@@ -9,12 +11,20 @@ from pyftdi.i2c import I2cPort as FtdiI2cPort
 from pyftdi.spi import SpiController as FtdiSpiController
 from pyftdi.spi import SpiPort as FtdiSpiPort
 
+from biofactory.drivers import bus_trace
+from biofactory.drivers.bus_trace import NO_REGISTER, busTrace
+from biofactory.metrics import BUS_BYTES, BUS_TRANSACTIONS
+from biofactory.tracing import tracer
 from biofactory.util import ArrayOfBytesAsInt
 from biofactory.util import BraceMessage as __
 
 HARDWARE_SESSION = RLock()
 
 
+def _length(data) -> int:
+    return len(data) if isinstance(data, Sized) else 0
+
+
 class HardwarePort:
 
     @property
@@ -25,6 +35,11 @@ class HardwarePort:
     def address(self):
         return 0
 
+    @property
+    def bus(self) -> Optional[str]:
+        """Name of the bus the port is on, commands on different buses can overlap"""
+        return None
+
     def read(self, readlen: int = 0, *args, **kwargs) -> bytes:
         pass
 
@@ -50,9 +65,10 @@ class HardwarePort:
 
 
 class LazyPort(HardwarePort):
-    def __init__(self, get_port: Callable[[], HardwarePort]):
+    def __init__(self, get_port: Callable[[], HardwarePort], bus: Optional[str] = None):
         self._get_port = get_port
         self._port = None
+        self._bus = bus
 
     @property
     def port(self):
@@ -62,6 +78,10 @@ class LazyPort(HardwarePort):
     def address(self):
         return self.port.address
 
+    @property
+    def bus(self):
+        return self._bus
+
     def exchange(
         self,
         out: Union[bytes, bytearray, Iterable[int]] = b"",
@@ -104,6 +124,10 @@ class I2cPort(FtdiI2cPort, HardwarePort):
         self._name = name
         self._registers = registers
         self.log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._transactions = BUS_TRANSACTIONS.labels("i2c", name)
+        self._bytes = BUS_BYTES.labels("i2c", name)
+        self._trace = busTrace()
+        self._trace_port = self._trace.register_port("i2c", name, address, registers)
 
     @property
     def address(self):
@@ -115,23 +139,59 @@ class I2cPort(FtdiI2cPort, HardwarePort):
         except KeyError:
             return "UNKNOWN"
 
+    def _count(self, length: int):
+        """Counts a transaction of ``length`` bytes on the bus, address included"""
+        self._transactions.inc()
+        self._bytes.inc(length)
+
+    def _span(self, operation: str, **attributes):
+        return tracer().span(
+            f"i2c.{operation}",
+            "bus",
+            port=self._name,
+            address=self._address,
+            **attributes,
+        )
+
+    def _trace_error(self, operation: int, regaddr: int, out, exc: Exception):
+        if self._trace.enabled:
+            self._trace.record_error(
+                self._trace_port, operation, regaddr, bytes(out), exc
+            )
+
     def read(self, readlen: int = 0, *args, **kwargs):
-        with self.session:
-            result = super().read(readlen, *args, **kwargs)
-            self.log.debug(
-                __(
-                    "R i2c: {port_name} (0x{port_addr:02X}) len: {readlen} data: [{data}]",
-                    port_name=self._name,
-                    port_addr=self._address,
-                    readlen=readlen,
-                    data=result.hex(" ").upper(),
+        with self.session, self._span("read", length=readlen):
+            self._count(readlen + 1)
+            try:
+                result = super().read(readlen, *args, **kwargs)
+            except Exception as exc:
+                self._trace_error(bus_trace.READ, NO_REGISTER, b"", exc)
+                raise
+            if self._trace.enabled:
+                self._trace.record(self._trace_port, bus_trace.READ, result=result)
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug(
+                    __(
+                        "R i2c: {port_name} (0x{port_addr:02X}) len: {readlen} data: [{data}]",
+                        port_name=self._name,
+                        port_addr=self._address,
+                        readlen=readlen,
+                        data=result.hex(" ").upper(),
+                    )
                 )
-            )
             return result
 
     def write(self, out: Union[bytes, bytearray, Iterable[int]], *args, **kwargs):
-        with self.session:
-            return super().write(out, *args, **kwargs)
+        with self.session, self._span("write"):
+            self._count(_length(out) + 1)
+            try:
+                result = super().write(out, *args, **kwargs)
+            except Exception as exc:
+                self._trace_error(bus_trace.WRITE, NO_REGISTER, out, exc)
+                raise
+            if self._trace.enabled:
+                self._trace.record(self._trace_port, bus_trace.WRITE, out=bytes(out))
+            return result
 
     def exchange(
         self,
@@ -140,41 +200,72 @@ class I2cPort(FtdiI2cPort, HardwarePort):
         *args,
         **kwargs,
     ) -> bytes:
-        with self.session:
-            return super().exchange(out, readlen, *args, **kwargs)
+        with self.session, self._span("exchange", length=readlen):
+            self._count(_length(out) + readlen + 2)
+            try:
+                result = super().exchange(out, readlen, *args, **kwargs)
+            except Exception as exc:
+                self._trace_error(bus_trace.EXCHANGE, NO_REGISTER, out, exc)
+                raise
+            if self._trace.enabled:
+                self._trace.record(
+                    self._trace_port, bus_trace.EXCHANGE, out=bytes(out), result=result
+                )
+            return result
 
     def write_to(
         self, regaddr: int, out: bytes | bytearray | Iterable[int], *args, **kwargs
     ):
-        with self.session:
-            self.log.debug(
-                __(
-                    "W i2c: {port_name} (0x{port_addr:02X}) reg: {regname} (0x{regaddr:02X}) data: {int_data} [{data}]",
-                    port_name=self._name,
-                    port_addr=self._address,
-                    regaddr=regaddr,
-                    regname=self.get_register_name(regaddr),
-                    int_data=ArrayOfBytesAsInt(out),
-                    data=bytearray(out).hex(" ").upper(),
+        with self.session, self._span("write_to", register=regaddr):
+            self._count(_length(out) + 2)
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug(
+                    __(
+                        "W i2c: {port_name} (0x{port_addr:02X}) reg: {regname} (0x{regaddr:02X}) data: {int_data} [{data}]",
+                        port_name=self._name,
+                        port_addr=self._address,
+                        regaddr=regaddr,
+                        regname=self.get_register_name(regaddr),
+                        int_data=ArrayOfBytesAsInt(out),
+                        data=bytearray(out).hex(" ").upper(),
+                    )
                 )
-            )
-            return super().write_to(regaddr, out, *args, **kwargs)
+            try:
+                result = super().write_to(regaddr, out, *args, **kwargs)
+            except Exception as exc:
+                self._trace_error(bus_trace.WRITE_TO, regaddr, out, exc)
+                raise
+            if self._trace.enabled:
+                self._trace.record(
+                    self._trace_port, bus_trace.WRITE_TO, regaddr, out=bytes(out)
+                )
+            return result
 
     def read_from(self, regaddr: int, readlen: int = 0, *args, **kwargs) -> bytes:
-        with self.session:
-            result = super().read_from(regaddr, readlen, *args, **kwargs)
-            self.log.debug(
-                __(
-                    "R i2c: {port_name} (0x{port_addr:02X}) reg: {regname} (0x{regaddr:02X}) len: {readlen} data: {int_data} [{data}]",
-                    port_name=self._name,
-                    port_addr=self._address,
-                    regaddr=regaddr,
-                    regname=self.get_register_name(regaddr),
-                    int_data=ArrayOfBytesAsInt(result),
-                    data=result.hex(" ").upper(),
-                    readlen=readlen,
+        with self.session, self._span("read_from", register=regaddr, length=readlen):
+            self._count(readlen + 3)
+            try:
+                result = super().read_from(regaddr, readlen, *args, **kwargs)
+            except Exception as exc:
+                self._trace_error(bus_trace.READ_FROM, regaddr, b"", exc)
+                raise
+            if self._trace.enabled:
+                self._trace.record(
+                    self._trace_port, bus_trace.READ_FROM, regaddr, result=result
+                )
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug(
+                    __(
+                        "R i2c: {port_name} (0x{port_addr:02X}) reg: {regname} (0x{regaddr:02X}) len: {readlen} data: {int_data} [{data}]",
+                        port_name=self._name,
+                        port_addr=self._address,
+                        regaddr=regaddr,
+                        regname=self.get_register_name(regaddr),
+                        int_data=ArrayOfBytesAsInt(result),
+                        data=result.hex(" ").upper(),
+                        readlen=readlen,
+                    )
                 )
-            )
             return result
 
 
@@ -204,14 +295,37 @@ class SpiPort(FtdiSpiPort, HardwarePort):
     ):
         super().__init__(controller=controller, cs=cs, **kwargs)
         self._name = name
+        self._transactions = BUS_TRANSACTIONS.labels("spi", name)
+        self._bytes = BUS_BYTES.labels("spi", name)
+        self._trace = busTrace()
+        self._trace_port = self._trace.register_port("spi", name, cs)
 
     @property
     def address(self):
         return self._cs
 
+    def _count(self, length: int):
+        self._transactions.inc()
+        self._bytes.inc(length)
+
+    def _span(self, operation: str, **attributes):
+        return tracer().span(
+            f"spi.{operation}", "bus", port=self._name, cs=self._cs, **attributes
+        )
+
+    def _trace_error(self, operation: int, out, exc: Exception):
+        if self._trace.enabled:
+            self._trace.record_error(
+                self._trace_port, operation, NO_REGISTER, bytes(out), exc
+            )
+
     def write(self, data: bytes | bytearray | Iterable[int], *args, **kwargs):
-        with self.session:
-            if kwargs.pop("log", True):
+        # log=False marks the single bytes of an exchange, traced by its span
+        write_log = kwargs.pop("log", True)
+        with self.session, self._span("write") if write_log else nullcontext():
+            # every write and read frames the bytes with the chip select
+            self._count(_length(data))
+            if write_log and self.log.isEnabledFor(logging.DEBUG):
                 self.log.debug(
                     __(
                         "W spi: {port_name} (CS{cs}) data: {int_data} [{data}]",
@@ -221,13 +335,29 @@ class SpiPort(FtdiSpiPort, HardwarePort):
                         data=bytearray(data).hex(" ").upper(),
                     )
                 )
-            return super().write(data, *args, **kwargs)
+            try:
+                result = super().write(data, *args, **kwargs)
+            except Exception as exc:
+                if write_log:
+                    self._trace_error(bus_trace.WRITE, data, exc)
+                raise
+            if write_log and self._trace.enabled:
+                self._trace.record(self._trace_port, bus_trace.WRITE, out=bytes(data))
+            return result
 
     def read(self, length: int, *args, **kwargs) -> bytes:
-        with self.session:
-            write_log = kwargs.pop("log", True)
-            result = super().read(length, *args, **kwargs)
-            if write_log:
+        write_log = kwargs.pop("log", True)
+        with self.session, self._span("read") if write_log else nullcontext():
+            self._count(length)
+            try:
+                result = super().read(length, *args, **kwargs)
+            except Exception as exc:
+                if write_log:
+                    self._trace_error(bus_trace.READ, b"", exc)
+                raise
+            if write_log and self._trace.enabled:
+                self._trace.record(self._trace_port, bus_trace.READ, result=result)
+            if write_log and self.log.isEnabledFor(logging.DEBUG):
                 self.log.debug(
                     __(
                         "R spi: {port_name} (CS{cs}) len: {length} data: {int_data} [{data}]",
@@ -247,31 +377,42 @@ class SpiPort(FtdiSpiPort, HardwarePort):
         *args,
         **kwargs,
     ) -> bytes:
-        with self.session:
-            self.log.debug(
-                __(
-                    "W spi: {port_name} (CS{cs}) data: {int_data} [{data}]",
-                    port_name=self._name,
-                    cs=self._cs,
-                    int_data=ArrayOfBytesAsInt(out),
-                    data=bytearray(out).hex(" ").upper(),
+        with self.session, self._span("exchange", length=readlen):
+            debug = self.log.isEnabledFor(logging.DEBUG)
+            if debug:
+                self.log.debug(
+                    __(
+                        "W spi: {port_name} (CS{cs}) data: {int_data} [{data}]",
+                        port_name=self._name,
+                        cs=self._cs,
+                        int_data=ArrayOfBytesAsInt(out),
+                        data=bytearray(out).hex(" ").upper(),
+                    )
                 )
-            )
-            if isinstance(out, Iterable):
-                for b in out:
-                    self.write(*args, [b], log=False, **kwargs)
-            else:
-                for b in range(len(out)):
-                    # start = b == 0
-                    # stop = readlen <= 0 and b == len(payload) - 1
-                    # self.spi_port.write(out=[payload[b]], start=start, stop=stop)
-                    self.write(*args, out=[out[b]], log=False, **kwargs)
             res = bytearray()
-            if readlen > 0:
-                for _b in range(readlen):
-                    # stop = b == readlen - 1
-                    # res += self.spi_port.read(readlen=1, start=False, stop=stop)
-                    res += self.read(*args, 1, log=False, **kwargs)
+            try:
+                if isinstance(out, Iterable):
+                    for b in out:
+                        self.write(*args, [b], log=False, **kwargs)
+                else:
+                    for b in range(len(out)):
+                        # start = b == 0
+                        # stop = readlen <= 0 and b == len(payload) - 1
+                        # self.spi_port.write(out=[payload[b]], start=start, stop=stop)
+                        self.write(*args, out=[out[b]], log=False, **kwargs)
+                if readlen > 0:
+                    for _b in range(readlen):
+                        # stop = b == readlen - 1
+                        # res += self.spi_port.read(readlen=1, start=False, stop=stop)
+                        res += self.read(*args, 1, log=False, **kwargs)
+            except Exception as exc:
+                self._trace_error(bus_trace.EXCHANGE, out, exc)
+                raise
+            if self._trace.enabled:
+                self._trace.record(
+                    self._trace_port, bus_trace.EXCHANGE, out=bytes(out), result=res
+                )
+            if readlen > 0 and debug:
                 self.log.debug(
                     __(
                         "Read from SPI (cs={cs}) {int_data} {data}",
@@ -299,6 +440,76 @@ class SpiController(FtdiSpiController):
         return self._spi_ports[cs]
 
 
+class RegisterCache:
+    """
+    Shadow copy of device registers which change only by the driver writes, lets
+    the driver skip redundant reads and writes. Volatile registers (status,
+    self-clearing bits) are never cached.
+    """
+
+    def __init__(self, volatile: Iterable[int] = ()):
+        self._values: dict[int, int] = {}
+        self._volatile = frozenset(volatile)
+
+    def get(self, regaddr: int, readlen: int = 1) -> Optional[bytes]:
+        """Returns cached bytes of the registers, None if any of them is unknown"""
+        try:
+            return bytes(self._values[regaddr + i] for i in range(readlen))
+        except KeyError:
+            return None
+
+    def get_register(self, regaddr: int) -> Optional[int]:
+        return self._values.get(regaddr)
+
+    def update(self, regaddr: int, data: Iterable[int]):
+        for i, value in enumerate(data):
+            if regaddr + i not in self._volatile:
+                self._values[regaddr + i] = value
+
+    def is_cached(self, regaddr: int, data: Iterable[int]) -> bool:
+        """True if the registers already hold the data"""
+        return all(
+            self._values.get(regaddr + i) == value and regaddr + i not in self._volatile
+            for i, value in enumerate(data)
+        )
+
+    def invalidate(self):
+        self._values.clear()
+
+
+def merge_register_writes(
+    values: dict[int, int],
+    max_gap: int = 0,
+    fill: Optional[Callable[[int], Optional[int]]] = None,
+) -> list[tuple[int, bytes]]:
+    """
+    Merges single register writes into bursts of consecutive registers for devices
+    with register address auto-increment. Gaps up to ``max_gap`` registers are
+    filled with ``fill(regaddr)`` values, a gap with an unknown value splits the
+    burst.
+
+    Returns:
+        list[tuple[int, bytes]]: start register and data of each burst
+    """
+    bursts = []
+    start = None
+    data = bytearray()
+    for regaddr in sorted(values):
+        if start is not None:
+            gap = range(start + len(data), regaddr)
+            gap_values = [fill(addr) if fill else None for addr in gap]
+            if len(gap) <= max_gap and None not in gap_values:
+                data.extend(gap_values)
+                data.append(values[regaddr])
+                continue
+            bursts.append((start, bytes(data)))
+        start = regaddr
+        data = bytearray([values[regaddr]])
+    if start is not None:
+        bursts.append((start, bytes(data)))
+    return bursts
+
+
 class Driver:
 
     def __init__(self, port: HardwarePort):
@@ -1,6 +1,5 @@
-import time
-
 from biofactory.drivers import HardwarePort, ThermometerDriver
+from biofactory.util import clock
 
 REGISTER_TEMPERATURE_VALUE = 0x00
 REGISTER_CONFIGURATION = 0x01
@@ -34,7 +33,7 @@ class ADT75Driver(ThermometerDriver):
     def read(self):
         with self.port.session:
             self.port.write([REGISTER_ONE_SHOT])
-            time.sleep(self.one_shot_delay)
+            clock.sleep(self.one_shot_delay)
             data = self.port.read_from(REGISTER_ONE_SHOT, TEMPERATURE_DATA_SIZE)
             digital_temp = int.from_bytes(data, "big", signed=True) >> NOT_A_VALUE_BITS
             celsius_temp = digital_temp * TEMPERATURE_RESOLUTION
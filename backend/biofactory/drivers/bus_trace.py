@@ -0,0 +1,243 @@
+"""
+Trace of the latest I2C/SPI transactions, enabled by the BIOFACTORY_BUS_TRACE=1
+environment variable or ``busTrace().enable()``.
+
+The ports record raw transactions (time, port, operation, register, bytes) into
+a preallocated ring buffer of fixed size records, nothing is formatted on the
+bus path. Records are decoded only when dumped. When a transaction fails the
+raw records preceding it are copied aside, so the traffic which led to a NACK
+can be inspected later even if the bus kept running.
+
+The ports record inside their hardware session, which serializes the
+transactions and so the writes to the buffer.
+"""
+
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+BUS_TRACE_ENV = "BIOFACTORY_BUS_TRACE"
+
+READ = 0
+WRITE = 1
+EXCHANGE = 2
+WRITE_TO = 3
+READ_FROM = 4
+OPERATIONS = ("read", "write", "exchange", "write_to", "read_from")
+
+NO_REGISTER = -1
+_ERROR = 0x80
+
+# time ns, port, operation (| error), register, written length, read length
+_HEADER = struct.Struct("<qHBhHH")
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def busTrace():
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = BusTrace()
+                if os.environ.get(BUS_TRACE_ENV, "").lower() in ("1", "true", "yes"):
+                    _instance.enable()
+    return _instance
+
+
+class TracedPort(NamedTuple):
+    bus: str
+    name: str
+    address: int
+    registers: dict[int, str]
+
+
+class ErrorDump(NamedTuple):
+    """Raw records preceding a failed transaction"""
+
+    time_ns: int
+    port: int
+    error: str
+    records: bytes
+
+
+class BusTrace:
+    """
+    capacity - count of the latest transactions kept
+    max_data - bytes of a transaction kept, longer transfers are truncated
+    dump_size - count of transactions copied aside when a transaction fails
+    """
+
+    def __init__(
+        self,
+        capacity: int = 4096,
+        max_data: int = 16,
+        dump_size: int = 32,
+        max_error_dumps: int = 16,
+    ):
+        self.enabled = False
+        self.capacity = capacity
+        self.max_data = max_data
+        self.dump_size = dump_size
+        self._record_size = _HEADER.size + max_data
+        self._buffer = bytearray(capacity * self._record_size)
+        self._written = 0
+        self._ports: list[TracedPort] = []
+        self._port_indexes: dict[tuple[str, str, int], int] = {}
+        self._ports_lock = threading.Lock()
+        self._error_dumps: deque[ErrorDump] = deque(maxlen=max_error_dumps)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._written = 0
+        self._error_dumps.clear()
+
+    def register_port(
+        self,
+        bus: str,
+        name: str,
+        address: int,
+        registers: Optional[dict[int, str]] = None,
+    ) -> int:
+        """Returns the index the port records its transactions with"""
+        key = (bus, name, address)
+        with self._ports_lock:
+            index = self._port_indexes.get(key)
+            if index is None:
+                index = self._port_indexes[key] = len(self._ports)
+                self._ports.append(TracedPort(bus, name, address, registers or {}))
+        return index
+
+    def record(
+        self,
+        port: int,
+        operation: int,
+        regaddr: int = NO_REGISTER,
+        out: bytes | bytearray = b"",
+        result: bytes | bytearray = b"",
+    ):
+        offset = (self._written % self.capacity) * self._record_size
+        _HEADER.pack_into(
+            self._buffer,
+            offset,
+            time.time_ns(),
+            port,
+            operation,
+            regaddr,
+            len(out),
+            len(result),
+        )
+        data = (bytes(out) + bytes(result))[: self.max_data]
+        start = offset + _HEADER.size
+        self._buffer[start : start + len(data)] = data
+        self._written += 1
+
+    def record_error(
+        self,
+        port: int,
+        operation: int,
+        regaddr: int,
+        out: bytes | bytearray,
+        exc: BaseException,
+    ):
+        """Records the failed transaction and copies aside the records up to it"""
+        self.record(port, operation | _ERROR, regaddr, out)
+        self._error_dumps.append(
+            ErrorDump(time.time_ns(), port, repr(exc), self._raw(self.dump_size))
+        )
+
+    def _raw(self, last: Optional[int] = None) -> bytes:
+        """Records oldest first"""
+        count = min(self._written, self.capacity)
+        if last is not None:
+            count = min(count, last)
+        end = self._written % self.capacity
+        start = end - count
+        size = self._record_size
+        if start >= 0:
+            return bytes(self._buffer[start * size : end * size])
+        return bytes(self._buffer[start * size :] + self._buffer[: end * size])
+
+    def _decode(self, raw: bytes) -> list[dict]:
+        transactions = []
+        for offset in range(0, len(raw), self._record_size):
+            time_ns, port, operation, regaddr, out_length, result_length = (
+                _HEADER.unpack_from(raw, offset)
+            )
+            start = offset + _HEADER.size
+            data = raw[start : start + min(out_length + result_length, self.max_data)]
+            traced_port = self._ports[port]
+            transaction = {
+                "time": time_ns / 1e9,
+                "bus": traced_port.bus,
+                "port": traced_port.name,
+                "address": traced_port.address,
+                "operation": OPERATIONS[operation & ~_ERROR],
+                "error": bool(operation & _ERROR),
+                "register": None,
+                "register_name": None,
+                "out": data[:out_length].hex(" ").upper(),
+                "result": data[out_length:].hex(" ").upper(),
+                "result_int": (
+                    int.from_bytes(data[out_length:], "big") if result_length else None
+                ),
+                "truncated": out_length + result_length > self.max_data,
+            }
+            if regaddr != NO_REGISTER:
+                transaction["register"] = regaddr
+                transaction["register_name"] = traced_port.registers.get(
+                    regaddr, "UNKNOWN"
+                )
+            transactions.append(transaction)
+        return transactions
+
+    def dump(self, last: Optional[int] = None) -> list[dict]:
+        """Decoded ``last`` transactions, oldest first"""
+        return self._decode(self._raw(last))
+
+    def get_error_dumps(self) -> list[dict]:
+        """Transactions preceding the latest failed transactions"""
+        return [
+            {
+                "time": dump.time_ns / 1e9,
+                "port": self._ports[dump.port].name,
+                "error": dump.error,
+                "transactions": self._decode(dump.records),
+            }
+            for dump in list(self._error_dumps)
+        ]
+
+    def format(self, last: Optional[int] = None) -> str:
+        """Dump as log lines"""
+        return "\n".join(_format_transaction(t) for t in self.dump(last))
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "transactions": self._written,
+            "capacity": self.capacity,
+            "errors": len(self._error_dumps),
+        }
+
+
+def _format_transaction(transaction: dict) -> str:
+    line = "{time:.6f} {bus}: {port} (0x{address:02X}) {operation}".format(
+        **transaction
+    )
+    if transaction["register"] is not None:
+        line += (
+            f" reg: {transaction['register_name']} (0x{transaction['register']:02X})"
+        )
+    line += f" out: [{transaction['out']}] in: [{transaction['result']}]"
+    if transaction["error"]:
+        line += " FAILED"
+    return line
@@ -134,9 +134,12 @@ class FtdiDriver(Driver):
             return LazyPort(
                 get_port=self.get_first_active_i2c_port_callback(
                     address, name, registers
-                )
+                ),
+                bus="i2c",
             )
-        return LazyPort(get_port=self.get_i2c_port_callback(address, name, registers))
+        return LazyPort(
+            get_port=self.get_i2c_port_callback(address, name, registers), bus="i2c"
+        )
 
     def get_i2c_port_callback(
         self, address: int, name: str, registers: Optional[dict[int, str]] = None
@@ -167,7 +170,9 @@ class FtdiDriver(Driver):
         freq: Optional[float] = None,
         mode: Optional[int] = None,
     ):
-        return LazyPort(get_port=self.get_spi_port_callback(name, cs, freq, mode))
+        return LazyPort(
+            get_port=self.get_spi_port_callback(name, cs, freq, mode), bus="spi"
+        )
 
     def get_spi_port_callback(
         self,
@@ -1,8 +1,9 @@
-import time
+import threading
 
 from biofactory.drivers import Driver, HardwarePort
 from biofactory.util import ArrayOfBytesAsInt
 from biofactory.util import BraceMessage as __
+from biofactory.util import clock
 
 # CONFIGURATION REGISTER
 # Bits:                         RDY | C1 | C0 | O/C | S1 | S0 | G1 | G0
@@ -10,59 +11,119 @@ from biofactory.util import BraceMessage as __
 # C1, C0 - These bits are not effected for the MCP3421
 
 
+BITRATE_TO_SAMPLES_PER_SECOND = {
+    # resolution: data rate (samples per secod)
+    12: 240,  # default
+    14: 60,
+    16: 15,
+    18: 3.75,
+}
+READY_BIT = 0b10000000
+
+
 class ADCDriver(Driver):
-    def __init__(self, port: HardwarePort) -> None:
+    def __init__(
+        self,
+        port: HardwarePort,
+        first_poll_ratio: float = 1.0,
+        poll_interval: float = 0.002,
+        poll_backoff: float = 1.5,
+    ) -> None:
+        """
+        :param first_poll_ratio: part of the conversion time to sleep before the first
+            ready bit poll
+        :param poll_interval: initial interval between ready bit polls in seconds
+        :param poll_backoff: multiplier of the poll interval after every not ready poll
+        """
         super().__init__(port=port)
         self._gain = 1
         self._bitrate = 12
         self._continous_conversion = True
+        self._configuration = None
+        self._lock = threading.RLock()
+        self.first_poll_ratio = first_poll_ratio
+        self.poll_interval = poll_interval
+        self.poll_backoff = poll_backoff
 
-    def measure(self, gain=8, bitrate=16, continuous_conversion=False):
-        self._log.debug(
-            f"enter measure(gain={gain}, bitrate={bitrate}, continuous_conversion={continuous_conversion})"
-        )
-        with self.port.session:
-            self.configure(
-                gain=gain, bitrate=bitrate, continuous_conversion=continuous_conversion
-            )
+    def init(self):
+        self.reset()
 
-            bitrate_to_samples_per_second = {
-                # resolution: data rate (samples per secod)
-                12: 240,  # default
-                14: 60,
-                16: 15,
-                18: 3.75,
-            }
-            new_data_is_ready = False
-            data = []
-            samples_per_second = bitrate_to_samples_per_second[bitrate]
-            seconds_per_sample = 1 / samples_per_second
-            for _ in range(100):  # try reading until conversion ready
-                self._log.debug(
-                    f"wait {seconds_per_sample:2f} seconds to complete sample"
-                )
-                time.sleep(seconds_per_sample)
+    def reset(self):
+        # the chip could be power cycled, so the cached configuration is unknown
+        self._configuration = None
 
-                data, config = self.read()
+    def measure(self, gain=8, bitrate=16, continuous_conversion=False, samples=1):
+        """
+        In one-shot mode every sample starts a new conversion by writing the
+        configuration. In continuous mode the configuration is written only when it
+        changes, the first conversion is dropped (it could have been started before
+        the input was switched) and the following ones are read as they get ready.
 
-                new_data_is_ready = (
-                    config[0] < 128
-                )  # if bit 7 (ready bit) is 1: NOT READY YET!
-                if new_data_is_ready:
-                    break
+        :param samples: number of averaged conversions
+        :return: (millivolts, error) where error is LSB for a single sample or the
+            standard deviation of the samples, but not less than LSB
+        """
+        self._log.debug(
+            f"enter measure(gain={gain}, bitrate={bitrate}, continuous_conversion={continuous_conversion}, samples={samples})"
+        )
+        if samples < 1:
+            raise ValueError(f"Samples count {samples} should be at least 1")
+        seconds_per_sample = 1 / BITRATE_TO_SAMPLES_PER_SECOND[bitrate]
+        values = []
+        with self._lock:
+            if continuous_conversion:
+                self.configure(
+                    gain=gain, bitrate=bitrate, continuous_conversion=True, force=False
+                )
+                self._wait_conversion(seconds_per_sample)
+            for _ in range(samples):
+                if not continuous_conversion:
+                    self.configure(
+                        gain=gain, bitrate=bitrate, continuous_conversion=False
+                    )
+                values.append(self._wait_conversion(seconds_per_sample))
 
-        assert new_data_is_ready
-        # TODO: replace to bit operators
-        digital_signal = int.from_bytes(data, "big", signed=True)
         lsb_mv = (
             2 * 2.048 / 2**bitrate * 1000 / gain
         )  # least significant bit millivolts
-        millivolts = lsb_mv * digital_signal
+        millivolts = lsb_mv * sum(values) / samples
         millivolts = round(millivolts, 10)
-        self._log.debug(f"exit measure return total: {millivolts} mv, LSB: {lsb_mv} mv")
-        return millivolts, lsb_mv
+        error = lsb_mv
+        if samples > 1:
+            variance = sum((value * lsb_mv - millivolts) ** 2 for value in values)
+            error = max((variance / (samples - 1)) ** 0.5, lsb_mv)
+        self._log.debug(
+            f"exit measure return total: {millivolts} mv, error: {error} mv, LSB: {lsb_mv} mv"
+        )
+        return millivolts, error
+
+    def _wait_conversion(self, seconds_per_sample: float) -> int:
+        """
+        Sleeps for the expected conversion time and then polls the ready bit
+        with a growing interval
+        :return: converted digital value
+        """
+        deadline = clock.monotonic() + 3 * seconds_per_sample + 0.1
+        clock.sleep(seconds_per_sample * self.first_poll_ratio)
+        interval = self.poll_interval
+        while True:
+            data, config = self.read()
+            if not config[0] & READY_BIT:
+                return int.from_bytes(data, "big", signed=True)
+            if clock.monotonic() > deadline:
+                raise TimeoutError(
+                    f"ADC 0x{self.port.address:02X} conversion is not ready"
+                )
+            clock.sleep(interval)
+            interval = min(interval * self.poll_backoff, seconds_per_sample / 4)
 
-    def configure(self, gain=8, bitrate=16, continuous_conversion=False):
+    def configure(
+        self, gain=8, bitrate=16, continuous_conversion=False, force: bool = True
+    ):
+        """
+        :param force: write the configuration even if the chip already has it, in
+            one-shot mode the write starts a conversion
+        """
         # RDY bit
         ready_bit = 0b10000000  # start conversion in one-shot mode
         # O/C bit
@@ -88,8 +149,11 @@ class ADCDriver(Driver):
         configuration = (
             ready_bit | conversion_mode_bit | bitrate_bits[bitrate] | gain_bits[gain]
         )
+        if not force and configuration == self._configuration:
+            return
         with self.port.session:
             self.write(configuration)
+            self._configuration = configuration
             self._gain = gain
             self._bitrate = bitrate
             self._continous_conversion = continuous_conversion
@@ -107,9 +171,10 @@ class ADCDriver(Driver):
 
     def read(self):
         with self.port.session:
-            response = self.port.read(4)  # read 4 bytes from ADC
-            data = response[:3] if self._bitrate == 18 else response[:2]
-            config = response[3:]
+            # data bytes (3 for 18 bit resolution, 2 otherwise) and configuration
+            response = self.port.read(4 if self._bitrate == 18 else 3)
+            data = response[:-1]
+            config = response[-1:]
             self._log.debug(
                 __(
                     "R i2c: ADC 0x{port_addr:02X} configuration: b{config:08b} ({config}) value: {value} [{hex_value}] data: [{hex_data}]",
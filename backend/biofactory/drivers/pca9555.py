@@ -110,6 +110,8 @@ class IOPortDriver(Driver):
         self.reset()
 
     def reset(self):
+        # output register could be changed by a power cycle, read it again
+        self._output_value = None
         self.write_config(self._config)
 
     @property
@@ -126,10 +128,11 @@ class IOPortDriver(Driver):
 
     @property
     def output_value(self):
+        """Output register value, read once and then shadowed by the writes"""
         with self.port.session:
-            # if self._output_value is None:
-            data = self.read_from(REGISTER_OUTPUT_PORT_0, 2)
-            self._output_value = int.from_bytes(data, "little")
+            if self._output_value is None:
+                data = self.read_from(REGISTER_OUTPUT_PORT_0, 2)
+                self._output_value = int.from_bytes(data, "little")
             return self._output_value
 
     @output_value.setter
@@ -194,10 +197,11 @@ class IOPortDriver(Driver):
         with self.port.session:
             value = value & 0xFF
             self.write_to(REGISTER_OUTPUT_PORT_0, value.to_bytes(1, "little"))
+            # the other port is unknown until the register is read
             self._output_value = (
-                value
+                None
                 if self._output_value is None
-                else (self._output_value & 0xFF) + value
+                else (self._output_value & 0xFF00) | value
             )
 
     def write_h(self, value: int):
@@ -205,9 +209,9 @@ class IOPortDriver(Driver):
             value = value & 0xFF
             self.write_to(REGISTER_OUTPUT_PORT_1, value.to_bytes(1, "little"))
             self._output_value = (
-                (value << 8)
+                None
                 if self._output_value is None
-                else (self._output_value & 0xFF00) + (value << 8)
+                else (self._output_value & 0xFF) | (value << 8)
             )
 
     def _changebit(self, bitmap, bit: int, value: int):
@@ -227,17 +231,50 @@ class IOPortDriver(Driver):
             raise ValueError(
                 f"Pin {pin} at i2c address 0x{self.port.address:02X} is configed as INPUT"
             )
-        new_value = self._changebit(self.output_value, pin, value)
-        if self._log.isEnabledFor(logging.DEBUG):
-            value_with_selected_pin = binary_with_bracket(new_value, pin)
-            self._log.debug(
-                f"Write pin {pin} at i2c address 0x{self.port.address:02X} value: {value_with_selected_pin}"
-            )
-        if pin <= 7:
-            self.write_to(REGISTER_OUTPUT_PORT_0, [new_value & 0xFF])
-        else:
-            self.write_to(REGISTER_OUTPUT_PORT_1, [new_value >> 8])
-        self._output_value = new_value
+        with self.port.session:
+            new_value = self._changebit(self.output_value, pin, value)
+            if new_value == self._output_value:
+                return
+            if self._log.isEnabledFor(logging.DEBUG):
+                value_with_selected_pin = binary_with_bracket(new_value, pin)
+                self._log.debug(
+                    f"Write pin {pin} at i2c address 0x{self.port.address:02X} value: {value_with_selected_pin}"
+                )
+            if pin <= 7:
+                self.write_to(REGISTER_OUTPUT_PORT_0, [new_value & 0xFF])
+            else:
+                self.write_to(REGISTER_OUTPUT_PORT_1, [new_value >> 8])
+            self._output_value = new_value
+
+    def write_pins(self, pins: dict[int, int]):
+        """
+        Change several output pins with a single register write
+
+        Args:
+            pins(dict[int, int]): pin (0-15) to value (0 = off ; 1 = on)
+        """
+        config = self.config
+        for pin in pins:
+            if config >> pin & 1 == PIN_INPUT:
+                raise ValueError(
+                    f"Pin {pin} at i2c address 0x{self.port.address:02X} is configed as INPUT"
+                )
+        with self.port.session:
+            new_value = self.output_value
+            for pin, value in pins.items():
+                new_value = self._changebit(new_value, pin, value)
+            if self._log.isEnabledFor(logging.DEBUG):
+                self._log.debug(
+                    f"Write pins {list(pins)} at i2c address 0x{self.port.address:02X} value: {new_value:016b}"
+                )
+            changed = new_value ^ self._output_value
+            if changed & 0xFF and changed >> 8:
+                self.write_to(REGISTER_OUTPUT_PORT_0, new_value.to_bytes(2, "little"))
+            elif changed & 0xFF:
+                self.write_to(REGISTER_OUTPUT_PORT_0, [new_value & 0xFF])
+            elif changed >> 8:
+                self.write_to(REGISTER_OUTPUT_PORT_1, [new_value >> 8])
+            self._output_value = new_value
 
     def read_pin(self, pin: int):
         if self.config >> pin & 1 == PIN_OUTPUT:
@@ -1,8 +1,14 @@
-import time
-from typing import Union
-
-from biofactory.drivers import Driver, HardwarePort
+from contextlib import contextmanager
+from typing import Optional, Union
+
+from biofactory.drivers import (
+    Driver,
+    HardwarePort,
+    RegisterCache,
+    merge_register_writes,
+)
 from biofactory.util import BraceMessage as __
+from biofactory.util import clock
 
 REGISTER_MODE_1 = 0x00
 REGISTER_MODE_2 = 0x01
@@ -62,6 +68,11 @@ def value_high(value):
     return (value >> 8) & 0xFF
 
 
+def get_led_on_registers(led_num: int) -> tuple[int, int]:
+    low_address = LED_STRIP_START_REGADR + (led_num * 4)
+    return low_address, low_address + 1
+
+
 def get_led_off_registers(led_num: int) -> tuple[int, int]:
     """Calculate register number for LED pin
     :param led_num: the led number, typically 0-15
@@ -76,6 +87,12 @@ class PWMDriver(Driver):
 
     def __init__(self, port: HardwarePort) -> None:
         super().__init__(port=port)
+        # MODE1 has self-clearing bits, ALL_LED registers always read as zero
+        self._cache = RegisterCache(
+            volatile=[REGISTER_MODE_1, REGISTER_ALL_LED_ON_L, REGISTER_ALL_LED_ON_H]
+        )
+        self._auto_increment = False
+        self._batch: Optional[dict[int, int]] = None
 
     def init(self):
         self.reset()
@@ -85,9 +102,12 @@ class PWMDriver(Driver):
             self._log.debug(
                 __("enter reset(frequency={frequency})", frequency=frequency)
             )
+            self._cache.invalidate()
             self.set_frequency(frequency)
             self._write_to_register(REGISTER_ALL_LED_ON_L, [0])
             self._write_to_register(REGISTER_ALL_LED_ON_H, [0])
+            for led_number in range(LED_STRIP_COUNT):
+                self._cache.update(get_led_on_registers(led_number)[0], [0, 0])
             self.start_all()
             self._log.debug("exit reset")
 
@@ -95,13 +115,14 @@ class PWMDriver(Driver):
         with self.port.session:
             self._log.debug("enter software_reset")
             self._write_to_register(REGISTER_MODE_1, [0])  # reset
+            self._cache.invalidate()
             self._log.debug("exit software_reset")
 
     def sleep_mode(self):
         with self.port.session:
             self._log.debug("enter sleep_mode")
             self._write_to_register(
-                REGISTER_MODE_1, [MODE1_SLEEP_BIT | MODE1_ALLCALL_BIT]
+                REGISTER_MODE_1, [MODE1_SLEEP_BIT | MODE1_AI_BIT | MODE1_ALLCALL_BIT]
             )
             self._log.debug("exit sleep_mode")
 
@@ -109,7 +130,7 @@ class PWMDriver(Driver):
         with self.port.session:
             self._log.debug("enter restart_mode")
             self._write_to_register(
-                REGISTER_MODE_1, [MODE1_RESTART_BIT | MODE1_ALLCALL_BIT]
+                REGISTER_MODE_1, [MODE1_RESTART_BIT | MODE1_AI_BIT | MODE1_ALLCALL_BIT]
             )
             self._log.debug("exit restart_mode")
 
@@ -149,8 +170,11 @@ class PWMDriver(Driver):
             )
             check_range(RANGE_LED_NUMBER, led_number)
             led_off_l, led_off_h = get_led_off_registers(led_number)
-            lsbr = self._read_from_register(led_off_l, 1)[0]
-            msbr = self._read_from_register(led_off_h, 1)[0]
+            if self._auto_increment:
+                lsbr, msbr = self._read_from_register(led_off_l, 2)
+            else:
+                lsbr = self._read_from_register(led_off_l, 1)[0]
+                msbr = self._read_from_register(led_off_h, 1)[0]
             duty_cycle_read = (
                 (msbr & 0xF) << 8 | lsbr
             ) / LED_MAX_VALUE  # keep only first 4 bits of MSBR
@@ -176,17 +200,47 @@ class PWMDriver(Driver):
             check_range((0, 1), duty_cycle)
             value = round(LED_MAX_VALUE * duty_cycle)
             led_off_l, led_off_h = get_led_off_registers(led_number)
-            self._write_to_register(led_off_l, [value_low(value)])
-            self._write_to_register(led_off_h, [value_high(value)])
+            self._write_registers(
+                {led_off_l: value_low(value), led_off_h: value_high(value)}
+            )
             self._log.debug("exit set_duty_cycle")
 
+    def set_duty_cycles(self, duty_cycles: dict[int, float]):
+        """Set duty cycles of several channels in one bus transaction
+
+        Args:
+            duty_cycles (dict[int, float]): PWM channel (0-15) to duty cycle (0-1)
+        """
+        with self.batch():
+            for led_number, duty_cycle in duty_cycles.items():
+                self.set_duty_cycle(led_number, duty_cycle)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collects the duty cycle changes made inside the context and writes them at
+        exit, consecutive channels are written in a single auto-increment burst
+        """
+        with self.port.session:
+            if self._batch is not None:
+                # nested batch, the outer one writes
+                yield
+                return
+            self._batch = {}
+            try:
+                yield
+                values = self._batch
+            finally:
+                self._batch = None
+            self._write_registers(values)
+
     def stop_all(self):
         """
         Stop all PWM signals.
         """
         with self.port.session:
             self._write_to_register(
-                REGISTER_MODE_1, [MODE1_SLEEP_BIT | MODE1_ALLCALL_BIT]
+                REGISTER_MODE_1, [MODE1_SLEEP_BIT | MODE1_AI_BIT | MODE1_ALLCALL_BIT]
             )
 
     def start_all(self):
@@ -196,11 +250,11 @@ class PWMDriver(Driver):
         with self.port.session:
             self._log.debug("enter start_all")
             self._write_to_register(
-                REGISTER_MODE_1, [MODE1_ALLCALL_BIT]
+                REGISTER_MODE_1, [MODE1_AI_BIT | MODE1_ALLCALL_BIT]
             )  # sleep mode off
-            time.sleep(OSCILLATOR_STABILIZE_TIME)
+            clock.sleep(OSCILLATOR_STABILIZE_TIME)
             self._write_to_register(
-                REGISTER_MODE_1, [MODE1_RESTART_BIT | MODE1_ALLCALL_BIT]
+                REGISTER_MODE_1, [MODE1_RESTART_BIT | MODE1_AI_BIT | MODE1_ALLCALL_BIT]
             )
             self._log.debug("exit start_all")
 
@@ -214,11 +268,47 @@ class PWMDriver(Driver):
             mode1_register = self._read_from_register(REGISTER_MODE_1, 1)[0]
             return mode1_register & MODE1_SLEEP_BIT > 0
 
+    def _write_registers(self, values: dict[int, int]):
+        if self._batch is not None:
+            self._batch.update(values)
+            return
+        changed = {
+            regaddr: value
+            for regaddr, value in values.items()
+            if not self._cache.is_cached(regaddr, [value])
+        }
+        if not changed:
+            return
+        if self._auto_increment:
+            # ON registers between OFF registers of neighbour channels are known
+            bursts = merge_register_writes(
+                changed, max_gap=2, fill=self._cache.get_register
+            )
+        else:
+            bursts = merge_register_writes(changed)
+        for regaddr, data in bursts:
+            self._write_to_register(regaddr, data)
+
     def _write_to_register(
         self, regaddr: int, data: Union[bytes, bytearray, list[int]]
     ):
+        if self._cache.is_cached(regaddr, data):
+            return
+        if not self._auto_increment and len(data) > 1:
+            for i, value in enumerate(data):
+                self._write_to_register(regaddr + i, [value])
+            return
         self.port.write_to(regaddr=regaddr, out=data)
+        self._cache.update(regaddr, data)
+        if regaddr == REGISTER_MODE_1:
+            self._auto_increment = bool(data[0] & MODE1_AI_BIT)
 
     def _read_from_register(self, regaddr: int, readlen: int = 0) -> bytes:
+        cached = self._cache.get(regaddr, readlen)
+        if cached is not None:
+            return cached
         result = self.port.read_from(regaddr=regaddr, readlen=readlen)
+        self._cache.update(regaddr, result)
+        if regaddr == REGISTER_MODE_1:
+            self._auto_increment = bool(result[0] & MODE1_AI_BIT)
         return result
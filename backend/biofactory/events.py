@@ -4,8 +4,11 @@ import logging
 import queue
 import re
 import threading
+import time
 from multiprocessing import RLock
 
+from biofactory.util import clock
+
 _instance = None
 _instance_lock = RLock()
 
@@ -135,9 +138,105 @@ def eventManager():
     return _instance
 
 
+class _Coalesced:
+    """Queue marker of a coalesced event, the payload is taken when dispatched"""
+
+    __slots__ = ("event",)
+
+    def __init__(self, event):
+        self.event = event
+
+
+class ListenerStats:
+    __slots__ = ("calls", "total_time", "max_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def add(self, duration):
+        self.calls += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "mean_latency": self.total_time / self.calls if self.calls else 0.0,
+            "max_latency": self.max_time,
+        }
+
+
+class ListenerWorker:
+    """
+    Dispatches events to the listeners assigned to it in its own thread, so a slow
+    listener doesn't stall the others. When ``max_queue_size`` events are queued,
+    a further coalesced event drops the oldest queued coalesced event, a later
+    payload supersedes it anyway. Other events, e.g. experiment status changes,
+    are never dropped.
+    """
+
+    def __init__(self, name, dispatch, max_queue_size=100, coalesced_events=()):
+        self.name = name
+        self.dropped = 0
+        self._dispatch = dispatch
+        self._max_queue_size = max_queue_size
+        self._coalesced_events = coalesced_events
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._thread = threading.Thread(
+            target=self._loop, name=f"EventListenerWorker-{name}"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, listener, event, payload):
+        with self._condition:
+            if (
+                event in self._coalesced_events
+                and len(self._queue) >= self._max_queue_size
+            ):
+                self._drop_oldest_coalesced()
+            self._queue.append((listener, event, payload))
+            self._condition.notify()
+
+    def _drop_oldest_coalesced(self):
+        for index, item in enumerate(self._queue):
+            if item is not None and item[1] in self._coalesced_events:
+                del self._queue[index]
+                self.dropped += 1
+                return
+
+    def stop(self):
+        with self._condition:
+            self._queue.append(None)
+            self._condition.notify()
+
+    def qsize(self):
+        return len(self._queue)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    with clock.blocking():
+                        self._condition.wait()
+                item = self._queue.popleft()
+            if item is None:
+                return
+            self._dispatch(*item)
+
+
 class EventManager:
     """
     Handles receiving events and dispatching them to subscribers
+
+    Events without subscribers are dropped once the startup event has been fired.
+    Coalesced events (e.g. queue size updates) are queued at most once, the
+    listeners receive the latest payload. Listeners subscribed with a ``worker``
+    name are called from that worker's thread instead of the event loop.
     """
 
     def __init__(self):
@@ -151,6 +250,25 @@ class EventManager:
         self._queue = queue.Queue()
         self._held_back = queue.Queue()
 
+        self._coalesced_events = {
+            Events.COMMAND_QUEUE_UPDATED,
+            Events.SEND_QUEUE_UPDATED,
+        }
+        self._coalesced_payloads = {}
+        self._coalesce_lock = threading.Lock()
+
+        self._listener_workers = {}
+        self._listener_worker_names = {}
+        """Worker names by (event, callback)"""
+        self._workers_lock = threading.RLock()
+
+        self._started = time.monotonic()
+        # fired from any thread, the stats are updated by the listener workers too
+        self._stats_lock = threading.Lock()
+        self._fired = collections.Counter()
+        self._skipped = collections.Counter()
+        self._listener_stats = collections.defaultdict(ListenerStats)
+
         self._worker = threading.Thread(target=self._event_manager_loop)
         self._worker.daemon = True
         self._worker.start()
@@ -158,7 +276,12 @@ class EventManager:
     def _event_manager_loop(self):
         try:
             while not self._shutdown_signaled:
-                event, payload = self._queue.get(True)
+                with clock.blocking():
+                    event, payload = self._queue.get(True)
+                if isinstance(event, _Coalesced):
+                    with self._coalesce_lock:
+                        event = event.event
+                        payload = self._coalesced_payloads.pop(event, None)
                 if event == Events.SHUTDOWN:
                     # we've got the shutdown event here, stop event loop processing after this has been processed
                     self._logger.info(
@@ -166,23 +289,37 @@ class EventManager:
                     )
                     self._shutdown_signaled = True
 
-                eventListeners = self._registeredListeners[event]
+                eventListeners = list(self._registeredListeners.get(event, ()))
                 self._logger_fire.debug(f"Firing event: {event} (Payload: {payload!r})")
 
                 for listener in eventListeners:
-                    self._logger.debug(f"Sending action to {listener!r}")
-                    try:
-                        listener(event, payload)
-                    except Exception:
-                        self._logger.exception(
-                            "Got an exception while sending event {} (Payload: {!r}) to {}".format(
-                                event, payload, listener
-                            )
-                        )
+                    worker = self._listener_workers.get(
+                        self._listener_worker_names.get((event, listener))
+                    )
+                    if worker is not None:
+                        worker.put(listener, event, payload)
+                    else:
+                        self._call_listener(listener, event, payload)
             self._logger.info("Event loop shut down")
         except Exception:
             self._logger.exception("Ooops, the event bus worker loop crashed")
 
+    def _call_listener(self, listener, event, payload):
+        self._logger.debug(f"Sending action to {listener!r}")
+        started = time.perf_counter()
+        try:
+            listener(event, payload)
+        except Exception:
+            self._logger.exception(
+                "Got an exception while sending event {} (Payload: {!r}) to {}".format(
+                    event, payload, listener
+                )
+            )
+        finally:
+            duration = time.perf_counter() - started
+            with self._stats_lock:
+                self._listener_stats[_listener_name(listener)].add(duration)
+
     def fire(self, event, payload=None):
         """
         Fire an event to anyone subscribed to it
@@ -200,7 +337,22 @@ class EventManager:
             self._startup_signaled = True
             send_held_back = True
 
-        self._enqueue(event, payload)
+        skipped = (
+            self._startup_signaled
+            and not self._registeredListeners.get(event)
+            and event != Events.SHUTDOWN
+        )
+        with self._stats_lock:
+            self._fired[event] += 1
+            if skipped:
+                self._skipped[event] += 1
+        if skipped:
+            # nobody listens, don't bother the event loop
+            pass
+        elif event in self._coalesced_events:
+            self._enqueue_coalesced(event, payload)
+        else:
+            self._enqueue(event, payload)
 
         if send_held_back:
             self._logger.info(
@@ -221,15 +373,43 @@ class EventManager:
 
         q.put((event, payload))
 
-    def subscribe(self, event, callback):
+    def _enqueue_coalesced(self, event, payload):
+        with self._coalesce_lock:
+            pending = event in self._coalesced_payloads
+            self._coalesced_payloads[event] = payload
+        if not pending:
+            self._enqueue(_Coalesced(event), None)
+
+    def register_coalesced_event(self, event):
+        """
+        Makes the event "latest value wins": while it waits in the queue further
+        fires only replace its payload
+        """
+        self._coalesced_events.add(event)
+
+    def subscribe(self, event, callback, worker=None, max_queue_size=100):
         """
         Subscribe a listener to an event -- pass in the event name (as a string) and the callback object
+
+        Listeners with the same ``worker`` name are called in order from a dedicated thread,
+        which drops the oldest coalesced events beyond ``max_queue_size`` queued events.
         """
 
         if callback in self._registeredListeners[event]:
             # callback is already subscribed to the event
             return
 
+        if worker is not None:
+            with self._workers_lock:
+                if worker not in self._listener_workers:
+                    self._listener_workers[worker] = ListenerWorker(
+                        worker,
+                        self._call_listener,
+                        max_queue_size=max_queue_size,
+                        coalesced_events=self._coalesced_events,
+                    )
+                self._listener_worker_names[(event, callback)] = worker
+
         self._registeredListeners[event].append(callback)
         self._logger.debug(f"Subscribed listener {callback!r} for event {event}")
 
@@ -244,11 +424,55 @@ class EventManager:
             # not registered
             pass
 
+        with self._workers_lock:
+            worker = self._listener_worker_names.pop((event, callback), None)
+            if (
+                worker is not None
+                and worker not in self._listener_worker_names.values()
+            ):
+                self._listener_workers.pop(worker).stop()
+
+    def get_stats(self):
+        """
+        Returns event rates, queue sizes and per listener call latencies (seconds)
+        """
+        uptime = time.monotonic() - self._started
+        with self._stats_lock:
+            fired_by_event = dict(self._fired)
+            skipped = sum(self._skipped.values())
+            listeners = {
+                name: stats.as_dict() for name, stats in self._listener_stats.items()
+            }
+        fired = sum(fired_by_event.values())
+        return {
+            "uptime": uptime,
+            "events_fired": fired,
+            "events_per_second": fired / uptime if uptime else 0.0,
+            "events_skipped": skipped,
+            "queue_size": self._queue.qsize(),
+            "fired": fired_by_event,
+            "listeners": listeners,
+            "workers": {
+                name: {"queue_size": worker.qsize(), "dropped": worker.dropped}
+                for name, worker in list(self._listener_workers.items())
+            },
+        }
+
+    def backlog(self):
+        """Count of events waiting in the queue and in the listener worker queues"""
+        with self._workers_lock:
+            workers = list(self._listener_workers.values())
+        return self._queue.qsize() + sum(worker.qsize() for worker in workers)
+
     def join(self, timeout=None):
         self._worker.join(timeout)
         return self._worker.is_alive()
 
 
+def _listener_name(listener):
+    return getattr(listener, "__qualname__", None) or repr(listener)
+
+
 class GenericEventListener:
     """
     The GenericEventListener can be subclassed to easily create custom event listeners.
@@ -1,13 +1,31 @@
 import logging
 import threading
+from concurrent.futures import CancelledError, Future
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from enum import Enum
 from threading import Thread
 from typing import Optional
 
+from biofactory.checkpoint import (
+    BEGIN,
+    CYCLE,
+    CYCLE_COMPLETE,
+    END,
+    OPERATION,
+    STARTED,
+    CheckpointLog,
+    CheckpointState,
+)
 from biofactory.events import Events, eventManager
 from biofactory.machine import BaseMachine
-from biofactory.util import interrupteble_sleep
+from biofactory.machine.aio import AsyncMachine, eventLoop
+from biofactory.metrics import (
+    EXPERIMENT_CYCLE_DURATION,
+    EXPERIMENT_CYCLE_TIME,
+    EXPERIMENT_CYCLES_TOO_LONG,
+)
+from biofactory.util import clock, interrupteble_sleep
 from biofactory.util.module_loading import import_string
 
 
@@ -50,6 +68,8 @@ class Experiment:
         self._cycles_max = 100
         self._cycleTime = 60.0
         self._warmupEnabled = True
+        self._resumeDelay = 0.0
+        self._checkpoint: Optional[CheckpointLog] = None
         self._lock = threading.RLock()
         self._status = ExperimentStatuses.READY
         self._experiment_callback = experiment_callback or ExperimentCallback()
@@ -78,6 +98,53 @@ class Experiment:
             "class": self.get_class_fullname(),
         }
 
+    def attach_checkpoint(self, checkpoint: CheckpointLog):
+        """Records the progress of the experiment to the checkpoint log"""
+        self._checkpoint = checkpoint
+
+    def detach_checkpoint(self):
+        """Stops recording, the experiment stays restorable from its log"""
+        checkpoint, self._checkpoint = self._checkpoint, None
+        if checkpoint is not None:
+            checkpoint.close()
+
+    def _write_checkpoint(self, record: dict):
+        checkpoint = self._checkpoint
+        if checkpoint is not None:
+            checkpoint.append(record)
+
+    def checkpoint_state(self) -> dict:
+        """
+        State to save with every cycle and operation, JSON serializable. Given
+        back to ``restore_state`` when the experiment is restored.
+        """
+        return {}
+
+    def restore_state(self, state: dict):
+        pass
+
+    def recover_operation(self, name: str, data: dict):
+        """Called on restore for an operation which began and did not end"""
+        self._log.warning(f"Operation {name} {data} was interrupted")
+
+    @contextmanager
+    def checkpoint_operation(self, key: str, name: str, **data):
+        """Records the operation, so an interrupted one is recovered on restore"""
+        self._write_checkpoint(
+            {"type": OPERATION, "phase": BEGIN, "key": key, "name": name, "data": data}
+        )
+        try:
+            yield
+        finally:
+            self._write_checkpoint(
+                {
+                    "type": OPERATION,
+                    "phase": END,
+                    "key": key,
+                    "state": self.checkpoint_state(),
+                }
+            )
+
     def interrupteble_sleep(self, timeout: float):
         interrupteble_sleep(timeout, self._abort)
 
@@ -90,8 +157,11 @@ class Experiment:
                 raise Exception("Experiment is already running")
             self._log.info("Starting experiment")
             self._set_status(ExperimentStatuses.STARTING)
-            self._startTime = datetime.now(timezone.utc)
+            self._startTime = clock.now(timezone.utc)
             self._thread = Thread(target=self._experiment_loop, args=({},), daemon=True)
+            self._write_checkpoint(
+                {"type": STARTED, "time": self._startTime.isoformat()}
+            )
             eventManager().fire(
                 Events.EXPERIMENT_STARTED, payload={"time": self._startTime}
             )
@@ -107,10 +177,37 @@ class Experiment:
             self._warmupEnabled = False
             self._thread = Thread(target=self._experiment_loop, args=({},), daemon=True)
             eventManager().fire(
-                Events.EXPERIMENT_RESTORED, payload={"time": datetime.now(timezone.utc)}
+                Events.EXPERIMENT_RESTORED, payload={"time": clock.now(timezone.utc)}
             )
             self._thread.start()
 
+    def restore_checkpoint(self, checkpoint: CheckpointState):
+        """
+        Resumes the experiment where its checkpoint log ends, without warming up.
+        An interrupted cycle runs again, after a completed cycle the experiment
+        waits for the rest of the cycle time.
+        """
+        if checkpoint.start_time is not None:
+            self._startTime = datetime.fromisoformat(checkpoint.start_time)
+        self.restore_state(checkpoint.state)
+        for key, operation in list(checkpoint.operations.items()):
+            self.recover_operation(operation["name"], operation["data"])
+            self._write_checkpoint(
+                {
+                    "type": OPERATION,
+                    "phase": END,
+                    "key": key,
+                    "state": self.checkpoint_state(),
+                }
+            )
+        if checkpoint.cycle_complete:
+            cycle_num = checkpoint.cycle
+            self._resumeDelay = checkpoint.cycle_time + self._cycleTime - clock.time()
+        else:
+            cycle_num = max(checkpoint.cycle - 1, 0)
+        self._log.info(f"Restoring experiment at cycle {cycle_num + 1}")
+        self.restore(cycle_num)
+
     def stop(self):
         with self._lock:
             if self.is_interrupted():
@@ -124,7 +221,7 @@ class Experiment:
                         self._abort.set()
                         eventManager().fire(
                             Events.EXPERIMENT_CANCELLING,
-                            payload={"time": datetime.now(timezone.utc)},
+                            payload={"time": clock.now(timezone.utc)},
                         )
                         self._machine.cancel_long_operation()
                         aborting_thread.join()
@@ -132,7 +229,7 @@ class Experiment:
                         self._log.info("Experiment cancelled")
                         eventManager().fire(
                             Events.EXPERIMENT_CANCELLED,
-                            payload={"time": datetime.now(timezone.utc)},
+                            payload={"time": clock.now(timezone.utc)},
                         )
                     except Exception as exc:
                         self._log.exception(exc)
@@ -153,10 +250,20 @@ class Experiment:
         self._set_status(ExperimentStatuses.RUNING)
         if self._warmupEnabled:
             self.warmup()
+        if self._resumeDelay > 0:
+            self.interrupteble_sleep(self._resumeDelay)
         while not self.is_interrupted():
-            start_cycle_time = datetime.now()
+            start_cycle_time = clock.now()
             self._cycles += 1
             self._log.info(f"Cycle {self._cycles} started")
+            self._write_checkpoint(
+                {
+                    "type": CYCLE,
+                    "cycle": self._cycles,
+                    "time": start_cycle_time.timestamp(),
+                    "state": self.checkpoint_state(),
+                }
+            )
             eventManager().fire(
                 Events.EXPERIMENT_NEW_CYCLE,
                 payload={"time": start_cycle_time, "cycle": self._cycles},
@@ -168,7 +275,7 @@ class Experiment:
                 eventManager().fire(
                     Events.EXPERIMENT_FAILED,
                     payload={
-                        "time": datetime.now(timezone.utc),
+                        "time": clock.now(timezone.utc),
                         "message": error_message,
                     },
                 )
@@ -177,15 +284,19 @@ class Experiment:
             if self.success_condition(**routine_result):
                 break
 
+            self._write_checkpoint({"type": CYCLE_COMPLETE, "cycle": self._cycles})
             eventManager().fire(
                 Events.EXPERIMENT_CYCLE_COMPLETE,
-                payload={"time": datetime.now(timezone.utc), "cycle": self._cycles},
+                payload={"time": clock.now(timezone.utc), "cycle": self._cycles},
             )
 
-            end_cycle_time = datetime.now()
+            end_cycle_time = clock.now()
             elapsed_time = end_cycle_time - start_cycle_time
             sleep_time = self._cycleTime - elapsed_time.total_seconds()
+            EXPERIMENT_CYCLE_TIME.set(self._cycleTime)
+            EXPERIMENT_CYCLE_DURATION.observe(elapsed_time.total_seconds())
             if sleep_time < 0:
+                EXPERIMENT_CYCLES_TOO_LONG.inc()
                 eventManager().fire(
                     Events.EXPERIMENT_CYCLE_TOO_LONG_WARNING,
                     payload={
@@ -198,10 +309,13 @@ class Experiment:
                 self.interrupteble_sleep(sleep_time)
 
         self.cooldown()
-        self._endTime = datetime.now(timezone.utc)
+        self._endTime = clock.now(timezone.utc)
         eventManager().fire(Events.EXPERIMENT_DONE, payload={"time": self._endTime})
         if self._status != ExperimentStatuses.FAILED:
             self._set_status(ExperimentStatuses.DONE)
+        checkpoint = self._checkpoint
+        if checkpoint is not None:
+            checkpoint.finish(self._status)
         self._thread = None
         self._log.info("Experiment loop end")
 
@@ -231,6 +345,39 @@ class Experiment:
         self._experiment_callback._on_experiment_status_change(self.status())
 
 
+class AsyncExperiment(Experiment):
+    """
+    Experiment with a coroutine routine, run on the shared event loop. The
+    routine awaits the machine commands through ``self._aio`` and any number of
+    concurrent waits (timers, growth timeouts) without a thread each. Stopping
+    the experiment cancels the routine and the operations it awaits.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._aio = AsyncMachine(self._machine)
+        self._routine_future: Optional[Future] = None
+
+    async def async_routine(self):
+        return {}
+
+    def routine(self):
+        self._routine_future = eventLoop().submit(self.async_routine())
+        try:
+            with clock.blocking():
+                return self._routine_future.result()
+        except CancelledError:
+            return {}
+        finally:
+            self._routine_future = None
+
+    def stop(self):
+        super().stop()
+        routine_future = self._routine_future
+        if routine_future is not None:
+            routine_future.cancel()
+
+
 class ExperimentRegistry:
 
     def __init__(self):
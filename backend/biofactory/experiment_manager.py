@@ -1,12 +1,22 @@
 import logging
+import os
 import threading
 from typing import Optional
 
+from biofactory.checkpoint import (
+    CHECKPOINT_SUFFIX,
+    CheckpointLog,
+    CheckpointState,
+    load_checkpoints,
+)
 from biofactory.events import Events, eventManager
-from biofactory.experiment import Experiment, ExperimentCallback
+from biofactory.experiment import Experiment, ExperimentCallback, ExperimentStatuses
 from biofactory.machine import BaseMachine
+from biofactory.machine.process import RemoteExperiment, RemoteMachine
 from biofactory.machine_manager import machineManager
+from biofactory.server import settings
 from biofactory.util import get_short_uuid
+from biofactory.util.module_loading import import_string
 
 _instance = None
 
@@ -19,6 +29,11 @@ def experimentManager():
 
 
 class ExperimentManager(ExperimentCallback):
+    """
+    Experiments of the server. Every experiment writes a checkpoint log to the
+    experiments folder, the experiments which did not finish are loaded from
+    their logs at startup and restored when their machine connects.
+    """
 
     class NamedExperimentCallback(ExperimentCallback):
         def __init__(self, experiment_id):
@@ -28,17 +43,49 @@ class ExperimentManager(ExperimentCallback):
             state.update({"experiment_id": self._experiment_id})
             eventManager().fire(Events.EXPERIMENT_STATUS_CHANGE, state)
 
-    def __init__(self):
+    def __init__(self, checkpoint_folder: Optional[str] = None):
         self._log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
         self._experiments = {}
         self._lock = threading.RLock()
+        self._checkpoint_folder = (
+            checkpoint_folder
+            or settings().folder.experiments
+            or os.path.abspath("experiments")
+        )
+        # experiments of the checkpoint logs waiting for their machine
+        self._restorable: dict[str, CheckpointState] = {}
+        for experiment_id, checkpoint in load_checkpoints(
+            self._checkpoint_folder
+        ).items():
+            if checkpoint.machine is None:
+                # can't tell which machine the experiment ran on
+                self._log.warning(
+                    f"Experiment {experiment_id} has no machine, not restored"
+                )
+                continue
+            self._restorable[experiment_id] = checkpoint
+        eventManager().subscribe(Events.MACHINE_CONNECTED, self._on_machine_connected)
 
     def get_states(self):
         with self._lock:
-            return {
+            states = {
                 experiment_id: experiment.status()
                 for experiment_id, (experiment, _) in self._experiments.items()
             }
+            for experiment_id, checkpoint in self._restorable.items():
+                states[experiment_id] = {
+                    "id": experiment_id,
+                    "cycles": checkpoint.cycle,
+                    "status": ExperimentStatuses.RESTORING,
+                    "class": checkpoint.experiment_class,
+                    "machine": checkpoint.machine,
+                }
+            return states
+
+    def _checkpoint_path(self, experiment_id: str) -> str:
+        return os.path.join(
+            self._checkpoint_folder, f"{experiment_id}{CHECKPOINT_SUFFIX}"
+        )
 
     def get_state(self, experiment_id: str):
         with self._lock:
@@ -50,30 +97,57 @@ class ExperimentManager(ExperimentCallback):
     def start_experiment(
         self,
         experiment_class: type[Experiment],
-        machine: Optional[BaseMachine] = None,
+        machine: Optional[BaseMachine | RemoteMachine | str] = None,
         *args,
         **kwargs,
     ):
+        """``machine`` is a machine or the serial number of a connected machine"""
         with self._lock:
-            machine = machine or machineManager().get_machine()
+            if machine is None or isinstance(machine, str):
+                machine = machineManager().get_machine(machine)
             if machine is None:
                 raise ValueError("No machine available")
             if not machine.isIdle():
                 raise ValueError("Machine is not ready to start experiment")
 
-            while (experiment_id := get_short_uuid()) in self._experiments:
+            while (
+                experiment_id := get_short_uuid()
+            ) in self._experiments or experiment_id in self._restorable:
                 self._log.debug(
                     f"Generated experiment id {experiment_id} is already in use, generating another one"
                 )
 
-            callback = self.NamedExperimentCallback(experiment_id)
-            experiment = experiment_class(
-                *args,
-                machine=machine,
-                experiment_callback=callback,
-                id=experiment_id,
-                **kwargs,
-            )
+            if isinstance(machine, RemoteMachine):
+                # runs in the worker process of the machine, which reports the
+                # status changes and the experiment events
+                callback = None
+                experiment = RemoteExperiment(
+                    machine,
+                    experiment_class,
+                    experiment_id,
+                    *args,
+                    checkpoint_path=self._checkpoint_path(experiment_id),
+                    **kwargs,
+                )
+            else:
+                callback = self.NamedExperimentCallback(experiment_id)
+                experiment = experiment_class(
+                    *args,
+                    machine=machine,
+                    experiment_callback=callback,
+                    id=experiment_id,
+                    **kwargs,
+                )
+                experiment.attach_checkpoint(
+                    CheckpointLog.create(
+                        self._checkpoint_path(experiment_id),
+                        experiment_id,
+                        experiment_class,
+                        machine.serial,
+                        args,
+                        kwargs,
+                    )
+                )
 
             self._experiments[experiment_id] = (experiment, callback)
             experiment.start()
@@ -110,6 +184,53 @@ class ExperimentManager(ExperimentCallback):
             self._log.info(f"Resumed experiment {experiment_id}")
             return experiment.status()
 
+    def _on_machine_connected(self, event, machine):
+        serial = machine.serial
+        if serial is None:
+            return
+        with self._lock:
+            for experiment_id, checkpoint in list(self._restorable.items()):
+                if checkpoint.machine == serial:
+                    del self._restorable[experiment_id]
+                    try:
+                        self._restore_experiment(experiment_id, checkpoint, machine)
+                    except Exception:
+                        self._log.exception(
+                            f"Could not restore experiment {experiment_id}"
+                        )
+
+    def _restore_experiment(
+        self,
+        experiment_id: str,
+        checkpoint: CheckpointState,
+        machine: BaseMachine | RemoteMachine,
+    ):
+        experiment_class = import_string(checkpoint.experiment_class)
+        path = self._checkpoint_path(experiment_id)
+        if isinstance(machine, RemoteMachine):
+            callback = None
+            experiment = RemoteExperiment(
+                machine, experiment_class, experiment_id, checkpoint_path=path
+            )
+            experiment.restore()
+        else:
+            callback = self.NamedExperimentCallback(experiment_id)
+            checkpoint_log = CheckpointLog.open(path)
+            experiment = experiment_class(
+                *checkpoint_log.state.args,
+                machine=machine,
+                experiment_callback=callback,
+                id=experiment_id,
+                **checkpoint_log.state.kwargs,
+            )
+            experiment.attach_checkpoint(checkpoint_log)
+            experiment.restore_checkpoint(checkpoint_log.state)
+        self._experiments[experiment_id] = (experiment, callback)
+        self._log.info(
+            f"Restored experiment {experiment_class.get_name()} ({experiment_id}) "
+            f"at cycle {checkpoint.cycle}"
+        )
+
     def _get_experiment(self, experiment_id: str) -> Experiment:
         experiment, _ = self._experiments.get(experiment_id, (None, None))
         return experiment
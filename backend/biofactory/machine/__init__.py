@@ -2,18 +2,27 @@ import inspect
 import logging
 import queue
 import threading
+import time
 from collections import OrderedDict
 from enum import Enum
 from inspect import signature
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Iterable, Optional
 
 from usb.core import Device as UsbDevice
 
 from biofactory.devices import Device, DeviceCallback
 from biofactory.drivers.ft2232h import FtdiDriver
 from biofactory.events import Events, eventManager
+from biofactory.machine.futures import CommandFuture
+from biofactory.machine.scheduler import (
+    OperationScheduler,
+    Priority,
+    ScheduledOperation,
+)
+from biofactory.metrics import COMMAND_DURATION, COMMAND_QUEUE_DEPTH
+from biofactory.tracing import traced, tracer
 from biofactory.usb_manager import usbManager
-from biofactory.util import StateMixin, slugify
+from biofactory.util import StateMixin, clock, slugify
 from biofactory.util.module_loading import import_string
 
 # class ReactorCommand:
@@ -47,6 +56,10 @@ class Reactor:
     def __str__(self):
         return f"Reactor {self._num}"
 
+    @property
+    def num(self) -> int:
+        return self._num
+
     @property
     def state(self):
         return self._state
@@ -86,7 +99,8 @@ class Reactor:
         for attr_name in dir(self):
             attr = getattr(self, attr_name)
             if callable(attr) and getattr(attr, "is_reactor_command", False):
-                args = inspect.getfullargspec(attr).args[1:]
+                # commands are wrapped for tracing, list the arguments of the method
+                args = inspect.getfullargspec(inspect.unwrap(attr)).args[1:]
                 command_info[attr_name] = args
                 # command_info[attr_name] = list(signature(attr).parameters.keys())
         return command_info
@@ -112,6 +126,7 @@ class CommandExecutor:
         )
         self._thread.start()
         self._log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        COMMAND_QUEUE_DEPTH.labels(self._name).set_function(self._command_queue.qsize)
 
     @property
     def name(self):
@@ -119,42 +134,64 @@ class CommandExecutor:
 
     def _command_executor_loop(self):
         while not self._stop_event.is_set():
-            try:
-                command, result_queue, executed = self._command_queue.get()
-                result = self._execute_callback(command)
-                if result_queue:
-                    result_queue.put(result)
-            except queue.Empty:
-                continue
-            except Exception as exc:
-                self._log.exception(exc)
-                if result_queue:
-                    result_queue.put(exc)
+            with clock.blocking():
+                command, future, trace = self._command_queue.get()
+            if self._stop_event.is_set():
+                break
+            if future is None or future.set_running_or_notify_cancel():
+                try:
+                    with tracer().resume(trace, executor=self._name):
+                        result = self._execute_callback(command)
+                except Exception as exc:
+                    self._log.exception(exc)
+                    if future is not None:
+                        future.set_exception(exc)
+                else:
+                    if future is not None:
+                        future.set_result(result)
             self._command_queue.task_done()
-            if executed:
-                executed.set()
         self._log.info(f"Closing {self.name} loop")
 
     def _execute(self, command):
         raise NotImplementedError()
 
+    def submit(self, command) -> CommandFuture:
+        """Queues the command, returns the future of its result"""
+        future = CommandFuture()
+        self._command_queue.put((command, future, tracer().capture()))
+        return future
+
     def queue_command_and_wait(self, command, timeout=None):
-        result_queue = queue.Queue()
-        executed = threading.Event()
-        self._command_queue.put((command, result_queue, executed))
-        executed.wait(timeout=timeout)
-        result = result_queue.get()
+        """
+        Returns the result of the command, or the exception it raised. Raises
+        TimeoutError if it did not complete in time, a queued command is dropped.
+        """
+        future = CommandFuture.from_pool()
+        self._command_queue.put((command, future, tracer().capture()))
+        if not clock.wait(future, timeout=timeout):
+            future.cancel()
+            raise TimeoutError(f"Command {command} of {self._name} timed out")
+        result = future.outcome()
+        future.recycle()
         return result
 
     def queue_command_no_wait(self, command):
-        self._command_queue.put((command, None, None))
+        self._command_queue.put((command, None, tracer().capture()))
 
     def stop(self):
         self._stop_event.set()
+        # wakes up the loop waiting for a command
+        self._command_queue.put((None, None, None))
         self._thread.join()
+        COMMAND_QUEUE_DEPTH.remove(self._name)
 
     def cancel_current_commands(self):
-        self._command_queue.queue.clear()
+        with self._command_queue.mutex:
+            commands = list(self._command_queue.queue)
+            self._command_queue.queue.clear()
+        for _, future, _ in commands:
+            if future is not None:
+                future.cancel()
 
 
 class DeviceManager:
@@ -167,6 +204,10 @@ class DeviceManager:
         self._high_priority_executor = CommandExecutor(
             name="HighPriorityExecutor", execute_callback=self._execute_command
         )
+        # commands of devices on different buses don't wait for each other
+        self._bus_executors: dict[str, CommandExecutor] = {}
+        self._device_buses: dict[str, Optional[str]] = {}
+        self._executors_lock = threading.Lock()
         self._log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
         self._commands_info = {}
 
@@ -180,6 +221,7 @@ class DeviceManager:
                 raise ValueError(f"Device {device.id} already exists")
             self._devices[device.id] = device
             self._drivers.update(device.get_drivers())
+            self._device_buses[device.id] = self._get_device_bus(device)
             self._commands_info[device.id] = device.get_commands_info()
 
     def initialize_devices(self):
@@ -204,9 +246,7 @@ class DeviceManager:
         no_wait = kwargs.pop("no_wait", False)
         high_priority = kwargs.pop("high_priority", False)
         timeout = kwargs.pop("timeout", None)
-        executor = (
-            self._high_priority_executor if high_priority else self._command_executor
-        )
+        executor = self._get_device_executor(device_id, high_priority)
         command_tuple = (device_id, command, args, kwargs)
         if no_wait:
             executor.queue_command_no_wait(command_tuple)
@@ -214,13 +254,68 @@ class DeviceManager:
         else:
             return executor.queue_command_and_wait(command_tuple, timeout=timeout)
 
+    def submit(
+        self, device_id, command, *args, high_priority=False, **kwargs
+    ) -> CommandFuture:
+        """
+        Queues the device command and returns the future of its result, e.g. to
+        wait for the commands of several devices with ``futures.wait_all``
+        """
+        executor = self._get_device_executor(device_id, high_priority)
+        return executor.submit((device_id, command, args, kwargs))
+
+    def _get_device_executor(self, device_id, high_priority=False) -> CommandExecutor:
+        if high_priority:
+            return self._high_priority_executor
+        return self._get_executor(self._device_buses.get(device_id))
+
+    @staticmethod
+    def _get_device_bus(device: Device) -> Optional[str]:
+        """Returns the bus of all device drivers, None if it uses several buses"""
+        buses = {
+            getattr(getattr(driver, "port", None), "bus", None)
+            for driver in device.get_drivers()
+        }
+        return buses.pop() if len(buses) == 1 else None
+
+    def stop(self):
+        """Stops the command executors, commands can't be executed afterwards"""
+        with self._executors_lock:
+            executors = [
+                self._command_executor,
+                self._high_priority_executor,
+                *self._bus_executors.values(),
+            ]
+        for executor in executors:
+            executor.stop()
+
+    def _get_executor(self, bus: Optional[str]) -> CommandExecutor:
+        if bus is None:
+            return self._command_executor
+        with self._executors_lock:
+            executor = self._bus_executors.get(bus)
+            if executor is None:
+                executor = CommandExecutor(
+                    name=f"{bus.capitalize()}CommandExecutor",
+                    execute_callback=self._execute_command,
+                )
+                self._bus_executors[bus] = executor
+            return executor
+
     def _execute_command(self, command):
         device_id, command, args, kwargs = command
         device = self._devices.get(device_id)
         if device is None:
             raise ValueError(f"Device {device_id} not found")
         method = getattr(device, command)
-        return method(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            with tracer().span(f"{device_id}.{command}", "device"):
+                return method(*args, **kwargs)
+        finally:
+            COMMAND_DURATION.labels(device_id, command).observe(
+                time.perf_counter() - started
+            )
 
 
 class MachineCallback:
@@ -233,6 +328,9 @@ class MachineCallback:
     def _on_machine_send_current_data(self, data, *args, **kwargs):
         pass
 
+    def _on_machine_add_measurements(self, reactor, values, timestamp, *args, **kwargs):
+        pass
+
 
 class ConnectionAdapterCallbacks:
     def _on_conn_state_change(self, state):
@@ -264,6 +362,12 @@ class ConnectionAdapter:
     def disconnect(self, *args, **kwargs):
         raise NotImplementedError()
 
+    @property
+    def serial_number(self) -> Optional[str]:
+        """Serial number of the connected USB device"""
+        usb_device = getattr(self, "_usb_device", None)
+        return usb_device.serial_number if usb_device is not None else None
+
     def get_device_info(self, *args, **kwargs):
         raise NotImplementedError()
 
@@ -341,6 +445,11 @@ class FtdiConnectionAdapter(ConnectionAdapter):
             finally:
                 self._set_state(self.States.STATE_DISCONNECTED)
 
+    @property
+    def serial_number(self) -> Optional[str]:
+        # kept while reconnecting, the device is found again by it
+        return self._serial
+
     def get_device_info(self, *args, **kwargs):
         if self._usb_device is None:
             return {}
@@ -393,17 +502,92 @@ class FtdiConnectionAdapter(ConnectionAdapter):
             self._usb_device = None
 
 
-def machine_command(func):
-    func.is_machine_command = True
-    return func
+def machine_command(
+    func=None,
+    *,
+    resources: Optional[Iterable[str]] = None,
+    priority: Optional[Priority] = None,
+):
+    """
+    Marks a machine command. ``resources`` lists what the command touches, e.g.
+    ("pumps", "stirrer-{num}", "vial-{num}"), names are formatted with the
+    command arguments, "vial-*" stands for all vials.
+    Commands touching different resources can run concurrently, commands without
+    resources run alone. ``priority`` is the default priority class of the
+    command, only give HIGH to short commands which are safe to run at the
+    preemption points of a long operation.
+    """
+
+    def decorator(func):
+        func = traced(category="machine")(func)
+        func.is_machine_command = True
+        if resources is not None:
+            func.resources = tuple(resources)
+        if priority is not None:
+            func.priority = priority
+        return func
+
+    return decorator(func) if func is not None else decorator
 
 
 def reactor_command(func):
+    func = traced(category="reactor")(func)
     func.is_reactor_command = True
     return func
 
 
-class BaseMachine(ConnectionAdapterCallbacks, DeviceCallback, StateMixin):
+class MachineStateMixin(StateMixin):
+    """State checks of a machine, shared by the machines and their proxies"""
+
+    def isClosedOrError(self):
+        return self._state in (
+            self.States.STATE_ERROR,
+            self.States.STATE_CLOSED,
+            self.States.STATE_CLOSED_WITH_ERROR,
+        )
+
+    def isIdle(self):
+        return self._state == self.States.STATE_OPERATIONAL
+
+    def isOperational(self):
+        return self._state in self.OPERATIONAL_STATES
+
+    def isWorking(self):
+        return self._state in self.WORKING_STATES
+
+    def isCancelling(self):
+        return self._state == self.States.STATE_CANCELLING
+
+    def isPausing(self):
+        return self._state == self.States.STATE_PAUSING
+
+    def isPaused(self):
+        return self._state == self.States.STATE_PAUSED
+
+    def isResuming(self):
+        return self._state == self.States.STATE_RESUMING
+
+    def isFinishing(self):
+        return self._state == self.States.STATE_FINISHING
+
+    def isError(self):
+        return self._state in (
+            self.States.STATE_ERROR,
+            self.States.STATE_CLOSED_WITH_ERROR,
+        )
+
+    def isBusy(self):
+        return (
+            self.isWorking()
+            or self.isPaused()
+            or self._state in (self.States.STATE_CANCELLING, self.States.STATE_PAUSING)
+        )
+
+    def isManualControl(self):
+        return self._state in (self.States.STATE_OPERATIONAL, self.States.STATE_PAUSED)
+
+
+class BaseMachine(ConnectionAdapterCallbacks, DeviceCallback, MachineStateMixin):
 
     reactor_class = Reactor
 
@@ -429,14 +613,15 @@ class BaseMachine(ConnectionAdapterCallbacks, DeviceCallback, StateMixin):
             for index in range(reactors_count)
         ]
         self._log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
-        self._operation_queue = queue.Queue()
-        self._stop_event = threading.Event()
-        self._thread = threading.Thread(target=self._machine_operation_queue_loop)
+        self._scheduler = OperationScheduler(
+            name=f"{self.__class__.__name__}Operations"
+        )
         self._stop_operation_timeout = 5
         self._commands_info = self._get_command_info()
         # self._experiment = None
         self._lock = threading.RLock()
         self._cancel_long_operation_event = threading.Event()
+        self._device_reactors: dict[str, int] = {}
 
     @classmethod
     def get_connection_options(cls, *args, **kwargs):
@@ -458,31 +643,17 @@ class BaseMachine(ConnectionAdapterCallbacks, DeviceCallback, StateMixin):
     def name(self):
         return self._name
 
+    @property
+    def serial(self) -> Optional[str]:
+        """Serial number of the USB device of the machine, None if not connected"""
+        return self._conn_adapter.serial_number
+
     def get_commands_info(self):
         return self._commands_info
 
     def get_devices_commands_info(self):
         return self._dev_manager.commands_info
 
-    def _machine_operation_queue_loop(self):
-        while not self._stop_event.is_set():
-            try:
-                operation, result_queue, executed = self._operation_queue.get()
-                command, args, kwargs = operation
-                result = command(*args, **kwargs)
-                if result_queue:
-                    result_queue.put(result)
-            except queue.Empty:
-                continue
-            except Exception as exc:
-                self._log.exception(exc)
-                if result_queue:
-                    result_queue.put(exc)
-            self._operation_queue.task_done()
-            if executed:
-                executed.set()
-        self._log.info(f"Closing {self.name} loop")
-
     def execute_device_command(self, device_id, command, *args, **kwargs):
         return self._dev_manager.execute(device_id, command, *args, **kwargs)
 
@@ -490,9 +661,11 @@ class BaseMachine(ConnectionAdapterCallbacks, DeviceCallback, StateMixin):
         """Execute machine command"""
         try:
             method = getattr(self, method_name)
-            self.add_operation((method, args, kwargs), no_wait=no_wait, timeout=timeout)
         except AttributeError:
             raise AttributeError(f"No command named {method_name} found")
+        return self.add_operation(
+            (method, args, kwargs), no_wait=no_wait, timeout=timeout
+        )
 
     def get_connected_device_info(self):
         return self._conn_adapter.get_device_info()
@@ -521,20 +694,40 @@ class BaseMachine(ConnectionAdapterCallbacks, DeviceCallback, StateMixin):
         operation: tuple[Callable[..., Any], tuple[Any, ...], dict[str, Any]],
         no_wait=False,
         timeout=None,
+        on_done: Optional[Callable[[Any], None]] = None,
+        priority: Optional[Priority] = None,
+        deadline: Optional[float] = None,
     ):
+        """
+        Runs the operation and returns its result. With ``no_wait`` returns at
+        once, with ``on_done`` returns the scheduled operation and passes the
+        result (or the exception) to ``on_done`` from the operation thread.
+        ``priority`` overrides the priority of the command, ``deadline`` is the
+        time in seconds the operation should start within.
+        """
+        if on_done is not None:
+            return self._scheduler.submit(operation, on_done, priority, deadline)
         if no_wait:
-            self._operation_queue.put((operation, None, None))
+            self._scheduler.submit(operation, None, priority, deadline)
             return None
-        result_queue = queue.Queue()
-        executed = threading.Event()
-        self._operation_queue.put((operation, result_queue, executed))
-        executed.wait(timeout=timeout)
-        result = result_queue.get()
+        future = CommandFuture.from_pool()
+        scheduled = self._scheduler.submit(
+            operation, future.set_result, priority, deadline
+        )
+        if not clock.wait(future, timeout):
+            self._scheduler.cancel(scheduled)
+            raise TimeoutError(f"Operation {operation[0]} timed out")
+        result = future.outcome()
+        future.recycle()
         return result
 
     def cancel_long_operation(self):
         self._cancel_long_operation_event.set()
 
+    def cancel_operation(self, scheduled: ScheduledOperation) -> bool:
+        """Cancels an operation of ``add_operation`` with ``on_done``"""
+        return self._scheduler.cancel(scheduled)
+
     def get_reactor(self, reactor_num) -> Reactor:
         return self._reactors[reactor_num - 1]
 
@@ -556,7 +749,7 @@ class BaseMachine(ConnectionAdapterCallbacks, DeviceCallback, StateMixin):
 
         # self._set_state(self.States.STATE_CONNECTING)
         self._conn_adapter.connect(*args, **kwargs)
-        self._thread.start()
+        self._scheduler.start()
 
         eventManager().fire(Events.MACHINE_CONNECTED, self)
         # self._clear_to_send.set()
@@ -585,17 +778,35 @@ class BaseMachine(ConnectionAdapterCallbacks, DeviceCallback, StateMixin):
         self._machine_callback._on_change_device_data(device.get_data())
         eventManager().fire(Events.DEVICE_STATE_CHANGED, (device, state))
 
+    # DeviceCallback
+    def _on_device_measurement(self, device, values, *args, **kwargs):
+        reactor = self._device_reactors.get(device.id, 0)
+        if not reactor:
+            values = {f"{device.id}.{key}": value for key, value in values.items()}
+        self._add_measurements(reactor, values)
+
+    def _add_measurements(self, reactor: int, values: dict[str, float]):
+        """
+        Reports measured values, reactor 0 is used for machine wide values
+        """
+        self._machine_callback._on_machine_add_measurements(
+            reactor, values, clock.time()
+        )
+
     def disconnect(self, *args, **kwargs):
         try:
             self._conn_adapter.disconnect(*args, **kwargs)
-            self._stop_event.set()
-            self._thread.join(timeout=self._stop_operation_timeout)
-            if self._thread.is_alive():
+            if self._scheduler.stop(timeout=self._stop_operation_timeout):
                 self._log.warning("Stop operation timeout")
             self._set_state(self.States.STATE_CLOSED)
         except Exception:
             self._set_state(self.States.STATE_CLOSED_WITH_ERROR)
 
+    def shutdown(self):
+        """Disconnects and stops the command threads of the machine"""
+        self.disconnect()
+        self._dev_manager.stop()
+
     def get_transport(self):
         raise NotImplementedError()
 
@@ -737,53 +948,6 @@ class BaseMachine(ConnectionAdapterCallbacks, DeviceCallback, StateMixin):
     def get_firmware_info(self):
         raise NotImplementedError()
 
-    def isClosedOrError(self):
-        return self._state in (
-            self.States.STATE_ERROR,
-            self.States.STATE_CLOSED,
-            self.States.STATE_CLOSED_WITH_ERROR,
-        )
-
-    def isIdle(self):
-        return self._state == self.States.STATE_OPERATIONAL
-
-    def isOperational(self):
-        return self._state in self.OPERATIONAL_STATES
-
-    def isWorking(self):
-        return self._state in self.WORKING_STATES
-
-    def isCancelling(self):
-        return self._state == self.States.STATE_CANCELLING
-
-    def isPausing(self):
-        return self._state == self.States.STATE_PAUSING
-
-    def isPaused(self):
-        return self._state == self.States.STATE_PAUSED
-
-    def isResuming(self):
-        return self._state == self.States.STATE_RESUMING
-
-    def isFinishing(self):
-        return self._state == self.States.STATE_FINISHING
-
-    def isError(self):
-        return self._state in (
-            self.States.STATE_ERROR,
-            self.States.STATE_CLOSED_WITH_ERROR,
-        )
-
-    def isBusy(self):
-        return (
-            self.isWorking()
-            or self.isPaused()
-            or self._state in (self.States.STATE_CANCELLING, self.States.STATE_PAUSING)
-        )
-
-    def isManualControl(self):
-        return self._state in (self.States.STATE_OPERATIONAL, self.States.STATE_PAUSED)
-
 
 Reactor.machine_class = BaseMachine
 
@@ -0,0 +1,160 @@
+"""
+asyncio facade of the machines, alongside the threaded ``cmd`` API.
+
+Awaiting a command submits its operation to the operation scheduler of the
+machine and waits on an asyncio future, no thread blocks while the operation
+runs. The scheduler threads stay the only ones driving the hardware, they
+resolve the future through ``call_soon_threadsafe`` when the operation ends::
+
+    machine = AsyncMachine(base_machine)
+    ods = await asyncio.gather(*(r.measure_od() for r in machine.get_reactors()))
+
+Cancelling the awaiting task drops the operation if it did not start yet, a
+running operation is marked as cancelled and long operations (e.g. dilutions)
+stop at their next step, see ``operation_cancelled``.
+
+``eventLoop()`` is an event loop running in its own thread, for the threaded
+code (e.g. the experiment loop) to run coroutines on.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine, Optional
+
+from biofactory.machine import BaseMachine, Reactor
+from biofactory.machine.scheduler import ScheduledOperation
+from biofactory.util import clock
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def eventLoop():
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = EventLoopThread()
+    return _instance
+
+
+class EventLoopThread:
+    """asyncio event loop running forever in a daemon thread"""
+
+    def __init__(self, name: str = "AsyncioLoop"):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        """Runs the coroutine on the loop, cancelling the future cancels it"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def run(self, coroutine: Coroutine, timeout: Optional[float] = None):
+        future = self.submit(coroutine)
+        with clock.blocking():
+            return future.result(timeout)
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def _resolve(future: asyncio.Future, result):
+    if future.done():
+        return
+    if isinstance(result, BaseException):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+class AsyncMachine:
+    def __init__(self, machine: BaseMachine):
+        self._machine = machine
+        self._reactors = [AsyncReactor(self, r) for r in machine.get_reactors()]
+
+    @property
+    def machine(self) -> BaseMachine:
+        return self._machine
+
+    def get_reactor(self, reactor_num: int) -> "AsyncReactor":
+        return self._reactors[reactor_num - 1]
+
+    def get_reactors(self) -> list["AsyncReactor"]:
+        return self._reactors
+
+    async def cmd(self, method_name: str, *args, **kwargs):
+        """Executes the machine command"""
+        method = getattr(self._machine, method_name, None)
+        if method is None:
+            raise AttributeError(f"No command named {method_name} found")
+        return await self.run((method, args, kwargs))
+
+    async def run(
+        self, operation: tuple[Callable[..., Any], tuple[Any, ...], dict[str, Any]]
+    ):
+        """Runs the operation like ``BaseMachine.add_operation``"""
+        return await self.submit(
+            lambda on_done: self._machine.add_operation(operation, on_done=on_done)
+        )
+
+    async def submit(self, add_operation: Callable[[Callable[[Any], None]], Any]):
+        """
+        Calls ``add_operation`` with the callback of the operation result and
+        waits for it. ``add_operation`` returns the scheduled operation, or the
+        result when the command ran at once. Errors, returned as values, are
+        raised.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def on_done(result):
+            loop.call_soon_threadsafe(_resolve, future, result)
+
+        scheduled = add_operation(on_done)
+        if isinstance(scheduled, BaseException):
+            raise scheduled
+        if not isinstance(scheduled, ScheduledOperation):
+            return scheduled
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self._machine.cancel_operation(scheduled)
+            raise
+
+
+class AsyncReactor:
+    """Reactor commands as coroutines, e.g. ``await reactor.dilute(0.3)``"""
+
+    def __init__(self, machine: AsyncMachine, reactor: Reactor):
+        self._machine = machine
+        self._reactor = reactor
+
+    def __str__(self):
+        return str(self._reactor)
+
+    @property
+    def reactor(self) -> Reactor:
+        return self._reactor
+
+    def __getattr__(self, name: str):
+        if name.startswith("_") or name not in self._reactor.get_command_info():
+            raise AttributeError(f"No command named {name} found")
+        command = getattr(self._reactor, name)
+
+        async def run(*args, **kwargs):
+            return await self._machine.submit(
+                lambda on_done: command(*args, on_done=on_done, **kwargs)
+            )
+
+        return run
@@ -86,6 +86,11 @@ class VirtualBiofactoryMachine(BaseMachine):
     def measure_od(self, num: int):
         return 0.0
 
+    @machine_command
+    def measure_od_all(self, nums: Optional[list[int]] = None):
+        nums = nums or [reactor.num for reactor in self._reactors]
+        return {num: 0.0 for num in nums}
+
     @machine_command
     def stop_pumps(self):
         pass
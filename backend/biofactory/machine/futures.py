@@ -0,0 +1,227 @@
+"""
+Result futures of the machine command executors.
+
+``CommandFuture`` has the interface of ``concurrent.futures.Future`` (result,
+exception, cancel, done callbacks) at a fraction of its cost: the state lives in
+slots, transitions take one module wide lock for a few instructions, and the
+waiters block on a single preacquired ``threading.Lock`` which the completion
+releases within the transition. The futures the executors wait on themselves
+are taken from a pool and recycled once their result is read, so a command
+allocates nothing.
+
+A future also passes for the event ``clock.wait`` expects (``wait`` and
+``is_set``), so the waits follow a virtual clock.
+"""
+
+import threading
+from concurrent.futures import CancelledError
+from typing import Any, Callable, Iterable, Optional
+
+from biofactory.util import clock
+
+FIRST_COMPLETED = "FIRST_COMPLETED"
+ALL_COMPLETED = "ALL_COMPLETED"
+
+_PENDING = 0
+_RUNNING = 1
+_FINISHED = 2
+_CANCELLED = 3
+
+POOL_SIZE = 256
+
+# guards the state transitions and the callbacks of all futures
+_lock = threading.Lock()
+_pool: list["CommandFuture"] = []
+
+
+class CommandFuture:
+    __slots__ = ("_state", "_result", "_exception", "_callbacks", "_gate")
+
+    def __init__(self):
+        self._state = _PENDING
+        self._result = None
+        self._exception: Optional[BaseException] = None
+        self._callbacks: Optional[list[Callable[["CommandFuture"], Any]]] = None
+        # held while pending, released once by the completion
+        self._gate = threading.Lock()
+        self._gate.acquire()
+
+    @classmethod
+    def from_pool(cls) -> "CommandFuture":
+        """
+        A pending future which the caller returns with ``recycle`` after reading
+        its result, it must not be handed out
+        """
+        try:
+            return _pool.pop()
+        except IndexError:
+            return cls()
+
+    def recycle(self):
+        """Returns the future to the pool, nothing may reference it anymore"""
+        if self._state < _FINISHED or self._callbacks:
+            return
+        # the completion may still be releasing the gate, wait for it
+        self._gate.acquire()
+        self._state = _PENDING
+        self._result = None
+        self._exception = None
+        if len(_pool) < POOL_SIZE:
+            _pool.append(self)
+
+    def __repr__(self):
+        state = ("pending", "running", "finished", "cancelled")[self._state]
+        return f"<{self.__class__.__name__} {state}>"
+
+    def done(self) -> bool:
+        return self._state >= _FINISHED
+
+    is_set = done
+
+    def running(self) -> bool:
+        return self._state == _RUNNING
+
+    def cancelled(self) -> bool:
+        return self._state == _CANCELLED
+
+    def set_running_or_notify_cancel(self) -> bool:
+        """Marks the future running, returns False if it was cancelled"""
+        with _lock:
+            if self._state == _CANCELLED:
+                return False
+            self._state = _RUNNING
+            return True
+
+    def cancel(self) -> bool:
+        """Cancels the future unless it is running or done"""
+        with _lock:
+            if self._state == _CANCELLED:
+                return True
+            if self._state != _PENDING:
+                return False
+            self._state = _CANCELLED
+            callbacks = self._release()
+        self._notify(callbacks)
+        return True
+
+    def set_result(self, result):
+        with _lock:
+            if self._state >= _FINISHED:
+                return
+            self._result = result
+            self._state = _FINISHED
+            callbacks = self._release()
+        self._notify(callbacks)
+
+    def set_exception(self, exception: BaseException):
+        with _lock:
+            if self._state >= _FINISHED:
+                return
+            self._exception = exception
+            self._state = _FINISHED
+            callbacks = self._release()
+        self._notify(callbacks)
+
+    def _release(self):
+        """Opens the gate and takes the callbacks, called with ``_lock`` held"""
+        self._gate.release()
+        callbacks, self._callbacks = self._callbacks, None
+        return callbacks
+
+    def _notify(self, callbacks):
+        if callbacks:
+            for callback in callbacks:
+                callback(self)
+
+    def add_done_callback(self, callback: Callable[["CommandFuture"], Any]):
+        """Calls ``callback(future)`` when done, at once if it is done already"""
+        with _lock:
+            if self._state < _FINISHED:
+                if self._callbacks is None:
+                    self._callbacks = []
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def remove_done_callback(self, callback: Callable[["CommandFuture"], Any]):
+        with _lock:
+            if self._callbacks and callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until done, returns False on timeout"""
+        if self._state >= _FINISHED:
+            return True
+        with clock.blocking():
+            acquired = self._gate.acquire(
+                True, -1 if timeout is None else max(timeout, 0.0)
+            )
+        if acquired:
+            # pass on to the other waiters
+            self._gate.release()
+            return True
+        return self._state >= _FINISHED
+
+    def result(self, timeout: Optional[float] = None):
+        if not self.wait(timeout):
+            raise TimeoutError(f"{self!r} is not done after {timeout} s")
+        if self._state == _CANCELLED:
+            raise CancelledError()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def outcome(self):
+        """Result or exception of the done future, None if it was cancelled"""
+        return self._exception if self._exception is not None else self._result
+
+    def exception(self, timeout: Optional[float] = None) -> Optional[BaseException]:
+        if not self.wait(timeout):
+            raise TimeoutError(f"{self!r} is not done after {timeout} s")
+        if self._state == _CANCELLED:
+            raise CancelledError()
+        return self._exception
+
+
+def wait(
+    futures: Iterable[CommandFuture],
+    timeout: Optional[float] = None,
+    return_when: str = ALL_COMPLETED,
+) -> tuple[set[CommandFuture], set[CommandFuture]]:
+    """
+    Waits until all or the first of the futures are done, returns the done and
+    the not done futures
+    """
+    futures = set(futures)
+    done = {future for future in futures if future.done()}
+    not_done = futures - done
+    if not not_done or (done and return_when == FIRST_COMPLETED):
+        return done, not_done
+
+    gate = threading.Lock()
+    gate.acquire()
+    remaining = [1 if return_when == FIRST_COMPLETED else len(not_done)]
+
+    def on_done(future):
+        with _lock:
+            remaining[0] -= 1
+            release = remaining[0] == 0
+        if release:
+            gate.release()
+
+    for future in not_done:
+        future.add_done_callback(on_done)
+    with clock.blocking():
+        gate.acquire(True, -1 if timeout is None else max(timeout, 0.0))
+    for future in not_done:
+        future.remove_done_callback(on_done)
+    done = {future for future in futures if future.done()}
+    return done, futures - done
+
+
+def wait_any(futures: Iterable[CommandFuture], timeout: Optional[float] = None):
+    return wait(futures, timeout, FIRST_COMPLETED)
+
+
+def wait_all(futures: Iterable[CommandFuture], timeout: Optional[float] = None):
+    return wait(futures, timeout, ALL_COMPLETED)
@@ -0,0 +1,705 @@
+"""
+Machines running in worker processes, one process per USB device.
+
+The worker process creates and connects the machine and runs its experiments,
+so a blocking FTDI call or a long computation on one machine never holds the
+GIL of the server or of another machine. The server drives it through
+``RemoteMachine``, which sends the calls over a pipe and keeps the state, device
+data and measurements the worker reports back as telemetry.
+
+Messages to the worker are ``(request_id, method, args, kwargs)``. The worker
+answers ``("reply", request_id, ok, value)`` unless ``request_id`` is None and
+reports ``("telemetry", kind, payload)`` on its own. Calls with a reply run in a
+thread pool of the worker, calls without a reply run in order on the receiving
+thread, so they must not block (e.g. ``cmd`` with ``no_wait``).
+
+Workers are spawned, not forked: the server runs threads and holds USB handles
+which a forked child would inherit in an undefined state.
+
+The metrics, the spans and the bus transactions of a worker are recorded in
+its own process, the server collects them with the ``metrics``, ``tracing``
+and ``bus_trace`` calls.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+
+from biofactory.checkpoint import CheckpointLog
+from biofactory.drivers.bus_trace import busTrace
+from biofactory.drivers.ft2232h import FtdiDriver
+from biofactory.events import Events, eventManager
+from biofactory.experiment import Experiment, ExperimentCallback
+from biofactory.machine import BaseMachine, MachineCallback, MachineStateMixin
+from biofactory.machine.futures import CommandFuture
+from biofactory.metrics import metricsRegistry
+from biofactory.tracing import tracer
+from biofactory.usb_manager import usbManager
+from biofactory.util import clock
+
+log = logging.getLogger(__name__)
+
+# events of the worker process fired again by the server
+FORWARDED_EVENTS = (
+    Events.EXPERIMENT_STATUS_CHANGE,
+    Events.EXPERIMENT_STARTED,
+    Events.EXPERIMENT_RESTORED,
+    Events.EXPERIMENT_DONE,
+    Events.EXPERIMENT_FAILED,
+    Events.EXPERIMENT_CANCELLING,
+    Events.EXPERIMENT_CANCELLED,
+    Events.EXPERIMENT_PAUSED,
+    Events.EXPERIMENT_RESUMED,
+    Events.EXPERIMENT_NEW_CYCLE,
+    Events.EXPERIMENT_CYCLE_COMPLETE,
+    Events.EXPERIMENT_CYCLE_TOO_LONG_WARNING,
+)
+
+
+class RemoteMachineError(Exception):
+    """The worker process failed or a result could not be sent back"""
+
+
+class MachineFactory:
+    """
+    Creates and connects the machine inside the worker process. Factories are
+    pickled to the worker, keep only plain data in them.
+    """
+
+    def __call__(self, machine_callback: MachineCallback) -> BaseMachine:
+        raise NotImplementedError()
+
+
+class UsbMachineFactory(MachineFactory):
+    def __init__(self, serial_number: str, machine_type: type[BaseMachine]):
+        self.serial_number = serial_number
+        self.machine_type = machine_type
+
+    def __call__(self, machine_callback: MachineCallback) -> BaseMachine:
+        usb_device = usbManager().find_device(serial_number=self.serial_number)
+        if usb_device is None:
+            raise ValueError(f"USB device {self.serial_number} not found")
+        machine = self.machine_type(machine_callback=machine_callback)
+        machine.connect(usb_device=usb_device)
+        return machine
+
+
+class _ForwardedExperimentCallback(ExperimentCallback):
+    def __init__(self, experiment_id):
+        self._experiment_id = experiment_id
+
+    def _on_experiment_status_change(self, state, *args, **kwargs):
+        state.update({"experiment_id": self._experiment_id})
+        eventManager().fire(Events.EXPERIMENT_STATUS_CHANGE, state)
+
+
+class _MachineWorker(MachineCallback):
+    """Runs in the worker process, serves the calls of the ``RemoteMachine``"""
+
+    CALLS = frozenset(
+        (
+            "cmd",
+            "execute_device_command",
+            "reactor_cmd",
+            "cancel_long_operation",
+            "usb_event",
+            "start_experiment",
+            "restore_experiment",
+            "experiment_command",
+            "metrics",
+            "tracing",
+            "bus_trace",
+        )
+    )
+
+    def __init__(self, serial: str, connection):
+        self._serial = serial
+        self._connection = connection
+        self._send_lock = threading.Lock()
+        self._machine: Optional[BaseMachine] = None
+        self._experiments: dict[str, Experiment] = {}
+        self._executor = ThreadPoolExecutor(thread_name_prefix=f"Machine-{serial}")
+
+    def run(self, factory: MachineFactory):
+        for event in FORWARDED_EVENTS:
+            eventManager().subscribe(event, self._forward_event)
+        # the event manager holds the events back until the startup
+        eventManager().fire(Events.STARTUP)
+        try:
+            self._machine = factory(self)
+        except Exception as exc:
+            log.exception("Could not create machine %s", self._serial)
+            self._send(("telemetry", "failed", repr(exc)))
+            return
+        self._send(("telemetry", "ready", self._get_info()))
+
+        while True:
+            try:
+                with clock.blocking():
+                    request_id, method, args, kwargs = self._connection.recv()
+            except (EOFError, OSError):
+                log.warning("Server of machine %s is gone", self._serial)
+                break
+            if method == "shutdown":
+                self._shutdown()
+                self._reply(request_id, True, None)
+                break
+            if request_id is None:
+                self._handle(request_id, method, args, kwargs)
+            else:
+                self._executor.submit(self._handle, request_id, method, args, kwargs)
+        self._executor.shutdown(wait=False)
+        eventManager().join(timeout=5)
+
+    def _get_info(self) -> dict:
+        machine = self._machine
+        return {
+            "id": machine.id,
+            "name": machine.name,
+            "state": machine.state,
+            "commands": machine.get_commands_info(),
+            "devices_commands": machine.get_devices_commands_info(),
+            "reactors_commands": [
+                reactor.get_command_info() for reactor in machine.get_reactors()
+            ],
+            "device_info": machine.get_connected_device_info(),
+        }
+
+    def _send(self, message):
+        with self._send_lock:
+            self._connection.send(message)
+
+    def _reply(self, request_id, ok, value):
+        if request_id is None:
+            if not ok:
+                log.error("Call of machine %s failed: %r", self._serial, value)
+            return
+        try:
+            self._send(("reply", request_id, ok, value))
+        except Exception as exc:
+            # the result or the exception can't be pickled
+            self._send(("reply", request_id, False, RemoteMachineError(repr(exc))))
+
+    def _handle(self, request_id, method, args, kwargs):
+        try:
+            if method not in self.CALLS:
+                raise AttributeError(f"No call named {method} found")
+            value = getattr(self, method)(*args, **kwargs)
+        except Exception as exc:
+            self._reply(request_id, False, exc)
+        else:
+            self._reply(request_id, True, value)
+
+    def _shutdown(self):
+        for experiment in self._experiments.values():
+            # the machine is going away, not the experiment: it is restored
+            # from its checkpoint log when the machine connects again
+            experiment.detach_checkpoint()
+            experiment.stop()
+        if self._machine is not None:
+            self._machine.shutdown()
+
+    def _forward_event(self, event, payload):
+        self._send(("telemetry", "event", (event, payload)))
+
+    # MachineCallback
+    def _on_machine_state_change(self, state, *args, **kwargs):
+        self._send(("telemetry", "state", state))
+
+    # MachineCallback
+    def _on_change_device_data(self, data, *args, **kwargs):
+        self._send(("telemetry", "device", data))
+
+    # MachineCallback
+    def _on_machine_add_measurements(self, reactor, values, timestamp, *args, **kwargs):
+        self._send(("telemetry", "measurements", (reactor, values, timestamp)))
+
+    def cmd(self, method_name, no_wait=False, timeout=None, args=(), kwargs=None):
+        return self._machine.cmd(method_name, no_wait, timeout, *args, **kwargs or {})
+
+    def execute_device_command(self, device_id, command, *args, **kwargs):
+        return self._machine.execute_device_command(device_id, command, *args, **kwargs)
+
+    def reactor_cmd(self, reactor_num, method_name, *args, **kwargs):
+        return self._machine.get_reactor(reactor_num).cmd(method_name, *args, **kwargs)
+
+    def cancel_long_operation(self):
+        self._machine.cancel_long_operation()
+
+    def usb_event(self, event):
+        """Replays the USB events of the server for the connection adapter"""
+        if event == Events.USB_CONNECTED:
+            usb_device = FtdiDriver.find_device(serial_number=self._serial)
+        else:
+            # the device is gone, the adapter only compares the serial
+            usb_device = SimpleNamespace(serial_number=self._serial)
+        if usb_device is not None:
+            eventManager().fire(event, usb_device)
+
+    def _create_experiment(self, experiment_class, experiment_id, args, kwargs):
+        experiment = experiment_class(
+            *args,
+            machine=self._machine,
+            experiment_callback=_ForwardedExperimentCallback(experiment_id),
+            id=experiment_id,
+            **kwargs,
+        )
+        self._experiments[experiment_id] = experiment
+        return experiment
+
+    def start_experiment(
+        self, experiment_class, experiment_id, args, kwargs, checkpoint_path=None
+    ):
+        experiment = self._create_experiment(
+            experiment_class, experiment_id, args, kwargs
+        )
+        if checkpoint_path is not None:
+            experiment.attach_checkpoint(
+                CheckpointLog.create(
+                    checkpoint_path,
+                    experiment_id,
+                    experiment_class,
+                    self._serial,
+                    args,
+                    kwargs,
+                )
+            )
+        experiment.start()
+        return experiment.status()
+
+    def restore_experiment(self, experiment_class, experiment_id, checkpoint_path):
+        checkpoint = CheckpointLog.open(checkpoint_path)
+        experiment = self._create_experiment(
+            experiment_class,
+            experiment_id,
+            checkpoint.state.args,
+            checkpoint.state.kwargs,
+        )
+        experiment.attach_checkpoint(checkpoint)
+        experiment.restore_checkpoint(checkpoint.state)
+        return experiment.status()
+
+    def experiment_command(self, experiment_id, command):
+        experiment = self._experiments.get(experiment_id)
+        if experiment is None:
+            raise ValueError(f"Experiment {experiment_id} not found")
+        if command not in ("stop", "pause", "resume", "status"):
+            raise ValueError(f"Unknown experiment command {command}")
+        if command != "status":
+            getattr(experiment, command)()
+        return experiment.status()
+
+    def metrics(self):
+        return metricsRegistry().collect()
+
+    def tracing(self, command: str = "stats", format: str = "chrome"):
+        if command in ("enable", "disable", "clear"):
+            getattr(tracer(), command)()
+        elif command == "spans":
+            if format == "otlp":
+                return tracer().export_otlp(f"biofactory-{self._serial}")
+            trace = tracer().export_chrome_trace()
+            trace["traceEvents"].append(
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "args": {"name": f"Machine {self._serial}"},
+                }
+            )
+            return trace
+        elif command != "stats":
+            raise ValueError(f"Unknown tracing command {command}")
+        return tracer().get_stats()
+
+    def bus_trace(self, command: str = "stats", last: Optional[int] = None):
+        if command in ("enable", "disable", "clear"):
+            getattr(busTrace(), command)()
+        elif command == "transactions":
+            return busTrace().dump(last)
+        elif command == "errors":
+            return busTrace().get_error_dumps()
+        elif command != "stats":
+            raise ValueError(f"Unknown bus trace command {command}")
+        return busTrace().get_stats()
+
+
+def _run_worker(serial: str, factory: MachineFactory, connection, log_level: int):
+    logging.basicConfig(
+        level=log_level,
+        format=f"%(asctime)s [{serial}] %(levelname)s %(name)s: %(message)s",
+    )
+    _MachineWorker(serial, connection).run(factory)
+
+
+class MachineProcess:
+    """Worker process of one machine and the pipe to it, used by ``RemoteMachine``"""
+
+    def __init__(
+        self,
+        serial: str,
+        factory: MachineFactory,
+        on_telemetry: Callable[[str, Any], None],
+    ):
+        self._serial = serial
+        self._on_telemetry = on_telemetry
+        context = multiprocessing.get_context("spawn")
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(
+            name=f"Machine-{serial}",
+            target=_run_worker,
+            args=(serial, factory, child_connection, logging.getLogger().level),
+            daemon=True,
+        )
+        self._child_connection = child_connection
+        self._ready = CommandFuture()
+        self._pending: dict[int, CommandFuture] = {}
+        self._request_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._receiver = threading.Thread(
+            name=f"Machine-{serial}-Receiver",
+            target=self._receive_loop,
+            daemon=True,
+        )
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid
+
+    def start(self, timeout: Optional[float] = None) -> dict:
+        """Starts the worker and returns the machine info once it is connected"""
+        self._process.start()
+        self._child_connection.close()
+        self._receiver.start()
+        return self._ready.result(timeout)
+
+    def call(self, method: str, args=(), kwargs=None) -> CommandFuture:
+        """Future of the result of ``method`` of the worker"""
+        future = CommandFuture()
+        with self._lock:
+            if self._stopped:
+                raise RemoteMachineError(f"Machine {self._serial} process is stopped")
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            self._connection.send((request_id, method, args, kwargs or {}))
+        return future
+
+    def send(self, method: str, args=(), kwargs=None):
+        """Calls ``method`` of the worker without waiting for the result"""
+        with self._lock:
+            if self._stopped:
+                raise RemoteMachineError(f"Machine {self._serial} process is stopped")
+            self._connection.send((None, method, args, kwargs or {}))
+
+    def stop(self, timeout: float = 10.0):
+        """Shuts the machine down and waits for the worker to exit"""
+        try:
+            self.call("shutdown").result(timeout)
+        except RemoteMachineError:
+            pass  # the worker has exited already
+        except Exception as exc:
+            log.warning("Machine %s did not shut down: %r", self._serial, exc)
+        with self._lock:
+            self._stopped = True
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+    def _receive_loop(self):
+        while True:
+            try:
+                message = self._connection.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == "reply":
+                _, request_id, ok, value = message
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+                continue
+            _, kind, payload = message
+            if kind == "ready":
+                self._ready.set_result(payload)
+            elif kind == "failed":
+                self._ready.set_exception(RemoteMachineError(payload))
+            else:
+                try:
+                    self._on_telemetry(kind, payload)
+                except Exception:
+                    log.exception("Error while handling %s telemetry", kind)
+
+        with self._lock:
+            self._stopped = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+        error = RemoteMachineError(f"Machine {self._serial} process exited")
+        for future in pending:
+            future.set_exception(error)
+        if not self._ready.done():
+            self._ready.set_exception(error)
+        self._connection.close()
+        self._on_telemetry("exited", self._process.exitcode)
+
+
+class RemoteReactor:
+    def __init__(self, machine: "RemoteMachine", reactor_num: int, commands_info):
+        self._machine = machine
+        self._num = reactor_num
+        self._commands_info = commands_info
+
+    def __str__(self):
+        return f"Reactor {self._num}"
+
+    @property
+    def num(self) -> int:
+        return self._num
+
+    def get_command_info(self):
+        return self._commands_info
+
+    def cmd(self, method_name: str, *args, **kwargs):
+        """Send a command to the reactor"""
+        if kwargs.get("no_wait"):
+            self._machine.send("reactor_cmd", self._num, method_name, *args, **kwargs)
+            return None
+        return self._machine.call(
+            "reactor_cmd", self._num, method_name, *args, **kwargs
+        )
+
+
+class RemoteMachine(MachineStateMixin):
+    """
+    Machine of the USB device ``serial`` running in its own worker process.
+
+    Commands are sent to the worker, the state is the latest state the worker
+    reported, so the checks of the state never wait for the worker.
+    """
+
+    def __init__(
+        self,
+        serial: str,
+        factory: MachineFactory,
+        machine_callback: Optional[MachineCallback] = None,
+        call_timeout: Optional[float] = None,
+    ):
+        self._serial = serial
+        self._machine_callback = machine_callback or MachineCallback()
+        self.changestate_callback = self._machine_callback._on_machine_state_change
+        self._call_timeout = call_timeout
+        self._state = self.States.STATE_OFFLINE
+        self._error = ""
+        self._info: dict = {}
+        self._reactors: list[RemoteReactor] = []
+        self._process = MachineProcess(serial, factory, self._on_telemetry)
+        self._stop_lock = threading.Lock()
+        self._stopping = False
+
+    @property
+    def serial(self) -> str:
+        return self._serial
+
+    @property
+    def id(self):
+        return self._info.get("id", self._serial)
+
+    @property
+    def name(self):
+        return self._info.get("name", self._serial)
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid
+
+    def connect(self, timeout: Optional[float] = 60.0, *args, **kwargs):
+        """Starts the worker process, returns once the machine is connected"""
+        self._set_state(self.States.STATE_CONNECTING)
+        try:
+            self._info = self._process.start(timeout)
+        except Exception as exc:
+            self._error = str(exc)
+            self._set_state(self.States.STATE_CLOSED_WITH_ERROR)
+            self.shutdown()
+            raise
+        self._reactors = [
+            RemoteReactor(self, index + 1, commands_info)
+            for index, commands_info in enumerate(self._info["reactors_commands"])
+        ]
+        self._set_state(self._info["state"])
+        eventManager().fire(Events.MACHINE_CONNECTED, self)
+
+    def call(self, method: str, *args, **kwargs):
+        """Calls ``method`` of the worker and waits for the result"""
+        return self._process.call(method, args, kwargs).result(self._call_timeout)
+
+    def send(self, method: str, *args, **kwargs):
+        self._process.send(method, args, kwargs)
+
+    def cmd(self, method_name: str, no_wait=False, timeout=None, *args, **kwargs):
+        """Execute machine command"""
+        if no_wait:
+            self.send("cmd", method_name, True, timeout, args, kwargs)
+            return None
+        return self.call("cmd", method_name, False, timeout, args, kwargs)
+
+    def execute_device_command(self, device_id, command, *args, **kwargs):
+        if kwargs.get("no_wait"):
+            self.send("execute_device_command", device_id, command, *args, **kwargs)
+            return None
+        return self.call("execute_device_command", device_id, command, *args, **kwargs)
+
+    def cancel_long_operation(self):
+        self.send("cancel_long_operation")
+
+    def get_commands_info(self):
+        return self._info.get("commands", {})
+
+    def get_devices_commands_info(self):
+        return self._info.get("devices_commands", {})
+
+    def get_connected_device_info(self):
+        return self._info.get("device_info", {})
+
+    def get_reactor(self, reactor_num) -> RemoteReactor:
+        return self._reactors[reactor_num - 1]
+
+    def get_reactors(self):
+        return self._reactors
+
+    def get_error_string(self):
+        return self._error
+
+    def get_data(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "serial": self.serial,
+            "state_id": self.get_state_id(),
+            "state_string": self.get_state_string(),
+            "error": self._error,
+        }
+
+    def usb_event(self, event):
+        self.send("usb_event", event)
+
+    def start_experiment(
+        self,
+        experiment_class: type[Experiment],
+        experiment_id: str,
+        *args,
+        checkpoint_path: Optional[str] = None,
+        **kwargs,
+    ) -> dict:
+        return self.call(
+            "start_experiment",
+            experiment_class,
+            experiment_id,
+            args,
+            kwargs,
+            checkpoint_path,
+        )
+
+    def restore_experiment(
+        self, experiment_class: type[Experiment], experiment_id: str, checkpoint_path
+    ) -> dict:
+        """Restores the experiment from its checkpoint log in the worker"""
+        return self.call(
+            "restore_experiment", experiment_class, experiment_id, checkpoint_path
+        )
+
+    def experiment_command(self, experiment_id: str, command: str) -> dict:
+        return self.call("experiment_command", experiment_id, command)
+
+    def disconnect(self, *args, **kwargs):
+        """Disconnects the machine and stops its worker process"""
+        self.shutdown()
+
+    def shutdown(self):
+        with self._stop_lock:
+            if self._stopping:
+                return
+            self._stopping = True
+        self._process.stop()
+        if not self.isClosedOrError():
+            self._set_state(self.States.STATE_CLOSED)
+
+    def _on_telemetry(self, kind: str, payload):
+        match kind:
+            case "state":
+                self._set_state(payload)
+            case "device":
+                self._machine_callback._on_change_device_data(payload)
+            case "measurements":
+                self._machine_callback._on_machine_add_measurements(*payload)
+            case "event":
+                event, event_payload = payload
+                if isinstance(event_payload, dict):
+                    event_payload["machine"] = self._serial
+                eventManager().fire(event, event_payload)
+            case "exited":
+                if not self._stopping and not self.isClosedOrError():
+                    self._error = f"Machine process exited with code {payload}"
+                    self._set_state(self.States.STATE_CLOSED_WITH_ERROR)
+
+
+class RemoteExperiment:
+    """Experiment running in the worker process of its machine"""
+
+    def __init__(
+        self,
+        machine: RemoteMachine,
+        experiment_class: type[Experiment],
+        experiment_id: str,
+        *args,
+        checkpoint_path: Optional[str] = None,
+        **kwargs,
+    ):
+        self._machine = machine
+        self._experiment_class = experiment_class
+        self._id = experiment_id
+        self._args = args
+        self._kwargs = kwargs
+        self._checkpoint_path = checkpoint_path
+
+    def get_name(self):
+        return self._experiment_class.get_name()
+
+    def start(self):
+        self._machine.start_experiment(
+            self._experiment_class,
+            self._id,
+            *self._args,
+            checkpoint_path=self._checkpoint_path,
+            **self._kwargs,
+        )
+
+    def restore(self):
+        self._machine.restore_experiment(
+            self._experiment_class, self._id, self._checkpoint_path
+        )
+
+    def stop(self):
+        self._machine.experiment_command(self._id, "stop")
+
+    def pause(self):
+        self._machine.experiment_command(self._id, "pause")
+
+    def resume(self):
+        self._machine.experiment_command(self._id, "resume")
+
+    def status(self) -> dict:
+        status = self._machine.experiment_command(self._id, "status")
+        status["machine"] = self._machine.serial
+        return status
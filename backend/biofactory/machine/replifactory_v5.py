@@ -1,12 +1,17 @@
 import logging
-import time
 from dataclasses import dataclass
 from typing import Optional
 
 from biofactory.devices.laser import Laser
+from biofactory.devices.motion import wait_for_motions
+from biofactory.devices.od_calibration import OdCalibrationEngine
 from biofactory.devices.optical_density_sensor import OpticalDensitySensor
+from biofactory.devices.optical_density_sensors_group import (
+    OpticalDensitySensorsGroup,
+)
 from biofactory.devices.photodiode import Photodiode
 from biofactory.devices.pump import Pump
+from biofactory.devices.pumps_group import PumpsGroup
 from biofactory.devices.step_motor import (
     Motor,
     MotorProfile_17HS15_1504S_X1,
@@ -32,6 +37,12 @@ from biofactory.machine import (
     machine_command,
     reactor_command,
 )
+from biofactory.machine.scheduler import (
+    Priority,
+    operation_cancelled,
+    preemption_point,
+)
+from biofactory.util import clock
 
 SPI_INTERFACE = 1
 SPI_CS_COUNT = 4
@@ -63,10 +74,21 @@ I2C_PORT_THERMOMETER_3 = 0x4A  # ADT75
 
 
 class ReplifactoryMachine(BaseMachine):
-
-    def __init__(self, *args, **kwargs):
+    """
+    Command resources: "pumps" and "valves" are shared by all reactors (the pumps
+    are connected to a reactor by opening its valve), "optics" is the laser and
+    photodiode multiplexing shared by all OD sensors, "stirrer-N" is the stirrer
+    of reactor N.
+    """
+
+    def __init__(self, *args, ftdi_driver: Optional[FtdiDriver] = None, **kwargs):
+        """
+        ftdi_driver - driver of the FTDI controller, e.g. a simulated one, by
+        default the USB device of the machine
+        """
         self._ftdi_adapter = FtdiConnectionAdapter(
-            ftdi_driver=FtdiDriver(
+            ftdi_driver=ftdi_driver
+            or FtdiDriver(
                 spi_interface=SPI_INTERFACE,
                 spi_cs_count=SPI_CS_COUNT,
                 spi_freq=SPI_FREQ,
@@ -85,6 +107,7 @@ class ReplifactoryMachine(BaseMachine):
         # Replifactory v5 layout
 
         # it's important to init pump drivers before valves, to stop motors before valves closing
+        pumps = []
         for pump_num in USED_PUMPS:
             step_motor_driver = StepMotorDriver(
                 port=self._ftdi_adapter.get_spi_hw_port(
@@ -98,6 +121,7 @@ class ReplifactoryMachine(BaseMachine):
             )
             motor = Motor(step_motor_driver, profile=profile, name=f"Motor {pump_num}")
             pump = Pump(motor, name=f"Pump {pump_num}", callback=self)
+            pumps.append(pump)
             self._dev_manager.add_devices(pump)
 
         # instantiate stirrers and valves
@@ -144,6 +168,14 @@ class ReplifactoryMachine(BaseMachine):
         self._dev_manager.add_devices(*valves)
         valves_group = ValvesGroup(valves)
         self._dev_manager.add_devices(valves_group)
+        # feed and dose both flow into the connected reactor, the discharge pump
+        # runs alone so the vial can't overflow
+        pumps_group = PumpsGroup(
+            pumps,
+            simultaneous=[{self._get_feed_pump_id(), self._get_dose_pump_id()}],
+            valves_group=valves_group,
+        )
+        self._dev_manager.add_devices(pumps_group)
 
         # instantiate optical density sensors
         adc_driver = ADCDriver(
@@ -189,6 +221,13 @@ class ReplifactoryMachine(BaseMachine):
             for i in range(VIALS_COUNT)
         ]
         self._dev_manager.add_devices(*od_sensors)
+        self._device_reactors.update(
+            {od_sensor.id: i + 1 for i, od_sensor in enumerate(od_sensors)}
+        )
+        od_sensors_group = OpticalDensitySensorsGroup(
+            od_sensors, calibration_engine=OdCalibrationEngine.from_settings()
+        )
+        self._dev_manager.add_devices(od_sensors_group)
 
         # instantiate thermometers
         thermometers = []
@@ -220,10 +259,11 @@ class ReplifactoryMachine(BaseMachine):
         self._log.debug("Homing all reactors")
         self.stop_pumps()
         self.disconnect_reactors_from_pumps()
-        for reactor in self._reactors:
-            self.stirrer_off(reactor._num, wait_time=None)
+        self.execute_device_command(self._get_stirrers_group_id(), "stop_all")
 
-    @machine_command
+    @machine_command(
+        resources=("pumps", "valves", "optics", "stirrer-{num}", "vial-{num}")
+    )
     def dilute(
         self,
         num: int,
@@ -256,7 +296,9 @@ class ReplifactoryMachine(BaseMachine):
             raise ReactorException("Failed to measure OD")
         changed_volume = 0.0
         while current_od > target_od:
-            if self._cancel_long_operation_event.is_set():
+            # the pumps and the stirrer are stopped, measurements may run
+            preemption_point()
+            if self._cancel_long_operation_event.is_set() or operation_cancelled():
                 # reactor._set_state(ReactorStates.READY)
                 self._cancel_long_operation_event.clear()
                 self._log.info(f"Cancelled dilution of reactor {num}")
@@ -269,8 +311,7 @@ class ReplifactoryMachine(BaseMachine):
                 )
                 raise ReactorException("Dilution volume exceeded reactor volume")
             self.discharge(num, dilution_volume, disconnect_reactors=False)
-            self.feed(num, feed_volume, disconnect_reactors=False)
-            self.dose(num, dose_volume, disconnect_reactors=False)
+            self.feed_and_dose(num, feed_volume, dose_volume, disconnect_reactors=False)
             self.stirrer(num, stirrer_speed, stirrer_time)
             self.stirrer_off(num, stirrer_cooldown_time)
             previous_od = current_od
@@ -282,122 +323,186 @@ class ReplifactoryMachine(BaseMachine):
         self.disconnect_reactors_from_pumps()
         self._log.info(f"Reactor {num} diluted to OD {current_od}")
 
-    @machine_command
+    @machine_command(resources=("valves", "vial-{num}"))
     def close_valve(self, num: int, wait=True):
         self._log.debug(f"Closing valve {num}")
         device_id = self._get_valve_id(num)
         return self.execute_device_command(device_id, "close", wait=wait)
 
-    @machine_command
+    @machine_command(resources=("valves", "vial-{num}"))
     def open_valve(self, num: int):
         self._log.debug(f"Opening valve {num}")
         device_id = self._get_valve_id(num)
         return self.execute_device_command(device_id, "open")
 
-    @machine_command
+    @machine_command(resources=("stirrer-{num}", "vial-{num}"))
     def stirrer(self, num: int, speed_ratio: float, wait_time: Optional[float] = None):
         self._log.debug(f"Setting stirrer {num} speed to {speed_ratio}")
         device_id = self._get_stirrer_id(num)
         self.execute_device_command(device_id, "set_speed", speed_ratio)
         if wait_time:
-            time.sleep(wait_time)
+            clock.sleep(wait_time)
 
-    @machine_command
+    @machine_command(resources=("stirrer-{num}", "vial-{num}"))
     def stirrer_off(self, num: int, wait_time: Optional[float] = None):
         self._log.debug(f"Turning off stirrer {num}")
         return self.stirrer(num, 0.0, wait_time)
 
-    @machine_command
+    @machine_command(resources=("optics", "vial-{num}"), priority=Priority.HIGH)
     def measure_od(self, num: int):
         self._log.debug(f"Measuring OD of reactor {num}")
         device_id = self._get_od_sensor_id(num)
         return self.execute_device_command(device_id, "measure_od")
 
-    @machine_command
+    @machine_command(resources=("optics", "vial-*"), priority=Priority.HIGH)
+    def measure_od_all(self, nums: Optional[list[int]] = None):
+        nums = nums or [reactor.num for reactor in self._reactors]
+        self._log.debug(f"Measuring OD of reactors {nums}")
+        device_id = self._get_od_sensors_group_id()
+        ods = self.execute_device_command(
+            device_id, "measure_od_all", [num - 1 for num in nums]
+        )
+        if isinstance(ods, Exception):
+            raise ods
+        return dict(zip(nums, ods))
+
+    @machine_command(resources=("pumps",))
     def stop_pumps(self):
         self._log.debug("Stopping all pumps")
-        for pump_num in USED_PUMPS:
-            self.stop_pump(f"pump-{pump_num}")
+        self._wait_device_motions(
+            self.execute_device_command(self._get_pumps_group_id(), "stop_all")
+        )
 
-    @machine_command
+    @machine_command(resources=("pumps",))
     def stop_pump(self, device_id: str):
         self._log.debug(f"Stopping pump {device_id}")
-        self.execute_device_command(device_id, "stop")
-        while (
-            self.execute_device_command(device_id, "read_state")
-            == Pump.States.STATE_WORKING
-        ):
-            time.sleep(0.1)
+        self._wait_device_motions([self.execute_device_command(device_id, "stop")])
 
-    @machine_command
+    @machine_command(resources=("valves", "vial-{reactor_num}"))
     def connect_reactor_to_pumps(self, reactor_num: int):
         self._log.debug(f"Connecting reactor {reactor_num} to pumps")
-        for reactor in self._reactors:
-            if reactor._num != reactor_num:
-                self.close_valve(reactor._num, wait=False)
+        self.execute_device_command(
+            self._get_valves_group_id(), "close_all_except", reactor_num - 1, wait=False
+        )
         self.open_valve(reactor_num)
 
-    @machine_command
+    @machine_command(resources=("valves",))
     def disconnect_reactors_from_pumps(self):
         self._log.debug("Disconnecting reactors from pumps")
-        for reactor in self._reactors:
-            wait = reactor._num == self._reactors[-1]._num
-            self.close_valve(reactor._num, wait=wait)
+        self.execute_device_command(self._get_valves_group_id(), "close_all")
 
-    @machine_command
+    @machine_command(resources=("pumps", "valves", "vial-{num}"))
     def feed(self, num: int, volume: float, disconnect_reactors=True):
         self._log.debug(f"Feeding reactor {num} with {volume} mL")
         self.stop_pumps()
         self.connect_reactor_to_pumps(num)
         device_id = self._get_feed_pump_id()
-        self.execute_device_command(device_id, "pump", volume)
+        self._wait_device_motions(
+            [self.execute_device_command(device_id, "pump", volume)]
+        )
+        self._add_measurements(num, {"feed": volume})
         if disconnect_reactors:
             self.disconnect_reactors_from_pumps()
 
-    @machine_command
+    @machine_command(resources=("pumps", "valves", "vial-{num}"))
     def dose(self, num: int, volume: float, disconnect_reactors=True):
         self._log.debug(f"Dosing reactor {num} with {volume} mL")
         self.stop_pumps()
         self.connect_reactor_to_pumps(num)
         device_id = self._get_dose_pump_id()
-        self.execute_device_command(device_id, "pump", volume)
+        self._wait_device_motions(
+            [self.execute_device_command(device_id, "pump", volume)]
+        )
+        self._add_measurements(num, {"dose": volume})
         if disconnect_reactors:
             self.disconnect_reactors_from_pumps()
 
-    @machine_command
+    @machine_command(resources=("pumps", "valves", "vial-{num}"))
+    def feed_and_dose(
+        self,
+        num: int,
+        feed_volume: float,
+        dose_volume: float,
+        disconnect_reactors=True,
+    ):
+        """Runs the feed and dose pumps simultaneously"""
+        self._log.debug(
+            f"Feeding reactor {num} with {feed_volume} mL and dosing {dose_volume} mL"
+        )
+        self.stop_pumps()
+        self.connect_reactor_to_pumps(num)
+        self._wait_device_motions(
+            self.execute_device_command(
+                self._get_pumps_group_id(),
+                "pump_volumes",
+                {
+                    self._get_feed_pump_id(): feed_volume,
+                    self._get_dose_pump_id(): dose_volume,
+                },
+            )
+        )
+        self._add_measurements(num, {"feed": feed_volume, "dose": dose_volume})
+        if disconnect_reactors:
+            self.disconnect_reactors_from_pumps()
+
+    @machine_command(resources=("pumps", "valves", "vial-{num}"))
     def discharge(self, num: int, volume: float, disconnect_reactors=True):
         self._log.debug(f"Discharging reactor {num} with {volume} mL")
         self.stop_pumps()
         self.connect_reactor_to_pumps(num)
         device_id = self._get_discharge_pump_id()
-        self.execute_device_command(device_id, "pump", volume)
+        self._wait_device_motions(
+            [self.execute_device_command(device_id, "pump", volume)]
+        )
+        self._add_measurements(num, {"discharge": volume})
         if disconnect_reactors:
             self.disconnect_reactors_from_pumps()
 
-    @machine_command
+    @machine_command(resources=("optics", "vial-{num}"))
     def laser_on(self, num: int):
         self._log.debug(f"Turning on laser {num}")
         device_id = self._get_laser_id(num)
         return self.execute_device_command(device_id, "switch_on")
 
-    @machine_command
+    @machine_command(resources=("optics", "vial-{num}"))
     def laser_off(self, num: int):
         self._log.debug(f"Turning off laser {num}")
         device_id = self._get_laser_id(num)
         return self.execute_device_command(device_id, "switch_off")
 
+    def _wait_device_motions(self, motions):
+        """
+        Waits for the motion futures returned by device commands, the device
+        command errors are returned as values and raised here
+        """
+        if isinstance(motions, Exception):
+            raise motions
+        for motion in motions:
+            if isinstance(motion, Exception):
+                raise motion
+        return wait_for_motions(motions)
+
     def _get_stirrer_id(self, num: int):
         return f"stirrer-{num}"
 
     def _get_valve_id(self, num: int):
         return f"valve-{num}"
 
+    def _get_valves_group_id(self):
+        return "valves-group"
+
+    def _get_stirrers_group_id(self):
+        return "stirrers-group"
+
     def _get_laser_id(self, num: int):
         return f"laser-{num}"
 
     def _get_od_sensor_id(self, num: int):
         return f"optical-density-sensor-{num}"
 
+    def _get_od_sensors_group_id(self):
+        return "optical-density-sensors-group"
+
     def _get_feed_pump_id(self):
         return "pump-1"
 
@@ -407,6 +512,9 @@ class ReplifactoryMachine(BaseMachine):
     def _get_discharge_pump_id(self):
         return "pump-4"
 
+    def _get_pumps_group_id(self):
+        return "pumps-group"
+
 
 @dataclass(frozen=True)
 class ReplifactoryReactorParams:
@@ -537,7 +645,7 @@ class ReplifactoryReactor(Reactor):
 
     @reactor_command
     def stirrer_off(self, wait_time: Optional[float] = None, *args, **kwargs):
-        return self.stirrer(0.0, wait_time)
+        return self.stirrer(0.0, wait_time, *args, **kwargs)
 
     @reactor_command
     def open_valve(self, *args, **kwargs):
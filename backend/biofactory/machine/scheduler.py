@@ -0,0 +1,329 @@
+import itertools
+import logging
+import math
+import threading
+from enum import IntEnum
+from inspect import signature
+from typing import Any, Callable, Iterable, Optional
+
+from biofactory.metrics import OPERATION_QUEUE_WAIT
+from biofactory.tracing import tracer
+from biofactory.util import clock
+
+EXCLUSIVE = "*"
+"""Resource of operations which conflict with any other operation"""
+
+
+class Priority(IntEnum):
+    """Priority classes of the operations, lower runs first"""
+
+    HIGH = 0
+    """Short operations safe to run inside a preemption point, e.g. measurements"""
+    NORMAL = 1
+    LOW = 2
+
+
+def operation_priority(command: Callable[..., Any]) -> Priority:
+    """Priority of ``machine_command(priority=...)``, NORMAL if not given"""
+    return Priority(getattr(command, "priority", Priority.NORMAL))
+
+
+def operation_resources(
+    command: Callable[..., Any], args: tuple = (), kwargs: Optional[dict] = None
+) -> frozenset[str]:
+    """
+    Returns resources the operation touches. Resource names of commands decorated
+    with ``machine_command(resources=...)`` are formatted with the command
+    arguments, e.g. "stirrer-{num}". Not annotated commands are exclusive.
+    """
+    templates = getattr(command, "resources", None)
+    if templates is None:
+        return frozenset({EXCLUSIVE})
+    try:
+        bound = signature(command).bind_partial(*args, **(kwargs or {}))
+        bound.apply_defaults()
+        return frozenset(template.format(**bound.arguments) for template in templates)
+    except (TypeError, KeyError, IndexError, ValueError):
+        return frozenset({EXCLUSIVE})
+
+
+def resources_conflict(first: Iterable[str], second: Iterable[str]) -> bool:
+    """
+    Resources ending with "-*" stand for all resources of the prefix, e.g.
+    "vial-*" conflicts with "vial-3"
+    """
+    first, second = set(first), set(second)
+    if EXCLUSIVE in first or EXCLUSIVE in second or first & second:
+        return True
+    return _prefix_conflict(first, second) or _prefix_conflict(second, first)
+
+
+def _prefix_conflict(wildcards: set[str], resources: set[str]) -> bool:
+    prefixes = tuple(r[:-1] for r in wildcards if r.endswith("-*"))
+    return bool(prefixes) and any(r.startswith(prefixes) for r in resources)
+
+
+class ScheduledOperation:
+    def __init__(
+        self,
+        operation,
+        resources,
+        on_done=None,
+        priority: Priority = Priority.NORMAL,
+        deadline: Optional[float] = None,
+        seq: int = 0,
+    ):
+        self.operation = operation
+        self.resources = resources
+        self.on_done = on_done
+        self.priority = priority
+        self.submitted = clock.monotonic()
+        self.deadline = math.inf if deadline is None else self.submitted + deadline
+        self.seq = seq
+        self.trace = tracer().capture()
+        self.cancelled = False
+
+    def sort_key(self, now: float, aging_interval: float):
+        """
+        Priority class, raised by one class for every ``aging_interval`` the
+        operation waited, then the earliest deadline, then the submission order
+        """
+        aged = int((now - self.submitted) // aging_interval)
+        return (max(self.priority - aged, 0), self.deadline, self.seq)
+
+
+_current = threading.local()
+
+
+def operation_cancelled() -> bool:
+    """
+    True if the operation running on this thread was cancelled, long operations
+    check it between their steps
+    """
+    scheduled = getattr(_current, "operation", None)
+    return scheduled is not None and scheduled.cancelled
+
+
+def preemption_point() -> int:
+    """
+    Long operations call it where the machine is in a safe state, e.g. between
+    the steps of a dilution. Runs the pending operations which have a higher
+    priority than the running one and need no resource held by another running
+    operation, in the order of the queue. Returns the count of operations run.
+    """
+    scheduled = getattr(_current, "operation", None)
+    scheduler = getattr(_current, "scheduler", None)
+    if scheduled is None or scheduler is None:
+        return 0
+    return scheduler._preempt(scheduled)
+
+
+class OperationScheduler:
+    """
+    Runs machine operations, operations touching different resources run
+    concurrently. Pending operations are ordered by priority class, then by
+    earliest deadline, then by submission order. An operation never overtakes an
+    operation ahead of it in this order it conflicts with, so operations of the
+    same priority without deadline on the same resource run in the order they
+    were added. An operation waiting for ``aging_interval`` seconds is raised by
+    one priority class, so a stream of high priority operations can't starve the
+    others. Long operations let higher priority operations in at their
+    ``preemption_point`` calls.
+
+    The queue wait time of every operation is recorded per priority class.
+    """
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        max_workers: int = 4,
+        aging_interval: float = 60.0,
+    ):
+        self._name = name or self.__class__.__name__
+        self._max_workers = max_workers
+        self._aging_interval = aging_interval
+        self._log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._condition = threading.Condition()
+        self._pending: list[ScheduledOperation] = []
+        self._running: dict[ScheduledOperation, threading.Thread] = {}
+        self._seq = itertools.count()
+        self._queue_wait = {
+            priority: OPERATION_QUEUE_WAIT.labels(self._name, priority.name.lower())
+            for priority in Priority
+        }
+        self._started = False
+        self._stopped = False
+
+    @property
+    def name(self):
+        return self._name
+
+    def start(self):
+        with self._condition:
+            self._started = True
+            self._stopped = False
+            self._dispatch()
+
+    def submit(
+        self,
+        operation: tuple[Callable[..., Any], tuple[Any, ...], dict[str, Any]],
+        on_done: Optional[Callable[[Any], None]] = None,
+        priority: Optional[Priority] = None,
+        deadline: Optional[float] = None,
+    ) -> ScheduledOperation:
+        """
+        ``priority`` defaults to the priority of the command, ``deadline`` is in
+        seconds from now
+        """
+        command, args, kwargs = operation
+        scheduled = ScheduledOperation(
+            operation,
+            operation_resources(command, args, kwargs),
+            on_done,
+            operation_priority(command) if priority is None else Priority(priority),
+            deadline,
+            next(self._seq),
+        )
+        with self._condition:
+            self._pending.append(scheduled)
+            self._dispatch()
+        return scheduled
+
+    def _sorted_pending(self) -> list[ScheduledOperation]:
+        now = clock.monotonic()
+        return sorted(
+            self._pending, key=lambda s: s.sort_key(now, self._aging_interval)
+        )
+
+    def _dispatch(self):
+        if not self._started or self._stopped:
+            return
+        blocking = [scheduled.resources for scheduled in self._running]
+        for scheduled in self._sorted_pending():
+            if len(self._running) >= self._max_workers:
+                break
+            if any(resources_conflict(scheduled.resources, r) for r in blocking):
+                # later operations must not overtake this one on its resources
+                blocking.append(scheduled.resources)
+                continue
+            self._pending.remove(scheduled)
+            thread = threading.Thread(
+                name=f"{self._name}Worker", target=self._run, args=(scheduled,)
+            )
+            thread.daemon = True
+            self._running[scheduled] = thread
+            blocking.append(scheduled.resources)
+            thread.start()
+
+    def _run(self, scheduled: ScheduledOperation):
+        result = self._execute(scheduled)
+        with self._condition:
+            self._running.pop(scheduled, None)
+            self._dispatch()
+            self._condition.notify_all()
+        if scheduled.on_done:
+            scheduled.on_done(result)
+
+    def _execute(self, scheduled: ScheduledOperation):
+        self._queue_wait[scheduled.priority].observe(
+            clock.monotonic() - scheduled.submitted
+        )
+        command, args, kwargs = scheduled.operation
+        previous = (
+            getattr(_current, "operation", None),
+            getattr(_current, "scheduler", None),
+        )
+        _current.operation = scheduled
+        _current.scheduler = self
+        try:
+            with tracer().resume(scheduled.trace, scheduler=self._name):
+                return command(*args, **kwargs)
+        except Exception as exc:
+            self._log.exception(exc)
+            return exc
+        finally:
+            _current.operation, _current.scheduler = previous
+
+    def _preempt(self, running: ScheduledOperation) -> int:
+        count = 0
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return count
+                others = [
+                    scheduled.resources
+                    for scheduled in self._running
+                    if scheduled is not running
+                ]
+                preempting = next(
+                    (
+                        scheduled
+                        for scheduled in self._sorted_pending()
+                        if self._may_preempt(scheduled, running, others)
+                    ),
+                    None,
+                )
+                if preempting is None:
+                    return count
+                self._pending.remove(preempting)
+                # holds its other resources (e.g. its vial) while it runs
+                self._running[preempting] = threading.current_thread()
+            self._log.debug(
+                f"{preempting.operation[0]} preempts {running.operation[0]}"
+            )
+            result = self._execute(preempting)
+            with self._condition:
+                self._running.pop(preempting, None)
+                self._dispatch()
+                self._condition.notify_all()
+            if preempting.on_done:
+                preempting.on_done(result)
+            count += 1
+
+    @staticmethod
+    def _may_preempt(
+        scheduled: ScheduledOperation,
+        running: ScheduledOperation,
+        others: list[frozenset[str]],
+    ) -> bool:
+        """
+        Runs inside ``running``, the resources it does not share with it must
+        be free
+        """
+        if scheduled.priority >= running.priority:
+            return False
+        if EXCLUSIVE in running.resources:
+            return True
+        if EXCLUSIVE in scheduled.resources:
+            return False
+        extra = scheduled.resources - running.resources
+        return not extra or not any(resources_conflict(extra, r) for r in others)
+
+    def cancel(self, scheduled: ScheduledOperation) -> bool:
+        """
+        Drops the operation if it did not start yet and returns True, its
+        ``on_done`` is never called. A running operation is only marked as
+        cancelled, see ``operation_cancelled``.
+        """
+        with self._condition:
+            scheduled.cancelled = True
+            if scheduled in self._pending:
+                self._pending.remove(scheduled)
+                self._dispatch()
+                return True
+            return False
+
+    def cancel_pending(self):
+        with self._condition:
+            cancelled, self._pending = self._pending, []
+        return cancelled
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stops starting new operations and waits for the running ones, returns True
+        if some are still running after the timeout
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.wait_for(lambda: not self._running, timeout=timeout)
+            return bool(self._running)
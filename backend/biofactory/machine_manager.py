@@ -1,5 +1,7 @@
 import copy
+import functools
 import logging
+import os
 import threading
 import time
 from collections import deque
@@ -8,11 +10,14 @@ from typing import Optional
 
 import biofactory.devices._machine as comm
 from biofactory.events import Events, eventManager
-from biofactory.machine import BaseMachine, MachineCallback, machineRegistry
+from biofactory.machine import MachineCallback, machineRegistry
+from biofactory.machine.process import MachineFactory, RemoteMachine, UsbMachineFactory
 from biofactory.server import settings
+from biofactory.timeseries import COLUMNS, MACHINE_WIDE, TimeSeriesStore
 from biofactory.usb_manager import UsbManager, usbManager
-from biofactory.util import InvariantContainer
+from biofactory.util import TimeRingBuffer, clock
 from biofactory.util import get_fully_qualified_classname as fqcn
+from biofactory.util import slugify
 
 logger = logging.getLogger(__name__)
 
@@ -27,35 +32,96 @@ def machineManager():
     return _instance
 
 
-class MachineManager(MachineCallback):
+class ManagedMachine(MachineCallback):
+    """
+    Machine of one USB serial number with its state monitor, temperature history
+    and stored measurements. Kept while the machine is offline, so the history
+    is still served and a reconnected machine continues it.
+    """
+
+    def __init__(self, manager: "MachineManager", serial: str):
+        self.serial = serial
+        self.machine: Optional[RemoteMachine] = None
+        self.connection = {}
+        self.state = None
+        self._manager = manager
+
+        self.timeseries = TimeSeriesStore(
+            os.path.join(
+                settings().folder.data or os.path.abspath("data"), slugify(serial)
+            )
+        )
+        self.temps = DataHistory(cutoff=settings().temperature.cutoff * 60)
+        self._load_temperature_history()
+
+        self.monitor = StateMonitor(
+            interval=0.5,
+            on_update=functools.partial(manager._sendCurrentDataCallbacks, serial),
+            on_change_environment=manager._updateEnvironmentCallback,
+        )
+        self.monitor.reset(experiment_data={})
+
+    def _load_temperature_history(self):
+        records = self.timeseries.query(
+            start=clock.time() - settings().temperature.cutoff * 60,
+            reactor=MACHINE_WIDE,
+        )
+        temps = {}
+        for timestamp, metric, value in zip(
+            records["time"].tolist(), records["metric"], records["value"].tolist()
+        ):
+            if metric.endswith(".temperature"):
+                temps.setdefault(timestamp, {"time": timestamp})[metric] = value
+        for item in temps.values():
+            self.temps.append(item)
+
+    # MachineCallback
+    def _on_machine_state_change(self, state, *args, **kwargs):
+        self._manager._on_machine_state_change(self.serial, state)
+
+    # MachineCallback
+    def _on_machine_add_measurements(self, reactor, values, timestamp, *args, **kwargs):
+        self.timeseries.append_many(reactor, values, timestamp)
+        temperatures = {
+            metric: value
+            for metric, value in values.items()
+            if metric.endswith(".temperature")
+        }
+        if reactor == MACHINE_WIDE and temperatures:
+            self.temps.append({"time": timestamp, **temperatures})
+            self.monitor.add_temperature(temperatures)
+
+    # MachineCallback
+    def _on_change_device_data(self, data, *args, **kwargs):
+        self.monitor.set_device_data(data["id"], data)
+
+
+class MachineManager:
+    """
+    Machines of the server keyed by the USB serial number, each one running in
+    its own worker process. Methods taking ``machine`` (a serial number) use the
+    first connected machine when it is None, or the first machine when none is
+    connected.
+    """
+
     def __init__(self):
         self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
 
         self._dict = dict
 
-        self._temps = DataHistory(cutoff=settings().temperature.cutoff * 60)
-
         self._messages = deque([], 300)
         self._log = deque([], 300)
 
-        self._state = None
-
         self._firmware_info = None
 
-        self._machine: Optional[BaseMachine] = None
-        self._current_connection = {}
+        self._machines: dict[str, ManagedMachine] = {}
+        self._lock = threading.RLock()
 
         self._callbacks: list[MachineCallback] = []
 
-        self._stateMonitor = StateMonitor(
-            interval=0.5,
-            on_update=self._sendCurrentDataCallbacks,
-            # on_add_temperature=self._sendAddTemperatureCallbacks,
-            # on_add_optical_density=self._sendAddOpticalDensityCallbacks,
-            # on_change_stirrer_speed=self._updateStirrerSpeedCallback,
-            on_change_environment=self._updateEnvironmentCallback,
-        )
-        self._stateMonitor.reset(
+        # state shown while no machine was ever connected
+        self._offlineMonitor = StateMonitor(interval=0.5)
+        self._offlineMonitor.reset(
             state=self._dict(
                 text=self.get_state_string(),
                 flags=self._getStateFlags(),
@@ -65,6 +131,9 @@ class MachineManager(MachineCallback):
         )
 
         eventManager().subscribe(Events.USB_LIST_UPDATED, self._on_usb_list_updated)
+        eventManager().subscribe(Events.USB_CONNECTED, self._on_usb_event)
+        eventManager().subscribe(Events.USB_DISCONNECTED, self._on_usb_event)
+        eventManager().subscribe(Events.SHUTDOWN, self._on_shutdown)
 
     def register_callback(self, callback, *args, **kwargs):
         if not isinstance(callback, MachineCallback):
@@ -79,13 +148,16 @@ class MachineManager(MachineCallback):
 
     def send_initial_callback(self, callback):
         if callback in self._callbacks:
-            self._sendInitialStateUpdate(callback)
+            managed_machines = list(self._machines.values())
+            for managed in managed_machines or [None]:
+                self._sendInitialStateUpdate(callback, managed)
 
-    def _sendCurrentDataCallbacks(self, data):
+    def _sendCurrentDataCallbacks(self, serial, data):
+        # the socket.io broadcaster fetches its own deltas, copy the data only once
+        data_copy = copy.deepcopy(data)
         for callback in self._callbacks:
             try:
-                data_copy = copy.deepcopy(data)
-                callback._on_machine_send_current_data(data_copy)
+                callback._on_machine_send_current_data(data_copy, machine=serial)
             except Exception:
                 self._logger.exception(
                     "Exception while pushing current data to callback {}".format(
@@ -124,11 +196,24 @@ class MachineManager(MachineCallback):
     def _updateEnvironmentCallback(self, data):
         pass
 
-    def _sendInitialStateUpdate(self, callback: MachineCallback):
+    def _sendInitialStateUpdate(
+        self, callback: MachineCallback, managed: Optional[ManagedMachine]
+    ):
         try:
-            data = self._stateMonitor.get_current_data()
+            if managed is None:
+                data = self._offlineMonitor.get_current_data()
+                data.update(temps=[], history=self.get_history())
+            else:
+                data = managed.monitor.get_current_data()
+                data.update(
+                    temps=managed.temps.slice(),
+                    history=self.get_history(
+                        start=clock.time() - settings().temperature.cutoff * 60,
+                        machine=managed.serial,
+                    ),
+                )
             data.update(
-                temps=list(self._temps),
+                machine=managed.serial if managed is not None else None,
                 logs=list(self._log),
                 messages=list(self._messages),
             )
@@ -141,30 +226,99 @@ class MachineManager(MachineCallback):
                 extra={"callback": fqcn(callback)},
             )
 
-    def _getStateFlags(self):
+    def get_machines(self) -> list[str]:
+        """Serial numbers of the machines, connected or not, in connection order"""
+        with self._lock:
+            return list(self._machines)
+
+    def call_workers(self, method: str, *args, **kwargs) -> dict:
+        """
+        Results of ``method`` of the worker processes by machine serial, e.g. the
+        metrics recorded in the workers. Workers which fail are left out.
+        """
+        with self._lock:
+            machines = [
+                (serial, managed.machine)
+                for serial, managed in self._machines.items()
+                if managed.machine is not None
+            ]
+        results = {}
+        for serial, machine in machines:
+            try:
+                results[serial] = machine.call(method, *args, **kwargs)
+            except Exception as exc:
+                self._logger.warning(f"Could not call {method} of {serial}: {exc!r}")
+        return results
+
+    def _get(self, machine: Optional[str] = None) -> Optional[ManagedMachine]:
+        with self._lock:
+            if machine is not None:
+                return self._machines.get(machine)
+            managed_machines = list(self._machines.values())
+        connected = (managed for managed in managed_machines if managed.machine)
+        return next(connected, None) or next(iter(managed_machines), None)
+
+    def get_history(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        reactor: Optional[int | list[int]] = None,
+        metric: Optional[str | list[str]] = None,
+        machine: Optional[str] = None,
+    ):
+        """
+        Returns stored measurements as columns: time, reactor, metric, value
+        """
+        managed = self._get(machine)
+        if managed is None:
+            return {column: [] for column in COLUMNS}
+        return managed.timeseries.query_dict(
+            start=start, end=end, reactor=reactor, metric=metric
+        )
+
+    def _on_shutdown(self, event, payload):
+        for managed in list(self._machines.values()):
+            if managed.machine is not None:
+                managed.machine.shutdown()
+            managed.timeseries.close()
+
+    def _getStateFlags(self, machine: Optional[str] = None):
         return self._dict(
-            operational=self.is_operational(),
-            working=self.is_working(),
-            cancelling=self.is_cancelling(),
-            pausing=self.is_pausing(),
-            resuming=self.is_resuming(),
-            finishing=self.is_finishing(),
-            closedOrError=self.is_closed_or_error(),
-            error=self.is_error(),
-            paused=self.is_paused(),
-            ready=self.is_ready(),
-            manualControl=self.is_manual_control(),
+            operational=self.is_operational(machine),
+            working=self.is_working(machine),
+            cancelling=self.is_cancelling(machine),
+            pausing=self.is_pausing(machine),
+            resuming=self.is_resuming(machine),
+            finishing=self.is_finishing(machine),
+            closedOrError=self.is_closed_or_error(machine),
+            error=self.is_error(machine),
+            paused=self.is_paused(machine),
+            ready=self.is_ready(machine),
+            manualControl=self.is_manual_control(machine),
         )
 
     def _on_usb_list_updated(self, event, data):
         payload = self.get_connection_options()
         eventManager().fire(Events.CONNECTION_OPTIONS_UPDATED, payload)
 
-    def get_current_connection(self):
-        return self._current_connection
-
-    def _set_current_connection(self, usb_device):
-        self._current_connection = UsbManager.get_device_info(usb_device)
+    def _on_usb_event(self, event, usb_device):
+        # the worker of the machine doesn't monitor the USB devices itself
+        machine = self.get_machine(getattr(usb_device, "serial_number", None) or "")
+        if machine is not None:
+            machine.usb_event(event)
+
+    def get_current_connection(self, machine: Optional[str] = None):
+        managed = self._get(machine)
+        return managed.connection if managed is not None else {}
+
+    def get_connections(self):
+        """Connections of the connected machines by serial number"""
+        with self._lock:
+            return {
+                serial: managed.connection
+                for serial, managed in self._machines.items()
+                if managed.machine is not None
+            }
 
     @classmethod
     def get_connection_options(cls):
@@ -179,14 +333,10 @@ class MachineManager(MachineCallback):
 
     def connect(self, device_address: str, *args, **kwargs):
         """
-        Connects to the machine. If port and/or baudrate is provided, uses these settings, otherwise autodetection
-        will be attempted.
+        Connects to the machine of the USB device, in a new worker process. Does
+        nothing if the machine of the device is already connected.
         """
-        if self._machine is not None:
-            return
-        eventManager().fire(Events.MACHINE_CONNECTING)
         usb_device = usbManager().get_device(device_id=device_address)
-        self._set_current_connection(usb_device)
         usb_device_dict = {
             attr: getattr(usb_device, attr)
             for attr in dir(usb_device)
@@ -197,19 +347,55 @@ class MachineManager(MachineCallback):
             raise ValueError(
                 f"No machine implementation found for USB device {device_address}"
             )
-        self._machine = machine_type(machine_callback=self)
-        self._machine.connect(usb_device=usb_device)
+        serial = usb_device.serial_number
+        return self.add_machine(
+            serial,
+            UsbMachineFactory(serial, machine_type),
+            connection=UsbManager.get_device_info(usb_device),
+        )
 
-    def disconnect(self, *args, **kwargs):
+    def add_machine(
+        self,
+        serial: str,
+        factory: MachineFactory,
+        connection: Optional[dict] = None,
+    ) -> RemoteMachine:
+        """Starts the worker process of the machine ``serial`` created by ``factory``"""
+        with self._lock:
+            managed = self._machines.get(serial)
+            if managed is not None and managed.machine is not None:
+                return managed.machine
+            if managed is None:
+                managed = self._machines[serial] = ManagedMachine(self, serial)
+            managed.connection = connection or {"serial_number": serial}
+            machine = managed.machine = RemoteMachine(
+                serial, factory, machine_callback=managed
+            )
+        eventManager().fire(Events.MACHINE_CONNECTING, {"machine": serial})
+        try:
+            machine.connect()
+        except Exception:
+            with self._lock:
+                if managed.machine is machine:
+                    managed.machine = None
+                managed.connection = {}
+            raise
+        return machine
+
+    def disconnect(self, machine: Optional[str] = None, *args, **kwargs):
         """
-        Closes the connection to the printer.
+        Closes the connection to the machine and stops its worker process.
         """
-        eventManager().fire(Events.MACHINE_DISCONNECTING)
-        self._current_connection = {}
-        if self._machine is not None:
-            self._machine.disconnect()
+        managed = self._get(machine)
+        eventManager().fire(
+            Events.MACHINE_DISCONNECTING,
+            {"machine": managed.serial if managed is not None else machine},
+        )
+        if managed is not None and managed.machine is not None:
+            managed.connection = {}
+            managed.machine.disconnect()
         else:
-            eventManager().fire(Events.MACHINE_DISCONNECTED)
+            eventManager().fire(Events.MACHINE_DISCONNECTED, {"machine": machine})
 
     # def valve_open(self, device_id, *args, **kwargs):
     #     if self._machine:
@@ -322,90 +508,113 @@ class MachineManager(MachineCallback):
     #     if self._machine:
     #         self._machine.command_queue_clear()
 
-    def is_closed_or_error(self, *args, **kwargs):
-        return self._machine is None or self._machine.isClosedOrError()
+    def is_closed_or_error(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is None or machine.isClosedOrError()
 
-    def is_operational(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isOperational()
+    def is_operational(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isOperational()
 
-    def is_idle(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isIdle()
+    def is_idle(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isIdle()
 
-    def is_working(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isWorking()
+    def is_working(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isWorking()
 
-    def is_cancelling(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isCancelling()
+    def is_cancelling(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isCancelling()
 
-    def is_pausing(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isPausing()
+    def is_pausing(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isPausing()
 
-    def is_paused(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isPaused()
+    def is_paused(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isPaused()
 
-    def is_resuming(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isResuming()
+    def is_resuming(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isResuming()
 
-    def is_finishing(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isFinishing()
+    def is_finishing(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isFinishing()
 
-    def is_error(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isError()
+    def is_error(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isError()
 
-    def is_ready(self, *args, **kwargs):
+    def is_ready(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
         return (
-            self.is_operational()
-            and not self._machine.isBusy()
+            machine is not None
+            and machine.isOperational()
+            and not machine.isBusy()
             # isBusy is true when paused
         )
 
-    def is_manual_control(self, *args, **kwargs):
-        return self._machine is not None and self._machine.isManualControl()
+    def is_manual_control(self, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        return machine is not None and machine.isManualControl()
 
-    def get_error(self):
-        if self._machine is None:
+    def get_error(self, machine: Optional[str] = None):
+        machine = self.get_machine(machine)
+        if machine is None:
             return ""
         else:
-            return self._machine.get_error_string()
+            return machine.get_error_string()
 
-    def get_state_id(self, state=None, *args, **kwargs):
-        if self._machine is None:
+    def get_state_id(self, state=None, machine: Optional[str] = None, *args, **kwargs):
+        machine = self.get_machine(machine)
+        if machine is None:
             return "OFFLINE"
         else:
-            return self._machine.get_state_id(state=state)
+            return machine.get_state_id(state=state)
 
-    def get_state_string(self, state=None, *args, **kwargs):
-        if self._machine is None:
+    def get_state_string(
+        self, state=None, machine: Optional[str] = None, *args, **kwargs
+    ):
+        machine = self.get_machine(machine)
+        if machine is None:
             return "Offline"
         else:
-            return self._machine.get_state_string(state=state)
+            return machine.get_state_string(state=state)
 
-    def _set_state(self, state, state_string, error_string):
-        state_string = state_string or self.get_state_string()
-        error_string = error_string or self.get_error()
+    def _set_state(self, serial, state, state_string, error_string):
+        managed = self._get(serial)
+        state_string = state_string or self.get_state_string(machine=serial)
+        error_string = error_string or self.get_error(serial)
 
-        self._state = state
-        self._stateMonitor.set_state(
+        managed.state = state
+        managed.monitor.set_state(
             self._dict(
-                text=state_string, flags=self._getStateFlags(), error=error_string
+                text=state_string,
+                flags=self._getStateFlags(serial),
+                error=error_string,
             )
         )
 
         payload = {
-            "state_id": self.get_state_id(self._state),
-            "state_string": self.get_state_string(self._state),
+            "machine": serial,
+            "state_id": self.get_state_id(state, machine=serial),
+            "state_string": self.get_state_string(state, machine=serial),
         }
         eventManager().fire(Events.MACHINE_STATE_CHANGED, payload)
 
-    # MachineCallback
-    def _on_machine_state_change(self, state, *args, **kwargs):
-        oldState = self._state
+    def _on_machine_state_change(self, serial, state):
+        managed = self._get(serial)
+        oldState = managed.state
 
         state_string = None
         error_string = None
-        if self._machine is not None:
-            state_string = self._machine.get_state_string()
-            # error_string = self._machine.get_error_string()
+        machine = managed.machine
+        if machine is not None:
+            state_string = machine.get_state_string()
+            # error_string = machine.get_error_string()
             error_string = "Unkonwn error"
 
         if oldState in (comm.Machine.States.STATE_WORKING,) and state in (
@@ -413,32 +622,48 @@ class MachineManager(MachineCallback):
             comm.Machine.States.STATE_ERROR,
             comm.Machine.States.STATE_CLOSED_WITH_ERROR,
         ):
-            self._logger.error("Work failed: %s", error_string)
+            self._logger.error("Work of machine %s failed: %s", serial, error_string)
 
         if (
             state == comm.Machine.States.STATE_CLOSED
             or state == comm.Machine.States.STATE_CLOSED_WITH_ERROR
         ):
-            if self._machine is not None:
-                self._machine = None
-            eventManager().fire(Events.MACHINE_DISCONNECTED)
+            if machine is not None:
+                managed.machine = None
+                # stops the worker if the machine closed on its own, a no-op
+                # when the machine is shutting down
+                threading.Thread(target=machine.shutdown, daemon=True).start()
+            eventManager().fire(Events.MACHINE_DISCONNECTED, {"machine": serial})
+
+        self._set_state(
+            serial, state, state_string=state_string, error_string=error_string
+        )
 
-        self._set_state(state, state_string=state_string, error_string=error_string)
+    def _get_monitor(self, machine: Optional[str] = None) -> "StateMonitor":
+        managed = self._get(machine)
+        return managed.monitor if managed is not None else self._offlineMonitor
 
-    # MachineCallback
-    def _on_change_device_data(self, data):
-        self._stateMonitor.set_device_data(data["id"], data)
+    def get_current_data(self, machine: Optional[str] = None):
+        return self._get_monitor(machine).get_current_data()
 
-    def get_current_data(self):
-        return self._stateMonitor.get_current_data()
+    def get_current_version(self, machine: Optional[str] = None):
+        return self._get_monitor(machine).version
+
+    def get_current_changes(self, since=None, machine: Optional[str] = None):
+        return self._get_monitor(machine).get_changes(since)
 
-    def get_machine(self):
-        return self._machine
+    def get_machine(self, machine: Optional[str] = None) -> Optional[RemoteMachine]:
+        managed = self._get(machine)
+        return managed.machine if managed is not None else None
 
 
 class StateMonitor:
     """
     Machine data to display at UI
+
+    Every change bumps the state version and remembers the version at which each
+    entry (state, experiment and every device) changed last, so clients can ask
+    only for the entries changed since the version they already have.
     """
 
     def __init__(
@@ -461,14 +686,24 @@ class StateMonitor:
         self._devices_data = {}
         self._experiment_data = None
 
+        self._version = 0
+        self._reset_version = 0
+        self._state_version = 0
+        self._experiment_version = 0
+        self._device_versions = {}
+
         self._change_event = threading.Event()
-        self._state_lock = threading.Lock()
+        self._state_lock = threading.RLock()
 
         self._last_update = time.monotonic()
         self._worker = threading.Thread(target=self._machine_state_monitor_loop)
         self._worker.daemon = True
         self._worker.start()
 
+    @property
+    def version(self):
+        return self._version
+
     def reset(
         self,
         state=None,
@@ -492,19 +727,36 @@ class StateMonitor:
     def set_state(self, state):
         with self._state_lock:
             self._state = state
+            self._version += 1
+            self._state_version = self._version
             self._change_event.set()
 
     def set_devices_data(self, machine_data):
-        self._devices_data = machine_data
-        self._change_event.set()
+        with self._state_lock:
+            self._devices_data = machine_data
+            # devices could be removed, clients have to resync
+            self._version += 1
+            self._reset_version = self._version
+            self._device_versions = {
+                device_id: self._version for device_id in machine_data
+            }
+            self._change_event.set()
 
     def set_device_data(self, device_id, data):
-        self._devices_data[device_id] = data
-        self._change_event.set()
+        with self._state_lock:
+            if self._devices_data.get(device_id) == data:
+                return
+            self._devices_data[device_id] = data
+            self._version += 1
+            self._device_versions[device_id] = self._version
+            self._change_event.set()
 
     def set_experiment_data(self, experiment_data):
-        self._experiment_data = experiment_data
-        self._change_event.set()
+        with self._state_lock:
+            self._experiment_data = experiment_data
+            self._version += 1
+            self._experiment_version = self._version
+            self._change_event.set()
 
     def _machine_state_monitor_loop(self):
         """
@@ -541,23 +793,37 @@ class StateMonitor:
             "experiment": self._experiment_data,
         }
 
-
-class DataHistory(InvariantContainer):
+    def get_changes(self, since=None):
+        """
+        Returns entries changed after version ``since`` together with the current
+        version. Returns a full snapshot (``full`` is True) when ``since`` is None
+        or older than the last devices reset.
+        """
+        with self._state_lock:
+            if since is None or since < self._reset_version:
+                return {
+                    "version": self._version,
+                    "since": None,
+                    "full": True,
+                    **copy.deepcopy(self.get_current_data()),
+                }
+            changes = {
+                "version": self._version,
+                "since": since,
+                "full": False,
+                "devices": {
+                    device_id: copy.deepcopy(self._devices_data[device_id])
+                    for device_id, version in self._device_versions.items()
+                    if version > since
+                },
+            }
+            if self._state_version > since:
+                changes["state"] = copy.deepcopy(self._state)
+            if self._experiment_version > since:
+                changes["experiment"] = copy.deepcopy(self._experiment_data)
+            return changes
+
+
+class DataHistory(TimeRingBuffer):
     def __init__(self, cutoff=30 * 60):
-        def data_invariant(data):
-            data.sort(key=lambda x: x["time"])
-            now = int(time.time())
-            return [item for item in data if item["time"] >= now - cutoff]
-
-        InvariantContainer.__init__(self, guarantee_invariant=data_invariant)
-        self._last = None
-
-    @property
-    def last(self):
-        return self._last
-
-    def append(self, item):
-        try:
-            return super().append(item)
-        finally:
-            self._last = self._data[-1] if len(self._data) else None
+        TimeRingBuffer.__init__(self, cutoff=cutoff, key="time")
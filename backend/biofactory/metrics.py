@@ -0,0 +1,378 @@
+"""
+Counters, gauges and histograms of the machine and bus health, served in the
+Prometheus text format by /api/metrics.
+
+Recording takes no lock: every thread accumulates into its own cell of the
+metric, only that thread writes to it. A scrape sums the cells of all threads,
+the cells of finished threads are folded into the totals, on a scrape and when
+a new thread records. Hot paths bind the labels once
+(``BUS_TRANSACTIONS.labels("i2c", name)``) and then only pay for the increment.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+from biofactory.events import eventManager
+
+# seconds, from a register read to a slow pump run
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def metricsRegistry():
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = MetricsRegistry()
+    return _instance
+
+
+class _Cells:
+    """Values of one labelled metric, accumulated per thread"""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cells: list[tuple[threading.Thread, list]] = []
+        self._retired = [0] * size
+
+    def _new_cell(self) -> list:
+        cell = [0] * self._size
+        with self._lock:
+            # short lived threads (e.g. of the operations) come and go between
+            # scrapes, their cells must not pile up
+            self._fold_finished()
+            self._cells.append((threading.current_thread(), cell))
+        self._local.cell = cell
+        return cell
+
+    def _fold_finished(self):
+        """Folds the cells of finished threads into the totals, lock held"""
+        alive = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                self._retired = [a + b for a, b in zip(self._retired, cell)]
+        self._cells = alive
+
+    def _totals(self) -> list:
+        with self._lock:
+            self._fold_finished()
+            cells = [cell for _, cell in self._cells]
+        return [sum(values) for values in zip(self._retired, *cells)]
+
+
+class CounterChild(_Cells):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0] += amount
+
+    def get(self) -> float:
+        return self._totals()[0]
+
+
+class GaugeChild(_Cells):
+    def __init__(self):
+        super().__init__(1)
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0] += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        """Not meant to be mixed with concurrent ``inc`` and ``dec``"""
+        with self._lock:
+            for _, cell in self._cells:
+                cell[0] = 0
+            self._retired = [value]
+
+    def set_function(self, function: Callable[[], float]):
+        """The gauge value is returned by ``function`` when scraped"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._totals()[0]
+
+
+class HistogramChild(_Cells):
+    """Cells hold the count of each bucket, +Inf last, followed by the sum"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        super().__init__(len(buckets) + 2)
+        self._buckets = buckets
+
+    def observe(self, value: float):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[bisect_left(self._buckets, value)] += 1
+        cell[-1] += value
+
+    def get(self) -> dict:
+        totals = self._totals()
+        cumulative = []
+        count = 0
+        for bucket_count in totals[:-1]:
+            count += bucket_count
+            cumulative.append(count)
+        return {
+            "buckets": dict(zip((*self._buckets, math.inf), cumulative)),
+            "count": count,
+            "sum": totals[-1],
+        }
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        registry: Optional["MetricsRegistry"] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, _Cells] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+        (registry or metricsRegistry()).register(self)
+
+    def _new_child(self) -> _Cells:
+        raise NotImplementedError()
+
+    def labels(self, *values, **labels):
+        """Child metric of the label values, keep it to record in a hot path"""
+        if labels:
+            values = tuple(labels[name] for name in self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(values, None)
+
+    def collect(self) -> list[tuple[dict[str, str], object]]:
+        """Label sets with the values of the children"""
+        return [
+            (dict(zip(self.labelnames, map(str, values))), child.get())
+            for values, child in list(self._children.items())
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default.set_function(function)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+        registry: Optional["MetricsRegistry"] = None,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    """Label pairs without the braces"""
+    return ",".join(
+        '{}="{}"'.format(
+            name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in labels.items()
+    )
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Metric:
+        return self._metrics[name]
+
+    def collect(self) -> dict[str, list[tuple[dict[str, str], object]]]:
+        return {name: metric.collect() for name, metric in list(self._metrics.items())}
+
+    def export_prometheus(
+        self, machines: Optional[dict[str, dict[str, list]]] = None
+    ) -> str:
+        """
+        Prometheus text exposition format 0.0.4. ``machines`` are the collected
+        metrics of the machine worker processes by serial number, exported
+        with a "machine" label.
+        """
+        lines = []
+        for name, metric in list(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            samples = metric.collect()
+            for serial, collected in (machines or {}).items():
+                samples += [
+                    ({**labels, "machine": serial}, value)
+                    for labels, value in collected.get(name, [])
+                ]
+            for labels, value in samples:
+                pairs = _format_labels(labels)
+                series = f"{{{pairs}}}" if pairs else ""
+                if metric.type != "histogram":
+                    lines.append(f"{name}{series} {_format_value(value)}")
+                    continue
+                prefix = (
+                    f"{name}_bucket{{{pairs},le=" if pairs else f"{name}_bucket{{le="
+                )
+                for bound, count in value["buckets"].items():
+                    lines.append(f'{prefix}"{_format_value(bound)}"}} {count}')
+                lines.append(f"{name}_sum{series} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{series} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+BUS_TRANSACTIONS = Counter(
+    "biofactory_bus_transactions_total",
+    "I2C and SPI transactions",
+    ("bus", "port"),
+)
+BUS_BYTES = Counter(
+    "biofactory_bus_bytes_total",
+    "Bytes transferred over the I2C and SPI buses",
+    ("bus", "port"),
+)
+I2C_NACKS = Counter(
+    "biofactory_i2c_nacks_total",
+    "Devices not acknowledging I2C transactions while their state is read",
+    ("device",),
+)
+COMMAND_QUEUE_DEPTH = Gauge(
+    "biofactory_command_queue_depth",
+    "Device commands waiting in the command executor queues",
+    ("executor",),
+)
+COMMAND_DURATION = Histogram(
+    "biofactory_command_duration_seconds",
+    "Execution time of the device commands",
+    ("device", "command"),
+)
+OPERATION_QUEUE_WAIT = Histogram(
+    "biofactory_operation_queue_wait_seconds",
+    "Time the machine operations wait in the scheduler queue",
+    ("scheduler", "priority"),
+)
+EVENT_BACKLOG = Gauge(
+    "biofactory_event_backlog",
+    "Events waiting to be dispatched by the event manager and its listener workers",
+)
+EXPERIMENT_CYCLE_DURATION = Histogram(
+    "biofactory_experiment_cycle_duration_seconds",
+    "Duration of the experiment cycles",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+EXPERIMENT_CYCLE_TIME = Gauge(
+    "biofactory_experiment_cycle_time_seconds",
+    "Cycle time of the running experiment",
+)
+EXPERIMENT_CYCLES_TOO_LONG = Counter(
+    "biofactory_experiment_cycles_too_long_total",
+    "Experiment cycles which took longer than the cycle time",
+)
+
+EVENT_BACKLOG.set_function(lambda: eventManager().backlog())
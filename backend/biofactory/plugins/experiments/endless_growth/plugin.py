@@ -5,6 +5,7 @@ from biofactory.experiment import Experiment
 from biofactory.machine import ReactorException, ReactorStates
 from biofactory.plugins import PluginUiModuleMetadata
 from biofactory.plugins.experiments import ExperimentPlugin
+from biofactory.util import clock
 
 
 def init_plugin(*args, **kwargs):
@@ -41,31 +42,72 @@ class EndlessGrowthExperiment(Experiment):
 
     def _experiment_loop(self, *args, **kwargs):
         for reactor in self._reactors:
-            self._reset_growth_timeout(reactor)
+            # a restored experiment keeps its growth timers
+            if str(reactor) not in self._start_growth_time:
+                self._reset_growth_timeout(reactor)
         return super()._experiment_loop(*args, **kwargs)
 
+    def checkpoint_state(self):
+        return {
+            "start_growth_time": {
+                reactor: time.isoformat()
+                for reactor, time in self._start_growth_time.items()
+            }
+        }
+
+    def restore_state(self, state):
+        for reactor, time in state.get("start_growth_time", {}).items():
+            self._start_growth_time[reactor] = datetime.fromisoformat(time)
+
+    def recover_operation(self, name, data):
+        if name != "dilute":
+            return super().recover_operation(name, data)
+        # the pumped volume is unknown, the next cycle measures the optical
+        # density again and dilutes once more if it is still above the threshold
+        self._log.warning(f"Dilution of reactor {data['reactor']} was interrupted")
+        for reactor in self._reactors:
+            if reactor.num == data["reactor"]:
+                self._reset_growth_timeout(reactor)
+
     def warmup(self):
         for reactor in self._reactors:
             reactor.home()
 
     def routine(self):
+        reactors = []
         for reactor in self._reactors:
-            if self.is_interrupted():
-                return
             if reactor.state != ReactorStates.READY:
                 self._log.warning(f"Reactor {reactor} is not ready")
                 continue
+            reactors.append(reactor)
+        if self.is_interrupted() or not reactors:
+            return
+        ods = self._machine.cmd(
+            "measure_od_all", nums=[reactor.num for reactor in reactors]
+        )
+        if isinstance(ods, Exception):
+            return {"error": ods}
+        for reactor in reactors:
+            if self.is_interrupted():
+                return
             try:
-                current_od = reactor.cmd("measure_od")
+                current_od = ods[reactor.num]
                 if current_od < self._params.od_dilution_threshold:
                     continue
                 self._reset_growth_timeout(reactor)
-                reactor.cmd(
+                with self.checkpoint_operation(
+                    f"dilute:{reactor.num}",
                     "dilute",
-                    self._params.dilution_target_od,
-                    self._params.dilution_volume,
-                )
-                self._reset_growth_timeout(reactor)
+                    reactor=reactor.num,
+                    target_od=self._params.dilution_target_od,
+                    volume=self._params.dilution_volume,
+                ):
+                    reactor.cmd(
+                        "dilute",
+                        self._params.dilution_target_od,
+                        self._params.dilution_volume,
+                    )
+                    self._reset_growth_timeout(reactor)
             except ReactorException as e:
                 return {"error": e}
 
@@ -77,7 +119,7 @@ class EndlessGrowthExperiment(Experiment):
             reactor.home()
 
     def _reset_growth_timeout(self, reactor):
-        self._start_growth_time[str(reactor)] = datetime.now()
+        self._start_growth_time[str(reactor)] = clock.now()
 
 
 class EndlessGrowthExperimentPlugin(ExperimentPlugin):
@@ -1,5 +1,5 @@
 from biofactory.experiment import Experiment
-from biofactory.machine import ReactorException, ReactorStates
+from biofactory.machine import ReactorStates
 from biofactory.plugins import PluginUiModuleMetadata
 from biofactory.plugins.experiments import ExperimentPlugin
 
@@ -21,16 +21,17 @@ class ODMeasureExperiment(Experiment):
             reactor.home()
 
     def routine(self):
+        nums = []
         for reactor in self._reactors:
-            if self.is_interrupted():
-                return
             if reactor.state != ReactorStates.READY:
                 self._log.warning(f"Reactor {reactor} is not ready")
                 continue
-            try:
-                reactor.cmd("measure_od")
-            except ReactorException as e:
-                return {"error": e}
+            nums.append(reactor.num)
+        if self.is_interrupted() or not nums:
+            return
+        ods = self._machine.cmd("measure_od_all", nums=nums)
+        if isinstance(ods, Exception):
+            return {"error": ods}
 
     def cooldown(self):
         for reactor in self._reactors:
@@ -3,6 +3,7 @@ import functools
 import inspect
 import logging
 import os
+import time
 from http.client import HTTPException
 
 from flask import Flask, jsonify, request, send_from_directory
@@ -27,6 +28,7 @@ from biofactory.machine_manager import machineManager
 from biofactory.plugins import pluginsManager
 from biofactory.plugins.experiments import ExperimentPlugin
 from biofactory.server.socketio import MachineNamespace
+from biofactory.startup_profile import startupProfile
 from biofactory.usb_manager import usbManager
 
 machine_manager = None
@@ -45,6 +47,8 @@ log = logging.getLogger(__name__)
 
 
 def create_app():
+    started = time.perf_counter()
+    startupProfile().mark("imports")
     # global settings
 
     # app = Flask(__name__, static_folder="static/build", static_url_path="/")
@@ -198,6 +202,8 @@ def create_app():
             # usb_manager.stop_monitoring()
             # turn off observers and other threads here
             eventManager().fire(Events.SHUTDOWN)
+            # let shutdown listeners (e.g. time series store flush) finish
+            eventManager().join(timeout=5)
 
         atexit.register(on_shutdown)
         eventManager().fire(Events.STARTUP)
@@ -293,6 +299,10 @@ def create_app():
     def send_report(path):
         return send_from_directory("static", path)
 
+    if startupProfile().enabled:
+        startupProfile().mark("create_app", time.perf_counter() - started)
+        app.before_request(startupProfile().on_first_request)
+
     return app
 
 
@@ -2,7 +2,10 @@ from flask import Blueprint
 
 api = Blueprint("api", __name__)
 
+from . import bus_trace as api_bus_trace  # noqa: F401,E402
 from . import connection as api_connection  # noqa: F401,E402
 from . import experiment as api_experiment  # noqa: F401,E402
 from . import machine as api_machine  # noqa: F401,E402
+from . import metrics as api_metrics  # noqa: F401,E402
 from . import security as api_security  # noqa: F401,E402
+from . import tracing as api_tracing  # noqa: F401,E402
@@ -0,0 +1,68 @@
+from flask import jsonify, request
+from flask_security.decorators import auth_required
+
+from biofactory.drivers.bus_trace import busTrace
+from biofactory.machine_manager import machineManager
+from biofactory.server.api import api
+from biofactory.util.flask import get_json_command_from_request
+
+
+def _stats(command: str = "stats"):
+    """Stats of the server and, by serial number, of the machine workers"""
+    stats = busTrace().get_stats()
+    stats["machines"] = machineManager().call_workers("bus_trace", command)
+    return stats
+
+
+def _merged(local: list, command: str, *args) -> list:
+    """
+    Transactions of the server and of the machine workers, oldest first, the
+    worker ones tagged with the serial number of their machine
+    """
+    merged = list(local)
+    for serial, entries in (
+        machineManager().call_workers("bus_trace", command, *args).items()
+    ):
+        merged += [{**entry, "machine": serial} for entry in entries]
+    merged.sort(key=lambda entry: entry["time"])
+    return merged
+
+
+@api.route("/bus-trace", methods=["GET"])
+@auth_required()
+def bus_trace_state():
+    return jsonify(_stats())
+
+
+@api.route("/bus-trace", methods=["POST"])
+@auth_required()
+def bus_trace_command():
+    valid_commands = {"enable": [], "disable": [], "clear": []}
+    command, _, response = get_json_command_from_request(request, valid_commands)
+    if response is not None:
+        return response
+    if command == "enable":
+        busTrace().enable()
+    elif command == "disable":
+        busTrace().disable()
+    elif command == "clear":
+        busTrace().clear()
+    return jsonify(_stats(command))
+
+
+@api.route("/bus-trace/transactions", methods=["GET"])
+@auth_required()
+def bus_trace_transactions():
+    """Latest transactions, ?last=N limits their count"""
+    last = request.args.get("last", type=int)
+    transactions = _merged(busTrace().dump(last), "transactions", last)
+    if last is not None:
+        transactions = transactions[-last:] if last > 0 else []
+    return jsonify({"transactions": transactions})
+
+
+@api.route("/bus-trace/errors", methods=["GET"])
+@auth_required()
+def bus_trace_errors():
+    """Transactions preceding the latest NACKs and bus errors"""
+    return jsonify({"errors": _merged(busTrace().get_error_dumps(), "errors")})
@@ -14,9 +14,15 @@ logger = logging.getLogger(__name__)
 # @auth_required()
 # @Permissions.STATUS.require(403)
 def connectionState():
-    current = machine_manager.get_current_connection()
+    current = machine_manager.get_current_connection(request.args.get("machine"))
     options = _get_options()
-    return jsonify({"current": current, "options": options})
+    return jsonify(
+        {
+            "current": current,
+            "machines": machine_manager.get_connections(),
+            "options": options,
+        }
+    )
 
 
 @api.route("/connection", methods=["POST"])
@@ -47,7 +53,7 @@ def connectionCommand():
             logger.exception("Error while connecting to usb device")
             return str(e), 500
     elif command == "disconnect":
-        machine_manager.disconnect()
+        machine_manager.disconnect(machine=data.get("machine"))
 
     return NO_CONTENT
 
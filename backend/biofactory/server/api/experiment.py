@@ -26,11 +26,11 @@ def get_running_experiments():
 
 @api.route("/experiments", methods=["POST"])
 def start_experiment():
-    machine = machineManager().get_machine()
+    data = request.get_json()
+    machine = machineManager().get_machine(data.pop("machine", None))
     if machine is None:
         return jsonify({"error": "No machine available"}), 400
 
-    data = request.get_json()
     plugin_id = data.pop("pluginId", None)
     plugin = pluginsManager().get_plugin(plugin_id)
     if plugin is None:
@@ -17,9 +17,10 @@ def get_reactors():
 @api.route("/reactors/<int:reactor_id>/command", methods=["POST"])
 @auth_required()
 def reactor_command(reactor_id):
-    if not machine_manager.is_manual_control():
+    serial = request.args.get("machine")
+    if not machine_manager.is_manual_control(serial):
         return "Manual control is not enabled", 400
-    machine = machine_manager.get_machine()
+    machine = machine_manager.get_machine(serial)
     if machine is None:
         return "Machine is not connected", 404
     try:
@@ -35,9 +36,10 @@ def reactor_command(reactor_id):
 @api.route("/machine/command", methods=["POST"])
 @auth_required()
 def machine_command():
-    if not machine_manager.is_manual_control():
+    serial = request.args.get("machine")
+    if not machine_manager.is_manual_control(serial):
         return "Manual control is not enabled", 400
-    machine = machine_manager.get_machine()
+    machine = machine_manager.get_machine(serial)
     if machine is None:
         return "Machine is not connected", 404
     valid_commands = machine.get_commands_info()
@@ -49,9 +51,10 @@ def machine_command():
 @api.route("/devices/<device_id>/command", methods=["POST"])
 @auth_required()
 def device_command(device_id):
-    if not machine_manager.is_manual_control():
+    serial = request.args.get("machine")
+    if not machine_manager.is_manual_control(serial):
         return "Manual control is not enabled", 400
-    machine = machine_manager.get_machine()
+    machine = machine_manager.get_machine(serial)
     if machine is None:
         return "Machine is not connected", 404
     valid_commands = machine.get_devices_commands_info().get(device_id, {})
@@ -60,6 +63,25 @@ def device_command(device_id):
     return NO_CONTENT
 
 
+@api.route("/machine/history", methods=["GET"])
+@auth_required()
+def machine_history():
+    # unix timestamps, values which are not numbers are ignored
+    start = request.args.get("start", type=float)
+    end = request.args.get("end", type=float)
+    reactors = request.args.getlist("reactor", type=int) or None
+    metrics = request.args.getlist("metric") or None
+    return flask.jsonify(
+        machine_manager.get_history(
+            start=start,
+            end=end,
+            reactor=reactors,
+            metric=metrics,
+            machine=request.args.get("machine"),
+        )
+    )
+
+
 @api.route("/machine/command_queue", methods=["POST"])
 @auth_required()
 def machineCommandQueue():
@@ -0,0 +1,16 @@
+from flask import Response
+from flask_security.decorators import auth_required
+
+from biofactory.machine_manager import machineManager
+from biofactory.metrics import metricsRegistry
+from biofactory.server.api import api
+
+
+@api.route("/metrics", methods=["GET"])
+@auth_required()
+def metrics():
+    """Prometheus text exposition format, worker series carry a "machine" label"""
+    return Response(
+        metricsRegistry().export_prometheus(machineManager().call_workers("metrics")),
+        mimetype="text/plain; version=0.0.4",
+    )
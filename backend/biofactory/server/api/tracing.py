@@ -0,0 +1,61 @@
+from flask import jsonify, request
+from flask_security.decorators import auth_required
+
+from biofactory.machine_manager import machineManager
+from biofactory.server.api import api
+from biofactory.tracing import tracer
+from biofactory.util.flask import get_json_command_from_request
+
+
+def _stats(command: str = "stats"):
+    """Stats of the server and, by serial number, of the machine workers"""
+    stats = tracer().get_stats()
+    stats["machines"] = machineManager().call_workers("tracing", command)
+    return stats
+
+
+@api.route("/tracing", methods=["GET"])
+@auth_required()
+def tracing_state():
+    return jsonify(_stats())
+
+
+@api.route("/tracing", methods=["POST"])
+@auth_required()
+def tracing_command():
+    valid_commands = {"enable": [], "disable": [], "clear": []}
+    command, _, response = get_json_command_from_request(request, valid_commands)
+    if response is not None:
+        return response
+    if command == "enable":
+        tracer().enable()
+    elif command == "disable":
+        tracer().disable()
+    elif command == "clear":
+        tracer().clear()
+    return jsonify(_stats(command))
+
+
+@api.route("/tracing/spans", methods=["GET"])
+@auth_required()
+def tracing_spans():
+    """
+    Chrome trace events by default, OTLP/JSON with ?format=otlp. The spans of
+    the machine workers are merged in, each worker is a process of the trace.
+    """
+    trace_format = request.args.get("format", "chrome")
+    workers = machineManager().call_workers("tracing", "spans", trace_format)
+    if trace_format == "otlp":
+        trace = tracer().export_otlp()
+        for worker_trace in workers.values():
+            trace["resourceSpans"] += worker_trace["resourceSpans"]
+        return jsonify(trace)
+    trace = tracer().export_chrome_trace()
+    for worker_trace in workers.values():
+        trace["traceEvents"] += worker_trace["traceEvents"]
+    response = jsonify(trace)
+    if "download" in request.args:
+        response.headers["Content-Disposition"] = (
+            "attachment; filename=biofactory-trace.json"
+        )
+    return response
@@ -1,4 +1,3 @@
-import copy
 import datetime
 import logging
 import threading
@@ -7,6 +6,7 @@ from typing import Dict, Optional
 
 import flask
 from flask_socketio import emit as socketio_emit
+from flask_socketio import join_room
 from flask_socketio.namespace import Namespace
 
 from biofactory.events import Events, eventManager
@@ -15,6 +15,9 @@ from biofactory.machine_manager import machineManager
 
 log = logging.getLogger(__name__)
 
+# room of the clients receiving the machines state
+CURRENT_ROOM = "current"
+
 
 class SocketIOSessionMachineCallback(MachineCallback):
     def __init__(self, app, sid, namespace: Optional[str] = None):
@@ -24,23 +27,26 @@ class SocketIOSessionMachineCallback(MachineCallback):
         self._sid = sid
         self._namespace = namespace or "/"
 
-        self._throttle_factor = 1
-        self._last_current = 0
-        self._base_rate_limit = 0.5
-
-        self._held_back_current = None
-        self._held_back_mutex = threading.RLock()
-
-        self._initial_data_sent = False
-
+        # socket emits could be slow, call them from a worker of this session
+        worker = f"socketio-{sid}"
         eventManager().subscribe(
-            Events.CONNECTION_OPTIONS_UPDATED, self._on_connection_options_updated
+            Events.CONNECTION_OPTIONS_UPDATED,
+            self._on_connection_options_updated,
+            worker=worker,
         )
-        eventManager().subscribe(Events.MACHINE_CONNECTED, self._on_connected)
-        eventManager().subscribe(Events.COMMAND_QUEUE_UPDATED, self._on_command_queue)
-        eventManager().subscribe(Events.SEND_QUEUE_UPDATED, self._on_send_queue)
         eventManager().subscribe(
-            Events.EXPERIMENT_STATUS_CHANGE, self._on_experiment_status_change
+            Events.MACHINE_CONNECTED, self._on_connected, worker=worker
+        )
+        eventManager().subscribe(
+            Events.COMMAND_QUEUE_UPDATED, self._on_command_queue, worker=worker
+        )
+        eventManager().subscribe(
+            Events.SEND_QUEUE_UPDATED, self._on_send_queue, worker=worker
+        )
+        eventManager().subscribe(
+            Events.EXPERIMENT_STATUS_CHANGE,
+            self._on_experiment_status_change,
+            worker=worker,
         )
 
     def __del__(self):
@@ -96,42 +102,10 @@ class SocketIOSessionMachineCallback(MachineCallback):
         self._emit(event, payload)
 
     def on_machine_send_initial_data(self, data):
-        self._initial_data_sent = True
         data_to_send = dict(data)
         data_to_send["serverTime"] = time.time()
         self._emit("history", data_to_send)
 
-    def _on_machine_send_current_data(self, data):
-        if not self._initial_data_sent:
-            self._logger.debug("Initial data not yet send, dropping current message")
-            return
-
-        # make sure we rate limit the updates according to our throttle factor
-        with self._held_back_mutex:
-            if self._held_back_current is not None:
-                self._held_back_current.cancel()
-                self._held_back_current = None
-
-            now = time.time()
-            delta = (
-                self._last_current + self._base_rate_limit * self._throttle_factor - now
-            )
-            if delta > 0:
-                self._held_back_current = threading.Timer(
-                    delta, lambda: self._on_machine_send_current_data(data)
-                )
-                self._held_back_current.start()
-                return
-
-        self._last_current = now
-
-        data.update(
-            {
-                "serverTime": time.time(),
-            }
-        )
-        self._emit("current", data)
-
     def _on_experiment_status_change(self, event, payload):
         for key, value in payload.items():
             if isinstance(value, datetime.datetime):
@@ -139,12 +113,145 @@ class SocketIOSessionMachineCallback(MachineCallback):
         self._emit(event, payload)
 
 
+class CurrentDataBroadcaster(MachineCallback):
+    """
+    Sends the state changes of a machine to all clients of the namespace, the
+    payloads carry the serial number of the machine.
+
+    A single coalescing timer rate limits the updates. Every tick the delta since
+    the previous tick is built once and emitted once to the room with all clients,
+    so the payload is encoded once regardless of the number of clients. A client
+    which missed a delta asks for a resync and gets the full snapshot, which is
+    cached until the state version changes.
+    """
+
+    def __init__(
+        self,
+        app,
+        namespace: Optional[str] = None,
+        machine: Optional[str] = None,
+        room: str = CURRENT_ROOM,
+        rate_limit: float = 0.5,
+        full_snapshot_interval: float = 30.0,
+    ):
+        self._logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._app = app
+        self._namespace = namespace or "/"
+        self._machine = machine
+        self._room = room
+        self._rate_limit = rate_limit
+        self._full_snapshot_interval = full_snapshot_interval
+
+        self._mutex = threading.RLock()
+        self._timer = None
+        self._last_sent = 0.0
+        self._last_full_snapshot = 0.0
+        self._version = None
+        self._snapshot = None
+
+    @property
+    def room(self):
+        return self._room
+
+    def _emit(self, payload, to):
+        with self._app.app_context():
+            try:
+                socketio_emit("current", payload, to=to, namespace=self._namespace)
+            except Exception as e:
+                self._logger.warning("Could not send current data to %s: %s", to, e)
+
+    def _on_machine_send_current_data(self, data, machine=None, *args, **kwargs):
+        if machine != self._machine:
+            return
+        with self._mutex:
+            if self._timer is not None:
+                # already scheduled, the tick will pick up this change too
+                return
+            delay = self._last_sent + self._rate_limit - time.monotonic()
+            if delay > 0:
+                self._timer = threading.Timer(delay, self._tick)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self._tick()
+
+    def _tick(self):
+        with self._mutex:
+            self._timer = None
+            self._last_sent = time.monotonic()
+            if (
+                self._version is None
+                or self._last_sent - self._last_full_snapshot
+                >= self._full_snapshot_interval
+            ):
+                payload = self._get_snapshot()
+            else:
+                payload = machineManager().get_current_changes(
+                    self._version, machine=self._machine
+                )
+                if (
+                    not payload["devices"]
+                    and "state" not in payload
+                    and "experiment" not in payload
+                ):
+                    return
+                payload["machine"] = self._machine
+                payload["serverTime"] = time.time()
+            self._version = payload["version"]
+            self._emit(payload, to=self._room)
+
+    def _get_snapshot(self):
+        with self._mutex:
+            version = machineManager().get_current_version(machine=self._machine)
+            if self._snapshot is None or self._snapshot["version"] != version:
+                self._snapshot = machineManager().get_current_changes(
+                    machine=self._machine
+                )
+                self._snapshot["machine"] = self._machine
+                self._snapshot["serverTime"] = time.time()
+                self._last_full_snapshot = time.monotonic()
+            return self._snapshot
+
+    def resync(self, sid):
+        """Sends the full machine state to a single client"""
+        self._emit(self._get_snapshot(), to=sid)
+
+
 class MachineNamespace(Namespace):
     def __init__(self, app, namespace: Optional[str] = None, *args, **kwargs):
         super().__init__(namespace)
         self._app = app
         # self._machine_manager = machine_manager
         self._clients_callbacks: Dict[str, SocketIOSessionMachineCallback] = {}
+        # one broadcaster per machine serial number, all emit to the same room
+        self._broadcasters: Dict[str, CurrentDataBroadcaster] = {}
+        self._broadcasters_lock = threading.Lock()
+        eventManager().subscribe(Events.MACHINE_CONNECTED, self._on_machine_connected)
+
+    def _get_broadcaster(self, machine: Optional[str]) -> CurrentDataBroadcaster:
+        with self._broadcasters_lock:
+            broadcaster = self._broadcasters.get(machine)
+            if broadcaster is None:
+                broadcaster = self._broadcasters[machine] = CurrentDataBroadcaster(
+                    app=self._app, namespace=self.namespace, machine=machine
+                )
+                machineManager().register_callback(broadcaster)
+            return broadcaster
+
+    def _on_machine_connected(self, event, machine):
+        serial = getattr(machine, "serial", None)
+        if serial is None:
+            return
+        # the state updates before the broadcaster existed are sent in a snapshot
+        self._get_broadcaster(serial)._on_machine_send_current_data(
+            None, machine=serial
+        )
+
+    def _resync(self, sid, machine: Optional[str] = None):
+        # without machines the offline state is sent
+        serials = [machine] if machine else machineManager().get_machines() or [None]
+        for serial in serials:
+            self._get_broadcaster(serial).resync(sid)
 
     def on_connect(self):
         log.debug("socket.io client connecting")
@@ -154,17 +261,16 @@ class MachineNamespace(Namespace):
         )
         self._clients_callbacks[sid] = client_calback
 
+        join_room(CURRENT_ROOM)
         machineManager().register_callback(client_calback)
         machineManager().send_initial_callback(client_calback)
         # experimentManager().send_initial_callback(client_callback)
 
-        data = machineManager().get_current_data()
-        data_copy = copy.deepcopy(data)
         # payload = {
         #     "state_id": self._machine_manager.get_state_id(),
         #     "state_string": self._machine_manager.get_state_string(),
         # }
-        client_calback._on_machine_send_current_data(data_copy)
+        self._resync(sid)
         # socketio_emit(Events.MACHINE_STATE_CHANGED, payload)
         eventManager().fire(Events.CLIENT_CONNECTED)
 
@@ -176,3 +282,6 @@ class MachineNamespace(Namespace):
             machineManager().unregister_callback(client_calback)
             client_calback.unsubscribe()
         eventManager().fire(Events.CLIENT_DISCONNECTED)
+
+    def on_current_resync(self, machine: Optional[str] = None):
+        self._resync(flask.request.sid, machine)
@@ -0,0 +1,252 @@
+"""
+In-process simulation of the FTDI I2C/SPI buses and the chips behind them.
+
+The simulated ports implement the same interface as the pyftdi ports, so the
+real drivers and devices run unchanged against register level chip models.
+Chip models take their time from a ``clock`` callable, which makes them
+deterministic for a given clock and lets the whole machine run on a virtual
+time source.
+"""
+
+import threading
+import time
+from typing import Callable, Iterable, Optional, Union
+
+from pyftdi.i2c import I2cNackError
+
+from biofactory.drivers import HardwarePort, bus_trace
+from biofactory.drivers.bus_trace import NO_REGISTER, busTrace
+from biofactory.metrics import BUS_BYTES, BUS_TRANSACTIONS
+from biofactory.tracing import tracer
+
+Bytes = Union[bytes, bytearray, Iterable[int]]
+
+
+class SimulatedBus:
+    """
+    Bus timing and statistics shared by the ports of a bus.
+
+    latency - seconds added to every transaction (USB round trip of the FTDI)
+    byte_time - seconds added per transferred byte
+    """
+
+    def __init__(
+        self,
+        name: str,
+        latency: float = 0.0,
+        byte_time: float = 0.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.name = name
+        self.latency = latency
+        self.byte_time = byte_time
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.transactions = 0
+        self.bytes = 0
+
+    def transaction(self, length: int, port: str = ""):
+        with self._lock:
+            self.transactions += 1
+            self.bytes += length
+        BUS_TRANSACTIONS.labels(self.name, port).inc()
+        BUS_BYTES.labels(self.name, port).inc(length)
+        with tracer().span(f"{self.name}.transaction", "bus", length=length):
+            delay = self.latency + self.byte_time * length
+            if delay > 0:
+                self._sleep(delay)
+
+    def get_stats(self) -> dict[str, int]:
+        return {"transactions": self.transactions, "bytes": self.bytes}
+
+    def reset_stats(self):
+        with self._lock:
+            self.transactions = 0
+            self.bytes = 0
+
+
+class I2cChip:
+    """Model of an I2C slave, a transaction is a write or a read of bytes"""
+
+    def write(self, data: bytes):
+        pass
+
+    def read(self, readlen: int) -> bytes:
+        return bytes(readlen)
+
+
+class RegisterChip(I2cChip):
+    """
+    I2C chip with a register pointer: the first written byte selects the
+    register, the following bytes are written from it and reads start at it
+    """
+
+    def __init__(self, size: int = 256):
+        self.registers = bytearray(size)
+        self.pointer = 0
+
+    def next_register(self, regaddr: int) -> int:
+        """Register address after an access to ``regaddr``"""
+        return (regaddr + 1) % len(self.registers)
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.pointer = data[0] % len(self.registers)
+        for value in data[1:]:
+            self.write_register(self.pointer, value)
+            self.pointer = self.next_register(self.pointer)
+
+    def read(self, readlen: int) -> bytes:
+        result = bytearray()
+        for _ in range(readlen):
+            result.append(self.read_register(self.pointer))
+            self.pointer = self.next_register(self.pointer)
+        return bytes(result)
+
+    def write_register(self, regaddr: int, value: int):
+        self.registers[regaddr] = value
+
+    def read_register(self, regaddr: int) -> int:
+        return self.registers[regaddr]
+
+
+class SpiChip:
+    """
+    Model of a SPI slave. The drivers frame every byte with the chip select, so
+    the model is fed byte by byte and answers the next byte on reads.
+    """
+
+    def write_byte(self, value: int):
+        pass
+
+    def read_byte(self) -> int:
+        return 0
+
+
+class SimulatedI2cPort(HardwarePort):
+    """I2C port of a simulated chip, an absent chip answers with NACK"""
+
+    def __init__(
+        self,
+        bus: SimulatedBus,
+        address: int,
+        name: str,
+        chip: Optional[I2cChip] = None,
+    ):
+        self._bus = bus
+        self._address = address
+        self._name = name
+        self.chip = chip
+        self._trace = busTrace()
+        self._trace_port = self._trace.register_port(bus.name, name, address)
+
+    @property
+    def address(self):
+        return self._address
+
+    @property
+    def bus(self):
+        return self._bus.name
+
+    def _get_chip(self, operation: int, out: bytes = b"") -> I2cChip:
+        if self.chip is None:
+            exc = I2cNackError(f"NACK from simulated 0x{self._address:02X}")
+            if self._trace.enabled:
+                self._trace.record_error(
+                    self._trace_port, operation, NO_REGISTER, out, exc
+                )
+            raise exc
+        return self.chip
+
+    def write(self, out: Bytes, *args, **kwargs):
+        with self.session:
+            out = bytes(out)
+            chip = self._get_chip(bus_trace.WRITE, out)
+            self._bus.transaction(len(out) + 1, self._name)
+            chip.write(out)
+            if self._trace.enabled:
+                self._trace.record(self._trace_port, bus_trace.WRITE, out=out)
+
+    def read(self, readlen: int = 0, *args, **kwargs) -> bytes:
+        with self.session:
+            chip = self._get_chip(bus_trace.READ)
+            self._bus.transaction(readlen + 1, self._name)
+            result = chip.read(readlen)
+            if self._trace.enabled:
+                self._trace.record(self._trace_port, bus_trace.READ, result=result)
+            return result
+
+    def exchange(self, out: Bytes = b"", readlen: int = 0, *args, **kwargs) -> bytes:
+        with self.session:
+            out = bytes(out)
+            chip = self._get_chip(bus_trace.EXCHANGE, out)
+            # repeated start, a single transaction on the bus
+            self._bus.transaction(len(out) + readlen + 2, self._name)
+            chip.write(out)
+            result = chip.read(readlen)
+            if self._trace.enabled:
+                self._trace.record(
+                    self._trace_port, bus_trace.EXCHANGE, out=out, result=result
+                )
+            return result
+
+    def write_to(self, regaddr: int, out: Bytes, *args, **kwargs):
+        self.write(bytes([regaddr]) + bytes(out))
+
+    def read_from(self, regaddr: int, readlen: int = 0, *args, **kwargs) -> bytes:
+        return self.exchange([regaddr], readlen)
+
+
+class SimulatedSpiPort(HardwarePort):
+    def __init__(self, bus: SimulatedBus, cs: int, name: str, chip: SpiChip):
+        self._bus = bus
+        self._cs = cs
+        self._name = name
+        self.chip = chip
+        self._trace = busTrace()
+        self._trace_port = self._trace.register_port(bus.name, name, cs)
+
+    @property
+    def address(self):
+        return self._cs
+
+    @property
+    def bus(self):
+        return self._bus.name
+
+    def _write(self, out: bytes):
+        self._bus.transaction(len(out), self._name)
+        for value in out:
+            self.chip.write_byte(value)
+
+    def _read(self, readlen: int) -> bytes:
+        self._bus.transaction(readlen, self._name)
+        return bytes(self.chip.read_byte() for _ in range(readlen))
+
+    def write(self, out: Bytes, *args, **kwargs):
+        with self.session:
+            out = bytes(out)
+            self._write(out)
+            if self._trace.enabled:
+                self._trace.record(self._trace_port, bus_trace.WRITE, out=out)
+
+    def read(self, readlen: int = 0, *args, **kwargs) -> bytes:
+        with self.session:
+            result = self._read(readlen)
+            if self._trace.enabled:
+                self._trace.record(self._trace_port, bus_trace.READ, result=result)
+            return result
+
+    def exchange(self, out: Bytes = b"", readlen: int = 0, *args, **kwargs) -> bytes:
+        with self.session:
+            out = bytes(out)
+            # the chip select is toggled after every byte, as SpiPort does
+            for value in out:
+                self._write(bytes([value]))
+            result = b"".join(self._read(1) for _ in range(readlen))
+            if self._trace.enabled:
+                self._trace.record(
+                    self._trace_port, bus_trace.EXCHANGE, out=out, result=result
+                )
+            return result
@@ -0,0 +1,53 @@
+from biofactory.drivers.adt75 import (
+    NOT_A_VALUE_BITS,
+    REGISTER_CONFIGURATION,
+    REGISTER_ONE_SHOT,
+    REGISTER_T_HYST_SETPOINT,
+    REGISTER_T_OS_SETPOINT,
+    REGISTER_TEMPERATURE_VALUE,
+    TEMPERATURE_RESOLUTION,
+)
+from biofactory.simulator import I2cChip
+
+TEMPERATURE_REGISTERS = (REGISTER_TEMPERATURE_VALUE, REGISTER_ONE_SHOT)
+
+
+class ADT75(I2cChip):
+    """ADT75 thermometer model, the one-shot register reads the temperature"""
+
+    def __init__(self, temperature: float = 25.0):
+        self.temperature = temperature
+        self.pointer = REGISTER_TEMPERATURE_VALUE
+        self.configuration = 0
+        self.hysteresis = self._encode(75.0)
+        self.overtemperature = self._encode(80.0)
+
+    @staticmethod
+    def _encode(celsius: float) -> bytes:
+        code = round(celsius / TEMPERATURE_RESOLUTION) << NOT_A_VALUE_BITS
+        return code.to_bytes(2, "big", signed=True)
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.pointer = data[0] & 0x07
+        value = data[1:]
+        if self.pointer == REGISTER_CONFIGURATION and value:
+            self.configuration = value[0]
+        elif self.pointer == REGISTER_T_HYST_SETPOINT and len(value) == 2:
+            self.hysteresis = bytes(value)
+        elif self.pointer == REGISTER_T_OS_SETPOINT and len(value) == 2:
+            self.overtemperature = bytes(value)
+
+    def read(self, readlen: int) -> bytes:
+        if self.pointer == REGISTER_CONFIGURATION:
+            data = bytes([self.configuration])
+        elif self.pointer == REGISTER_T_HYST_SETPOINT:
+            data = self.hysteresis
+        elif self.pointer == REGISTER_T_OS_SETPOINT:
+            data = self.overtemperature
+        elif self.pointer in TEMPERATURE_REGISTERS:
+            data = self._encode(self.temperature)
+        else:
+            data = b""
+        return (data * readlen)[:readlen].ljust(readlen, b"\xff")
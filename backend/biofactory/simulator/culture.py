@@ -0,0 +1,60 @@
+import math
+
+
+class CultureModel:
+    """
+    Bacterial culture in a vial. The optical density grows logistically with a
+    rate inhibited by the drug concentration, added medium dilutes both of them
+    and the discharge needle removes liquid above ``min_volume``.
+
+    growth_rate - maximal growth rate per hour
+    max_od - optical density of the saturated culture
+    ic50 - drug concentration halving the growth rate
+    """
+
+    def __init__(
+        self,
+        od: float = 0.05,
+        volume: float = 15.0,
+        growth_rate: float = math.log(2),
+        max_od: float = 2.0,
+        ic50: float = 1.0,
+        min_volume: float = 15.0,
+        max_volume: float = 35.0,
+    ):
+        self.od = od
+        self.volume = volume
+        self.drug = 0.0
+        self.growth_rate = growth_rate
+        self.max_od = max_od
+        self.ic50 = ic50
+        self.min_volume = min_volume
+        self.max_volume = max_volume
+        self.overflowed = False
+
+    @property
+    def effective_growth_rate(self) -> float:
+        return self.growth_rate / (1 + self.drug / self.ic50)
+
+    def grow(self, hours: float):
+        if hours <= 0 or self.od <= 0:
+            return
+        growth = math.exp(self.effective_growth_rate * hours)
+        self.od = self.max_od / (1 + (self.max_od / self.od - 1) / growth)
+
+    def add(self, volume: float, drug: float = 0.0):
+        """Adds medium with the drug concentration"""
+        if volume <= 0:
+            return
+        total = self.volume + volume
+        self.od *= self.volume / total
+        self.drug = (self.drug * self.volume + drug * volume) / total
+        self.volume = total
+        if self.volume > self.max_volume:
+            self.overflowed = True
+
+    def remove(self, volume: float):
+        """Pumps out liquid, only the liquid above the needle is reached"""
+        self.volume = max(
+            self.volume - max(volume, 0.0), min(self.volume, self.min_volume)
+        )
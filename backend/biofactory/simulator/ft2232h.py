@@ -0,0 +1,92 @@
+import time
+from typing import Callable, Optional
+
+from pyftdi.i2c import I2cIOError
+from pyftdi.spi import SpiIOError
+from usb.core import Device as UsbDevice
+
+from biofactory.drivers.ft2232h import FtdiDriver
+from biofactory.simulator import (
+    I2cChip,
+    SimulatedBus,
+    SimulatedI2cPort,
+    SimulatedSpiPort,
+    SpiChip,
+)
+
+
+class SimulatedFtdiDriver(FtdiDriver):
+    """
+    FTDI driver serving the ports of simulated chips instead of the USB device.
+    I2C addresses without a chip answer with NACK, so the address scans of the
+    drivers work as on the real bus.
+
+    latency - seconds added to every bus transaction
+    byte_time - seconds added per transferred byte
+    """
+
+    def __init__(
+        self,
+        i2c_chips: Optional[dict[int, I2cChip]] = None,
+        spi_chips: Optional[dict[int, SpiChip]] = None,
+        latency: float = 0.0,
+        byte_time: float = 0.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        super().__init__()
+        self.i2c_chips = dict(i2c_chips or {})
+        self.spi_chips = dict(spi_chips or {})
+        self.i2c_bus = SimulatedBus("i2c", latency, byte_time, sleep)
+        self.spi_bus = SimulatedBus("spi", latency, byte_time, sleep)
+        self._connected = False
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    def connect(self, usb_device: Optional[UsbDevice] = None):
+        self._usb_device = usb_device
+        self._connected = True
+
+    def reset(self):
+        pass
+
+    def terminate(self):
+        with self._lock:
+            self._opened_ports = {}
+            self._usb_device = None
+            self._connected = False
+
+    def get_bus_stats(self) -> dict[str, dict[str, int]]:
+        return {
+            self.i2c_bus.name: self.i2c_bus.get_stats(),
+            self.spi_bus.name: self.spi_bus.get_stats(),
+        }
+
+    def get_i2c_port(
+        self, address: int, name: str, registers: Optional[dict[int, str]] = None
+    ) -> SimulatedI2cPort:
+        if not self.is_connected:
+            raise I2cIOError("FTDI controller not initialized")
+        port_id = f"i2c_{address}_{name}"
+        if port_id not in self._opened_ports:
+            self._opened_ports[port_id] = SimulatedI2cPort(
+                self.i2c_bus, address, name, self.i2c_chips.get(address)
+            )
+        return self._opened_ports[port_id]
+
+    def get_spi_port(
+        self,
+        name: str,
+        cs: int,
+        freq: Optional[float] = None,
+        mode: Optional[int] = None,
+    ) -> SimulatedSpiPort:
+        if not self.is_connected:
+            raise SpiIOError("FTDI controller not initialized")
+        port_id = f"spi_{cs}_{name}"
+        if port_id not in self._opened_ports:
+            self._opened_ports[port_id] = SimulatedSpiPort(
+                self.spi_bus, cs, name, self.spi_chips.get(cs) or SpiChip()
+            )
+        return self._opened_ports[port_id]
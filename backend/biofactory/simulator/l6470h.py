@@ -0,0 +1,322 @@
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from biofactory.devices.motion import estimate_move_duration
+from biofactory.drivers.l6470h import Parameters, commands
+from biofactory.simulator import SpiChip
+from biofactory.util.clock import monotonic
+
+PARAMETERS = {
+    param.address: param for param in Parameters.__ALL__.values() if param.size
+}
+READ_ONLY_PARAMETERS = {
+    Parameters.SPEED.address,
+    Parameters.ADC_OUT.address,
+    Parameters.STATUS.address,
+}
+POWER_ON_VALUES = {
+    Parameters.ACC.address: 0x08A,
+    Parameters.DEC.address: 0x08A,
+    Parameters.MAX_SPEED.address: 0x041,
+    Parameters.KVAL_HOLD.address: 0x29,
+    Parameters.KVAL_RUN.address: 0x29,
+    Parameters.KVAL_ACC.address: 0x29,
+    Parameters.KVAL_DEC.address: 0x29,
+    Parameters.INT_SPEED.address: 0x0408,
+    Parameters.ST_SLP.address: 0x19,
+    Parameters.FN_SLP_ACC.address: 0x29,
+    Parameters.FN_SLP_DEC.address: 0x29,
+    Parameters.K_THERM.address: 0x0,
+    Parameters.OCD_TH.address: 0x8,
+    Parameters.STALL_TH.address: 0x40,
+    Parameters.FS_SPD.address: 0x027,
+    Parameters.STEP_MODE.address: 0x07,
+    Parameters.ALARM_EN.address: 0xFF,
+    Parameters.CONFIG.address: 0x2E88,
+}
+ABS_POS_MASK = (1 << Parameters.ABS_POS.size) - 1
+# active low fault flags of the status high byte, no faults
+STATUS_NO_FAULTS = 0x7E
+STATUS_WRONG_CMD = 0x01
+STATUS_HIZ = 0x01
+STATUS_NOT_BUSY = 0x02
+STATUS_DIR = 0x10
+STATUS_NOTPERF_CMD = 0x80
+MOT_STATUS_STOPPED = 0
+MOT_STATUS_DECELERATION = 2
+MOT_STATUS_CONSTANT_SPEED = 3
+
+MOVE_COMMANDS = (commands.MOVE_BACK.address, commands.MOVE_FORWARD.address)
+RUN_COMMANDS = (commands.RUN.address, commands.RUN.address | 1)
+# commands with a 3 bytes argument which the model accepts but doesn't perform
+UNSUPPORTED_COMMANDS = {
+    commands.GO_TO.address,
+    commands.GO_TO_DIR.address,
+    commands.GO_TO_DIR.address | 1,
+    commands.GO_UNTIL.address,
+    commands.GO_UNTIL.address | 1,
+    commands.GO_UNTIL.address | 0x08,
+    commands.GO_UNTIL.address | 0x09,
+}
+
+
+@dataclass
+class _Motion:
+    started: float
+    duration: Optional[float]  # None for RUN, which lasts until a stop
+    speed: float  # full steps per second
+    forward: bool
+    steps: float = 0.0  # full steps of a move
+    stopping: bool = False
+
+    def steps_at(self, now: float) -> float:
+        """Full steps done until ``now``, a move is assumed to be uniform"""
+        elapsed = max(now - self.started, 0.0)
+        if self.duration is None:
+            return self.speed * elapsed
+        if self.duration <= 0:
+            return self.steps
+        return self.steps * min(elapsed / self.duration, 1.0)
+
+
+class L6470(SpiChip):
+    """
+    L6470 stepper driver model. Moves take the time of the trapezoidal profile
+    set by MAX_SPEED, ACC and DEC, BUSY is low and MOT_STATUS shows the motion
+    until then. Runs last until a stop command, a soft stop decelerates with DEC.
+
+    on_motion - called with the signed count of full steps when a motion ends
+    """
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = monotonic,
+        on_motion: Optional[Callable[[float], None]] = None,
+        seconds_per_tick: float = 250e-9,
+    ):
+        self._clock = clock
+        self._on_motion = on_motion
+        self._tick = seconds_per_tick
+        self._lock = threading.RLock()
+        self._output = deque()
+        self._command: Optional[int] = None
+        self._data = bytearray()
+        self._data_length = 0
+        self._reset()
+
+    def _reset(self):
+        self._params = dict(POWER_ON_VALUES)
+        self._abs_pos = 0
+        self._motion: Optional[_Motion] = None
+        self._forward = True
+        self._hiz = True
+        self._wrong_cmd = False
+        self._notperf_cmd = False
+
+    @property
+    def abs_pos(self) -> int:
+        """Position in microsteps of the current step mode, two's complement"""
+        with self._lock:
+            self.update()
+            return self._abs_pos
+
+    @property
+    def microsteps_per_step(self) -> int:
+        return 1 << (self._params[Parameters.STEP_MODE.address] & 0b111)
+
+    @property
+    def max_speed(self) -> float:
+        """Full steps per second"""
+        return self._params[Parameters.MAX_SPEED.address] * 2**-18 / self._tick
+
+    @property
+    def acceleration(self) -> float:
+        return self._params[Parameters.ACC.address] * 2**-40 / self._tick**2
+
+    @property
+    def deceleration(self) -> float:
+        return self._params[Parameters.DEC.address] * 2**-40 / self._tick**2
+
+    @property
+    def is_busy(self) -> bool:
+        with self._lock:
+            self.update()
+            return self._motion is not None
+
+    def update(self):
+        """Ends the current motion if its time is over"""
+        with self._lock:
+            motion = self._motion
+            if motion is None or motion.duration is None:
+                return
+            if self._clock() >= motion.started + motion.duration:
+                self._end_motion(motion.steps)
+
+    def _end_motion(self, steps: float):
+        self._motion = None
+        signed_steps = steps if self._forward else -steps
+        microsteps = round(signed_steps * self.microsteps_per_step)
+        self._abs_pos = (self._abs_pos + microsteps) & ABS_POS_MASK
+        if self._on_motion is not None and steps:
+            self._on_motion(signed_steps)
+
+    def _stop(self, soft: bool):
+        motion = self._motion
+        if motion is None:
+            return
+        now = self._clock()
+        steps = motion.steps_at(now)
+        if not soft or motion.stopping or self.deceleration <= 0:
+            self._end_motion(steps)
+            return
+        speed = min(motion.speed, self.max_speed)
+        self._end_motion(steps)
+        self._motion = _Motion(
+            started=now,
+            duration=speed / self.deceleration,
+            speed=speed,
+            forward=motion.forward,
+            steps=speed**2 / (2 * self.deceleration),
+            stopping=True,
+        )
+
+    def write_byte(self, value: int):
+        with self._lock:
+            self.update()
+            if self._command is None:
+                self._command = value
+                self._data = bytearray()
+                self._data_length = self._get_data_length(value)
+            else:
+                self._data.append(value)
+            if len(self._data) >= self._data_length:
+                command, self._command = self._command, None
+                self._execute(command, int.from_bytes(self._data, "big"))
+
+    def read_byte(self) -> int:
+        with self._lock:
+            self.update()
+            return self._output.popleft() if self._output else 0
+
+    @staticmethod
+    def _get_data_length(command: int) -> int:
+        if command & 0xE0 == 0:
+            param = PARAMETERS.get(command & 0x1F)
+            return len(param.mask) if param else 0
+        if command in MOVE_COMMANDS or command in RUN_COMMANDS:
+            return 3
+        if command in UNSUPPORTED_COMMANDS:
+            return 3
+        return 0
+
+    def _execute(self, command: int, data: int):
+        if command == 0:
+            return  # NOP
+        if command & 0xE0 == 0:
+            self._set_param(command & 0x1F, data)
+        elif command & 0xE0 == commands.GET_PARAM.address:
+            self._get_param(command & 0x1F)
+        elif command == commands.GET_STATUS.address:
+            self._output.extend(self._read_status().to_bytes(2, "big"))
+        elif command in MOVE_COMMANDS:
+            self._move(command & 1 == 1, data & 0x3FFFFF)
+        elif command in RUN_COMMANDS:
+            self._run(command & 1 == 1, data & 0xFFFFF)
+        elif command == commands.SOFT_STOP.address:
+            self._stop(soft=True)
+        elif command == commands.HARD_STOP.address:
+            self._stop(soft=False)
+            self._hiz = False
+        elif command in (commands.SOFT_HIZ.address, commands.HARD_HIZ.address):
+            self._stop(soft=False)
+            self._hiz = True
+        elif command == commands.RESET_DEVICE.address:
+            self._reset()
+        elif command == commands.RESET_POS.address:
+            self._abs_pos = 0
+        else:
+            self._wrong_cmd = True
+
+    def _set_param(self, address: int, value: int):
+        param = PARAMETERS.get(address)
+        if param is None or address in READ_ONLY_PARAMETERS:
+            self._wrong_cmd = True
+            return
+        value &= int.from_bytes(param.mask, "big")
+        if address == Parameters.ABS_POS.address:
+            self._abs_pos = value
+        else:
+            self._params[address] = value
+
+    def _get_param(self, address: int):
+        param = PARAMETERS.get(address)
+        if param is None:
+            self._wrong_cmd = True
+            return
+        if address == Parameters.ABS_POS.address:
+            value = self._abs_pos
+        elif address == Parameters.STATUS.address:
+            value = self._read_status()
+        elif address == Parameters.SPEED.address:
+            speed = self._motion.speed if self._motion else 0.0
+            value = round(speed * self._tick * 2**28)
+        else:
+            value = self._params.get(address, 0)
+        self._output.extend(value.to_bytes(len(param.mask), "big"))
+
+    def _read_status(self) -> int:
+        """Status register value, reading it clears the latched flags"""
+        motion = self._motion
+        low = STATUS_DIR if self._forward else 0
+        if self._hiz:
+            low |= STATUS_HIZ
+        if self._notperf_cmd:
+            low |= STATUS_NOTPERF_CMD
+        if motion is None:
+            low |= STATUS_NOT_BUSY | MOT_STATUS_STOPPED << 5
+        elif motion.stopping:
+            low |= MOT_STATUS_DECELERATION << 5
+        elif motion.duration is None:
+            # BUSY is released when a run reaches its speed
+            low |= STATUS_NOT_BUSY | MOT_STATUS_CONSTANT_SPEED << 5
+        else:
+            low |= MOT_STATUS_CONSTANT_SPEED << 5
+        high = STATUS_NO_FAULTS | (STATUS_WRONG_CMD if self._wrong_cmd else 0)
+        self._wrong_cmd = False
+        self._notperf_cmd = False
+        return high << 8 | low
+
+    def _move(self, forward: bool, microsteps: int):
+        if self._motion is not None:
+            self._notperf_cmd = True
+            return
+        steps = microsteps / self.microsteps_per_step
+        self._forward = forward
+        self._hiz = False
+        self._motion = _Motion(
+            started=self._clock(),
+            duration=estimate_move_duration(
+                steps, self.max_speed, self.acceleration, self.deceleration
+            ),
+            speed=self.max_speed,
+            forward=forward,
+            steps=steps,
+        )
+
+    def _run(self, forward: bool, speed: int):
+        if self._motion is not None:
+            if self._motion.duration is not None or self._motion.forward != forward:
+                self._notperf_cmd = True
+                return
+            # speed change of the running motor
+            self._end_motion(self._motion.steps_at(self._clock()))
+        self._forward = forward
+        self._hiz = False
+        self._motion = _Motion(
+            started=self._clock(),
+            duration=None,
+            speed=min(speed * 2**-28 / self._tick, self.max_speed),
+            forward=forward,
+        )
@@ -0,0 +1,91 @@
+from typing import Callable
+
+from biofactory.simulator import I2cChip
+from biofactory.util.clock import monotonic
+
+READY_BIT = 0b10000000
+CONTINUOUS_CONVERSION_BIT = 0b00010000
+POWER_ON_CONFIGURATION = READY_BIT | CONTINUOUS_CONVERSION_BIT
+RESOLUTION_BITS = {0b00: 12, 0b01: 14, 0b10: 16, 0b11: 18}
+SAMPLES_PER_SECOND = {12: 240, 14: 60, 16: 15, 18: 3.75}
+REFERENCE_VOLTAGE = 2.048
+
+
+class MCP3421(I2cChip):
+    """
+    MCP3421 delta-sigma ADC model. Writing the configuration with the RDY bit
+    starts a one-shot conversion, in continuous mode a new result is ready every
+    conversion period. The RDY bit reads as 1 until a new result is available,
+    in continuous mode reading the result sets it again.
+
+    source - input voltage in millivolts
+    """
+
+    def __init__(
+        self,
+        source: Callable[[], float],
+        clock: Callable[[], float] = monotonic,
+    ):
+        self._source = source
+        self._clock = clock
+        self.configuration = POWER_ON_CONFIGURATION
+        self._conversion_start = clock()
+        self._converted = 0
+        self._read_conversions = 0
+        self._code = 0
+
+    @property
+    def resolution(self) -> int:
+        return RESOLUTION_BITS[(self.configuration >> 2) & 0b11]
+
+    @property
+    def gain(self) -> int:
+        return 1 << (self.configuration & 0b11)
+
+    @property
+    def continuous(self) -> bool:
+        return bool(self.configuration & CONTINUOUS_CONVERSION_BIT)
+
+    @property
+    def conversion_time(self) -> float:
+        return 1 / SAMPLES_PER_SECOND[self.resolution]
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.configuration = data[-1] & 0b10011111
+        if self.continuous or self.configuration & READY_BIT:
+            self._conversion_start = self._clock()
+            self._converted = 0
+            self._read_conversions = 0
+
+    def _completed_conversions(self) -> int:
+        conversions = int(
+            (self._clock() - self._conversion_start) / self.conversion_time
+        )
+        return conversions if self.continuous else min(conversions, 1)
+
+    def convert(self, millivolts: float) -> int:
+        """Output code of the input voltage with the current configuration"""
+        bits = self.resolution
+        lsb_mv = 2 * REFERENCE_VOLTAGE / 2**bits * 1000 / self.gain
+        code = round(millivolts / lsb_mv)
+        return max(-(2 ** (bits - 1)), min(code, 2 ** (bits - 1) - 1))
+
+    def read(self, readlen: int) -> bytes:
+        conversions = self._completed_conversions()
+        if conversions > self._converted:
+            self._converted = conversions
+            self._code = self.convert(self._source())
+        ready = conversions > self._read_conversions
+        if ready and self.continuous:
+            # a one-shot result stays ready until the next conversion starts
+            self._read_conversions = conversions
+        configuration = self.configuration & ~READY_BIT
+        if not ready:
+            configuration |= READY_BIT
+        data_size = 3 if self.resolution == 18 else 2
+        response = self._code.to_bytes(data_size, "big", signed=True)
+        # the configuration byte is repeated while the master reads
+        response += bytes([configuration]) * max(readlen - data_size, 0)
+        return response[:readlen]
@@ -0,0 +1,56 @@
+from biofactory.drivers.pca9555 import (
+    REGISTER_CONFIGURATION_PORT_0,
+    REGISTER_INPUT_PORT_0,
+    REGISTER_OUTPUT_PORT_0,
+    REGISTER_POLARITY_INVERSION_PORT_0,
+)
+from biofactory.simulator import RegisterChip
+
+REGISTERS_COUNT = 8
+
+
+class PCA9555(RegisterChip):
+    """
+    PCA9555 16 bit IO expander model. Registers are pairs of port 0 and port 1,
+    the pointer toggles inside the pair on consecutive accesses. Input
+    registers read the output value of output pins and ``inputs`` of the input
+    pins.
+    """
+
+    def __init__(self, inputs: int = 0xFFFF):
+        super().__init__(REGISTERS_COUNT)
+        self.inputs = inputs
+        self.registers[REGISTER_OUTPUT_PORT_0.address : REGISTERS_COUNT] = bytes(
+            [0xFF, 0xFF, 0x00, 0x00, 0xFF, 0xFF]
+        )
+
+    def next_register(self, regaddr: int) -> int:
+        return regaddr ^ 1
+
+    def _get_pair(self, regaddr: int) -> int:
+        return int.from_bytes(self.registers[regaddr : regaddr + 2], "little")
+
+    @property
+    def output_value(self) -> int:
+        return self._get_pair(REGISTER_OUTPUT_PORT_0.address)
+
+    @property
+    def config(self) -> int:
+        return self._get_pair(REGISTER_CONFIGURATION_PORT_0.address)
+
+    @property
+    def pins(self) -> int:
+        """Levels of the pins, inputs are driven from outside"""
+        config = self.config
+        return (self.output_value & ~config | self.inputs & config) & 0xFFFF
+
+    def write_register(self, regaddr: int, value: int):
+        if regaddr >= REGISTER_OUTPUT_PORT_0.address:
+            self.registers[regaddr] = value
+
+    def read_register(self, regaddr: int) -> int:
+        if regaddr <= REGISTER_INPUT_PORT_0.address + 1:
+            port = regaddr - REGISTER_INPUT_PORT_0.address
+            polarity = self.registers[REGISTER_POLARITY_INVERSION_PORT_0.address + port]
+            return (self.pins >> (8 * port) & 0xFF) ^ polarity
+        return self.registers[regaddr]
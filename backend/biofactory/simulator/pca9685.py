@@ -0,0 +1,82 @@
+from biofactory.drivers.pca9685 import (
+    LED_MAX_VALUE,
+    LED_STRIP_COUNT,
+    LED_STRIP_START_REGADR,
+    MODE1_AI_BIT,
+    MODE1_ALLCALL_BIT,
+    MODE1_RESTART_BIT,
+    MODE1_SLEEP_BIT,
+    REGISTER_ALL_LED_ON_L,
+    REGISTER_MODE_1,
+    REGISTER_MODE_2,
+    REGISTER_PRE_SCALE,
+    get_led_off_registers,
+    get_led_on_registers,
+)
+from biofactory.simulator import RegisterChip
+
+POWER_ON_MODE_1 = MODE1_SLEEP_BIT | MODE1_ALLCALL_BIT
+POWER_ON_MODE_2 = 0x04
+POWER_ON_PRE_SCALE = 0x1E
+ALL_LED_REGISTERS = range(REGISTER_ALL_LED_ON_L, REGISTER_ALL_LED_ON_L + 4)
+FULL_BIT = 0x10
+
+
+class PCA9685(RegisterChip):
+    """
+    PCA9685 16 channel PWM controller model. The register pointer is
+    incremented only with the MODE1 AI bit, ALL_LED registers write the
+    registers of every channel and read as zero, the prescaler can be changed
+    only in sleep mode.
+    """
+
+    def __init__(self):
+        super().__init__(256)
+        self.registers[REGISTER_MODE_1] = POWER_ON_MODE_1
+        self.registers[REGISTER_MODE_2] = POWER_ON_MODE_2
+        self.registers[REGISTER_PRE_SCALE] = POWER_ON_PRE_SCALE
+        for channel in range(LED_STRIP_COUNT):
+            # LEDn_OFF_H full off
+            self.registers[get_led_off_registers(channel)[1]] = FULL_BIT
+
+    def next_register(self, regaddr: int) -> int:
+        if self.registers[REGISTER_MODE_1] & MODE1_AI_BIT:
+            return (regaddr + 1) % len(self.registers)
+        return regaddr
+
+    @property
+    def sleeping(self) -> bool:
+        return bool(self.registers[REGISTER_MODE_1] & MODE1_SLEEP_BIT)
+
+    def write_register(self, regaddr: int, value: int):
+        if regaddr == REGISTER_MODE_1:
+            # writing 1 to RESTART clears it
+            self.registers[regaddr] = value & ~MODE1_RESTART_BIT
+        elif regaddr == REGISTER_PRE_SCALE:
+            if self.sleeping:
+                self.registers[regaddr] = value
+        elif regaddr in ALL_LED_REGISTERS:
+            offset = regaddr - REGISTER_ALL_LED_ON_L
+            for channel in range(LED_STRIP_COUNT):
+                self.registers[LED_STRIP_START_REGADR + channel * 4 + offset] = value
+        else:
+            self.registers[regaddr] = value
+
+    def read_register(self, regaddr: int) -> int:
+        if regaddr in ALL_LED_REGISTERS:
+            return 0
+        return self.registers[regaddr]
+
+    def duty_cycle(self, channel: int) -> float:
+        """Output duty cycle of the channel, zero in sleep mode"""
+        if self.sleeping:
+            return 0.0
+        on_l, on_h = get_led_on_registers(channel)
+        off_l, off_h = get_led_off_registers(channel)
+        if self.registers[off_h] & FULL_BIT:
+            return 0.0
+        if self.registers[on_h] & FULL_BIT:
+            return 1.0
+        on = (self.registers[on_h] & 0x0F) << 8 | self.registers[on_l]
+        off = (self.registers[off_h] & 0x0F) << 8 | self.registers[off_l]
+        return ((off - on) % (LED_MAX_VALUE + 1)) / LED_MAX_VALUE
@@ -0,0 +1,244 @@
+"""
+Simulated Replifactory v5 board: the chips at the addresses and chip selects of
+``biofactory.machine.replifactory_v5`` wired to culture models of the vials.
+"""
+
+import functools
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+from biofactory.devices.laser import LASER_ON
+from biofactory.devices.od_calibration import ADC_FULL_SCALE_MV, mv_from_od
+from biofactory.devices.optical_density_sensor import (
+    default_curve_fitting_parameters,
+)
+from biofactory.machine.process import MachineFactory
+from biofactory.machine.replifactory_v5 import (
+    I2C_PORT_ADC,
+    I2C_PORT_IO_ADC,
+    I2C_PORT_IO_LASER,
+    I2C_PORT_PWM,
+    I2C_PORT_THERMOMETER_1,
+    I2C_PORT_THERMOMETER_2,
+    I2C_PORT_THERMOMETER_3,
+    STIRRER_PWM_CHANNEL_START_ADDR,
+    STIRRERS_COUNT,
+    USED_PUMPS,
+    VALVE_CLOSED_DUTY_CYCLE,
+    VALVE_OPEN_DUTY_CYCLE,
+    VAVLE_PWM_CHANNEL_START_ADDR,
+    VIALS_COUNT,
+    ReplifactoryMachine,
+)
+from biofactory.simulator.adt75 import ADT75
+from biofactory.simulator.culture import CultureModel
+from biofactory.simulator.ft2232h import SimulatedFtdiDriver
+from biofactory.simulator.l6470h import L6470
+from biofactory.simulator.mcp3421 import MCP3421
+from biofactory.simulator.pca9555 import PCA9555
+from biofactory.simulator.pca9685 import PCA9685
+from biofactory.util.clock import monotonic
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+FEED_PUMP_CS = 0
+DOSE_PUMP_CS = 1
+DISCHARGE_PUMP_CS = 3
+STEPS_PER_REVOLUTION = 200
+SECONDS_PER_HOUR = 3600
+OD_CURVE_PARAMETERS = (
+    default_curve_fitting_parameters.infinity_x_asymptote,
+    default_curve_fitting_parameters.hill,
+    default_curve_fitting_parameters.inflection,
+    default_curve_fitting_parameters.small_x_asymptote,
+    default_curve_fitting_parameters.rate_of_change,
+)
+
+
+class ReplifactoryPlant:
+    """
+    The photodiode signal of a vial is the background light plus, with the
+    laser of the vial on, the signal of the culture optical density on the
+    default calibration curve of the sensors. Pump moves add or remove liquid
+    in the vials with an open valve when the move ends. The cultures are grown
+    lazily up to the clock time whenever the plant is observed.
+
+    time_scale - culture seconds per clock second, e.g. 3600 grows the cultures
+        an hour every second
+    volume_per_rotation - mL pumped by a pump rotation
+    noise_mv - standard deviation of the photodiode noise, seeded by ``seed``
+    """
+
+    def __init__(
+        self,
+        cultures: Optional[list[CultureModel]] = None,
+        time_scale: float = 1.0,
+        clock: Callable[[], float] = monotonic,
+        volume_per_rotation: float = 10.0,
+        drug_concentration: float = 1.0,
+        background_mv: float = 0.5,
+        noise_mv: float = 0.0,
+        temperature: float = 30.0,
+        seed: int = 0,
+    ):
+        self._lock = threading.RLock()
+        self.clock = clock
+        self.time_scale = time_scale
+        self.cultures = cultures or [CultureModel() for _ in range(VIALS_COUNT)]
+        self.volume_per_rotation = volume_per_rotation
+        self.drug_concentration = drug_concentration
+        self.background_mv = background_mv
+        self.noise_mv = noise_mv
+        self._random = random.Random(seed)
+        self._updated = clock()
+        self._valves_open = [False] * VIALS_COUNT
+        self.pumped = {pump_num - 1: 0.0 for pump_num in USED_PUMPS}
+
+        self.pwm = PCA9685()
+        self.io_laser = PCA9555()
+        self.io_adc = PCA9555()
+        self.adc = MCP3421(source=self.get_photodiode_mv, clock=clock)
+        self.thermometers = {
+            address: ADT75(temperature)
+            for address in (
+                I2C_PORT_THERMOMETER_1,
+                I2C_PORT_THERMOMETER_2,
+                I2C_PORT_THERMOMETER_3,
+            )
+        }
+        self.pumps = {
+            cs: L6470(
+                clock=clock, on_motion=functools.partial(self._on_pump_motion, cs)
+            )
+            for cs in self.pumped
+        }
+
+    def create_driver(
+        self,
+        latency: float = 0.0,
+        byte_time: float = 0.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> SimulatedFtdiDriver:
+        return SimulatedFtdiDriver(
+            i2c_chips={
+                I2C_PORT_PWM: self.pwm,
+                I2C_PORT_IO_LASER: self.io_laser,
+                I2C_PORT_IO_ADC: self.io_adc,
+                I2C_PORT_ADC[0]: self.adc,
+                **self.thermometers,
+            },
+            spi_chips=self.pumps,
+            latency=latency,
+            byte_time=byte_time,
+            sleep=sleep,
+        )
+
+    def create_machine(
+        self,
+        latency: float = 0.0,
+        byte_time: float = 0.0,
+        sleep: Callable[[float], None] = time.sleep,
+        **kwargs,
+    ) -> ReplifactoryMachine:
+        """ReplifactoryMachine running the real devices and drivers on the plant"""
+        return ReplifactoryMachine(
+            ftdi_driver=self.create_driver(latency, byte_time, sleep), **kwargs
+        )
+
+    def update(self):
+        """Ends the finished pump moves and grows the cultures until now"""
+        # the pumps call back into the plant, never hold the plant lock here
+        for pump in self.pumps.values():
+            pump.update()
+        with self._lock:
+            self._grow()
+
+    def _grow(self):
+        now = self.clock()
+        hours = (now - self._updated) * self.time_scale / SECONDS_PER_HOUR
+        self._updated = now
+        for culture in self.cultures:
+            culture.grow(hours)
+
+    def is_laser_on(self, num: int) -> bool:
+        pin = 2 * num - 1
+        if self.io_laser.config >> pin & 1:
+            return False
+        return self.io_laser.pins >> pin & 1 == LASER_ON
+
+    def is_valve_open(self, num: int) -> bool:
+        with self._lock:
+            channel = VAVLE_PWM_CHANNEL_START_ADDR + num - 1
+            duty_cycle = self.pwm.duty_cycle(channel)
+            if duty_cycle > 0:
+                # the servo holds its position without the PWM signal
+                self._valves_open[num - 1] = duty_cycle < (
+                    (VALVE_OPEN_DUTY_CYCLE + VALVE_CLOSED_DUTY_CYCLE) / 2
+                )
+            return self._valves_open[num - 1]
+
+    def get_stirrer_duty_cycle(self, num: int) -> float:
+        channel = STIRRER_PWM_CHANNEL_START_ADDR + STIRRERS_COUNT - num
+        return self.pwm.duty_cycle(channel)
+
+    def get_photodiode_mv(self) -> float:
+        """Voltage of the photodiode selected by the ADC multiplexer"""
+        self.update()
+        with self._lock:
+            num = VIALS_COUNT - (self.io_adc.output_value >> 8 & 0xFF)
+            millivolts = self.background_mv
+            if 1 <= num <= VIALS_COUNT and self.is_laser_on(num):
+                millivolts += self.get_culture_mv(self.cultures[num - 1].od)
+            if self.noise_mv:
+                millivolts += self._random.gauss(0.0, self.noise_mv)
+            return max(millivolts, 0.0)
+
+    @staticmethod
+    def get_culture_mv(od: float) -> float:
+        """Transmitted light signal of the optical density"""
+        saturated, _, _, _, _ = OD_CURVE_PARAMETERS
+        if od >= saturated:
+            return 0.0
+        return min(mv_from_od(max(od, 0.0), *OD_CURVE_PARAMETERS), ADC_FULL_SCALE_MV)
+
+    def _on_pump_motion(self, cs: int, steps: float):
+        volume = steps / STEPS_PER_REVOLUTION * self.volume_per_rotation
+        with self._lock:
+            self._grow()
+            self.pumped[cs] += volume
+            vials = [
+                self.cultures[num - 1]
+                for num in range(1, VIALS_COUNT + 1)
+                if self.is_valve_open(num)
+            ]
+            for culture in vials:
+                share = volume / len(vials)
+                if cs == DISCHARGE_PUMP_CS:
+                    culture.remove(share)
+                elif share > 0:
+                    drug = self.drug_concentration if cs == DOSE_PUMP_CS else 0.0
+                    culture.add(share, drug)
+                else:
+                    culture.remove(-share)
+
+
+class SimulatedMachineFactory(MachineFactory):
+    """
+    Creates a plant and its connected machine in the worker process of the
+    machine, e.g. ``RemoteMachine("SIM-1", SimulatedMachineFactory())``.
+    ``plant_kwargs`` are passed to ``ReplifactoryPlant``.
+    """
+
+    def __init__(self, latency: float = 0.0, byte_time: float = 0.0, **plant_kwargs):
+        self.latency = latency
+        self.byte_time = byte_time
+        self.plant_kwargs = plant_kwargs
+
+    def __call__(self, machine_callback) -> ReplifactoryMachine:
+        plant = ReplifactoryPlant(**self.plant_kwargs)
+        machine = plant.create_machine(
+            self.latency, self.byte_time, machine_callback=machine_callback
+        )
+        machine.connect(usb_device=VirtualUsbDevice())
+        return machine
@@ -0,0 +1,183 @@
+"""
+Startup profiling, enabled by the BIOFACTORY_PROFILE_STARTUP=1 environment variable.
+
+Records the import time of every module imported after the profiling started as a
+tree, how long create_app took and the time to the first request. The report is
+logged when the first request arrives.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from importlib.abc import MetaPathFinder
+from typing import Optional
+
+PROFILE_ENV = "BIOFACTORY_PROFILE_STARTUP"
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def startupProfile():
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = StartupProfile()
+    return _instance
+
+
+class ImportNode:
+    __slots__ = ("name", "duration", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.duration = 0.0
+        self.children: list["ImportNode"] = []
+
+
+class _TimedLoader:
+    """Loader proxy which times module execution"""
+
+    def __init__(self, loader, profile: "StartupProfile"):
+        self._loader = loader
+        self._profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self._profile.importing(module.__name__):
+            self._loader.exec_module(module)
+
+
+class _ImportTimer(MetaPathFinder):
+    def __init__(self, profile: "StartupProfile"):
+        self._profile = profile
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimedLoader(spec.loader, self._profile)
+                    return spec
+            return None
+        finally:
+            self._local.finding = False
+
+
+class StartupProfile:
+    def __init__(self):
+        self._log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._started: Optional[float] = None
+        self._marks: dict[str, float] = {}
+        self._root = ImportNode("<startup>")
+        self._stack = [self._root]
+        self._finder: Optional[_ImportTimer] = None
+        self._first_request_reported = False
+
+    @property
+    def enabled(self):
+        return self._started is not None
+
+    def start(self):
+        if self.enabled:
+            return
+        self._started = time.perf_counter()
+        self._finder = _ImportTimer(self)
+        sys.meta_path.insert(0, self._finder)
+
+    def stop(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        self._finder = None
+
+    def importing(self, name: str):
+        profile = self
+
+        class _Timer:
+            def __enter__(self):
+                self.node = ImportNode(name)
+                self.started = time.perf_counter()
+                profile._stack[-1].children.append(self.node)
+                profile._stack.append(self.node)
+
+            def __exit__(self, *exc):
+                self.node.duration = time.perf_counter() - self.started
+                profile._stack.pop()
+
+        return _Timer()
+
+    def mark(self, name: str, duration: Optional[float] = None):
+        """Records a startup milestone, seconds since the profiling started"""
+        if self.enabled:
+            self._marks[name] = (
+                duration
+                if duration is not None
+                else time.perf_counter() - self._started
+            )
+
+    def on_first_request(self):
+        if not self.enabled or self._first_request_reported:
+            return
+        self._first_request_reported = True
+        self.mark("first_request")
+        self.stop()
+        self._log.info(self.format_report())
+
+    def get_report(self, min_duration: float = 0.005, depth: int = 3) -> dict:
+        def node_to_dict(node: ImportNode, level: int):
+            children = sorted(node.children, key=lambda n: -n.duration)
+            return {
+                "name": node.name,
+                "duration": node.duration,
+                "children": (
+                    [
+                        node_to_dict(child, level + 1)
+                        for child in children
+                        if child.duration >= min_duration
+                    ]
+                    if level < depth
+                    else []
+                ),
+            }
+
+        self._root.duration = sum(child.duration for child in self._root.children)
+        return {"marks": dict(self._marks), "imports": node_to_dict(self._root, 0)}
+
+    def format_report(self, **kwargs) -> str:
+        report = self.get_report(**kwargs)
+        lines = ["Startup profile:"]
+        lines += [
+            f"  {name}: {seconds * 1000:.0f} ms"
+            for name, seconds in report["marks"].items()
+        ]
+        lines.append("  imports (cumulative):")
+
+        def add_node(node, indent):
+            lines.append(
+                f"{' ' * indent}{node['duration'] * 1000:8.1f} ms {node['name']}"
+            )
+            for child in node["children"]:
+                add_node(child, indent + 2)
+
+        add_node(report["imports"], 4)
+        return "\n".join(lines)
+
+
+def start_from_environment():
+    if os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes"):
+        startupProfile().start()
@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+
+from biofactory.util import atomic_write, clock
+
+COLUMNS = {
+    "time": np.dtype("<f8"),
+    "reactor": np.dtype("<i2"),
+    "metric": np.dtype("<u2"),
+    "value": np.dtype("<f8"),
+}
+MACHINE_WIDE = 0
+"""Reactor number of the records which don't belong to any reactor, e.g. temperatures"""
+
+SEGMENT_PREFIX = "segment-"
+METRICS_FILE = "metrics.json"
+
+
+@dataclass
+class Segment:
+    path: str
+    size: int
+    first_time: float
+    last_time: float
+    ordered: bool = True
+    """False when records were appended out of time order, e.g. late timestamps"""
+
+    def column_path(self, column: str) -> str:
+        return os.path.join(self.path, f"{column}.bin")
+
+    def column(self, column: str) -> np.ndarray:
+        if self.size == 0:
+            return np.empty(0, dtype=COLUMNS[column])
+        return np.memmap(
+            self.column_path(column),
+            dtype=COLUMNS[column],
+            mode="r",
+            shape=(self.size,),
+        )
+
+
+class TimeSeriesStore:
+    """
+    Append-only columnar store of the machine measurements.
+
+    Every record is (time, reactor, metric, value). Records are kept in a memory
+    buffer and flushed in batches to the current segment, a folder with one raw
+    little-endian file per column. A new segment is started when the current one
+    reaches ``segment_size`` records. Range queries memory-map only the segments
+    which overlap the requested time range and bisect their time column, or mask
+    it when the segment got records older than its last one.
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        flush_size: int = 1024,
+        flush_interval: float = 60.0,
+        segment_size: int = 1_000_000,
+    ):
+        self._folder = folder
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._segment_size = segment_size
+        self._log = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
+        self._lock = threading.RLock()
+        self._buffer: list[tuple[float, int, int, float]] = []
+        self._metrics: dict[str, int] = {}
+        self._metrics_dirty = False
+        self._segments: list[Segment] = []
+        self._last_flush = time.monotonic()
+        self._load()
+
+    @property
+    def folder(self):
+        return self._folder
+
+    def _load(self):
+        if not os.path.isdir(self._folder):
+            return
+        metrics_path = os.path.join(self._folder, METRICS_FILE)
+        if os.path.exists(metrics_path):
+            with open(metrics_path) as f:
+                self._metrics = json.load(f)
+        for name in sorted(os.listdir(self._folder)):
+            path = os.path.join(self._folder, name)
+            if name.startswith(SEGMENT_PREFIX) and os.path.isdir(path):
+                self._segments.append(self._load_segment(path))
+
+    def _load_segment(self, path: str) -> Segment:
+        segment = Segment(path=path, size=0, first_time=0.0, last_time=0.0)
+        sizes = []
+        for column, dtype in COLUMNS.items():
+            column_path = segment.column_path(column)
+            file_size = (
+                os.path.getsize(column_path) if os.path.exists(column_path) else 0
+            )
+            sizes.append(file_size // dtype.itemsize)
+        segment.size = min(sizes)
+        if any(size != segment.size for size in sizes):
+            # interrupted flush, drop the partially written records
+            self._log.warning(f"Truncating segment {path} to {segment.size} records")
+            for column, dtype in COLUMNS.items():
+                with open(segment.column_path(column), "ab") as f:
+                    f.truncate(segment.size * dtype.itemsize)
+        if segment.size:
+            times = segment.column("time")
+            segment.ordered = bool(np.all(times[1:] >= times[:-1]))
+            segment.first_time = float(times.min())
+            segment.last_time = float(times.max())
+        return segment
+
+    def _get_metric_id(self, metric: str) -> int:
+        metric_id = self._metrics.get(metric)
+        if metric_id is None:
+            metric_id = len(self._metrics)
+            self._metrics[metric] = metric_id
+            self._metrics_dirty = True
+        return metric_id
+
+    def get_metrics(self) -> list[str]:
+        with self._lock:
+            return list(self._metrics)
+
+    def append(
+        self,
+        reactor: int,
+        metric: str,
+        value: float,
+        timestamp: Optional[float] = None,
+    ):
+        self.append_many(reactor, {metric: value}, timestamp)
+
+    def append_many(
+        self,
+        reactor: int,
+        values: dict[str, float],
+        timestamp: Optional[float] = None,
+    ):
+        timestamp = clock.time() if timestamp is None else timestamp
+        with self._lock:
+            for metric, value in values.items():
+                self._buffer.append(
+                    (timestamp, reactor, self._get_metric_id(metric), value)
+                )
+            if (
+                len(self._buffer) >= self._flush_size
+                or time.monotonic() - self._last_flush >= self._flush_interval
+            ):
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer:
+                return
+            os.makedirs(self._folder, exist_ok=True)
+            if self._metrics_dirty:
+                with atomic_write(
+                    os.path.join(self._folder, METRICS_FILE), mode="w"
+                ) as f:
+                    json.dump(self._metrics, f)
+                self._metrics_dirty = False
+            records = self._records_to_columns(sorted(self._buffer))
+            written = 0
+            while written < len(records["time"]):
+                segment = self._get_writable_segment()
+                count = min(
+                    self._segment_size - segment.size, len(records["time"]) - written
+                )
+                for column in COLUMNS:
+                    with open(segment.column_path(column), "ab") as f:
+                        f.write(records[column][written : written + count].tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                first_time = float(records["time"][written])
+                last_time = float(records["time"][written + count - 1])
+                if segment.size == 0:
+                    segment.first_time = first_time
+                    segment.last_time = last_time
+                else:
+                    segment.ordered &= first_time >= segment.last_time
+                    segment.first_time = min(segment.first_time, first_time)
+                    segment.last_time = max(segment.last_time, last_time)
+                segment.size += count
+                written += count
+            self._buffer = []
+
+    def _get_writable_segment(self) -> Segment:
+        if self._segments and self._segments[-1].size < self._segment_size:
+            return self._segments[-1]
+        path = os.path.join(self._folder, f"{SEGMENT_PREFIX}{len(self._segments):06d}")
+        os.makedirs(path, exist_ok=True)
+        segment = Segment(path=path, size=0, first_time=0.0, last_time=0.0)
+        self._segments.append(segment)
+        return segment
+
+    @staticmethod
+    def _records_to_columns(records) -> dict[str, np.ndarray]:
+        if not records:
+            return {column: np.empty(0, dtype) for column, dtype in COLUMNS.items()}
+        time_, reactor, metric, value = zip(*records)
+        return {
+            "time": np.array(time_, dtype=COLUMNS["time"]),
+            "reactor": np.array(reactor, dtype=COLUMNS["reactor"]),
+            "metric": np.array(metric, dtype=COLUMNS["metric"]),
+            "value": np.array(value, dtype=COLUMNS["value"]),
+        }
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        reactor: Optional[Union[int, list[int]]] = None,
+        metric: Optional[Union[str, list[str]]] = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        Returns records with start <= time <= end as columns ordered by time, metric
+        column contains metric names
+        """
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        with self._lock:
+            names = np.array(list(self._metrics), dtype=object)
+            metric_ids = None
+            if metric is not None:
+                metric = [metric] if isinstance(metric, str) else metric
+                metric_ids = [self._metrics[m] for m in metric if m in self._metrics]
+            reactors = [reactor] if isinstance(reactor, int) else reactor
+            parts = []
+            for segment in self._segments:
+                if segment.size == 0:
+                    continue
+                if segment.last_time < start or segment.first_time > end:
+                    continue
+                times = segment.column("time")
+                if not segment.ordered:
+                    in_range = (times >= start) & (times <= end)
+                    parts.append(
+                        {
+                            column: np.asarray(segment.column(column)[in_range])
+                            for column in COLUMNS
+                        }
+                    )
+                    continue
+                lo = np.searchsorted(times, start, side="left")
+                hi = np.searchsorted(times, end, side="right")
+                if lo < hi:
+                    parts.append(
+                        {
+                            column: np.asarray(segment.column(column)[lo:hi])
+                            for column in COLUMNS
+                        }
+                    )
+            if self._buffer:
+                buffered = self._records_to_columns(sorted(self._buffer))
+                in_range = (buffered["time"] >= start) & (buffered["time"] <= end)
+                parts.append(
+                    {column: values[in_range] for column, values in buffered.items()}
+                )
+        result = {
+            column: (
+                np.concatenate([part[column] for part in parts])
+                if parts
+                else np.empty(0, dtype)
+            )
+            for column, dtype in COLUMNS.items()
+        }
+        if np.any(result["time"][1:] < result["time"][:-1]):
+            order = np.argsort(result["time"], kind="stable")
+            result = {column: values[order] for column, values in result.items()}
+        mask = np.ones(len(result["time"]), dtype=bool)
+        if reactors is not None:
+            mask &= np.isin(result["reactor"], reactors)
+        if metric_ids is not None:
+            mask &= np.isin(result["metric"], metric_ids)
+        if not mask.all():
+            result = {column: values[mask] for column, values in result.items()}
+        result["metric"] = names[result["metric"]]
+        return result
+
+    def query_dict(self, *args, **kwargs) -> dict[str, list]:
+        """Same as query, but returns JSON serializable lists"""
+        return {
+            column: values.tolist()
+            for column, values in self.query(*args, **kwargs).items()
+        }
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,358 @@
+"""
+Tracing of the command path, enabled by the BIOFACTORY_TRACING=1 environment
+variable or ``tracer().enable()``.
+
+Spans are opened by the machine and reactor commands, the operation scheduler,
+the device command executors, the FTDI ports and the clock sleeps. The current
+span is kept in a context variable, work handed over to another thread carries
+it along with the time it was queued, so the time spent waiting in the queues
+shows up as ``queued`` spans. Finished spans are kept in a ring buffer and
+exported as Chrome trace events (chrome://tracing, Perfetto) or as OpenTelemetry
+OTLP/JSON.
+
+A disabled tracer returns a shared no-op scope, instrumented code pays a
+function call per span.
+"""
+
+import functools
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, NamedTuple, Optional
+
+TRACING_ENV = "BIOFACTORY_TRACING"
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def tracer():
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = Tracer()
+    return _instance
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "category",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "thread_id",
+        "thread_name",
+        "attributes",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        category: str,
+        trace_id: int,
+        span_id: int,
+        parent_id: Optional[int],
+        start_ns: int,
+        attributes: dict[str, Any],
+    ):
+        self.name = name
+        self.category = category
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = start_ns
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        self.attributes = attributes
+
+    @property
+    def duration_ns(self) -> int:
+        return self.end_ns - self.start_ns
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class TraceContext(NamedTuple):
+    """Span of the thread which queued some work and when it was queued"""
+
+    parent: Optional[Span]
+    queued_ns: int
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("biofactory_span", default=None)
+
+
+class _NoopScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SCOPE = _NoopScope()
+
+
+class _SpanScope:
+    __slots__ = ("_tracer", "_span", "_token")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self._tracer = tracer
+        self._span = span
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        self._span.end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            self._span.attributes["error"] = repr(exc)
+        _current_span.reset(self._token)
+        self._tracer._finish(self._span)
+        return False
+
+
+class _ParentScope:
+    """Makes the span of another thread the parent of the spans opened here"""
+
+    __slots__ = ("_parent", "_token")
+
+    def __init__(self, parent: Optional[Span]):
+        self._parent = parent
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self._parent)
+        return self._parent
+
+    def __exit__(self, *exc):
+        _current_span.reset(self._token)
+        return False
+
+
+class Tracer:
+    """
+    capacity - count of the latest finished spans kept
+    """
+
+    def __init__(self, capacity: int = 20000):
+        self.enabled = False
+        self._spans: deque[Span] = deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._dropped = 0
+        # perf_counter has an arbitrary origin, exports need epoch times
+        self._epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+
+    @property
+    def capacity(self) -> int:
+        return self._spans.maxlen
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._spans.clear()
+        self._dropped = 0
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def _new_span(
+        self,
+        name: str,
+        category: str,
+        parent: Optional[Span],
+        start_ns: int,
+        attributes: dict,
+    ) -> Span:
+        span_id = next(self._ids)
+        return Span(
+            name,
+            category,
+            parent.trace_id if parent is not None else span_id,
+            span_id,
+            parent.span_id if parent is not None else None,
+            start_ns,
+            attributes,
+        )
+
+    def _finish(self, span: Span):
+        if len(self._spans) == self._spans.maxlen:
+            self._dropped += 1
+        self._spans.append(span)
+
+    def span(self, name: str, category: str = "", **attributes):
+        """Context manager timing a span, a child of the current span"""
+        if not self.enabled:
+            return _NOOP_SCOPE
+        return _SpanScope(
+            self,
+            self._new_span(
+                name,
+                category,
+                _current_span.get(),
+                time.perf_counter_ns(),
+                attributes,
+            ),
+        )
+
+    def capture(self) -> Optional[TraceContext]:
+        """Context to pass along with work queued for another thread"""
+        if not self.enabled:
+            return None
+        return TraceContext(_current_span.get(), time.perf_counter_ns())
+
+    def resume(
+        self,
+        context: Optional[TraceContext],
+        name: str = "queued",
+        category: str = "queue",
+        **attributes,
+    ):
+        """
+        Records the time the work waited in the queue and makes the span which
+        queued it the parent of the spans opened in the returned scope
+        """
+        if context is None or not self.enabled:
+            return _NOOP_SCOPE
+        span = self._new_span(
+            name, category, context.parent, context.queued_ns, attributes
+        )
+        span.end_ns = time.perf_counter_ns()
+        self._finish(span)
+        return _ParentScope(context.parent)
+
+    def get_spans(self) -> list[Span]:
+        return list(self._spans)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "spans": len(self._spans),
+            "capacity": self.capacity,
+            "dropped": self._dropped,
+        }
+
+    def export_chrome_trace(self) -> dict:
+        """Trace Event Format, complete events in microseconds"""
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for span in self.get_spans():
+            threads[span.thread_id] = span.thread_name
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": (span.start_ns + self._epoch_offset_ns) / 1000,
+                    "dur": span.duration_ns / 1000,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": {
+                        **span.attributes,
+                        "trace_id": span.trace_id,
+                        "span_id": span.span_id,
+                        "parent_id": span.parent_id,
+                    },
+                }
+            )
+        events += [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": thread_name},
+            }
+            for thread_id, thread_name in threads.items()
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_otlp(self, service_name: str = "biofactory") -> dict:
+        """OTLP/JSON ExportTraceServiceRequest"""
+
+        def attribute(key, value):
+            if isinstance(value, bool):
+                typed = {"boolValue": value}
+            elif isinstance(value, int):
+                typed = {"intValue": str(value)}
+            elif isinstance(value, float):
+                typed = {"doubleValue": value}
+            else:
+                typed = {"stringValue": str(value)}
+            return {"key": key, "value": typed}
+
+        spans = []
+        for span in self.get_spans():
+            otlp_span = {
+                "traceId": f"{span.trace_id:032x}",
+                "spanId": f"{span.span_id:016x}",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns + self._epoch_offset_ns),
+                "endTimeUnixNano": str(span.end_ns + self._epoch_offset_ns),
+                "attributes": [
+                    attribute(key, value)
+                    for key, value in {
+                        **span.attributes,
+                        "category": span.category,
+                        "thread.id": span.thread_id,
+                        "thread.name": span.thread_name,
+                    }.items()
+                ],
+            }
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = f"{span.parent_id:016x}"
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [attribute("service.name", service_name)]
+                    },
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+                }
+            ]
+        }
+
+
+def traced(name: Optional[str] = None, category: str = ""):
+    """Decorator opening a span around every call of the function"""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            current = tracer()
+            if not current.enabled:
+                return func(*args, **kwargs)
+            with current.span(span_name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_from_environment():
+    if os.environ.get(TRACING_ENV, "").lower() in ("1", "true", "yes"):
+        tracer().enable()
@@ -13,8 +13,12 @@ from collections.abc import Set
 from contextlib import contextmanager, suppress
 from typing import Iterable, Literal, Union
 
-import numpy as np
-import pandas as pd
+from biofactory.util import clock
+from biofactory.util.module_loading import lazy_import
+
+# heavy scientific dependencies are imported on first use
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 
 def read_file_tail(filepath, lines=1000, _buffer=4096):
@@ -206,6 +210,106 @@ class InvariantContainer:
         return self._data.__iter__()
 
 
+class TimeRingBuffer:
+    """
+    Time ordered buffer of items with a time key.
+
+    Items are stored in a list with a head index and their times in a parallel
+    numpy array, so appending is O(1), items older than ``cutoff`` seconds are
+    evicted by moving the head and time ranges are found by bisection. Storage is
+    compacted once the evicted head takes more than half of it.
+    """
+
+    def __init__(
+        self, cutoff=None, key="time", initial_capacity=1024, clock=clock.time
+    ):
+        self._cutoff = cutoff
+        self._clock = clock
+        self._key = key
+        self._items = []
+        self._times = np.empty(initial_capacity, dtype=np.float64)
+        self._head = 0
+        self._mutex = threading.RLock()
+
+    @property
+    def times(self) -> "np.ndarray":
+        """Read-only view of the item times, oldest first"""
+        with self._mutex:
+            view = self._times[self._head : len(self._items)]
+            view.flags.writeable = False
+            return view
+
+    def append(self, item):
+        timestamp = float(item[self._key])
+        with self._mutex:
+            size = len(self._items)
+            if size == len(self._times):
+                self._compact(grow=True)
+                size = len(self._items)
+            if size > self._head and timestamp < self._times[size - 1]:
+                # out of order item, insert at its position
+                index = int(
+                    np.searchsorted(
+                        self._times[self._head : size], timestamp, side="right"
+                    )
+                )
+                index += self._head
+                self._items.insert(index, item)
+                self._times[index + 1 : size + 1] = self._times[index:size]
+                self._times[index] = timestamp
+            else:
+                self._items.append(item)
+                self._times[size] = timestamp
+            self.evict()
+
+    def evict(self, now=None):
+        if self._cutoff is None:
+            return
+        now = self._clock() if now is None else now
+        with self._mutex:
+            self._head += int(
+                np.searchsorted(
+                    self._times[self._head : len(self._items)],
+                    now - self._cutoff,
+                    side="left",
+                )
+            )
+            if self._head > len(self._times) // 2:
+                self._compact()
+
+    def _compact(self, grow=False):
+        size = len(self._items) - self._head
+        capacity = len(self._times)
+        if grow and size * 2 > capacity:
+            capacity *= 2
+        times = np.empty(capacity, dtype=np.float64)
+        times[:size] = self._times[self._head : len(self._items)]
+        self._times = times
+        del self._items[: self._head]
+        self._head = 0
+
+    def slice(self, start=None, end=None) -> list:
+        """Returns items with start <= time <= end"""
+        with self._mutex:
+            times = self._times[self._head : len(self._items)]
+            lo = 0 if start is None else int(np.searchsorted(times, start, "left"))
+            hi = (
+                len(times) if end is None else int(np.searchsorted(times, end, "right"))
+            )
+            return self._items[self._head + lo : self._head + hi]
+
+    @property
+    def last(self):
+        with self._mutex:
+            return self._items[-1] if len(self._items) > self._head else None
+
+    def __len__(self):
+        return len(self._items) - self._head
+
+    def __iter__(self):
+        return iter(self.slice())
+
+
 class CaseInsensitiveSet(Set):
     """
     Basic case insensitive set
@@ -237,7 +341,7 @@ def silent_remove(file):
         file (string): The path of the file to be removed
     """
 
-    with suppress(ValueError):
+    with suppress(OSError):
         os.remove(file)
 
 
@@ -767,8 +871,4 @@ def interrupteble_sleep(timeout: float, interrupt_event: threading.Event):
         timeout (float): The time to sleep
         interrupt_event (threading.Event): The event to interrupt the sleep
     """
-    start_time = time.monotonic()
-    while time.monotonic() - start_time < timeout:
-        interrupt_event.wait(timeout - (time.monotonic() - start_time))
-        if interrupt_event.is_set():
-            break
+    clock.sleep(timeout, interrupt_event)
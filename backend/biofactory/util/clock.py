@@ -0,0 +1,354 @@
+"""
+Time source of the machines and experiments.
+
+Device delays, experiment loops and measurement timestamps read the time and
+sleep through the functions of this module instead of the ``time`` module, so
+installing a :class:`VirtualClock` with :func:`set_clock` runs the whole
+machine in virtual time. Time which is not part of the process being run, like
+UI update throttling, profiling and log timestamps, stays on the wall clock.
+
+Threads which wait on other primitives than the clock, e.g. for the next item of
+a queue, do it in a :func:`blocking` block, so the virtual clock knows they
+can't run either.
+"""
+
+import heapq
+import itertools
+import threading
+import time as _time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, tzinfo
+from typing import Optional
+
+from biofactory.tracing import tracer
+
+
+class Clock:
+    """The wall clock"""
+
+    def time(self) -> float:
+        return _time.time()
+
+    def monotonic(self) -> float:
+        return _time.monotonic()
+
+    def sleep(
+        self, seconds: float, interrupt: Optional[threading.Event] = None
+    ) -> bool:
+        """
+        Sleeps for the given time, returns True if the interrupt event was set
+        before the time passed
+        """
+        if interrupt is not None:
+            return interrupt.wait(max(seconds, 0.0))
+        if seconds > 0:
+            _time.sleep(seconds)
+        return False
+
+    def wait(self, event: threading.Event, timeout: Optional[float] = None) -> bool:
+        """Event.wait measuring the timeout with the clock"""
+        return event.wait(timeout)
+
+    def wait_condition(
+        self, condition: threading.Condition, timeout: Optional[float] = None
+    ) -> bool:
+        """Condition.wait measuring the timeout with the clock"""
+        return condition.wait(timeout)
+
+    def blocking(self):
+        """Context of a wait on other primitives than the clock"""
+        return nullcontext()
+
+
+@dataclass(order=True)
+class _Sleeper:
+    deadline: float
+    seq: int
+    target: bool = field(compare=False)
+    thread: threading.Thread = field(compare=False)
+    condition: Optional[threading.Condition] = field(compare=False, default=None)
+    woken: threading.Event = field(compare=False, default_factory=threading.Event)
+
+    def wake(self):
+        self.woken.set()
+        if self.condition is not None:
+            with self.condition:
+                self.condition.notify_all()
+
+
+class VirtualClock(Clock):
+    """
+    Clock running at the wall clock speed which jumps ahead to the end of the
+    earliest sleep once all threads waiting with the clock are waiting again
+    and none of them used the clock for ``settle_time`` wall seconds, which
+    covers the hand over of work between them. A 4 hour sleep of an experiment
+    then takes ``settle_time`` once the machine is idle.
+
+    A thread takes part from its first sleep or wait with a timeout until it
+    ends. Between its waits it is running, whether or not it reads the time,
+    so its other waits must be in :meth:`blocking`.
+
+    Only sleeps are jumped to, the timeout of a wait for an event passes when
+    the clock reaches it, so waiting for a result never times out because
+    the thread producing it was busy.
+
+    start - epoch time of the clock start, defaults to the current time
+    auto_advance - False freezes the time between calls to :meth:`advance`
+    """
+
+    def __init__(
+        self,
+        start: Optional[float] = None,
+        auto_advance: bool = True,
+        settle_time: float = 0.001,
+        max_poll_interval: float = 0.05,
+    ):
+        self._epoch = _time.time() if start is None else start
+        self._auto_advance = auto_advance
+        self._settle_time = settle_time
+        self._max_poll_interval = max_poll_interval
+        self._condition = threading.Condition()
+        self._wall_start = _time.monotonic()
+        self._offset = 0.0
+        self._sleepers: list[_Sleeper] = []
+        self._seq = itertools.count()
+        self._activity = 0
+        self._waits: dict[threading.Thread, int] = {}
+        """Nested waits by participating thread, 0 while the thread runs"""
+        self._woken: set[threading.Thread] = set()
+        """Threads of the ended sleeps which did not return yet"""
+        self._jumps = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def jumps(self) -> int:
+        """Count of the jumps ahead done since the clock was created"""
+        return self._jumps
+
+    def _now(self) -> float:
+        if not self._auto_advance:
+            return self._offset
+        return _time.monotonic() - self._wall_start + self._offset
+
+    def time(self) -> float:
+        return self._epoch + self.monotonic()
+
+    def monotonic(self) -> float:
+        # any use of the clock means a thread is still running
+        self._activity += 1
+        return self._now()
+
+    def advance(self, seconds: float):
+        """Moves the time ahead and wakes the sleeps which ended"""
+        with self._condition:
+            self._offset += max(seconds, 0.0)
+            self._activity += 1
+            due = self._pop_due()
+        for sleeper in due:
+            sleeper.wake()
+
+    @contextmanager
+    def blocking(self):
+        thread = threading.current_thread()
+        with self._condition:
+            # threads which never waited with the clock don't take part
+            participant = thread in self._waits
+            if participant:
+                self._waits[thread] += 1
+        try:
+            yield
+        finally:
+            if participant:
+                with self._condition:
+                    self._waits[thread] -= 1
+                    self._woken.discard(thread)
+                    self._activity += 1
+
+    def _running(self) -> bool:
+        """True if a participating thread is not waiting, prunes ended threads"""
+        for thread, waits in list(self._waits.items()):
+            if not thread.is_alive():
+                del self._waits[thread]
+                self._woken.discard(thread)
+            elif waits == 0 or thread in self._woken:
+                return True
+        return False
+
+    def _add_sleeper(
+        self,
+        seconds: float,
+        target: bool,
+        condition: Optional[threading.Condition] = None,
+    ) -> _Sleeper:
+        thread = threading.current_thread()
+        with self._condition:
+            sleeper = _Sleeper(
+                self._now() + seconds,
+                next(self._seq),
+                target,
+                thread,
+                condition,
+            )
+            heapq.heappush(self._sleepers, sleeper)
+            self._waits[thread] = self._waits.get(thread, 0) + 1
+            self._activity += 1
+            self._ensure_thread()
+            self._condition.notify_all()
+        return sleeper
+
+    def _remove_sleeper(self, sleeper: _Sleeper):
+        with self._condition:
+            if not sleeper.woken.is_set():
+                sleeper.woken.set()
+                self._sleepers.remove(sleeper)
+                heapq.heapify(self._sleepers)
+            self._waits[sleeper.thread] -= 1
+            self._woken.discard(sleeper.thread)
+            self._activity += 1
+
+    def _pop_due(self) -> list[_Sleeper]:
+        now = self._now()
+        due = []
+        while self._sleepers and self._sleepers[0].deadline <= now:
+            sleeper = heapq.heappop(self._sleepers)
+            # marked under the lock, the sleeper is then never removed twice
+            sleeper.woken.set()
+            # running from now on, not when it gets scheduled again
+            self._woken.add(sleeper.thread)
+            due.append(sleeper)
+        return due
+
+    def _poll_interval(self, sleeper: _Sleeper) -> float:
+        return min(max(sleeper.deadline - self._now(), 0.0), self._max_poll_interval)
+
+    def sleep(
+        self, seconds: float, interrupt: Optional[threading.Event] = None
+    ) -> bool:
+        if seconds <= 0:
+            return interrupt is not None and interrupt.is_set()
+        sleeper = self._add_sleeper(seconds, target=True)
+        try:
+            while not sleeper.woken.wait(self._max_poll_interval):
+                if interrupt is not None and interrupt.is_set():
+                    return True
+            return interrupt is not None and interrupt.is_set()
+        finally:
+            self._remove_sleeper(sleeper)
+
+    def wait(self, event: threading.Event, timeout: Optional[float] = None) -> bool:
+        if event.is_set():
+            return True
+        if timeout is None:
+            with self.blocking():
+                return event.wait()
+        sleeper = self._add_sleeper(max(timeout, 0.0), target=False)
+        try:
+            while not sleeper.woken.is_set():
+                if event.wait(self._poll_interval(sleeper)):
+                    return True
+            return event.is_set()
+        finally:
+            self._remove_sleeper(sleeper)
+
+    def wait_condition(
+        self, condition: threading.Condition, timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Waits for a notification of the condition, the timeout is a sleep
+        which the clock may jump to. The condition lock must be held and must
+        not be held by the thread advancing the clock.
+        """
+        if timeout is None:
+            with self.blocking():
+                return condition.wait()
+        sleeper = self._add_sleeper(max(timeout, 0.0), target=True, condition=condition)
+        try:
+            while not sleeper.woken.is_set():
+                if condition.wait(self._max_poll_interval):
+                    return not sleeper.woken.is_set()
+            return False
+        finally:
+            self._remove_sleeper(sleeper)
+
+    def _ensure_thread(self):
+        if not self._auto_advance:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="VirtualClock", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._sleepers:
+                    self._condition.wait()
+                activity = self._activity
+                self._condition.wait(
+                    min(
+                        self._settle_time,
+                        max(self._sleepers[0].deadline - self._now(), 0.0),
+                    )
+                )
+                if self._activity == activity and not self._running():
+                    targets = [s.deadline for s in self._sleepers if s.target]
+                    if targets and min(targets) > self._now():
+                        self._offset += min(targets) - self._now()
+                        self._jumps += 1
+                due = self._pop_due()
+            for sleeper in due:
+                sleeper.wake()
+
+
+_clock = Clock()
+
+
+def get_clock() -> Clock:
+    return _clock
+
+
+def set_clock(clock: Clock) -> Clock:
+    """Installs the clock used by biofactory, returns the previous one"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+def time() -> float:
+    return _clock.time()
+
+
+def monotonic() -> float:
+    return _clock.monotonic()
+
+
+def now(tz: Optional[tzinfo] = None) -> datetime:
+    """datetime.now of the clock"""
+    return datetime.fromtimestamp(_clock.time(), tz)
+
+
+def sleep(seconds: float, interrupt: Optional[threading.Event] = None) -> bool:
+    with tracer().span("sleep", "sleep", seconds=seconds):
+        return _clock.sleep(seconds, interrupt)
+
+
+def wait(event: threading.Event, timeout: Optional[float] = None) -> bool:
+    return _clock.wait(event, timeout)
+
+
+def wait_condition(
+    condition: threading.Condition, timeout: Optional[float] = None
+) -> bool:
+    return _clock.wait_condition(condition, timeout)
+
+
+def blocking():
+    """
+    Context of a wait on other primitives than the clock, e.g. a queue get::
+
+        with clock.blocking():
+            item = queue.get()
+    """
+    return _clock.blocking()
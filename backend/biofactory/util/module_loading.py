@@ -1,4 +1,5 @@
 import sys
+import types
 from importlib import import_module
 
 
@@ -30,3 +31,35 @@ def import_string(dotted_path):
             'Module "%s" does not define a "%s" attribute/class'
             % (module_path, class_name)
         ) from err
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module proxy which imports the module on the first attribute access, used for
+    heavy dependencies (numpy, pandas, scipy) which most processes never touch
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = import_module(self.__name__)
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    """
+    Returns the module if it is already imported, otherwise a proxy which imports
+    it when used
+    """
+    return sys.modules.get(name) or LazyModule(name)
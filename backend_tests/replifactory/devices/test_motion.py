@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from biofactory.devices.motion import (
+    MotionWatcher,
+    estimate_move_duration,
+    wait_for_motions,
+)
+
+
+class FakeMotor:
+    def __init__(self, duration):
+        self.finish = time.monotonic() + duration
+        self.checks = 0
+
+    def is_busy(self):
+        self.checks += 1
+        return time.monotonic() < self.finish
+
+
+def test_estimate_move_duration():
+    # trapezoidal: 1 s ramps and 1 s at the max speed
+    assert estimate_move_duration(200, 100, 100) == pytest.approx(3.0)
+    # triangular: the max speed is never reached
+    assert estimate_move_duration(100, 1000, 100) == pytest.approx(2.0)
+    assert estimate_move_duration(0, 100, 100) == 0.0
+
+
+def test_watcher_sleeps_until_expected_end_of_several_motions():
+    watcher = MotionWatcher(lead_time=0.02)
+    motors = [FakeMotor(0.2), FakeMotor(0.3)]
+
+    futures = [
+        watcher.watch(f"motor-{i}", m.is_busy, 0.2) for i, m in enumerate(motors)
+    ]
+    durations = wait_for_motions(futures, timeout=5)
+
+    assert durations[0] >= 0.2 and durations[1] >= 0.3
+    # no polling during the expected move time, a few polls after it
+    assert motors[0].checks <= 3
+    assert motors[1].checks <= 6
+
+
+def test_watcher_times_out_stuck_motion():
+    watcher = MotionWatcher(max_poll_interval=0.02, timeout_margin=0.1)
+
+    future = watcher.watch("stuck", lambda: True)
+
+    with pytest.raises(TimeoutError):
+        wait_for_motions([future], timeout=5)
@@ -0,0 +1,58 @@
+import pytest
+
+from biofactory.devices.od_calibration import (
+    OdCalibrationEngine,
+    OdLookupTable,
+    mv_from_od,
+    od_from_mv,
+)
+
+PARAMETERS = [(10.0, 1.2, 5.0, -0.1, 1.0), (12.0, 1.0, 6.0, -0.15, 1.3)]
+ODS = [0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 3.0]
+
+
+def calibration_points(parameters):
+    return {od: [float(mv_from_od(od, *parameters))] * 2 for od in ODS}
+
+
+def test_lookup_table_matches_function():
+    table = OdLookupTable(PARAMETERS[0])
+
+    for mv in (0.5, 3.0, 25.0, 200.0, 300.0):
+        assert table(mv) == pytest.approx(od_from_mv(mv, *PARAMETERS[0]), abs=1e-6)
+
+
+def test_engine_fits_sensors_together_and_caches_coefficients():
+    cache = {}
+    saves = []
+    engine = OdCalibrationEngine(cache=cache, save=lambda: saves.append(1))
+    points = {f"sensor-{i}": calibration_points(p) for i, p in enumerate(PARAMETERS)}
+    points["uncalibrated"] = {}
+
+    fitted = engine.fit(points)
+
+    assert set(fitted) == {"sensor-0", "sensor-1"}
+    for sensor_id, parameters in zip(fitted, PARAMETERS):
+        for od in ODS:
+            mv = mv_from_od(od, *parameters)
+            assert od_from_mv(mv, *fitted[sensor_id]) == pytest.approx(od, abs=0.01)
+    assert len(cache) == 2 and saves == [1]
+
+    assert engine.fit(points) == fitted
+    assert saves == [1]
+
+
+def test_engine_does_not_cache_failed_fits():
+    class FailingEngine(OdCalibrationEngine):
+        def _fit_batch(self, sensors_points):
+            fitted, _ = super()._fit_batch(sensors_points)
+            return fitted, False
+
+    cache = {}
+    saves = []
+    engine = FailingEngine(cache=cache, save=lambda: saves.append(1))
+
+    fitted = engine.fit({"sensor-0": calibration_points(PARAMETERS[0])})
+
+    assert set(fitted) == {"sensor-0"}
+    assert cache == {} and saves == []
@@ -0,0 +1,86 @@
+from biofactory.devices.laser import LASER_ON, Laser
+from biofactory.devices.optical_density_sensor import OpticalDensitySensor
+from biofactory.devices.optical_density_sensors_group import (
+    OpticalDensitySensorsGroup,
+)
+from biofactory.devices.photodiode import Photodiode
+from biofactory.drivers import HardwarePort
+from biofactory.drivers.pca9555 import REGISTER_OUTPUT_PORT_0, IOPortDriver
+
+
+class RegistersPort(HardwarePort):
+    def __init__(self, address):
+        self._address = address
+        self.registers = bytearray(8)
+        self.writes = []
+
+    @property
+    def address(self):
+        return self._address
+
+    def read_from(self, regaddr, readlen=0, *args, **kwargs):
+        return bytes(self.registers[regaddr : regaddr + readlen])
+
+    def write_to(self, regaddr, out, *args, **kwargs):
+        out = bytes(out)
+        self.writes.append((regaddr, out))
+        self.registers[regaddr : regaddr + len(out)] = out
+
+
+class FakeADC:
+    def __init__(self, io_adc: RegistersPort, io_laser: RegistersPort):
+        self.io_adc = io_adc
+        self.io_laser = io_laser
+
+    def measure(self, gain=8, bitrate=16):
+        diode_cs = self.io_adc.registers[REGISTER_OUTPUT_PORT_0.address + 1]
+        laser_pin = (6 - diode_cs) * 2 + 1
+        output = int.from_bytes(self.io_laser.registers[2:4], "little")
+        laser_on = (output >> laser_pin) & 1 == LASER_ON
+        return (10.0 + diode_cs + (20.0 if laser_on else 0.0), 0.01)
+
+
+def create_group():
+    io_laser_port = RegistersPort(0x20)
+    io_adc_port = RegistersPort(0x21)
+    io_laser = IOPortDriver(io_laser_port)
+    io_adc = IOPortDriver(io_adc_port)
+    adc = FakeADC(io_adc_port, io_laser_port)
+    sensors = [
+        OpticalDensitySensor(
+            photodiode=Photodiode(6 - i, adc_driver=adc, io_driver=io_adc),
+            laser=Laser(i * 2 + 1, io_driver=io_laser),
+            delay_before_measure=0,
+            name=f"Optical Density Sensor {i + 1}",
+        )
+        for i in range(7)
+    ]
+    for sensor in sensors:
+        sensor.laser.switch_off()
+    io_laser_port.writes.clear()
+    return OpticalDensitySensorsGroup(sensors), sensors, io_laser_port
+
+
+def test_measure_od_all_matches_single_measurements():
+    group, sensors, _ = create_group()
+
+    ods = group.measure_od_all()
+
+    assert ods == [sensor.measure_od() for sensor in sensors]
+    assert [sensor._background for sensor in sensors] == [
+        10.0 + 6 - i for i in range(7)
+    ]
+
+
+def test_measure_od_all_switches_lasers_in_groups():
+    group, _, io_laser_port = create_group()
+
+    group.measure_od_all([0, 1, 2])
+
+    # lasers of vials 1 and 3 (pins 1 and 5) are switched together, then vial 2 (pin 3)
+    assert io_laser_port.writes == [
+        (REGISTER_OUTPUT_PORT_0.address, bytes([0x88])),
+        (REGISTER_OUTPUT_PORT_0.address, bytes([0xAA])),
+        (REGISTER_OUTPUT_PORT_0.address, bytes([0xA2])),
+        (REGISTER_OUTPUT_PORT_0.address, bytes([0xAA])),
+    ]
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from biofactory.devices.pump_calibration import PumpCalibration
+
+COEFFICIENTS = {1: 10, 5: 9.5, 10: 9.0, 50: 8.5}
+
+
+def test_from_coefficients_matches_coefficient_interpolation():
+    calibration = PumpCalibration.from_coefficients(COEFFICIENTS)
+
+    assert calibration.volume(1) == pytest.approx(10.0)
+    assert calibration.volume(3) == pytest.approx(29.25)
+    assert calibration.volume(50) == pytest.approx(425.0)
+    assert calibration.volume(100) == pytest.approx(850.0)
+    assert calibration.rotations(-47.5) == pytest.approx(-5.0)
+
+
+def test_lookups_are_inverse_and_accept_arrays():
+    calibration = PumpCalibration.from_coefficients(COEFFICIENTS)
+    rotations = np.linspace(-80, 80, 33)
+
+    volumes = calibration.volume(rotations)
+
+    assert np.allclose(calibration.rotations(volumes), rotations)
+    assert volumes[20] == calibration.volume(float(rotations[20]))
+
+
+def test_fit_is_monotone():
+    calibration = PumpCalibration.fit(
+        rotations=[1, 2, 3, 3, 4, 5], volumes=[10, 19, 28, 30, 38, 37]
+    )
+
+    grid = np.linspace(0, 10, 101)
+    assert np.all(np.diff(calibration.volume(grid)) > 0)
+    assert calibration.volume(3) == pytest.approx(29.0, abs=0.01)
+    assert calibration.rotations(calibration.volume(2.5)) == pytest.approx(2.5)
@@ -0,0 +1,93 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from biofactory.devices import Device
+from biofactory.devices.motion import MotionWatcher, wait_for_motions
+from biofactory.devices.pumps_group import PumpsGroup, PumpsInterlockError
+from biofactory.devices.valve import Valve
+from biofactory.devices.valves_group import ValvesGroup
+
+WATCHER = MotionWatcher(lead_time=0.0)
+
+
+class FakePump(Device):
+    def __init__(self, name, seconds_per_ml=0.1):
+        super().__init__(name)
+        self.seconds_per_ml = seconds_per_ml
+        self.started = []
+        self.stopped = False
+
+    def pump(self, volume, rot_per_sec=None):
+        duration = volume * self.seconds_per_ml
+        finish = time.monotonic() + duration
+        self.started.append(time.monotonic())
+        return WATCHER.watch(self.name, lambda: time.monotonic() < finish, duration)
+
+    def stop(self):
+        self.stopped = True
+        return WATCHER.watch(self.name, lambda: False, 0.0)
+
+    def get_drivers(self):
+        return []
+
+
+class FailingPump(FakePump):
+    def pump(self, volume, rot_per_sec=None):
+        raise RuntimeError(f"{self.name} failed")
+
+
+def create_valves(open_valves):
+    driver = SimpleNamespace(set_duty_cycle=lambda channel, duty_cycle: None)
+    valves = ValvesGroup(
+        [
+            Valve(channel, driver, init_state=Valve.States.STATE_CLOSE)
+            for channel in range(7)
+        ]
+    )
+    for index in range(open_valves):
+        valves[index].open(wait=False)
+    return valves
+
+
+def create_group(open_valves=1):
+    pumps = [FakePump("Pump 1"), FakePump("Pump 2"), FakePump("Pump 4")]
+    valves = create_valves(open_valves)
+    group = PumpsGroup(pumps, simultaneous=[{"pump-1", "pump-2"}], valves_group=valves)
+    return group, pumps
+
+
+def test_pump_volumes_runs_pumps_simultaneously():
+    group, pumps = create_group()
+
+    started = time.monotonic()
+    wait_for_motions(group.pump_volumes({"pump-1": 2.0, "pump-2": 2.0}), timeout=5)
+
+    assert time.monotonic() - started < 0.35
+    assert abs(pumps[0].started[0] - pumps[1].started[0]) < 0.05
+
+
+def test_pump_volumes_checks_interlocks():
+    group, pumps = create_group()
+
+    with pytest.raises(PumpsInterlockError):
+        group.pump_volumes({"pump-1": 1.0, "pump-4": 1.0})
+    with pytest.raises(PumpsInterlockError):
+        create_group(open_valves=2)[0].pump_volumes({"pump-1": 1.0, "pump-2": 1.0})
+    with pytest.raises(PumpsInterlockError):
+        create_group(open_valves=0)[0].pump_volumes({"pump-1": 1.0, "pump-2": 1.0})
+    # a zero volume doesn't count as flow
+    wait_for_motions(group.pump_volumes({"pump-1": 0.1, "pump-4": 0.0}), timeout=5)
+    assert not pumps[2].started
+
+
+def test_pump_volumes_stops_the_started_pumps_when_a_pump_fails():
+    pumps = [FakePump("Pump 1"), FailingPump("Pump 2")]
+    group = PumpsGroup(
+        pumps, simultaneous=[{"pump-1", "pump-2"}], valves_group=create_valves(1)
+    )
+
+    with pytest.raises(RuntimeError):
+        group.pump_volumes({"pump-1": 1.0, "pump-2": 1.0})
+    assert pumps[0].started and pumps[0].stopped
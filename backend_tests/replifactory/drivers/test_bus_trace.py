@@ -0,0 +1,61 @@
+import pytest
+from pyftdi.i2c import I2cNackError
+
+from biofactory.drivers import bus_trace
+from biofactory.drivers.bus_trace import BusTrace, busTrace
+from biofactory.simulator import RegisterChip, SimulatedBus, SimulatedI2cPort
+
+
+@pytest.fixture
+def enabled_bus_trace():
+    trace = busTrace()
+    trace.clear()
+    trace.enable()
+    yield trace
+    trace.disable()
+    trace.clear()
+
+
+def test_ring_buffer_keeps_the_latest_transactions():
+    trace = BusTrace(capacity=4, max_data=4)
+    port = trace.register_port("i2c", "ADC", 0x68, {0x01: "CONFIG"})
+    for value in range(6):
+        trace.record(port, bus_trace.READ_FROM, 0x01, result=bytes([value, 0xFF]))
+    trace.record(port, bus_trace.WRITE, out=b"\x01\x02\x03\x04\x05")
+
+    transactions = trace.dump()
+    assert [t["result"] for t in transactions[:-1]] == ["03 FF", "04 FF", "05 FF"]
+    assert transactions[0]["register_name"] == "CONFIG"
+    assert transactions[0]["result_int"] == 0x03FF
+    assert transactions[-1]["out"] == "01 02 03 04"
+    assert transactions[-1]["truncated"]
+    assert len(trace.dump(2)) == 2
+    assert trace.register_port("i2c", "ADC", 0x68) == port
+
+
+def test_nack_keeps_the_transactions_before_it(enabled_bus_trace):
+    bus = SimulatedBus("i2c")
+    port = SimulatedI2cPort(bus, 0x40, "PWM", RegisterChip())
+    absent = SimulatedI2cPort(bus, 0x41, "ABSENT")
+    port.write_to(0x06, b"\x10\x20")
+    assert port.read_from(0x06, 2) == b"\x10\x20"
+
+    with pytest.raises(I2cNackError):
+        absent.read(1)
+    port.read(1)
+
+    (error,) = enabled_bus_trace.get_error_dumps()
+    assert error["port"] == "ABSENT"
+    assert [(t["port"], t["operation"], t["error"]) for t in error["transactions"]] == [
+        ("PWM", "write", False),
+        ("PWM", "exchange", False),
+        ("ABSENT", "read", True),
+    ]
+    assert len(enabled_bus_trace.dump()) == 4
+
+
+def test_disabled_bus_trace_records_nothing():
+    port = SimulatedI2cPort(SimulatedBus("i2c"), 0x40, "PWM", RegisterChip())
+    written = busTrace().get_stats()["transactions"]
+    port.write_to(0x06, b"\x10")
+    assert busTrace().get_stats()["transactions"] == written
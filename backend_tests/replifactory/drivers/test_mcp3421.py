@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from biofactory.drivers import HardwarePort
+from biofactory.drivers.mcp3421 import ADCDriver
+
+SAMPLES_PER_SECOND = {0b00: 240, 0b01: 60, 0b10: 15, 0b11: 3.75}
+
+
+class MCP3421Port(HardwarePort):
+    def __init__(self, codes, ready=True):
+        self._codes = iter(codes)
+        self._ready = ready
+        self.configuration = 0b10010000
+        self.conversion_end = 0.0
+        self.writes = 0
+        self.reads = 0
+
+    @property
+    def address(self):
+        return 0x68
+
+    def write(self, out, *args, **kwargs):
+        self.writes += 1
+        self.configuration = out[0]
+        period = 1 / SAMPLES_PER_SECOND[(self.configuration >> 2) & 0b11]
+        self.conversion_end = time.monotonic() + period
+
+    def read(self, readlen=0, *args, **kwargs):
+        self.reads += 1
+        if self._ready and time.monotonic() >= self.conversion_end:
+            code = next(self._codes)
+            period = 1 / SAMPLES_PER_SECOND[(self.configuration >> 2) & 0b11]
+            self.conversion_end = time.monotonic() + period
+            config = self.configuration & 0x7F
+        else:
+            code = 0
+            config = self.configuration | 0x80
+        return code.to_bytes(readlen - 1, "big", signed=True) + bytes([config])
+
+
+def test_measure_one_shot():
+    port = MCP3421Port([1000])
+    driver = ADCDriver(port)
+
+    millivolts, error = driver.measure(gain=1, bitrate=12)
+
+    assert millivolts == pytest.approx(1000.0)
+    assert error == pytest.approx(1.0)
+    assert port.writes == 1
+
+
+def test_measure_averages_samples():
+    port = MCP3421Port([100, 102, 104, 106])
+    driver = ADCDriver(port)
+
+    millivolts, error = driver.measure(gain=1, bitrate=12, samples=4)
+
+    assert millivolts == pytest.approx(103.0)
+    assert error == pytest.approx((20 / 3) ** 0.5)
+    assert port.writes == 4
+
+
+def test_continuous_measure_skips_unchanged_configuration():
+    port = MCP3421Port(range(100, 200))
+    driver = ADCDriver(port)
+
+    driver.measure(gain=1, bitrate=12, continuous_conversion=True)
+    driver.measure(gain=1, bitrate=12, continuous_conversion=True, samples=3)
+
+    assert port.writes == 1
+
+
+def test_measure_raises_timeout_when_not_ready():
+    driver = ADCDriver(MCP3421Port([], ready=False))
+
+    with pytest.raises(TimeoutError):
+        driver.measure(gain=1, bitrate=12)
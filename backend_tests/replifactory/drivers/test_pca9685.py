@@ -0,0 +1,77 @@
+from biofactory.devices.stirrer import Stirrer
+from biofactory.devices.stirrers_group import StirrersGroup
+from biofactory.drivers import HardwarePort, merge_register_writes
+from biofactory.drivers.pca9685 import (
+    MODE1_AI_BIT,
+    REGISTER_MODE_1,
+    PWMDriver,
+    get_led_off_registers,
+)
+
+
+class PCA9685Port(HardwarePort):
+    def __init__(self):
+        self.registers = bytearray(256)
+        self.registers[0xFE] = 0x1E
+        self.writes = []
+        self.reads = []
+
+    @property
+    def address(self):
+        return 0x70
+
+    def _auto_increment(self, regaddr, length):
+        if length > 1:
+            assert self.registers[REGISTER_MODE_1] & MODE1_AI_BIT
+
+    def read_from(self, regaddr, readlen=0, *args, **kwargs):
+        self._auto_increment(regaddr, readlen)
+        self.reads.append((regaddr, readlen))
+        return bytes(self.registers[regaddr : regaddr + readlen])
+
+    def write_to(self, regaddr, out, *args, **kwargs):
+        out = bytes(out)
+        self._auto_increment(regaddr, len(out))
+        self.writes.append((regaddr, out))
+        self.registers[regaddr : regaddr + len(out)] = out
+
+
+def create_driver():
+    port = PCA9685Port()
+    driver = PWMDriver(port)
+    driver.init()
+    port.writes.clear()
+    port.reads.clear()
+    return driver, port
+
+
+def test_merge_register_writes_fills_known_gaps():
+    values = {8: 1, 9: 2, 12: 3, 13: 4, 20: 5}
+    known = {10: 0, 11: 0}
+
+    bursts = merge_register_writes(values, max_gap=2, fill=known.get)
+
+    assert bursts == [(8, bytes([1, 2, 0, 0, 3, 4])), (20, bytes([5]))]
+
+
+def test_duty_cycle_is_cached():
+    driver, port = create_driver()
+
+    driver.set_duty_cycle(3, 0.5)
+    driver.set_duty_cycle(3, 0.5)
+
+    assert len(port.writes) == 1
+    assert driver.get_duty_cycle(3) == round(4095 * 0.5) / 4095
+    assert port.reads == []
+
+
+def test_stirrers_group_writes_all_channels_in_one_transaction():
+    driver, port = create_driver()
+    stirrers = [Stirrer(channel, driver) for channel in reversed(range(7))]
+    group = StirrersGroup(stirrers)
+
+    group.run_all(0.5)
+
+    assert port.writes == [
+        (get_led_off_registers(0)[0], bytes([0x00, 0x08, 0, 0] * 6 + [0x00, 0x08]))
+    ]
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import pytest
+
+from biofactory.machine.aio import AsyncMachine, eventLoop
+from biofactory.machine.scheduler import operation_cancelled
+from biofactory.simulator.culture import CultureModel
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+@pytest.fixture
+def machine():
+    cultures = [CultureModel(od=0.3 + i / 10) for i in range(7)]
+    machine = ReplifactoryPlant(cultures=cultures).create_machine()
+    machine.connect(usb_device=VirtualUsbDevice())
+    yield machine
+    machine.shutdown()
+
+
+def test_gather_reactor_commands(machine):
+    aio = AsyncMachine(machine)
+
+    async def measure():
+        return await asyncio.gather(*(r.measure_od() for r in aio.get_reactors()))
+
+    ods = eventLoop().run(measure(), timeout=30)
+
+    assert ods == pytest.approx([0.3 + i / 10 for i in range(7)], abs=0.01)
+    with pytest.raises(AttributeError):
+        eventLoop().run(aio.cmd("no_such_command"), timeout=5)
+
+
+def test_error_returned_at_once_is_raised(machine):
+    aio = AsyncMachine(machine)
+
+    with pytest.raises(ValueError, match="refused"):
+        eventLoop().run(aio.submit(lambda on_done: ValueError("refused")), timeout=5)
+
+
+def test_cancelled_task_cancels_its_operations(machine):
+    aio = AsyncMachine(machine)
+    started = threading.Event()
+    ran = []
+
+    def long_operation():
+        started.set()
+        while not operation_cancelled():
+            threading.Event().wait(0.01)
+        return "stopped"
+
+    async def run():
+        # exclusive operations, the second one waits for the first
+        running = asyncio.ensure_future(aio.run((long_operation, (), {})))
+        pending = asyncio.ensure_future(aio.run((ran.append, (1,), {})))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        pending.cancel()
+        running.cancel()
+        await asyncio.gather(running, pending, return_exceptions=True)
+        return await aio.run((lambda: "after", (), {}))
+
+    assert eventLoop().run(run(), timeout=10) == "after"
+    assert ran == []
@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from biofactory.machine import CommandExecutor
+from biofactory.machine.futures import CommandFuture, wait_all, wait_any
+
+
+def test_future_callbacks_and_cancel():
+    future = CommandFuture()
+    done = []
+    future.add_done_callback(done.append)
+
+    assert not future.wait(0.01)
+    with pytest.raises(TimeoutError):
+        future.result(timeout=0.01)
+    future.set_exception(ValueError("failed"))
+    future.set_result(1)  # a done future keeps its outcome
+
+    assert done == [future]
+    assert isinstance(future.exception(), ValueError)
+    with pytest.raises(ValueError):
+        future.result()
+
+    cancelled = CommandFuture()
+    assert cancelled.cancel()
+    assert not cancelled.set_running_or_notify_cancel()
+    with pytest.raises(CancelledError):
+        cancelled.result()
+
+
+def test_executor_timeout_raises_and_drops_the_queued_command():
+    release = threading.Event()
+    executed = []
+
+    def execute(command):
+        if command == "block":
+            release.wait(5)
+        executed.append(command)
+        return command
+
+    executor = CommandExecutor(name="Test", execute_callback=execute)
+    try:
+        blocking = executor.submit("block")
+        with pytest.raises(TimeoutError):
+            executor.queue_command_and_wait("dropped", timeout=0.05)
+        futures = [executor.submit(i) for i in range(3)]
+        assert wait_any(futures, timeout=0.05) == (set(), set(futures))
+        release.set()
+        done, not_done = wait_all([blocking, *futures], timeout=5)
+        assert executor.queue_command_and_wait("after") == "after"
+    finally:
+        executor.stop()
+
+    assert not not_done and len(done) == 4
+    assert [future.result() for future in futures] == [0, 1, 2]
+    assert executed == ["block", 0, 1, 2, "after"]
+
+
+class _SlowGate:
+    """Gate whose release waits until the test lets it through"""
+
+    def __init__(self, gate):
+        self._gate = gate
+        self.releasing = threading.Event()
+        self.proceed = threading.Event()
+
+    def acquire(self, blocking=True, timeout=-1):
+        return self._gate.acquire(blocking, timeout)
+
+    def release(self):
+        self.releasing.set()
+        self.proceed.wait(5)
+        self._gate.release()
+
+
+def test_recycle_waits_for_the_completion_to_release_the_gate():
+    future = CommandFuture.from_pool()
+    future._gate = gate = _SlowGate(future._gate)
+    completer = threading.Thread(target=future.set_result, args=(1,))
+    completer.start()
+    assert gate.releasing.wait(5)
+    # the waiter takes the fast path while the completion is still releasing
+    assert future.wait(0) and future.outcome() == 1
+    recycler = threading.Thread(target=future.recycle)
+    recycler.start()
+    gate.proceed.set()
+    completer.join(5)
+    recycler.join(5)
+
+    assert CommandFuture.from_pool() is future
+    assert not future.wait(0) and future.outcome() is None
@@ -0,0 +1,73 @@
+import pytest
+
+from biofactory.machine import MachineCallback
+from biofactory.machine.process import RemoteMachine, RemoteMachineError
+from biofactory.simulator.culture import CultureModel
+from biofactory.simulator.replifactory_v5 import SimulatedMachineFactory
+
+
+class RecordingCallback(MachineCallback):
+    def __init__(self):
+        self.states = []
+        self.measurements = []
+
+    def _on_machine_state_change(self, state, *args, **kwargs):
+        self.states.append(state)
+
+    def _on_machine_add_measurements(self, reactor, values, timestamp, *args, **kwargs):
+        self.measurements.append((reactor, values))
+
+
+def test_machine_runs_in_its_worker_process():
+    cultures = [CultureModel(od=0.3 + i / 10) for i in range(7)]
+    callback = RecordingCallback()
+    machine = RemoteMachine(
+        "SIM-1", SimulatedMachineFactory(cultures=cultures), machine_callback=callback
+    )
+    machine.connect()
+    try:
+        assert machine.isIdle()
+        ods = machine.cmd("measure_od_all")
+        with pytest.raises(AttributeError):
+            machine.cmd("no_such_command")
+        reactor_commands = machine.get_reactor(1).get_command_info()
+    finally:
+        machine.shutdown()
+
+    assert list(ods.values()) == pytest.approx([c.od for c in cultures], abs=0.01)
+    assert "dilute" in reactor_commands
+    assert any(reactor for reactor, _ in callback.measurements)
+    assert callback.states[-1] == machine.States.STATE_CLOSED
+    with pytest.raises(RemoteMachineError):
+        machine.cmd("measure_od_all")
+
+
+def test_worker_serves_its_metrics_and_spans():
+    machine = RemoteMachine("SIM-3", SimulatedMachineFactory())
+    machine.connect()
+    try:
+        machine.call("tracing", "enable")
+        machine.cmd("measure_od_all")
+        metrics = machine.call("metrics")
+        trace = machine.call("tracing", "spans")
+        bus_stats = machine.call("bus_trace")
+        with pytest.raises(ValueError):
+            machine.call("bus_trace", "no_such_command")
+    finally:
+        machine.shutdown()
+
+    assert any(
+        labels.get("command") == "measure_od_all"
+        for labels, _ in metrics["biofactory_command_duration_seconds"]
+    )
+    assert any(event["ph"] == "X" for event in trace["traceEvents"])
+    assert {"enabled", "transactions"} <= set(bus_stats)
+
+
+def test_failed_worker_closes_the_machine():
+    machine = RemoteMachine("SIM-2", SimulatedMachineFactory(no_such_argument=1))
+
+    with pytest.raises(RemoteMachineError, match="no_such_argument"):
+        machine.connect()
+
+    assert machine.isError()
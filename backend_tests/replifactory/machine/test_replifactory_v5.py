@@ -0,0 +1,42 @@
+import pytest
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.devices.pumps_group import PumpsInterlockError
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.util.clock import VirtualClock, set_clock
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+class PumpFailure(Exception):
+    pass
+
+
+@pytest.fixture
+def machine():
+    previous = set_clock(VirtualClock())
+    machine = ReplifactoryPlant().create_machine()
+    machine.connect(usb_device=VirtualUsbDevice())
+    yield machine
+    machine.shutdown()
+    set_clock(previous)
+
+
+def fail(*args, **kwargs):
+    raise PumpFailure()
+
+
+def test_pump_errors_are_raised_by_the_pump_commands(machine, monkeypatch):
+    monkeypatch.setattr(machine._dev_manager._devices["pump-4"], "pump", fail)
+
+    with pytest.raises(PumpFailure):
+        machine.discharge(1, 1.0)
+    operation = (machine.discharge, (1, 1.0), {})
+    assert isinstance(machine.add_operation(operation), PumpFailure)
+
+
+def test_interlock_errors_are_raised_by_feed_and_dose(machine, monkeypatch):
+    pumps_group = machine._dev_manager._devices["pumps-group"]
+    monkeypatch.setattr(pumps_group, "_simultaneous", [])
+
+    with pytest.raises(PumpsInterlockError):
+        machine.feed_and_dose(1, 1.0, 1.0)
@@ -0,0 +1,233 @@
+import threading
+import time
+
+import pytest
+
+from biofactory.machine import machine_command
+from biofactory.machine.scheduler import (
+    EXCLUSIVE,
+    OperationScheduler,
+    Priority,
+    ScheduledOperation,
+    _current,
+    operation_resources,
+    preemption_point,
+    resources_conflict,
+)
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.util import clock
+from biofactory.util.clock import VirtualClock, set_clock
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+class Commands:
+    def __init__(self):
+        self.log = []
+        self.release = threading.Event()
+
+    @machine_command(resources=("pumps", "valves", "vial-{num}"))
+    def discharge(self, num: int, volume: float):
+        self.log.append(("discharge", num))
+        self.release.wait(1)
+
+    @machine_command(resources=("optics", "vial-{num}"), priority=Priority.HIGH)
+    def measure_od(self, num: int):
+        self.log.append(("measure_od", num))
+
+    @machine_command(resources=("pumps", "valves", "optics", "vial-{num}"))
+    def dilute(self, num: int, steps: int):
+        for step in range(steps):
+            preemption_point()
+            self.log.append(("dilute", num, step))
+            self.release.wait(0.05)
+
+    @machine_command(resources=("stirrer-{num}", "vial-{num}"))
+    def stirrer(self, num: int, speed: float):
+        self.log.append(("stirrer", num))
+
+    @machine_command(resources=("stirrer-{num}", "vial-{num}"))
+    def stir(self, num: int, seconds: float):
+        self.log.append(("stir", num))
+        threading.Event().wait(seconds)
+
+    @machine_command
+    def home(self):
+        self.log.append(("home",))
+
+
+def test_operation_resources_are_formatted_with_arguments():
+    commands = Commands()
+
+    assert operation_resources(commands.stirrer, (3,), {"speed": 0.5}) == {
+        "stirrer-3",
+        "vial-3",
+    }
+    assert operation_resources(commands.home) == {EXCLUSIVE}
+
+
+def test_independent_operations_run_concurrently():
+    commands = Commands()
+    scheduler = OperationScheduler()
+    scheduler.start()
+    done = threading.Event()
+
+    scheduler.submit((commands.discharge, (3, 1.0), {}))
+    scheduler.submit((commands.measure_od, (5,), {}), on_done=lambda r: done.set())
+
+    # OD is measured while the discharge is still running
+    assert done.wait(1)
+    assert not commands.release.is_set()
+    commands.release.set()
+    assert not scheduler.stop(timeout=1)
+
+
+def test_operations_on_a_vial_do_not_overlap():
+    commands = Commands()
+    scheduler = OperationScheduler()
+    scheduler.start()
+    done = threading.Event()
+
+    scheduler.submit((commands.discharge, (3, 1.0), {}))
+    scheduler.submit((commands.measure_od, (3,), {}), on_done=lambda r: done.set())
+
+    # OD is not measured while the vial is pumped
+    assert not done.wait(0.1)
+    commands.release.set()
+    assert done.wait(1)
+    assert not scheduler.stop(timeout=1)
+    assert commands.log == [("discharge", 3), ("measure_od", 3)]
+
+
+def test_all_vials_resource_conflicts_with_each_vial():
+    assert resources_conflict({"optics", "vial-*"}, {"pumps", "vial-3"})
+    assert resources_conflict({"vial-2"}, {"vial-*"})
+    assert not resources_conflict({"vial-*"}, {"stirrer-2", "pumps"})
+
+
+def test_conflicting_operations_keep_their_order():
+    commands = Commands()
+    scheduler = OperationScheduler()
+    scheduler.start()
+
+    scheduler.submit((commands.discharge, (3, 1.0), {}))
+    scheduler.submit((commands.home, (), {}))
+    done = threading.Event()
+    scheduler.submit((commands.stirrer, (1, 0.5), {}), on_done=lambda r: done.set())
+    time.sleep(0.05)
+    commands.release.set()
+
+    assert done.wait(1)
+
+    assert commands.log == [("discharge", 3), ("home",), ("stirrer", 1)]
+
+
+def test_operations_run_by_priority_then_deadline():
+    commands = Commands()
+    scheduler = OperationScheduler()
+    scheduler.start()
+    scheduler.submit((commands.discharge, (1, 1.0), {}))
+    done = threading.Event()
+
+    scheduler.submit((commands.discharge, (2, 1.0), {}), priority=Priority.LOW)
+    scheduler.submit((commands.discharge, (3, 1.0), {}), deadline=10.0)
+    scheduler.submit((commands.discharge, (4, 1.0), {}), deadline=1.0)
+    scheduler.submit((commands.discharge, (5, 1.0), {}), priority=Priority.HIGH)
+    scheduler.submit((commands.home, (), {}), on_done=lambda r: done.set())
+    commands.release.set()
+
+    assert done.wait(1)
+    assert [entry[-1] for entry in commands.log] == [1, 5, 4, 3, "home", 2]
+
+
+def test_waiting_operations_are_raised_to_a_higher_priority():
+    commands = Commands()
+    scheduler = OperationScheduler(aging_interval=0.05)
+    scheduler.start()
+    scheduler.submit((commands.discharge, (1, 1.0), {}))
+    done = threading.Event()
+
+    scheduler.submit((commands.discharge, (2, 1.0), {}), priority=Priority.LOW)
+    time.sleep(0.12)
+    scheduler.submit((commands.discharge, (3, 1.0), {}), priority=Priority.HIGH)
+    scheduler.submit((commands.home, (), {}), on_done=lambda r: done.set())
+    commands.release.set()
+
+    assert done.wait(1)
+    assert [entry[-1] for entry in commands.log] == [1, 2, 3, "home"]
+
+
+def test_high_priority_operation_preempts_a_long_operation():
+    commands = Commands()
+    scheduler = OperationScheduler()
+    scheduler.start()
+    done = threading.Event()
+
+    scheduler.submit((commands.dilute, (1, 4), {}))
+    time.sleep(0.02)
+    scheduler.submit((commands.measure_od, (2,), {}), on_done=lambda r: done.set())
+
+    assert done.wait(1)
+    assert not scheduler.stop(timeout=1)
+    assert commands.log == [
+        ("dilute", 1, 0),
+        ("measure_od", 2),
+        ("dilute", 1, 1),
+        ("dilute", 1, 2),
+        ("dilute", 1, 3),
+    ]
+
+
+def test_operation_timeout_follows_the_clock():
+    previous = set_clock(VirtualClock())
+    machine = ReplifactoryPlant().create_machine()
+    release = threading.Event()
+
+    def operation():
+        # the clock jumps an hour ahead, past the timeout of the caller
+        clock.sleep(3600)
+        release.wait(5)
+
+    try:
+        machine.connect(usb_device=VirtualUsbDevice())
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            machine.add_operation((operation, (), {}), timeout=60)
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        machine.shutdown()
+        set_clock(previous)
+
+
+def test_inline_operation_restores_the_scheduler_of_the_thread():
+    outer, inner = OperationScheduler("Outer"), OperationScheduler("Inner")
+    seen = []
+
+    def nested():
+        seen.append(_current.scheduler)
+
+    def operation():
+        inner._execute(ScheduledOperation((nested, (), {}), frozenset()))
+        seen.append(_current.scheduler)
+
+    outer._execute(ScheduledOperation((operation, (), {}), frozenset()))
+
+    assert seen == [inner, outer]
+    assert _current.scheduler is None and preemption_point() == 0
+
+
+def test_preempting_operation_waits_for_its_other_resources():
+    commands = Commands()
+    scheduler = OperationScheduler()
+    scheduler.start()
+    done = threading.Event()
+
+    scheduler.submit((commands.dilute, (1, 4), {}))
+    scheduler.submit((commands.stir, (3, 0.4), {}))
+    time.sleep(0.02)
+    # vial 3 is stirred, the measurement can't run at the preemption points
+    scheduler.submit((commands.measure_od, (3,), {}), on_done=lambda r: done.set())
+
+    assert done.wait(1)
+    assert not scheduler.stop(timeout=1)
+    assert commands.log[-1] == ("measure_od", 3)
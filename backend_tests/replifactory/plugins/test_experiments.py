@@ -0,0 +1,30 @@
+from pyftdi.i2c import I2cNackError
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.plugins.experiments.endless_growth.plugin import (
+    EndlessGrowthExperiment,
+)
+from biofactory.plugins.experiments.od_measure.plugin import ODMeasureExperiment
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+def test_failed_od_measurement_is_the_routine_error(monkeypatch):
+    plant = ReplifactoryPlant()
+    machine = plant.create_machine()
+    machine.connect(usb_device=VirtualUsbDevice())
+
+    def nack(readlen):
+        raise I2cNackError("NACK from the ADC")
+
+    monkeypatch.setattr(plant.adc, "read", nack)
+    try:
+        results = [
+            experiment_class(machine=machine, id="exp1").routine()
+            for experiment_class in (EndlessGrowthExperiment, ODMeasureExperiment)
+        ]
+    finally:
+        machine.shutdown()
+
+    for result in results:
+        assert isinstance(result["error"], I2cNackError)
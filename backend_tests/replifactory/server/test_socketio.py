@@ -0,0 +1,75 @@
+import time
+
+import biofactory.server.socketio as socketio_module
+from biofactory.machine_manager import StateMonitor
+from biofactory.server.socketio import CurrentDataBroadcaster
+
+
+class RecordingBroadcaster(CurrentDataBroadcaster):
+    def __init__(self, **kwargs):
+        super().__init__(app=None, **kwargs)
+        self.emitted = []
+
+    def _emit(self, payload, to):
+        self.emitted.append((to, payload))
+
+
+class MonitorMachineManager:
+    def __init__(self, monitor):
+        self._monitor = monitor
+
+    def get_current_version(self, machine=None):
+        return self._monitor.version
+
+    def get_current_changes(self, since=None, machine=None):
+        return self._monitor.get_changes(since)
+
+
+def test_updates_are_coalesced_into_one_room_emit(monkeypatch):
+    monitor = StateMonitor(interval=0)
+    monitor.reset(state={}, devices_data={"stirrer-1": {}, "stirrer-2": {}})
+    monkeypatch.setattr(
+        socketio_module, "machineManager", lambda: MonitorMachineManager(monitor)
+    )
+    broadcaster = RecordingBroadcaster(rate_limit=0.05)
+
+    broadcaster._on_machine_send_current_data(None)
+    for speed in range(10):
+        monitor.set_device_data("stirrer-2", {"speed": speed})
+        broadcaster._on_machine_send_current_data(None)
+    time.sleep(0.2)
+
+    assert [to for to, _ in broadcaster.emitted] == ["current", "current"]
+    full, delta = (payload for _, payload in broadcaster.emitted)
+    assert full["full"] is True
+    assert delta["since"] == full["version"]
+    assert delta["devices"] == {"stirrer-2": {"speed": 9}}
+
+
+def test_resync_reuses_snapshot_of_the_same_version(monkeypatch):
+    monitor = StateMonitor(interval=0)
+    monitor.reset(state={}, devices_data={"stirrer-1": {}})
+    monkeypatch.setattr(
+        socketio_module, "machineManager", lambda: MonitorMachineManager(monitor)
+    )
+    broadcaster = RecordingBroadcaster()
+
+    broadcaster.resync("a")
+    broadcaster.resync("b")
+
+    assert broadcaster.emitted[0][1] is broadcaster.emitted[1][1]
+
+
+def test_broadcaster_sends_only_its_machine(monkeypatch):
+    monitor = StateMonitor(interval=0)
+    monitor.reset(state={}, devices_data={"stirrer-1": {}})
+    monkeypatch.setattr(
+        socketio_module, "machineManager", lambda: MonitorMachineManager(monitor)
+    )
+    broadcaster = RecordingBroadcaster(machine="FT05A")
+
+    broadcaster._on_machine_send_current_data(None, machine="FT05B")
+    broadcaster._on_machine_send_current_data(None, machine="FT05A")
+
+    ((_, payload),) = broadcaster.emitted
+    assert payload["machine"] == "FT05A"
@@ -0,0 +1,74 @@
+import pytest
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.drivers.l6470h import STEP_MODE_HS, StepMotorDriver
+from biofactory.simulator import SimulatedBus, SimulatedSpiPort
+from biofactory.simulator.culture import CultureModel
+from biofactory.simulator.l6470h import L6470
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+class ManualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_l6470_is_busy_until_the_move_ends():
+    clock = ManualClock()
+    motions = []
+    chip = L6470(clock=clock, on_motion=motions.append)
+    driver = StepMotorDriver(SimulatedSpiPort(SimulatedBus("spi"), 0, "Motor", chip))
+    driver.set_max_speed(driver.convert_steps_per_sec_to_steps_per_tick(200))
+    driver.set_acceleration(1000)
+    driver.set_deceleration(1000)
+    driver.set_step_mode(STEP_MODE_HS)
+
+    # 400 full steps, about 2.2 s with the ramps
+    assert driver.move(800).is_busy
+    clock.now = 2.0
+    assert driver.get_status().is_busy
+    clock.now = 2.3
+
+    assert not driver.get_status().is_busy
+    assert motions == [pytest.approx(400)]
+    assert driver.absolute_position.value == 800
+
+
+def test_culture_grows_and_is_diluted():
+    culture = CultureModel(od=0.1, volume=10.0, max_od=1.0, min_volume=10.0)
+
+    culture.grow(hours=1.0)
+    grown = culture.od
+    culture.add(10.0, drug=2.0)
+    culture.remove(15.0)
+
+    assert 0.1 < grown < 0.2
+    assert culture.od == pytest.approx(grown / 2)
+    assert culture.drug == pytest.approx(1.0)
+    assert culture.volume == 10.0
+
+
+def test_machine_runs_on_simulated_hardware():
+    plant = ReplifactoryPlant(
+        cultures=[CultureModel(od=0.3 + i / 10) for i in range(7)]
+    )
+    machine = plant.create_machine(latency=0.0001)
+    machine.connect(usb_device=VirtualUsbDevice())
+    try:
+        ods = machine.measure_od_all()
+        expected = [culture.od for culture in plant.cultures]
+        machine.feed_and_dose(2, 4.0, 1.0)
+    finally:
+        machine.shutdown()
+
+    assert list(ods.values()) == pytest.approx(expected, abs=0.01)
+    assert plant.cultures[1].volume == pytest.approx(20.0, abs=0.1)
+    assert plant.cultures[0].volume == 15.0
+    assert plant.is_valve_open(2) is False
+    bus_stats = machine._ftdi_adapter._ftdi_driver.get_bus_stats()
+    assert bus_stats["i2c"]["transactions"] > 0
+    assert bus_stats["spi"]["transactions"] > 0
@@ -0,0 +1,145 @@
+import os
+import threading
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.checkpoint import (
+    CheckpointLog,
+    CheckpointState,
+    load_checkpoints,
+    read_checkpoint,
+)
+from biofactory.events import Events, eventManager
+from biofactory.experiment_manager import ExperimentManager
+from biofactory.plugins.experiments.endless_growth.plugin import (
+    EndlessGrowthExperiment,
+)
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+def _create(tmp_path, experiment_id="exp1", machine="SIM-1", **log_kwargs):
+    return CheckpointLog.create(
+        str(tmp_path / f"{experiment_id}.wal"),
+        experiment_id,
+        EndlessGrowthExperiment,
+        machine,
+        kwargs={"dilution_volume": 2.0},
+        **log_kwargs,
+    )
+
+
+def test_torn_tail_is_dropped_and_compaction_keeps_the_state(tmp_path):
+    checkpoint = _create(tmp_path, compact_records=10)
+    for cycle in range(1, 13):
+        checkpoint.append({"type": "cycle", "cycle": cycle, "time": 1.0, "state": {}})
+    checkpoint.append(
+        {
+            "type": "operation",
+            "phase": "begin",
+            "key": "dilute:2",
+            "name": "dilute",
+            "data": {"reactor": 2},
+        }
+    )
+    checkpoint.close()
+    with open(checkpoint.path, "ab") as f:
+        f.write(b'0badc0de {"type":"cycle_complete"')
+
+    state, records, _ = read_checkpoint(checkpoint.path)
+    assert records == 5  # snapshot at 10 records and the 4 after it
+    assert state.cycle == 12 and not state.cycle_complete
+    assert state.operations == {"dilute:2": {"name": "dilute", "data": {"reactor": 2}}}
+    assert state.kwargs == {"dilution_volume": 2.0}
+
+    reopened = CheckpointLog.open(checkpoint.path)
+    reopened.append({"type": "cycle_complete", "cycle": 12})
+    reopened.finish("done")
+    assert read_checkpoint(checkpoint.path)[1] == 1
+    assert load_checkpoints(str(tmp_path)) == {}
+
+
+def test_experiment_resumes_the_interrupted_cycle_without_warmup(tmp_path):
+    machine = ReplifactoryPlant().create_machine()
+    machine.connect(usb_device=VirtualUsbDevice())
+    checkpoint = _create(tmp_path)
+    growth_start = "2026-01-01T10:00:00"
+    checkpoint.append({"type": "started", "time": "2026-01-01T09:00:00+00:00"})
+    checkpoint.append(
+        {
+            "type": "cycle",
+            "cycle": 3,
+            "time": 1.0,
+            "state": {"start_growth_time": {"Reactor 1": growth_start}},
+        }
+    )
+    checkpoint.append(
+        {
+            "type": "operation",
+            "phase": "begin",
+            "key": "dilute:2",
+            "name": "dilute",
+            "data": {"reactor": 2},
+        }
+    )
+    checkpoint.close()
+    (restorable,) = load_checkpoints(str(tmp_path)).values()
+    assert isinstance(restorable, CheckpointState) and restorable.cycle == 3
+
+    checkpoint = CheckpointLog.open(checkpoint.path)
+    experiment = EndlessGrowthExperiment(
+        machine=machine, id="exp1", **checkpoint.state.kwargs
+    )
+    experiment._cycleTime = 0.0
+    experiment._cycles_max = 3
+    warmed_up = threading.Event()
+    experiment.warmup = warmed_up.set
+    cycles = []
+    experiment.routine = lambda: cycles.append(experiment._cycles)
+    try:
+        experiment.attach_checkpoint(checkpoint)
+        experiment.restore_checkpoint(checkpoint.state)
+        thread = experiment._thread
+        thread.join(timeout=10)
+    finally:
+        machine.shutdown()
+
+    assert not thread.is_alive()
+    assert cycles == [3, 4]
+    assert not warmed_up.is_set()
+    assert experiment._start_growth_time["Reactor 1"].isoformat() == growth_start
+    state, _, _ = read_checkpoint(checkpoint.path)
+    assert state.finished == "done"
+    assert state.operations == {}
+    assert state.state["start_growth_time"]["Reactor 2"] != growth_start
+    assert os.listdir(tmp_path) == ["exp1.wal"]
+
+
+def test_experiments_are_restored_only_on_their_machine(tmp_path, monkeypatch):
+    for experiment_id, serial in (
+        ("exp1", "VIRTUAL"),
+        ("exp2", "OTHER"),
+        ("exp3", None),
+    ):
+        _create(tmp_path, experiment_id, machine=serial).close()
+    manager = ExperimentManager(checkpoint_folder=str(tmp_path))
+    restored = []
+    monkeypatch.setattr(
+        manager,
+        "_restore_experiment",
+        lambda experiment_id, checkpoint, machine: restored.append(experiment_id),
+    )
+    machine = ReplifactoryPlant().create_machine()
+    try:
+        assert machine.serial is None
+        manager._on_machine_connected(Events.MACHINE_CONNECTED, machine)
+        machine.connect(usb_device=VirtualUsbDevice())
+        manager._on_machine_connected(Events.MACHINE_CONNECTED, machine)
+    finally:
+        eventManager().unsubscribe(
+            Events.MACHINE_CONNECTED, manager._on_machine_connected
+        )
+        machine.shutdown()
+
+    assert machine.serial == "VIRTUAL"
+    assert restored == ["exp1"]
+    assert set(manager.get_states()) == {"exp2"}
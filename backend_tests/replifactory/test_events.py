@@ -0,0 +1,117 @@
+import threading
+import time
+
+from biofactory.events import EventManager, Events
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_coalesced_events_deliver_latest_payload():
+    manager = EventManager()
+    received = []
+    blocker = threading.Event()
+    manager.subscribe(Events.CLIENT_CONNECTED, lambda e, p: blocker.wait())
+    manager.subscribe(Events.COMMAND_QUEUE_UPDATED, lambda e, p: received.append(p))
+    manager.fire(Events.STARTUP)
+
+    manager.fire(Events.CLIENT_CONNECTED)
+    for size in range(10):
+        manager.fire(Events.COMMAND_QUEUE_UPDATED, {"size": size})
+    blocker.set()
+
+    assert wait_until(lambda: received)
+    time.sleep(0.05)
+    assert received == [{"size": 9}]
+
+
+def test_events_without_listeners_are_not_queued():
+    manager = EventManager()
+    manager.fire(Events.STARTUP)
+
+    manager.fire(Events.CLIENT_CONNECTED)
+
+    # both startup and client connected events have no listeners
+    assert manager.get_stats()["events_skipped"] == 2
+
+
+def test_slow_worker_listener_does_not_stall_others():
+    manager = EventManager()
+    received = []
+    release = threading.Event()
+    manager.subscribe(Events.CLIENT_CONNECTED, lambda e, p: release.wait(), "slow")
+    manager.subscribe(Events.CLIENT_CONNECTED, lambda e, p: received.append(p))
+    manager.fire(Events.STARTUP)
+
+    manager.fire(Events.CLIENT_CONNECTED, 1)
+    manager.fire(Events.CLIENT_CONNECTED, 2)
+
+    assert wait_until(lambda: received == [1, 2])
+    release.set()
+    assert manager.get_stats()["workers"]["slow"]["dropped"] == 0
+
+
+def test_full_worker_drops_only_coalesced_events():
+    manager = EventManager()
+    received = []
+    busy = threading.Event()
+    release = threading.Event()
+
+    def listener(event, payload):
+        busy.set()
+        release.wait()
+        received.append((event, payload))
+
+    for event in (Events.COMMAND_QUEUE_UPDATED, Events.EXPERIMENT_STATUS_CHANGE):
+        manager.subscribe(event, listener, "slow", max_queue_size=2)
+
+    def worker_stats():
+        return manager.get_stats()["workers"]["slow"]
+
+    manager.fire(Events.STARTUP)
+
+    manager.fire(Events.COMMAND_QUEUE_UPDATED, 1)
+    assert busy.wait(2.0)
+    for status in ("started", "paused"):
+        manager.fire(Events.EXPERIMENT_STATUS_CHANGE, status)
+    manager.fire(Events.COMMAND_QUEUE_UPDATED, 2)
+    assert wait_until(lambda: worker_stats()["queue_size"] == 3)
+    manager.fire(Events.COMMAND_QUEUE_UPDATED, 3)
+    assert wait_until(lambda: worker_stats()["dropped"] == 1)
+    manager.fire(Events.EXPERIMENT_STATUS_CHANGE, "stopped")
+    release.set()
+
+    assert wait_until(lambda: len(received) == 5)
+    assert [payload for _, payload in received] == [
+        1,
+        "started",
+        "paused",
+        3,
+        "stopped",
+    ]
+    assert worker_stats() == {"queue_size": 0, "dropped": 1}
+
+
+def test_callback_runs_in_the_worker_of_each_subscription():
+    manager = EventManager()
+    threads = {}
+
+    def listener(event, payload):
+        threads[event] = threading.current_thread().name
+
+    manager.subscribe(Events.CLIENT_CONNECTED, listener, "clients")
+    manager.subscribe(Events.MACHINE_CONNECTED, listener)
+    manager.fire(Events.STARTUP)
+    manager.fire(Events.CLIENT_CONNECTED)
+    manager.fire(Events.MACHINE_CONNECTED)
+
+    assert wait_until(lambda: len(threads) == 2)
+    assert threads[Events.CLIENT_CONNECTED] == "EventListenerWorker-clients"
+    assert threads[Events.MACHINE_CONNECTED] != "EventListenerWorker-clients"
+
+    manager.unsubscribe(Events.MACHINE_CONNECTED, listener)
+    assert "clients" in manager.get_stats()["workers"]
@@ -0,0 +1,105 @@
+import threading
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.metrics import (
+    BUS_TRANSACTIONS,
+    COMMAND_DURATION,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+)
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.util.clock import VirtualClock, set_clock
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+def test_counter_sums_the_cells_of_all_threads():
+    counter = Counter("test_total", "Test", ("port",), registry=MetricsRegistry())
+    child = counter.labels("a")
+
+    def record():
+        for _ in range(1000):
+            child.inc()
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    child.inc(5)
+    for thread in threads:
+        thread.join()
+
+    # finished threads are folded into the totals
+    assert child.get() == 4005
+    assert child.get() == 4005
+    assert counter.labels(port="a") is child
+
+
+def test_cells_of_finished_threads_are_folded_without_a_scrape():
+    histogram = Histogram("test_wait_seconds", "Test", registry=MetricsRegistry())
+    child = histogram.labels()
+
+    for _ in range(100):
+        thread = threading.Thread(target=child.observe, args=(0.5,))
+        thread.start()
+        thread.join()
+
+    assert len(child._cells) == 1
+    assert child.get()["count"] == 100
+
+
+def test_prometheus_export():
+    registry = MetricsRegistry()
+    histogram = Histogram(
+        "test_seconds", "Durations", ("command",), buckets=(0.1, 1), registry=registry
+    )
+    gauge = Gauge("test_depth", "Depth", registry=registry)
+    for value in (0.05, 0.5, 5):
+        histogram.labels('say "hi"').observe(value)
+    gauge.inc(3)
+    gauge.dec()
+
+    assert registry.export_prometheus() == (
+        "# HELP test_seconds Durations\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{command="say \\"hi\\"",le="0.1"} 1\n'
+        'test_seconds_bucket{command="say \\"hi\\"",le="1"} 2\n'
+        'test_seconds_bucket{command="say \\"hi\\"",le="+Inf"} 3\n'
+        'test_seconds_sum{command="say \\"hi\\""} 5.55\n'
+        'test_seconds_count{command="say \\"hi\\""} 3\n'
+        "# HELP test_depth Depth\n"
+        "# TYPE test_depth gauge\n"
+        "test_depth 2\n"
+    )
+
+
+def test_prometheus_export_labels_the_series_of_the_machine_workers():
+    registry = MetricsRegistry()
+    gauge = Gauge("test_depth", "Depth", ("queue",), registry=registry)
+    gauge.labels("server").set(1)
+    machines = {"SIM-1": {"test_depth": [({"queue": "operations"}, 4)]}}
+
+    assert registry.export_prometheus(machines) == (
+        "# HELP test_depth Depth\n"
+        "# TYPE test_depth gauge\n"
+        'test_depth{queue="server"} 1\n'
+        'test_depth{queue="operations",machine="SIM-1"} 4\n'
+    )
+
+
+def test_machine_commands_record_bus_and_command_metrics():
+    previous = set_clock(VirtualClock())
+    machine = ReplifactoryPlant().create_machine()
+    try:
+        machine.connect(usb_device=VirtualUsbDevice())
+        transactions = sum(value for _, value in BUS_TRANSACTIONS.collect())
+        machine.cmd("measure_od_all")
+    finally:
+        machine.shutdown()
+        set_clock(previous)
+
+    assert sum(value for _, value in BUS_TRANSACTIONS.collect()) > transactions
+    durations = dict(
+        (labels["command"], value) for labels, value in COMMAND_DURATION.collect()
+    )
+    assert durations["measure_od_all"]["count"] >= 1
@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+
+import biofactory
+
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from biofactory.server import create_app
+create_app()
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "modules": [name for name in ("scipy", "pandas") if name in sys.modules],
+}))
+"""
+
+
+def test_create_app_does_not_import_scientific_stack(tmp_path):
+    backend = os.path.dirname(os.path.dirname(biofactory.__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [backend, env.get("PYTHONPATH")]))
+    env.setdefault("SETUPTOOLS_SCM_PRETEND_VERSION", "0.1.0")
+    env.pop("BIOFACTORY_PROFILE_STARTUP", None)
+
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=120,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result["modules"] == []
+    # generous default for the Raspberry Pi class boards the server runs on
+    assert result["seconds"] < float(os.environ.get("BIOFACTORY_STARTUP_BUDGET", 10))
@@ -0,0 +1,34 @@
+import biofactory.server  # noqa: F401  (resolves the server/machine_manager import cycle)
+from biofactory.machine_manager import StateMonitor
+
+
+def test_get_changes_returns_only_changed_devices():
+    monitor = StateMonitor(interval=0)
+    monitor.reset(
+        state={"text": "Operational"},
+        devices_data={"stirrer-1": {"speed": 0}, "stirrer-2": {"speed": 0}},
+        experiment_data={},
+    )
+    version = monitor.version
+
+    monitor.set_device_data("stirrer-2", {"speed": 0.5})
+    monitor.set_device_data("stirrer-1", {"speed": 0})
+
+    changes = monitor.get_changes(version)
+    assert changes["full"] is False
+    assert changes["version"] == version + 1
+    assert changes["devices"] == {"stirrer-2": {"speed": 0.5}}
+    assert "state" not in changes and "experiment" not in changes
+
+
+def test_get_changes_returns_snapshot_after_devices_reset():
+    monitor = StateMonitor(interval=0)
+    monitor.reset(state={}, devices_data={"stirrer-1": {}}, experiment_data={})
+    version = monitor.version
+
+    monitor.set_devices_data({"valve-1": {}})
+
+    changes = monitor.get_changes(version)
+    assert changes["full"] is True
+    assert changes["devices"] == {"valve-1": {}}
+    assert changes["state"] == {}
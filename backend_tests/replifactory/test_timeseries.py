@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+from biofactory.timeseries import TimeSeriesStore
+
+
+def test_query_returns_buffered_and_flushed_records(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), flush_size=4)
+
+    for i in range(6):
+        store.append_many(i % 2 + 1, {"od": i * 0.1}, timestamp=100.0 + i)
+
+    result = store.query(start=101.0, end=104.0, reactor=2)
+
+    assert result["time"].tolist() == [101.0, 103.0]
+    assert result["metric"].tolist() == ["od", "od"]
+    assert np.allclose(result["value"], [0.1, 0.3])
+    assert len(store.query()["time"]) == 6
+
+
+def test_records_survive_reopening(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), segment_size=3)
+    for i in range(7):
+        store.append_many(1, {"od": float(i), "feed": 1.0}, timestamp=float(i))
+    store.close()
+
+    reopened = TimeSeriesStore(str(tmp_path))
+
+    result = reopened.query(start=2.0, end=4.0, metric="od")
+    assert result["value"].tolist() == [2.0, 3.0, 4.0]
+    assert sorted(reopened.get_metrics()) == ["feed", "od"]
+    assert (
+        len([name for name in os.listdir(tmp_path) if name.startswith("segment")]) == 5
+    )
+
+
+def test_partially_written_records_are_dropped(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    for i in range(3):
+        store.append(0, "thermometer-0x48.temperature", 25.0 + i, timestamp=float(i))
+    store.close()
+    with open(tmp_path / "segment-000000" / "value.bin", "ab") as f:
+        f.write(b"\x00\x01\x02")
+
+    reopened = TimeSeriesStore(str(tmp_path))
+
+    assert reopened.query()["value"].tolist() == [25.0, 26.0, 27.0]
+
+
+def test_records_appended_out_of_order_are_queried(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), flush_size=2)
+    store.append_many(1, {"od": 0.1, "mv": 10.0}, timestamp=100.0)
+    store.append_many(1, {"od": 0.2, "mv": 20.0}, timestamp=50.0)
+    store.append(1, "od", 0.3, timestamp=75.0)
+    store.flush()
+
+    for reopened in (store, TimeSeriesStore(str(tmp_path))):
+        records = reopened.query(start=60.0, metric="od")
+        assert records["time"].tolist() == [75.0, 100.0]
+        assert records["value"].tolist() == [0.3, 0.1]
+        assert reopened.query()["time"].tolist() == [50.0, 50.0, 75.0, 100.0, 100.0]
+    store.close()
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.machine import CommandExecutor
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.tracing import Tracer, tracer
+from biofactory.util.clock import VirtualClock, set_clock
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+@pytest.fixture
+def enabled_tracer():
+    current = tracer()
+    current.clear()
+    current.enable()
+    yield current
+    current.disable()
+    current.clear()
+
+
+def test_disabled_tracer_records_nothing():
+    disabled = Tracer()
+
+    with disabled.span("noop") as span:
+        pass
+
+    assert span is None
+    assert disabled.capture() is None
+    assert disabled.get_spans() == []
+
+
+def test_spans_follow_commands_to_the_executor_thread(enabled_tracer):
+    def execute(command):
+        with tracer().span(command, "device"):
+            return command
+
+    executor = CommandExecutor(name="Test", execute_callback=execute)
+    try:
+        with tracer().span("request") as request:
+            executor.queue_command_and_wait("measure")
+    finally:
+        executor.stop()
+
+    spans = {span.name: span for span in enabled_tracer.get_spans()}
+    assert spans["queued"].parent_id == request.span_id
+    assert spans["queued"].attributes == {"executor": "Test"}
+    assert spans["measure"].parent_id == request.span_id
+    assert spans["measure"].thread_name == "TestThread"
+    assert {span.trace_id for span in spans.values()} == {request.trace_id}
+
+
+def test_machine_command_is_traced_down_to_the_bus(enabled_tracer):
+    previous = set_clock(VirtualClock())
+    machine = ReplifactoryPlant().create_machine()
+    try:
+        machine.connect(usb_device=VirtualUsbDevice())
+        enabled_tracer.clear()
+        with tracer().span("api") as api:
+            machine.cmd("measure_od_all")
+    finally:
+        machine.shutdown()
+        set_clock(previous)
+
+    spans = enabled_tracer.get_spans()
+    names = {span.name for span in spans if span.trace_id == api.trace_id}
+    assert {
+        "ReplifactoryMachine.measure_od_all",
+        "optical-density-sensors-group.measure_od_all",
+        "i2c.transaction",
+        "sleep",
+        "queued",
+    } <= names
+    chrome_trace = json.loads(json.dumps(enabled_tracer.export_chrome_trace()))
+    assert len([e for e in chrome_trace["traceEvents"] if e["ph"] == "X"]) == len(spans)
+    otlp = enabled_tracer.export_otlp()
+    otlp_spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert all(len(span["traceId"]) == 32 for span in otlp_spans)
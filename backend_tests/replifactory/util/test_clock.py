@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.simulator.culture import CultureModel
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.util import clock
+from biofactory.util.clock import VirtualClock, set_clock
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+@pytest.fixture
+def virtual_clock():
+    virtual_clock = VirtualClock()
+    previous = set_clock(virtual_clock)
+    yield virtual_clock
+    set_clock(previous)
+
+
+def test_virtual_clock_jumps_over_sleeps(virtual_clock):
+    started = time.monotonic()
+    virtual_started = clock.monotonic()
+
+    clock.sleep(4 * 3600)
+
+    assert clock.monotonic() - virtual_started >= 4 * 3600
+    assert time.monotonic() - started < 1.0
+
+
+def test_virtual_clock_does_not_jump_to_wait_timeouts(virtual_clock):
+    done = threading.Event()
+
+    def worker():
+        clock.sleep(10)
+        done.set()
+
+    started = clock.monotonic()
+    threading.Thread(target=worker).start()
+
+    assert clock.wait(done, timeout=3600)
+    assert 10 <= clock.monotonic() - started < 3600
+
+
+def test_virtual_clock_waits_for_running_threads(virtual_clock):
+    working = threading.Event()
+    started = clock.monotonic()
+    elapsed = []
+
+    def worker():
+        # takes part in the virtual time, then works without reading the clock
+        clock.sleep(1)
+        working.set()
+        time.sleep(0.1)
+        elapsed.append(clock.monotonic() - started)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    with clock.blocking():
+        working.wait()
+    clock.sleep(3600)
+    thread.join()
+
+    assert elapsed[0] < 60
+    assert clock.monotonic() - started >= 3600
+
+
+def test_manual_virtual_clock_advances_on_request():
+    manual_clock = VirtualClock(start=0.0, auto_advance=False)
+    woken = threading.Event()
+
+    def sleeper():
+        manual_clock.sleep(5)
+        woken.set()
+
+    thread = threading.Thread(target=sleeper)
+    thread.start()
+    time.sleep(0.05)
+
+    manual_clock.advance(4)
+    assert not woken.wait(0.05)
+    manual_clock.advance(1)
+    thread.join(1.0)
+
+    assert woken.is_set()
+    assert manual_clock.time() == 5.0
+
+
+def test_simulated_machine_runs_hours_in_virtual_time(virtual_clock):
+    plant = ReplifactoryPlant(cultures=[CultureModel(od=0.1) for _ in range(7)])
+    machine = plant.create_machine()
+    started = time.monotonic()
+    machine.connect(usb_device=VirtualUsbDevice())
+    try:
+        clock.sleep(3600)
+        ods = machine.measure_od_all()
+    finally:
+        machine.shutdown()
+
+    # logistic growth for a doubling time plus the few virtual seconds of I/O
+    expected = 2.0 / (1 + (2.0 / 0.1 - 1) / 2)
+    assert list(ods.values()) == pytest.approx([expected] * 7, abs=0.01)
+    assert time.monotonic() - started < 5.0
+    assert virtual_clock.jumps > 0
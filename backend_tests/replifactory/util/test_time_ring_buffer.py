@@ -0,0 +1,24 @@
+from biofactory.util import TimeRingBuffer
+
+
+def test_append_evicts_items_older_than_cutoff():
+    now = [0]
+    buffer = TimeRingBuffer(cutoff=10, initial_capacity=4, clock=lambda: now[0])
+
+    for t in range(100):
+        now[0] = t
+        buffer.append({"time": t})
+
+    assert [item["time"] for item in buffer] == list(range(89, 100))
+    assert buffer.times.tolist() == list(range(89, 100))
+    assert buffer.last == {"time": 99}
+
+
+def test_out_of_order_items_are_inserted_in_time_order():
+    buffer = TimeRingBuffer()
+
+    for t in [1.0, 3.0, 2.0, 0.5, 3.0]:
+        buffer.append({"time": t})
+
+    assert buffer.times.tolist() == [0.5, 1.0, 2.0, 3.0, 3.0]
+    assert [item["time"] for item in buffer.slice(1.0, 2.0)] == [1.0, 2.0]
@@ -0,0 +1,87 @@
+"""
+asyncio facade benchmark: ``measure_od`` of all reactors of a simulated
+Replifactory with the threaded API, one caller thread per reactor, and
+``asyncio.gather`` over the reactors of ``AsyncMachine``, plus 1000 concurrent
+waits (e.g. growth timeouts of an experiment) with a thread each and as asyncio
+tasks on the shared event loop.
+"""
+
+import asyncio
+import threading
+import time
+
+from biofactory.machine.aio import AsyncMachine, eventLoop
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+LATENCY = 0.0002
+
+
+def _create_machine():
+    machine = ReplifactoryPlant().create_machine(latency=LATENCY)
+    machine.connect(usb_device=VirtualUsbDevice())
+    return machine
+
+
+def bench_threaded_commands(repeat: int = 5):
+    machine = _create_machine()
+    reactors = machine.get_reactors()
+    try:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            threads = [threading.Thread(target=r.measure_od) for r in reactors]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        machine.shutdown()
+    return {"commands_per_second": repeat * len(reactors) / elapsed}
+
+
+def bench_async_commands(repeat: int = 5):
+    machine = _create_machine()
+    aio = AsyncMachine(machine)
+
+    async def measure():
+        for _ in range(repeat):
+            await asyncio.gather(*(r.measure_od() for r in aio.get_reactors()))
+
+    try:
+        started = time.perf_counter()
+        eventLoop().run(measure())
+        elapsed = time.perf_counter() - started
+    finally:
+        machine.shutdown()
+    return {"commands_per_second": repeat * len(aio.get_reactors()) / elapsed}
+
+
+def bench_thread_waits(count: int = 1000, wait: float = 0.5):
+    threads_before = threading.active_count()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=time.sleep, args=(wait,)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    peak_threads = threading.active_count() - threads_before
+    for thread in threads:
+        thread.join()
+    return {
+        "seconds_over_wait": time.perf_counter() - started - wait,
+        "threads": peak_threads,
+    }
+
+
+def bench_async_waits(count: int = 1000, wait: float = 0.5):
+    threads_before = threading.active_count()
+
+    async def waits():
+        await asyncio.gather(*(asyncio.sleep(wait) for _ in range(count)))
+
+    eventLoop()  # the loop thread is started once
+    started = time.perf_counter()
+    eventLoop().run(waits())
+    return {
+        "seconds_over_wait": time.perf_counter() - started - wait,
+        "threads": threading.active_count() - threads_before,
+    }
@@ -0,0 +1,69 @@
+"""
+I2C port overhead benchmark: read_from and write_to of the I2cPort against a
+controller which answers at once, so only the port bookkeeping is measured.
+Compares the bus trace disabled, enabled, and DEBUG logging of every
+transaction, which formats the data as the port did on every call before.
+"""
+
+import logging
+import time
+
+from biofactory.drivers import I2cPort
+from biofactory.drivers.bus_trace import busTrace
+
+
+class _Controller:
+    """Answers the transactions of the port without a FTDI device"""
+
+    def exchange(self, address, out, readlen=0, relax=True):
+        return bytes(readlen)
+
+    def write(self, address, out, relax=True):
+        pass
+
+
+def _run(repeat: int, trace: bool, debug: bool):
+    port = I2cPort(_Controller(), 0x68, "ADC", {0x01: "CONFIG"})
+    busTrace().enable() if trace else busTrace().disable()
+    port.log.setLevel(logging.DEBUG if debug else logging.WARNING)
+    port.log.propagate = False
+    disabled = logging.root.manager.disable
+    logging.disable(logging.NOTSET)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        port.write_to(0x01, b"\x90")
+        port.read_from(0x01, 3)
+    elapsed = time.perf_counter() - started
+    logging.disable(disabled)
+    busTrace().disable()
+    busTrace().clear()
+    return {"seconds_per_transaction": elapsed / (2 * repeat)}
+
+
+def bench_port_trace_disabled(repeat: int = 50000):
+    return _run(repeat, trace=False, debug=False)
+
+
+def bench_port_trace_enabled(repeat: int = 50000):
+    return _run(repeat, trace=True, debug=False)
+
+
+def bench_port_debug_logging(repeat: int = 20000):
+    return _run(repeat, trace=False, debug=True)
+
+
+def bench_dump(repeat: int = 20):
+    port = I2cPort(_Controller(), 0x68, "ADC", {0x01: "CONFIG"})
+    busTrace().enable()
+    for _ in range(busTrace().capacity):
+        port.read_from(0x01, 3)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        busTrace().dump()
+    elapsed = time.perf_counter() - started
+    busTrace().disable()
+    busTrace().clear()
+    return {
+        "seconds_per_dump": elapsed / repeat,
+        "transactions": busTrace().capacity,
+    }
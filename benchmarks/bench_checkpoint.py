@@ -0,0 +1,79 @@
+"""
+Experiment checkpoint log benchmark: records appended per second with an fsync
+for every record and with the fsyncs batched, and the time the experiment
+manager takes at startup to rebuild the state of 16 running experiments from
+their logs, at the longest a log gets before it is compacted.
+"""
+
+import os
+import tempfile
+import time
+
+from biofactory.checkpoint import CheckpointLog, load_checkpoints
+from biofactory.experiment import Experiment
+
+COMPACT_RECORDS = 1000
+
+
+def _create(folder: str, experiment_id: str) -> CheckpointLog:
+    return CheckpointLog.create(
+        os.path.join(folder, f"{experiment_id}.wal"),
+        experiment_id,
+        Experiment,
+        "SIM-1",
+        compact_records=COMPACT_RECORDS,
+    )
+
+
+def _operation(reactor: int, phase: str) -> dict:
+    return {
+        "type": "operation",
+        "phase": phase,
+        "key": f"dilute:{reactor}",
+        "name": "dilute",
+        "data": {"reactor": reactor, "target_od": 0.3, "volume": 1.0},
+        "state": {"start_growth_time": {f"Reactor {reactor}": "2026-01-01T10:00:00"}},
+    }
+
+
+def _records_per_second(repeat: int, sync: bool) -> float:
+    with tempfile.TemporaryDirectory() as folder:
+        checkpoint = _create(folder, "bench")
+        started = time.perf_counter()
+        for i in range(repeat):
+            checkpoint.append(_operation(i % 7 + 1, "begin"), sync=sync)
+        elapsed = time.perf_counter() - started
+        checkpoint.close()
+    return repeat / elapsed
+
+
+def bench_append(repeat: int = 2000):
+    return {
+        "fsync_every_record_per_second": _records_per_second(repeat, sync=True),
+        "fsync_batched_per_second": _records_per_second(repeat, sync=False),
+    }
+
+
+def bench_rebuild(experiments: int = 16, repeat: int = 5):
+    with tempfile.TemporaryDirectory() as folder:
+        for index in range(experiments):
+            checkpoint = _create(folder, f"exp{index}")
+            cycle = 0
+            # stop one record short of the compaction
+            while checkpoint._records < COMPACT_RECORDS - 3:
+                cycle += 1
+                checkpoint.append(
+                    {"type": "cycle", "cycle": cycle, "time": 0.0, "state": {}}
+                )
+                checkpoint.append(_operation(cycle % 7 + 1, "begin"))
+                checkpoint.append(_operation(cycle % 7 + 1, "end"))
+            checkpoint.close()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            states = load_checkpoints(folder)
+        elapsed = time.perf_counter() - started
+    return {
+        "seconds_per_rebuild": elapsed / repeat,
+        "experiments": len(states),
+        "records_per_experiment": COMPACT_RECORDS - 1,
+    }
@@ -0,0 +1,66 @@
+"""
+Temperature history benchmark: appends at the StateMonitor rate (2 Hz) over a
+multi-hour window with the history cutoff evicting old samples.
+"""
+
+import time
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.machine_manager import DataHistory
+from biofactory.util import InvariantContainer, TimeRingBuffer
+from biofactory.util.clock import Clock, set_clock
+
+
+class LegacyDataHistory(InvariantContainer):
+    """Previous implementation which sorts and filters the list on every append"""
+
+    def __init__(self, cutoff=30 * 60, now=None):
+        def data_invariant(data):
+            data.sort(key=lambda x: x["time"])
+            return [item for item in data if item["time"] >= now[0] - cutoff]
+
+        InvariantContainer.__init__(self, guarantee_invariant=data_invariant)
+
+
+def _run(history, now, hours, rate):
+    samples = int(hours * 3600 * rate)
+    started = time.perf_counter()
+    for i in range(samples):
+        now[0] = 1_700_000_000.0 + i / rate
+        history.append({"time": now[0], "thermometer-0x48.temperature": 30.0})
+    elapsed = time.perf_counter() - started
+    return {
+        "samples": samples,
+        "retained": len(history),
+        "microseconds_per_append": elapsed / samples * 1e6,
+    }
+
+
+def bench_data_history_legacy(hours: float = 1.0, rate: float = 2.0, cutoff=1800):
+    now = [0.0]
+    history = LegacyDataHistory(cutoff=cutoff, now=now)
+    return _run(history, now, hours, rate)
+
+
+def bench_data_history_ring_buffer(hours: float = 6.0, rate: float = 2.0, cutoff=1800):
+    now = [0.0]
+    # DataHistory is a TimeRingBuffer keyed by "time"
+    history = TimeRingBuffer(cutoff=cutoff, clock=lambda: now[0])
+    return _run(history, now, hours, rate)
+
+
+class _SampleClock(Clock):
+    def __init__(self, now):
+        self._now = now
+
+    def time(self):
+        return self._now[0]
+
+
+def bench_data_history(hours: float = 6.0, rate: float = 2.0, cutoff=1800):
+    now = [0.0]
+    previous = set_clock(_SampleClock(now))
+    try:
+        return _run(DataHistory(cutoff=cutoff), now, hours, rate)
+    finally:
+        set_clock(previous)
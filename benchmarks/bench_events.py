@@ -0,0 +1,62 @@
+"""
+EventManager dispatch benchmark: events fired from one thread and delivered to N
+listeners by the event loop, or by a listener worker thread.
+"""
+
+import threading
+import time
+
+from biofactory.events import EventManager, Events
+
+EVENT = "BenchmarkEvent"
+
+
+def _run(listeners: int, repeat: int, worker=None):
+    manager = EventManager()
+    manager.fire(Events.STARTUP)
+    delivered = threading.Event()
+    counts = [0] * listeners
+
+    def make_listener(index):
+        def listener(event, payload):
+            counts[index] += 1
+            if index == listeners - 1 and payload == repeat - 1:
+                delivered.set()
+
+        return listener
+
+    for index in range(listeners):
+        manager.subscribe(
+            EVENT,
+            make_listener(index),
+            worker=worker,
+            max_queue_size=repeat * listeners,
+        )
+    started = time.perf_counter()
+    for i in range(repeat):
+        manager.fire(EVENT, i)
+    delivered.wait(60)
+    elapsed = time.perf_counter() - started
+    manager.fire(Events.SHUTDOWN)
+    return {
+        "events_per_second": repeat / elapsed,
+        "deliveries_per_second": repeat * listeners / elapsed,
+        "delivered": sum(counts),
+    }
+
+
+def bench_event_manager_1_listener(repeat: int = 20000):
+    return _run(1, repeat)
+
+
+def bench_event_manager_10_listeners(repeat: int = 10000):
+    return _run(10, repeat)
+
+
+def bench_event_manager_50_listeners(repeat: int = 2000):
+    return _run(50, repeat)
+
+
+def bench_event_manager_10_listeners_worker(repeat: int = 10000):
+    # the worker queue fits the whole burst, so no event is dropped
+    return _run(10, repeat, worker="benchmark")
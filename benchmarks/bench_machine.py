@@ -0,0 +1,107 @@
+"""
+Machine level benchmarks. The OD sweep and the dilution cycle run the v5 machine
+on the simulated hardware in virtual time, so both the wall time of the software
+and the time the real hardware would take are reported. The command throughput
+runs on VirtualBiofactoryMachine, which has no devices at all.
+"""
+
+import time
+from contextlib import contextmanager
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.machine import CommandExecutor
+from biofactory.machine.biofactory_virtual import VirtualBiofactoryMachine
+from biofactory.machine.futures import wait_all
+from biofactory.simulator.culture import CultureModel
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.util import clock
+from biofactory.util.clock import VirtualClock, set_clock
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+@contextmanager
+def _simulated_machine(cultures_od: float = 0.5):
+    previous = set_clock(VirtualClock())
+    plant = ReplifactoryPlant(cultures=[CultureModel(od=cultures_od) for _ in range(7)])
+    machine = plant.create_machine()
+    try:
+        machine.connect(usb_device=VirtualUsbDevice())
+        yield plant, machine
+    finally:
+        machine.shutdown()
+        set_clock(previous)
+
+
+def _run(operation, repeat: int):
+    started = time.perf_counter()
+    virtual_started = clock.monotonic()
+    for _ in range(repeat):
+        operation()
+    return {
+        "seconds_per_operation": (time.perf_counter() - started) / repeat,
+        "hardware_seconds_per_operation": (clock.monotonic() - virtual_started)
+        / repeat,
+    }
+
+
+def bench_od_sweep(repeat: int = 10):
+    with _simulated_machine() as (_, machine):
+        return _run(machine.measure_od_all, repeat)
+
+
+def bench_dilution_cycle(repeat: int = 5, target_od: float = 0.3):
+    with _simulated_machine() as (plant, machine):
+        reactor = machine.get_reactor(1)
+
+        def dilute():
+            # every cycle starts above the target, so the dilution is never skipped
+            plant.cultures[0].od = 0.5
+            reactor.dilute(target_od)
+
+        return _run(dilute, repeat)
+
+
+def bench_command_executor(repeat: int = 10000):
+    executor = CommandExecutor(execute_callback=lambda command: command)
+    try:
+        started = time.perf_counter()
+        for i in range(repeat):
+            executor.queue_command_and_wait(i)
+        elapsed = time.perf_counter() - started
+    finally:
+        executor.stop()
+    return {
+        "commands_per_second": repeat / elapsed,
+        "microseconds_per_command": elapsed / repeat * 1e6,
+    }
+
+
+def bench_command_executor_wait_all(repeat: int = 100, batch: int = 100):
+    executor = CommandExecutor(execute_callback=lambda command: command)
+    try:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            wait_all([executor.submit(i) for i in range(batch)])
+        elapsed = time.perf_counter() - started
+    finally:
+        executor.stop()
+    return {
+        "commands_per_second": repeat * batch / elapsed,
+        "microseconds_per_command": elapsed / (repeat * batch) * 1e6,
+    }
+
+
+def bench_machine_commands(repeat: int = 2000):
+    machine = VirtualBiofactoryMachine()
+    machine.connect()
+    try:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            machine.cmd("measure_od_all")
+        elapsed = time.perf_counter() - started
+    finally:
+        machine.shutdown()
+    return {
+        "commands_per_second": repeat / elapsed,
+        "microseconds_per_command": elapsed / repeat * 1e6,
+    }
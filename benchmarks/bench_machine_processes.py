@@ -0,0 +1,85 @@
+"""
+Multi-machine throughput benchmark: ``measure_od_all`` commands per second of
+1, 2 and 4 simulated Replifactory units driven at once, with the machines in the
+server process (all units share its GIL) and with one worker process per
+machine, plus the round trip of a call to a worker process. The processes scale
+up to the CPU count reported with the results.
+"""
+
+import os
+import threading
+import time
+
+from biofactory.machine.process import RemoteMachine
+from biofactory.simulator.replifactory_v5 import (
+    ReplifactoryPlant,
+    SimulatedMachineFactory,
+)
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+UNITS = (1, 2, 4)
+LATENCY = 0.0002
+
+
+def _commands_per_second(machines, repeat: int) -> float:
+    def drive(machine):
+        for _ in range(repeat):
+            machine.cmd("measure_od_all")
+
+    threads = [threading.Thread(target=drive, args=(m,)) for m in machines]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(machines) * repeat / (time.perf_counter() - started)
+
+
+def bench_in_process(repeat: int = 5):
+    results = {}
+    for units in UNITS:
+        machines = [
+            ReplifactoryPlant().create_machine(latency=LATENCY) for _ in range(units)
+        ]
+        for machine in machines:
+            machine.connect(usb_device=VirtualUsbDevice())
+        try:
+            results[f"{units}_units_commands_per_second"] = _commands_per_second(
+                machines, repeat
+            )
+        finally:
+            for machine in machines:
+                machine.shutdown()
+    return results
+
+
+def bench_worker_processes(repeat: int = 5):
+    results = {"cpu_count": os.cpu_count()}
+    for units in UNITS:
+        machines = [
+            RemoteMachine(f"SIM-{unit}", SimulatedMachineFactory(latency=LATENCY))
+            for unit in range(units)
+        ]
+        for machine in machines:
+            machine.connect()
+        try:
+            results[f"{units}_units_commands_per_second"] = _commands_per_second(
+                machines, repeat
+            )
+        finally:
+            for machine in machines:
+                machine.shutdown()
+    return results
+
+
+def bench_call_round_trip(repeat: int = 2000):
+    machine = RemoteMachine("SIM-0", SimulatedMachineFactory())
+    machine.connect()
+    try:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            machine.call("cancel_long_operation")
+        elapsed = time.perf_counter() - started
+    finally:
+        machine.shutdown()
+    return {"seconds_per_call": elapsed / repeat}
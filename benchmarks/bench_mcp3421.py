@@ -0,0 +1,77 @@
+"""
+MCP3421 ADC driver benchmark against the simulated chip, counting the bus
+transactions.
+"""
+
+import time
+
+from biofactory.drivers import HardwarePort
+from biofactory.drivers.mcp3421 import ADCDriver
+from biofactory.simulator import SimulatedBus, SimulatedI2cPort
+from biofactory.simulator.mcp3421 import MCP3421
+
+
+def _simulated_adc(oscillator_error: float = 0.03):
+    """
+    Bus and port of the simulated MCP3421. The internal oscillator of the chip runs
+    ``oscillator_error`` slower than the nominal data rate, as real chips do
+    within their tolerance.
+    """
+    chip = MCP3421(
+        source=lambda: 10.0,
+        clock=lambda: time.monotonic() / (1 + oscillator_error),
+    )
+    bus = SimulatedBus("i2c")
+    return bus, SimulatedI2cPort(bus, 0x68, "ADC", chip)
+
+
+def legacy_measure(port: HardwarePort, bitrate: int = 16):
+    """Fixed sleep measurement which reconfigures the chip on every call"""
+    samples_per_second = {12: 240, 14: 60, 16: 15, 18: 3.75}[bitrate]
+    bitrate_bits = {12: 0b0000, 14: 0b0100, 16: 0b1000, 18: 0b1100}[bitrate]
+    port.write([0b10000000 | bitrate_bits | 0b11])
+    for _ in range(100):
+        time.sleep(1 / samples_per_second)
+        response = port.read(4)
+        if response[3] < 128:
+            return response
+
+
+def _run(measure, bus: SimulatedBus, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        measure()
+    elapsed = time.perf_counter() - started
+    stats = bus.get_stats()
+    return {
+        "seconds_per_measure": elapsed / repeat,
+        "transactions_per_measure": stats["transactions"] / repeat,
+        "bytes_per_measure": stats["bytes"] / repeat,
+    }
+
+
+def bench_mcp3421_legacy(repeat: int = 10, bitrate: int = 16):
+    bus, port = _simulated_adc()
+    return _run(lambda: legacy_measure(port, bitrate), bus, repeat)
+
+
+def bench_mcp3421_one_shot(repeat: int = 10, bitrate: int = 16):
+    bus, port = _simulated_adc()
+    driver = ADCDriver(port)
+    return _run(lambda: driver.measure(gain=8, bitrate=bitrate), bus, repeat)
+
+
+def bench_mcp3421_continuous_oversampling(
+    repeat: int = 10, bitrate: int = 16, samples: int = 4
+):
+    bus, port = _simulated_adc()
+    driver = ADCDriver(port)
+    result = _run(
+        lambda: driver.measure(
+            gain=8, bitrate=bitrate, continuous_conversion=True, samples=samples
+        ),
+        bus,
+        repeat,
+    )
+    result["samples_per_measure"] = samples
+    return result
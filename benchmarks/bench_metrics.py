@@ -0,0 +1,65 @@
+"""
+Metrics recording benchmark: the cost of a counter increment and a histogram
+observation in the driver hot path, from one thread and from threads recording
+into the same metric at once, and of a scrape.
+"""
+
+import threading
+import time
+
+from biofactory.metrics import Counter, Histogram, MetricsRegistry
+
+
+def _per_operation(operation, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        operation()
+    return (time.perf_counter() - started) / repeat
+
+
+def bench_counter_inc(repeat: int = 500000):
+    counter = Counter("bench_total", "", ("bus", "port"), registry=MetricsRegistry())
+    child = counter.labels("i2c", "bench")
+    return {
+        "seconds_per_inc": _per_operation(child.inc, repeat),
+        "seconds_per_labels_inc": _per_operation(
+            lambda: counter.labels("i2c", "bench").inc(), repeat
+        ),
+    }
+
+
+def bench_histogram_observe(repeat: int = 500000):
+    histogram = Histogram("bench_seconds", "", registry=MetricsRegistry())
+    return {
+        "seconds_per_observe": _per_operation(lambda: histogram.observe(0.02), repeat)
+    }
+
+
+def bench_counter_inc_4_threads(repeat: int = 200000):
+    child = Counter("bench_total", "", registry=MetricsRegistry()).labels()
+    threads = [
+        threading.Thread(target=_per_operation, args=(child.inc, repeat))
+        for _ in range(4)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "incs_per_second": 4 * repeat / elapsed,
+        "total": child.get(),
+    }
+
+
+def bench_export(repeat: int = 200):
+    registry = MetricsRegistry()
+    histogram = Histogram("bench_seconds", "", ("device", "command"), registry=registry)
+    for device in range(20):
+        for command in range(5):
+            histogram.labels(f"device-{device}", f"command-{command}").observe(0.01)
+    return {
+        "seconds_per_export": _per_operation(registry.export_prometheus, repeat),
+        "series": 100,
+    }
@@ -0,0 +1,46 @@
+"""
+read_csv_tail benchmark on large logs of the legacy CSV format: a timestamp
+column followed by the values of the 7 vials.
+"""
+
+import os
+import tempfile
+import time
+
+from biofactory.util import read_csv_tail
+
+COLUMNS = ["time"] + [f"vial{num}" for num in range(1, 8)]
+
+
+def _write_log(path: str, rows: int):
+    with open(path, "w") as f:
+        f.write(",".join(COLUMNS) + "\n")
+        for row in range(rows):
+            values = ", ".join(
+                f"{0.1 + (row * num % 997) / 1000:.5f}" for num in range(1, 8)
+            )
+            f.write(f"{1_700_000_000 + row * 60}, {values}\n")
+
+
+def _run(rows: int, lines: int, repeat: int):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "od.csv")
+        _write_log(path, rows)
+        size = os.path.getsize(path)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            df = read_csv_tail(path, lines=lines)
+        elapsed = time.perf_counter() - started
+    return {
+        "file_megabytes": size / 1e6,
+        "rows_read": len(df),
+        "seconds_per_read": elapsed / repeat,
+    }
+
+
+def bench_read_csv_tail_1000_lines(rows: int = 1_000_000, repeat: int = 10):
+    return _run(rows, 1000, repeat)
+
+
+def bench_read_csv_tail_10000_lines(rows: int = 1_000_000, repeat: int = 3):
+    return _run(rows, 10000, repeat)
@@ -0,0 +1,72 @@
+"""
+Operation scheduler benchmark: latency of the OD measurements of reactor 2,
+taken every 10 s while reactor 1 is diluted, on the simulated Replifactory in
+virtual time. The measurements run at their HIGH priority, which lets them in at
+the preemption points of the dilution, and at NORMAL priority, which makes them
+wait for the whole dilution as before. Latencies are in machine seconds.
+"""
+
+import statistics
+import threading
+from contextlib import contextmanager
+
+from biofactory.machine.scheduler import Priority
+from biofactory.simulator.culture import CultureModel
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.util import clock
+from biofactory.util.clock import VirtualClock, set_clock
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+MEASURE_INTERVAL = 10.0
+
+
+@contextmanager
+def _simulated_machine():
+    previous = set_clock(VirtualClock())
+    plant = ReplifactoryPlant(cultures=[CultureModel(od=0.9) for _ in range(7)])
+    machine = plant.create_machine()
+    try:
+        machine.connect(usb_device=VirtualUsbDevice())
+        yield plant, machine
+    finally:
+        machine.shutdown()
+        set_clock(previous)
+
+
+def _measurement_latencies(priority: Priority, dilutions: int) -> dict:
+    with _simulated_machine() as (plant, machine):
+        diluted = machine.get_reactor(1)
+        measured = machine.get_reactor(2)
+        done = threading.Event()
+        latencies = []
+
+        def measure():
+            while not done.is_set():
+                started = clock.monotonic()
+                measured.measure_od(priority=priority)
+                latencies.append(clock.monotonic() - started)
+                clock.sleep(MEASURE_INTERVAL, done)
+
+        thread = threading.Thread(target=measure)
+        thread.start()
+        started = clock.monotonic()
+        for _ in range(dilutions):
+            plant.cultures[0].od = 0.9
+            diluted.dilute(0.3)
+        dilution_seconds = (clock.monotonic() - started) / dilutions
+        done.set()
+        thread.join()
+    return {
+        "measurements": len(latencies),
+        "mean_latency_seconds": statistics.mean(latencies),
+        "max_latency_seconds": max(latencies),
+        "dilution_seconds": dilution_seconds,
+    }
+
+
+def bench_measurements_preempt_dilution(dilutions: int = 3):
+    return _measurement_latencies(Priority.HIGH, dilutions)
+
+
+def bench_measurements_wait_for_dilution(dilutions: int = 3):
+    return _measurement_latencies(Priority.NORMAL, dilutions)
@@ -0,0 +1,44 @@
+"""
+Replifactory v5 machine benchmark on the simulated FTDI buses, the whole driver
+stack runs against the chip models with a bus latency per transaction.
+"""
+
+import time
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+def _run(operation, repeat: int, latency: float):
+    plant = ReplifactoryPlant(time_scale=3600)
+    machine = plant.create_machine(latency=latency)
+    machine.connect(usb_device=VirtualUsbDevice())
+    try:
+        driver = machine._ftdi_adapter._ftdi_driver
+        driver.i2c_bus.reset_stats()
+        driver.spi_bus.reset_stats()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            operation(machine)
+        elapsed = time.perf_counter() - started
+        stats = driver.get_bus_stats()
+    finally:
+        machine.shutdown()
+    return {
+        "seconds_per_operation": elapsed / repeat,
+        "i2c_transactions_per_operation": stats["i2c"]["transactions"] / repeat,
+        "spi_transactions_per_operation": stats["spi"]["transactions"] / repeat,
+    }
+
+
+def bench_measure_od_all(repeat: int = 5, latency: float = 0.001):
+    return _run(lambda machine: machine.measure_od_all(), repeat, latency)
+
+
+def bench_feed_and_dose(repeat: int = 3, latency: float = 0.001):
+    return _run(
+        lambda machine: machine.feed_and_dose(1, 0.5, 0.5, disconnect_reactors=False),
+        repeat,
+        latency,
+    )
@@ -0,0 +1,92 @@
+"""
+StateMonitor to socket.io benchmark: the data of the simulated v5 machine devices
+changes one device per tick and the update is sent to N socket.io test clients,
+once to the room of all clients as CurrentDataBroadcaster does, or as the full
+state to every client as the session callbacks did before.
+"""
+
+import json
+import time
+
+from flask import Flask
+from flask_socketio import SocketIO, join_room
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.machine_manager import StateMonitor
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.util.clock import VirtualClock, set_clock
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+NAMESPACE = "/machine"
+ROOM = "current"
+
+
+def _devices_data():
+    previous = set_clock(VirtualClock())
+    machine = ReplifactoryPlant().create_machine()
+    try:
+        machine.connect(usb_device=VirtualUsbDevice())
+        return {
+            device_id: device.get_data()
+            for device_id, device in machine._dev_manager._devices.items()
+        }
+    finally:
+        machine.shutdown()
+        set_clock(previous)
+
+
+def _run(clients: int, repeat: int, broadcast: bool):
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode="threading")
+    socketio.on_event("connect", lambda: join_room(ROOM), namespace=NAMESPACE)
+    test_clients = [
+        socketio.test_client(app, namespace=NAMESPACE) for _ in range(clients)
+    ]
+    sids = [client.eio_sid for client in test_clients]
+
+    monitor = StateMonitor(interval=0)
+    devices_data = _devices_data()
+    monitor.reset(state={"text": "Operational"}, devices_data=devices_data)
+    version = monitor.version
+    stirrers = [device_id for device_id in devices_data if "stirrer" in device_id]
+    sent_bytes = 0
+    started = time.perf_counter()
+    for i in range(repeat):
+        device_id = stirrers[i % len(stirrers)]
+        monitor.set_device_data(device_id, {**devices_data[device_id], "speed": i})
+        if broadcast:
+            payload = monitor.get_changes(version)
+            version = payload["version"]
+            socketio.emit("current", payload, to=ROOM, namespace=NAMESPACE)
+            sent_bytes += len(json.dumps(payload))
+        else:
+            payload = monitor.get_current_data()
+            for sid in socketio.server.manager.get_participants(NAMESPACE, ROOM):
+                socketio.emit("current", payload, to=sid[0], namespace=NAMESPACE)
+                sent_bytes += len(json.dumps(payload))
+    elapsed = time.perf_counter() - started
+    received = sum(len(client.get_received(NAMESPACE)) for client in test_clients)
+    for client in test_clients:
+        client.disconnect(namespace=NAMESPACE)
+    return {
+        "clients": len(sids),
+        "seconds_per_update": elapsed / repeat,
+        "bytes_per_update": sent_bytes / repeat,
+        "received": received,
+    }
+
+
+def bench_broadcast_1_client(repeat: int = 500):
+    return _run(1, repeat, broadcast=True)
+
+
+def bench_broadcast_10_clients(repeat: int = 500):
+    return _run(10, repeat, broadcast=True)
+
+
+def bench_broadcast_50_clients(repeat: int = 200):
+    return _run(50, repeat, broadcast=True)
+
+
+def bench_full_state_per_client_10_clients(repeat: int = 200):
+    return _run(10, repeat, broadcast=False)
@@ -0,0 +1,60 @@
+"""
+Tracing overhead: the cost of a span with the tracer disabled and enabled, and of
+an OD sweep of the simulated v5 machine with tracing on.
+"""
+
+import time
+
+import biofactory.server  # noqa: F401 resolves the machine import cycle
+from biofactory.simulator.replifactory_v5 import ReplifactoryPlant
+from biofactory.tracing import Tracer, tracer
+from biofactory.util.clock import VirtualClock, set_clock
+from biofactory.virtual_usb_device import VirtualUsbDevice
+
+
+def _span_cost(enabled: bool, repeat: int):
+    span_tracer = Tracer()
+    if enabled:
+        span_tracer.enable()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        with span_tracer.span("span", "benchmark", index=1):
+            pass
+    return {"nanoseconds_per_span": (time.perf_counter() - started) / repeat * 1e9}
+
+
+def bench_span_disabled(repeat: int = 200000):
+    return _span_cost(False, repeat)
+
+
+def bench_span_enabled(repeat: int = 200000):
+    return _span_cost(True, repeat)
+
+
+def _od_sweep(enabled: bool, repeat: int):
+    previous = set_clock(VirtualClock())
+    machine = ReplifactoryPlant().create_machine()
+    try:
+        machine.connect(usb_device=VirtualUsbDevice())
+        tracer().clear()
+        if enabled:
+            tracer().enable()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            machine.measure_od_all()
+        elapsed = time.perf_counter() - started
+        spans = len(tracer().get_spans())
+    finally:
+        tracer().disable()
+        tracer().clear()
+        machine.shutdown()
+        set_clock(previous)
+    return {"seconds_per_sweep": elapsed / repeat, "spans_per_sweep": spans / repeat}
+
+
+def bench_od_sweep_tracing_disabled(repeat: int = 10):
+    return _od_sweep(False, repeat)
+
+
+def bench_od_sweep_tracing_enabled(repeat: int = 10):
+    return _od_sweep(True, repeat)
@@ -0,0 +1,132 @@
+"""
+Runs the ``bench_*`` functions of all benchmark modules and writes the results
+as JSON. With ``--compare`` the results are checked against a stored baseline
+and the run fails when a metric got worse by more than ``--threshold``.
+
+Metrics named ``*_per_second`` are throughputs where higher is better, other
+``*_per_*`` metrics (seconds, bytes or transactions per operation) are costs
+where lower is better. The remaining values describe the run and are not
+compared.
+
+Run with ``poetry run python benchmarks/run.py --output results.json`` and later
+``poetry run python benchmarks/run.py --compare results.json``. The benchmarks of a
+single module run with ``-k``, e.g. ``benchmarks/run.py -k bench_mcp3421``.
+"""
+
+import argparse
+import datetime
+import importlib.util
+import json
+import logging
+import pathlib
+import platform
+import sys
+import time
+
+BENCHMARKS_DIR = pathlib.Path(__file__).parent
+
+
+def discover(pattern: str = ""):
+    """Yields the qualified names and the functions of the benchmarks"""
+    for path in sorted(BENCHMARKS_DIR.glob("bench_*.py")):
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        for name, function in vars(module).items():
+            qualified_name = f"{path.stem}.{name}"
+            if (
+                name.startswith("bench_")
+                and callable(function)
+                and pattern in qualified_name
+            ):
+                yield qualified_name, function
+
+
+def run(pattern: str = "") -> dict:
+    results = {}
+    for name, function in discover(pattern):
+        started = time.perf_counter()
+        results[name] = function()
+        print(f"{name}: {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def metric_direction(metric: str) -> int:
+    """1 if higher values are better, -1 if lower values are, 0 if not compared"""
+    if metric.endswith("_per_second"):
+        return 1
+    if "_per_" in metric:
+        return -1
+    return 0
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.25) -> list[dict]:
+    """Returns the metrics which got worse than the baseline by the threshold"""
+    regressions = []
+    for name, metrics in current["results"].items():
+        baseline_metrics = baseline["results"].get(name, {})
+        for metric, value in metrics.items():
+            direction = metric_direction(metric)
+            reference = baseline_metrics.get(metric)
+            if not direction or not reference or not isinstance(value, (int, float)):
+                continue
+            change = (value - reference) / abs(reference)
+            if -direction * change > threshold:
+                regressions.append(
+                    {
+                        "benchmark": name,
+                        "metric": metric,
+                        "baseline": reference,
+                        "current": value,
+                        "change": change,
+                    }
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "-k", "--filter", default="", help="run benchmarks containing this text"
+    )
+    parser.add_argument("-o", "--output", help="write the results to this file")
+    parser.add_argument("-c", "--compare", help="baseline results file")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="relative change flagged as a regression, 0.25 by default",
+    )
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    current = run(args.filter)
+    output = json.dumps(current, indent=2)
+    if args.output:
+        pathlib.Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        baseline = json.loads(pathlib.Path(args.compare).read_text())
+        regressions = compare(baseline, current, args.threshold)
+        for regression in regressions:
+            print(
+                "REGRESSION {benchmark} {metric}: {baseline:.6g} -> {current:.6g}"
+                " ({change:+.0%})".format(**regression),
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
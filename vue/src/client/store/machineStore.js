@@ -1,5 +1,19 @@
 import api from "@/api.js";
 
+// the state without a machine (offline) is sent with a null serial
+const machineKey = (machine) => machine ?? "";
+
+function storeMachineData(state, key, data, version) {
+  state.machines[key] = { version, data };
+  if (state.selected === null && key !== "") {
+    // show the first machine which reports its state
+    state.selected = key;
+  }
+  if (key === (state.selected ?? "")) {
+    state.data = data;
+  }
+}
+
 export default {
   namespaced: true,
   state: {
@@ -28,6 +42,9 @@ export default {
       },
       devices: {},
     },
+    // state and its version by machine serial, data is the selected machine
+    machines: {},
+    selected: null,
   },
   mutations: {
     updateConnectionOptions(state, options) {
@@ -44,7 +61,33 @@ export default {
       state.devices = new_value;
     },
     updateData(state, data) {
-      state.data = data;
+      const key = machineKey(data.machine);
+      storeMachineData(state, key, data, state.machines[key]?.version ?? null);
+    },
+    applyChanges(state, changes) {
+      const { version, since, full, serverTime, ...entries } = changes;
+      const key = machineKey(changes.machine);
+      let data;
+      if (full) {
+        data = { ...entries, serverTime };
+      } else {
+        const previous = state.machines[key].data;
+        const { devices, ...rest } = entries;
+        data = {
+          ...previous,
+          ...rest,
+          devices: { ...previous.devices, ...devices },
+          serverTime,
+        };
+      }
+      storeMachineData(state, key, data, version);
+    },
+    selectMachine(state, machine) {
+      const key = machineKey(machine);
+      state.selected = key;
+      if (Object.hasOwn(state.machines, key)) {
+        state.data = state.machines[key].data;
+      }
     },
     updateSendQueue(state, data) {
       state.queue.send = data;
@@ -54,6 +97,9 @@ export default {
     },
   },
   getters: {
+    getVersion: (state) => (machine) => {
+      return state.machines[machineKey(machine)]?.version ?? null;
+    },
     isDisconnected(state) {
       return state.data.state.flags.closedOrError;
     },
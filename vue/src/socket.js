@@ -3,8 +3,13 @@ import store from "@/client/store";
 
 export const socket = io("/machine");
 
+// machines whose full state was asked for and did not arrive yet
+const resyncing = new Set();
+
 socket.on("connect", () => {
   store.commit("setBackendConnected", true);
+  // the server sends the full state of every machine on connect
+  resyncing.clear();
 });
 
 socket.on("disconnect", () => {
@@ -20,8 +25,22 @@ socket.on("reconnect", (attemptNumber) => {
   console.log(`Reconnected after ${attemptNumber} attempts`);
 });
 
-socket.on("current", (data) => {
-  store.commit("machine/updateData", data);
+socket.on("current", (changes) => {
+  // every machine has its own version
+  const machine = changes.machine ?? null;
+  const version = store.getters["machine/getVersion"](machine);
+  if (changes.full) {
+    resyncing.delete(machine);
+  } else if (version === null || changes.since > version) {
+    // without a version the full state is on its way (sent on connect and
+    // when the machine connects), otherwise an update was missed
+    if (version !== null && !resyncing.has(machine)) {
+      resyncing.add(machine);
+      socket.emit("current_resync", machine);
+    }
+    return;
+  }
+  store.commit("machine/applyChanges", changes);
 });
 
 socket.on("history", (data) => {